@@ -0,0 +1,52 @@
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Performance indexes that the ORM models cannot express portably.
+# Every statement must be idempotent; they run on each service start.
+PERFORMANCE_INDEXES = [
+    # Name search and typeahead for NameSearch (GET /vendors?search=, /vendors/typeahead)
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    """
+    CREATE INDEX IF NOT EXISTS ix_vendors_name_trgm
+    ON vendors USING gin (name gin_trgm_ops)
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS ix_vendors_name_prefix
+    ON vendors (lower(name) text_pattern_ops)
+    """,
+    # Open (approved, not fully paid) invoices for aging. The predicate must
+    # match the filter in AccountsPayableService.generate_aging_report.
+    """
+    CREATE INDEX IF NOT EXISTS ix_invoices_open_aging
+    ON invoices (due_date, vendor_id)
+    INCLUDE (total_amount, paid_amount, invoice_date)
+    WHERE status = 'Approved' AND paid_amount < total_amount
+    """,
+    # Payment run selection by discount date; due-date selection reuses
+    # ix_invoices_open_aging. Must match PaymentRunService._select_due_invoices.
+    """
+    CREATE INDEX IF NOT EXISTS ix_invoices_open_discount
+    ON invoices (discount_date, vendor_id)
+    WHERE status = 'Approved' AND paid_amount = 0 AND discount_date IS NOT NULL
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS ix_payment_run_items_invoice
+    ON payment_run_items (invoice_id, payment_run_id)
+    """,
+]
+
+
+def create_performance_indexes(engine: Engine) -> None:
+    """Create the service's performance indexes if they do not exist yet"""
+    if engine.dialect.name != "postgresql":
+        logger.info(f"Skipping performance indexes on {engine.dialect.name}")
+        return
+
+    with engine.begin() as connection:
+        for statement in PERFORMANCE_INDEXES:
+            connection.execute(text(statement))
+
+    logger.info(f"Ensured {len(PERFORMANCE_INDEXES)} performance indexes")
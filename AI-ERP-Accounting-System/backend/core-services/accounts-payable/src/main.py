@@ -1,23 +1,36 @@
 from fastapi import FastAPI, HTTPException, Depends, status, UploadFile, File
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
 from typing import List, Optional
+import asyncio
 import logging
 from datetime import datetime, date
 from decimal import Decimal
 
-from .database.connection import get_db
+from .database.connection import get_db, engine, SessionLocal
+from .database.indexes import create_performance_indexes
 from .models.vendors import Vendor, VendorCreate, VendorUpdate
 from .models.invoices import Invoice, InvoiceCreate, InvoiceUpdate, InvoiceLine
 from .models.payments import Payment, PaymentCreate, PaymentUpdate
 from .models.purchase_orders import PurchaseOrder, PurchaseOrderCreate, PurchaseOrderUpdate
+from .models.receipts import ReceiptCreate
+from .models.payment_runs import PaymentRunCreate, PaymentRunSummary
+from .models.accruals import AccrualRunCreate, AccrualRunSummary
+from .models.upload_jobs import InvoiceUploadJobStatus
 from .services.ap_service import AccountsPayableService
 from .services.invoice_service import InvoiceService
 from .services.payment_service import PaymentService
+from .services.payment_run_service import PaymentRunService, PAYMENT_FILE_FORMATS
+from .services.accrual_service import AccrualService
 from .services.vendor_service import VendorService
+from .services.ocr_pipeline import InvoiceUploadPipeline
+from .services.duplicate_detection_service import DuplicateDetectionService, KEYED_INVOICE_FIELDS
 from .utils.validators import validate_invoice, validate_payment
 from .utils.helpers import format_currency
+from .utils.search import NameSearch
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -45,7 +58,35 @@ security = HTTPBearer()
 ap_service = AccountsPayableService()
 invoice_service = InvoiceService()
 payment_service = PaymentService()
+payment_run_service = PaymentRunService()
+accrual_service = AccrualService()
 vendor_service = VendorService()
+vendor_search = NameSearch(Vendor)
+duplicate_service = DuplicateDetectionService()
+upload_pipeline = InvoiceUploadPipeline(duplicate_service=duplicate_service)
+
+@app.on_event("startup")
+async def ensure_performance_indexes():
+    """Create performance indexes that migrations do not manage"""
+    try:
+        create_performance_indexes(engine)
+    except Exception as e:
+        logger.error(f"Error creating performance indexes: {str(e)}")
+
+@app.on_event("startup")
+async def resume_invoice_uploads():
+    """Reschedule invoice uploads interrupted by a restart"""
+    try:
+        resumed = upload_pipeline.resume_pending_jobs()
+        if resumed:
+            logger.info(f"Resumed {resumed} invoice upload jobs")
+    except Exception as e:
+        logger.error(f"Error resuming invoice uploads: {str(e)}")
+
+@app.on_event("shutdown")
+async def stop_invoice_pipeline():
+    """Stop the OCR worker pool"""
+    upload_pipeline.shutdown()
 
 @app.get("/")
 async def root():
@@ -76,7 +117,10 @@ async def create_vendor(
 ):
     """Create a new vendor"""
     try:
-        return vendor_service.create_vendor(db, vendor)
+        db_vendor = vendor_service.create_vendor(db, vendor)
+        vendor_search.invalidate()
+        ap_service.invalidate_vendor_analysis(db_vendor.id)
+        return db_vendor
     except Exception as e:
         logger.error(f"Error creating vendor: {str(e)}")
         raise HTTPException(status_code=400, detail=str(e))
@@ -92,11 +136,34 @@ async def get_vendors(
 ):
     """Get vendors with optional filtering"""
     try:
+        if search:
+            # Ranked trigram search instead of a wildcard scan
+            filters = []
+            if active is not None:
+                filters.append(Vendor.is_active == active)
+            return vendor_search.search(db, search, skip=skip, limit=limit, filters=filters)
+        
         return vendor_service.get_vendors(db, skip=skip, limit=limit, active=active, search=search)
     except Exception as e:
         logger.error(f"Error retrieving vendors: {str(e)}")
         raise HTTPException(status_code=400, detail=str(e))
 
+@app.get("/vendors/typeahead")
+async def vendor_typeahead(
+    prefix: str,
+    limit: int = 10,
+    active: Optional[bool] = True,
+    db: Session = Depends(get_db),
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    """Suggest vendors whose name starts with the prefix"""
+    try:
+        filters = [Vendor.is_active == active] if active is not None else []
+        return vendor_search.typeahead(db, prefix, limit=min(limit, 50), filters=filters)
+    except Exception as e:
+        logger.error(f"Error retrieving vendor suggestions: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+
 @app.get("/vendors/{vendor_id}", response_model=Vendor)
 async def get_vendor(
     vendor_id: int,
@@ -127,6 +194,8 @@ async def update_vendor(
         updated_vendor = vendor_service.update_vendor(db, vendor_id, vendor)
         if not updated_vendor:
             raise HTTPException(status_code=404, detail="Vendor not found")
+        vendor_search.invalidate()
+        ap_service.invalidate_vendor_analysis(vendor_id)
         return updated_vendor
     except HTTPException:
         raise
@@ -210,6 +279,7 @@ async def update_purchase_order(
 @app.post("/invoices", response_model=Invoice, status_code=status.HTTP_201_CREATED)
 async def create_invoice(
     invoice: InvoiceCreate,
+    allow_duplicate: bool = False,
     db: Session = Depends(get_db),
     credentials: HTTPAuthorizationCredentials = Depends(security)
 ):
@@ -220,29 +290,77 @@ async def create_invoice(
         if not validation_result["valid"]:
             raise HTTPException(status_code=400, detail=validation_result["errors"])
         
-        return invoice_service.create_invoice(db, invoice)
+        # Screen against indexed invoices of the same vendor
+        duplicates = duplicate_service.find_duplicates(
+            db, invoice.vendor_id, invoice.invoice_number, invoice.total_amount, invoice.invoice_date
+        )
+        if duplicates and not allow_duplicate:
+            raise HTTPException(
+                status_code=409,
+                detail={
+                    "message": "Possible duplicate invoice",
+                    "candidates": jsonable_encoder(duplicates)
+                }
+            )
+        
+        db_invoice = invoice_service.create_invoice(db, invoice)
+        duplicate_service.flag_duplicates(db, db_invoice.id, duplicates)
+        duplicate_service.index_invoice(db, db_invoice)
+        ap_service.invalidate_vendor_analysis(db_invoice.vendor_id)
+        return db_invoice
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"Error creating invoice: {str(e)}")
         raise HTTPException(status_code=400, detail=str(e))
 
-@app.post("/invoices/upload")
+@app.post("/invoices/duplicates/rescreen")
+async def rescreen_duplicate_invoices(
+    vendor_ids: Optional[List[int]] = None,
+    db: Session = Depends(get_db),
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    """Re-screen the invoice history for duplicates (all vendors if omitted)"""
+    try:
+        result = duplicate_service.rescreen_history(db, vendor_ids)
+        return {"message": "Duplicate re-screening completed", **result}
+    except Exception as e:
+        logger.error(f"Error re-screening duplicate invoices: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/invoices/upload", status_code=status.HTTP_202_ACCEPTED)
 async def upload_invoice(
     file: UploadFile = File(...),
     vendor_id: Optional[int] = None,
     db: Session = Depends(get_db),
     credentials: HTTPAuthorizationCredentials = Depends(security)
 ):
-    """Upload and process invoice document (OCR)"""
+    """Upload an invoice document and queue it for OCR processing"""
     try:
-        # This would integrate with OCR service for invoice processing
-        result = invoice_service.process_invoice_upload(db, file, vendor_id)
-        return {"message": "Invoice uploaded and processed", "invoice_id": result.id}
+        job = await upload_pipeline.submit_upload(db, file, vendor_id)
+        return {"message": "Invoice upload queued for processing", "job_id": job.job_id}
     except Exception as e:
         logger.error(f"Error uploading invoice: {str(e)}")
         raise HTTPException(status_code=400, detail=str(e))
 
+@app.get("/invoices/upload/{job_id}", response_model=InvoiceUploadJobStatus)
+async def get_invoice_upload_status(
+    job_id: str,
+    db: Session = Depends(get_db),
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    """Get processing progress of an uploaded invoice document"""
+    try:
+        job = upload_pipeline.get_job(db, job_id)
+        if not job:
+            raise HTTPException(status_code=404, detail="Upload job not found")
+        return job
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error retrieving upload job {job_id}: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+
 @app.get("/invoices", response_model=List[Invoice])
 async def get_invoices(
     skip: int = 0,
@@ -294,6 +412,10 @@ async def update_invoice(
         updated_invoice = invoice_service.update_invoice(db, invoice_id, invoice)
         if not updated_invoice:
             raise HTTPException(status_code=404, detail="Invoice not found")
+        # Keys derived from the old vendor, number, amount or date would screen against stale values
+        if set(invoice.dict(exclude_unset=True)) & set(KEYED_INVOICE_FIELDS):
+            duplicate_service.reindex_invoice(db, updated_invoice)
+        ap_service.invalidate_vendor_analysis(updated_invoice.vendor_id)
         return updated_invoice
     except HTTPException:
         raise
@@ -329,7 +451,9 @@ async def create_payment(
         if not validation_result["valid"]:
             raise HTTPException(status_code=400, detail=validation_result["errors"])
         
-        return payment_service.create_payment(db, payment)
+        db_payment = payment_service.create_payment(db, payment)
+        ap_service.invalidate_vendor_analysis(db_payment.vendor_id)
+        return db_payment
     except HTTPException:
         raise
     except Exception as e:
@@ -384,39 +508,191 @@ async def process_payment(
     """Process a payment (execute bank transfer)"""
     try:
         result = payment_service.process_payment(db, payment_id)
+        ap_service.invalidate_vendor_analysis()
         return {"message": "Payment processed successfully", "payment_id": payment_id}
     except Exception as e:
         logger.error(f"Error processing payment {payment_id}: {str(e)}")
         raise HTTPException(status_code=400, detail=str(e))
 
+# Payment run endpoints
+@app.post("/payment-runs", response_model=PaymentRunSummary, status_code=status.HTTP_201_CREATED)
+async def create_payment_run(
+    run: PaymentRunCreate,
+    db: Session = Depends(get_db),
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    """Select due invoices and create one payment per vendor and currency"""
+    try:
+        db_run = payment_run_service.create_payment_run(db, run)
+        # The run's payments span many vendors, so every cached analysis may be stale
+        ap_service.invalidate_vendor_analysis()
+        return db_run
+    except Exception as e:
+        logger.error(f"Error creating payment run: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/payment-runs/{run_id}", response_model=PaymentRunSummary)
+async def get_payment_run(
+    run_id: int,
+    db: Session = Depends(get_db),
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    """Get a specific payment run by ID"""
+    try:
+        run = payment_run_service.get_payment_run(db, run_id)
+        if not run:
+            raise HTTPException(status_code=404, detail="Payment run not found")
+        return run
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error retrieving payment run {run_id}: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/payment-runs/{run_id}/file")
+async def download_payment_file(
+    run_id: int,
+    format: str = "nacha",
+    db: Session = Depends(get_db),
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    """Stream the bank payment file (NACHA or ISO 20022 pain.001) for a run"""
+    if format not in PAYMENT_FILE_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported payment file format: {format}")
+
+    run = payment_run_service.get_payment_run(db, run_id)
+    if not run:
+        raise HTTPException(status_code=404, detail="Payment run not found")
+    if run.status == "Cancelled":
+        raise HTTPException(status_code=400, detail="Payment run is cancelled")
+    try:
+        payment_run_service.check_payment_file(db, run, format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    def file_chunks():
+        # The response outlives the request session, so stream from a session of its own
+        stream_db = SessionLocal()
+        try:
+            stream_run = payment_run_service.get_payment_run(stream_db, run_id)
+            yield from payment_run_service.stream_payment_file(stream_db, stream_run, format)
+        finally:
+            stream_db.close()
+
+    if format == "nacha":
+        media_type, filename = "text/plain", f"{run.run_number}.ach"
+    else:
+        media_type, filename = "application/xml", f"{run.run_number}.xml"
+
+    return StreamingResponse(
+        file_chunks(),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
 # Three-way matching
 @app.post("/invoices/{invoice_id}/match")
 async def three_way_match(
     invoice_id: int,
     po_id: Optional[int] = None,
     receipt_id: Optional[int] = None,
+    quantity_tolerance: Decimal = Decimal("0.05"),
+    price_tolerance: Decimal = Decimal("0.02"),
     db: Session = Depends(get_db),
     credentials: HTTPAuthorizationCredentials = Depends(security)
 ):
     """Perform three-way matching (PO, Invoice, Receipt)"""
     try:
-        result = ap_service.perform_three_way_match(db, invoice_id, po_id, receipt_id)
+        result = ap_service.perform_three_way_match(
+            db, invoice_id, po_id, receipt_id,
+            quantity_tolerance=quantity_tolerance, price_tolerance=price_tolerance
+        )
         return {"message": "Three-way matching completed", "match_result": result}
     except Exception as e:
         logger.error(f"Error performing three-way match: {str(e)}")
         raise HTTPException(status_code=400, detail=str(e))
 
+@app.post("/invoices/match/batch")
+async def batch_three_way_match(
+    vendor_ids: Optional[List[int]] = None,
+    quantity_tolerance: Decimal = Decimal("0.05"),
+    price_tolerance: Decimal = Decimal("0.02"),
+    db: Session = Depends(get_db),
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    """Three-way match all open invoices for the given vendors (all vendors if omitted)"""
+    try:
+        result = ap_service.match_open_invoices(
+            db, vendor_ids,
+            quantity_tolerance=quantity_tolerance, price_tolerance=price_tolerance
+        )
+        return {"message": "Batch matching completed", **result}
+    except Exception as e:
+        logger.error(f"Error performing batch three-way match: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+
+# Goods Receipt endpoints
+@app.post("/receipts", status_code=status.HTTP_201_CREATED)
+async def create_receipt(
+    receipt: ReceiptCreate,
+    db: Session = Depends(get_db),
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    """Record goods received against a purchase order"""
+    try:
+        db_receipt = ap_service.create_receipt(db, receipt)
+        return {"message": "Receipt recorded successfully", "receipt_id": db_receipt.id, "receipt_number": db_receipt.receipt_number}
+    except Exception as e:
+        logger.error(f"Error creating receipt: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+
+# Period-end accrual endpoints
+@app.post("/accruals/received-not-invoiced", response_model=AccrualRunSummary, status_code=status.HTTP_201_CREATED)
+async def run_received_not_invoiced_accrual(
+    request: AccrualRunCreate,
+    db: Session = Depends(get_db),
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    """Accrue goods received but not invoiced at period end, with automatic reversal"""
+    try:
+        # Posting waits on the GL over blocking HTTP, so keep it off the event loop
+        return await asyncio.get_running_loop().run_in_executor(
+            None, accrual_service.run_received_not_invoiced, db, request, credentials.credentials
+        )
+    except Exception as e:
+        logger.error(f"Error running received-not-invoiced accrual: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/accruals/{run_id}", response_model=AccrualRunSummary)
+async def get_accrual_run(
+    run_id: int,
+    db: Session = Depends(get_db),
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    """Get a specific accrual run by ID"""
+    try:
+        run = accrual_service.get_accrual_run(db, run_id)
+        if not run:
+            raise HTTPException(status_code=404, detail="Accrual run not found")
+        return run
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error retrieving accrual run {run_id}: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+
 # Reporting endpoints
 @app.get("/reports/aging")
 async def get_aging_report(
     as_of_date: date,
     vendor_id: Optional[int] = None,
+    group_by_vendor: bool = False,
     db: Session = Depends(get_db),
     credentials: HTTPAuthorizationCredentials = Depends(security)
 ):
     """Get accounts payable aging report"""
     try:
-        return ap_service.generate_aging_report(db, as_of_date, vendor_id)
+        return ap_service.generate_aging_report(db, as_of_date, vendor_id, group_by_vendor)
     except Exception as e:
         logger.error(f"Error generating aging report: {str(e)}")
         raise HTTPException(status_code=400, detail=str(e))
@@ -426,12 +702,13 @@ async def get_vendor_analysis(
     start_date: date,
     end_date: date,
     vendor_id: Optional[int] = None,
+    top_n: Optional[int] = None,
     db: Session = Depends(get_db),
     credentials: HTTPAuthorizationCredentials = Depends(security)
 ):
     """Get vendor analysis report"""
     try:
-        return ap_service.generate_vendor_analysis(db, start_date, end_date, vendor_id)
+        return ap_service.generate_vendor_analysis(db, start_date, end_date, vendor_id, top_n)
     except Exception as e:
         logger.error(f"Error generating vendor analysis: {str(e)}")
         raise HTTPException(status_code=400, detail=str(e))
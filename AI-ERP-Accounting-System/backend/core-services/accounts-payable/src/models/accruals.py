@@ -0,0 +1,66 @@
+from sqlalchemy import Column, Integer, String, DateTime, Date, Text, ForeignKey, Numeric
+from sqlalchemy.ext.declarative import declarative_base
+from datetime import datetime, date
+from typing import Optional
+from pydantic import BaseModel
+from decimal import Decimal
+
+Base = declarative_base()
+
+# SQLAlchemy Models
+class AccrualRun(Base):
+    __tablename__ = "accrual_runs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    accrual_type = Column(String(30), default="ReceivedNotInvoiced")
+    period_end_date = Column(Date, nullable=False, index=True)
+    reversal_date = Column(Date, nullable=False)
+    expense_account_id = Column(Integer, nullable=False)
+    accrual_account_id = Column(Integer, nullable=False)
+    status = Column(String(20), default="Pending")  # Pending, Posted, Failed
+    line_count = Column(Integer, default=0)
+    vendor_count = Column(Integer, default=0)
+    total_amount = Column(Numeric(15, 2), default=0)
+    journal_entry_ids = Column(Text, nullable=True)  # Comma separated GL entry IDs
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    attempted_at = Column(DateTime, nullable=True)  # Last time posting to the GL started
+    posted_at = Column(DateTime, nullable=True)
+    created_by = Column(Integer, nullable=True)
+
+class AccrualLine(Base):
+    __tablename__ = "accrual_lines"
+
+    id = Column(Integer, primary_key=True, index=True)
+    accrual_run_id = Column(Integer, ForeignKey("accrual_runs.id", ondelete="CASCADE"), nullable=False, index=True)
+    purchase_order_id = Column(Integer, ForeignKey("purchase_orders.id"), nullable=False)
+    vendor_id = Column(Integer, nullable=False)
+    item_code = Column(String(50), nullable=False)
+    quantity_received = Column(Numeric(15, 4), nullable=False)
+    quantity_invoiced = Column(Numeric(15, 4), default=0)
+    unit_price = Column(Numeric(15, 4), nullable=False)
+    accrual_amount = Column(Numeric(15, 2), nullable=False)
+    journal_entry_id = Column(Integer, nullable=True)  # GL entry carrying the line, set once posted
+    reversal_entry_id = Column(Integer, nullable=True)
+
+# Pydantic Models
+class AccrualRunCreate(BaseModel):
+    period_end_date: date
+    reversal_date: Optional[date] = None  # Defaults to the day after period end
+    expense_account_id: int
+    accrual_account_id: int
+    post: bool = True
+
+class AccrualRunSummary(BaseModel):
+    id: int
+    period_end_date: date
+    reversal_date: date
+    status: str
+    line_count: int
+    vendor_count: int
+    total_amount: Decimal
+    journal_entry_ids: Optional[str] = None
+    error: Optional[str] = None
+
+    class Config:
+        from_attributes = True
@@ -0,0 +1,50 @@
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, Date, ForeignKey, Numeric, Index
+from sqlalchemy.ext.declarative import declarative_base
+from datetime import datetime, date
+from typing import List
+from pydantic import BaseModel
+from decimal import Decimal
+
+Base = declarative_base()
+
+# SQLAlchemy Models
+class InvoiceDuplicateKey(Base):
+    """Normalized blocking keys of an invoice used for duplicate screening"""
+    __tablename__ = "invoice_duplicate_keys"
+
+    id = Column(Integer, primary_key=True, index=True)
+    invoice_id = Column(Integer, ForeignKey("invoices.id", ondelete="CASCADE"), nullable=False, unique=True)
+    vendor_id = Column(Integer, nullable=False)
+    normalized_number = Column(String(50), nullable=False)
+    number_core = Column(String(50), nullable=False)  # Digits only, leading zeros stripped
+    number_minhash = Column(BigInteger, nullable=False)  # Min trigram hash of the normalized number
+    amount_cents = Column(BigInteger, nullable=False)
+    invoice_date = Column(Date, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_invoice_dup_keys_number", "vendor_id", "normalized_number"),
+        Index("ix_invoice_dup_keys_core", "vendor_id", "number_core"),
+        Index("ix_invoice_dup_keys_minhash", "vendor_id", "number_minhash"),
+        Index("ix_invoice_dup_keys_amount", "vendor_id", "amount_cents", "invoice_date"),
+    )
+
+class InvoiceDuplicateFlag(Base):
+    __tablename__ = "invoice_duplicate_flags"
+
+    id = Column(Integer, primary_key=True, index=True)
+    invoice_id = Column(Integer, ForeignKey("invoices.id", ondelete="CASCADE"), nullable=False, index=True)
+    duplicate_of_invoice_id = Column(Integer, ForeignKey("invoices.id", ondelete="CASCADE"), nullable=False, index=True)
+    score = Column(Numeric(5, 4), nullable=False)
+    reasons = Column(String(100), nullable=True)  # Comma separated: SameNumber, SimilarNumber, SameAmount, NearDate
+    status = Column(String(20), default="Open", index=True)  # Open, Confirmed, Dismissed
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+# Pydantic Models
+class DuplicateCandidate(BaseModel):
+    invoice_id: int
+    normalized_number: str
+    amount: Decimal
+    invoice_date: date
+    score: Decimal
+    reasons: List[str]
@@ -0,0 +1,31 @@
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, ForeignKey, Numeric
+from sqlalchemy.ext.declarative import declarative_base
+from datetime import datetime
+
+Base = declarative_base()
+
+# SQLAlchemy Models
+class InvoiceMatchResult(Base):
+    __tablename__ = "invoice_match_results"
+
+    id = Column(Integer, primary_key=True, index=True)
+    invoice_id = Column(Integer, ForeignKey("invoices.id"), nullable=False, unique=True, index=True)
+    purchase_order_id = Column(Integer, ForeignKey("purchase_orders.id"), nullable=True)
+    matched = Column(Boolean, default=False, index=True)
+    match_score = Column(Numeric(5, 4), default=0)
+    lines_matched = Column(Integer, default=0)
+    lines_total = Column(Integer, default=0)
+    matched_at = Column(DateTime, default=datetime.utcnow)
+
+class MatchDiscrepancy(Base):
+    __tablename__ = "match_discrepancies"
+
+    id = Column(Integer, primary_key=True, index=True)
+    match_result_id = Column(Integer, ForeignKey("invoice_match_results.id", ondelete="CASCADE"), nullable=False, index=True)
+    invoice_id = Column(Integer, ForeignKey("invoices.id"), nullable=False, index=True)
+    item_code = Column(String(50), nullable=True)
+    discrepancy_type = Column(String(30), nullable=False)  # NoPurchaseOrder, NoPOLine, NotReceived, QuantityExceedsReceipt, QuantityExceedsOrder, PriceVariance
+    expected_value = Column(Numeric(15, 4), nullable=True)
+    actual_value = Column(Numeric(15, 4), nullable=True)
+    message = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
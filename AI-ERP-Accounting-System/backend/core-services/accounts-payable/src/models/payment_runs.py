@@ -0,0 +1,60 @@
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Date, ForeignKey, Numeric
+from sqlalchemy.ext.declarative import declarative_base
+from datetime import datetime, date
+from typing import Optional, List
+from pydantic import BaseModel, Field
+from decimal import Decimal
+
+Base = declarative_base()
+
+# SQLAlchemy Models
+class PaymentRun(Base):
+    __tablename__ = "payment_runs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    run_number = Column(String(20), unique=True, index=True, nullable=False)
+    run_date = Column(Date, nullable=False)
+    payment_date = Column(Date, nullable=False)
+    pay_through_date = Column(Date, nullable=False)
+    take_discounts = Column(Boolean, default=True)
+    payment_method = Column(String(20), default="ACH")  # ACH, Wire, SEPA
+    status = Column(String(20), default="Created")  # Created, Exported, Cancelled
+    invoice_count = Column(Integer, default=0)
+    payment_count = Column(Integer, default=0)
+    total_amount = Column(Numeric(15, 2), default=0)
+    discount_amount = Column(Numeric(15, 2), default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    exported_at = Column(DateTime, nullable=True)
+    created_by = Column(Integer, nullable=True)
+
+class PaymentRunItem(Base):
+    __tablename__ = "payment_run_items"
+
+    id = Column(Integer, primary_key=True, index=True)
+    payment_run_id = Column(Integer, ForeignKey("payment_runs.id"), nullable=False, index=True)
+    payment_id = Column(Integer, ForeignKey("payments.id"), nullable=False, index=True)
+    invoice_id = Column(Integer, ForeignKey("invoices.id"), nullable=False, index=True)
+    amount = Column(Numeric(15, 2), nullable=False)
+    discount_taken = Column(Numeric(15, 2), default=0)
+
+# Pydantic Models
+class PaymentRunCreate(BaseModel):
+    payment_date: date
+    pay_through_date: Optional[date] = None  # Defaults to the payment date
+    take_discounts: bool = True
+    payment_method: str = Field(default="ACH", pattern="^(ACH|Wire|SEPA)$")
+    vendor_ids: Optional[List[int]] = None
+    currency: Optional[str] = Field(None, min_length=3, max_length=3)
+
+class PaymentRunSummary(BaseModel):
+    id: int
+    run_number: str
+    payment_date: date
+    status: str
+    invoice_count: int
+    payment_count: int
+    total_amount: Decimal
+    discount_amount: Decimal
+
+    class Config:
+        from_attributes = True
@@ -0,0 +1,54 @@
+from sqlalchemy import Column, Integer, String, DateTime, Date, Text, ForeignKey, Numeric
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import relationship
+from datetime import datetime, date
+from typing import Optional, List
+from pydantic import BaseModel, Field
+from decimal import Decimal
+
+Base = declarative_base()
+
+# SQLAlchemy Models
+class Receipt(Base):
+    __tablename__ = "receipts"
+
+    id = Column(Integer, primary_key=True, index=True)
+    receipt_number = Column(String(20), unique=True, index=True, nullable=False)
+    purchase_order_id = Column(Integer, ForeignKey("purchase_orders.id"), nullable=False, index=True)
+    vendor_id = Column(Integer, ForeignKey("vendors.id"), nullable=False, index=True)
+    receipt_date = Column(Date, nullable=False)
+    status = Column(String(20), default="Received")  # Received, Cancelled
+    notes = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_by = Column(Integer, nullable=True)
+
+    # Relationships
+    receipt_lines = relationship("ReceiptLine", back_populates="receipt", cascade="all, delete-orphan")
+
+class ReceiptLine(Base):
+    __tablename__ = "receipt_lines"
+
+    id = Column(Integer, primary_key=True, index=True)
+    receipt_id = Column(Integer, ForeignKey("receipts.id"), nullable=False, index=True)
+    item_code = Column(String(50), nullable=False)
+    description = Column(Text, nullable=True)
+    quantity_received = Column(Numeric(15, 4), nullable=False)
+    quantity_rejected = Column(Numeric(15, 4), default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    # Relationships
+    receipt = relationship("Receipt", back_populates="receipt_lines")
+
+# Pydantic Models
+class ReceiptLineCreate(BaseModel):
+    item_code: str = Field(..., min_length=1, max_length=50)
+    description: Optional[str] = None
+    quantity_received: Decimal = Field(..., gt=0)
+    quantity_rejected: Decimal = Field(default=0, ge=0)
+
+class ReceiptCreate(BaseModel):
+    purchase_order_id: int
+    receipt_date: date
+    notes: Optional[str] = None
+    receipt_lines: List[ReceiptLineCreate]
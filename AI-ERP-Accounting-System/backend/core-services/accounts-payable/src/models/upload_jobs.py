@@ -0,0 +1,45 @@
+from sqlalchemy import Column, Integer, String, DateTime, Text, BigInteger
+from sqlalchemy.ext.declarative import declarative_base
+from datetime import datetime
+from typing import Optional
+from pydantic import BaseModel
+
+Base = declarative_base()
+
+# SQLAlchemy Model
+class InvoiceUploadJob(Base):
+    __tablename__ = "invoice_upload_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    job_id = Column(String(36), unique=True, index=True, nullable=False)
+    filename = Column(String(255), nullable=False)
+    stored_path = Column(String(500), nullable=False)
+    content_type = Column(String(100), nullable=True)
+    file_size = Column(BigInteger, default=0)
+    vendor_id = Column(Integer, nullable=True)
+    status = Column(String(20), default="Queued", index=True)  # Queued, Processing, Completed, Failed
+    pages_total = Column(Integer, default=0)
+    pages_done = Column(Integer, default=0)
+    invoice_id = Column(Integer, nullable=True)
+    error = Column(Text, nullable=True)
+    claim_token = Column(String(36), nullable=True)  # Set by the process that scheduled the job
+    claimed_at = Column(DateTime, nullable=True)  # Refreshed while the claiming process makes progress
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    completed_at = Column(DateTime, nullable=True)
+
+# Pydantic Models
+class InvoiceUploadJobStatus(BaseModel):
+    job_id: str
+    filename: str
+    status: str
+    pages_total: int
+    pages_done: int
+    invoice_id: Optional[int] = None
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    completed_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
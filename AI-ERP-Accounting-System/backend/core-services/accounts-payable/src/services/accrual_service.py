@@ -0,0 +1,291 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import and_, func, case, insert, select, literal
+from typing import List, Optional, Dict, Any
+from datetime import datetime, date, timedelta
+from decimal import Decimal
+import logging
+
+from ..models.invoices import Invoice, InvoiceLine
+from ..models.purchase_orders import PurchaseOrder, PurchaseOrderLine
+from ..models.receipts import Receipt, ReceiptLine
+from ..models.accruals import AccrualRun, AccrualLine, AccrualRunCreate
+from ..utils.gl_client import post_journal_entries
+
+logger = logging.getLogger(__name__)
+
+EXCLUDED_PO_STATUSES = ("Draft", "Cancelled")
+MAX_ACCRUAL_LINES_PER_ENTRY = 1000  # Vendor lines per journal entry
+ACCRUAL_STALE_AFTER = timedelta(minutes=30)  # A Pending run not attempted for this long was interrupted
+
+
+class AccrualService:
+    """Service class for period-end received-not-invoiced accruals"""
+
+    def run_received_not_invoiced(
+        self,
+        db: Session,
+        request: AccrualRunCreate,
+        token: Optional[str] = None
+    ) -> AccrualRun:
+        """Net receipts against invoices per PO line, store the accrual lines and post them to the GL.
+
+        A failed or interrupted run for the period is resumed instead of recomputed: its stored
+        lines go out again under the same entry references and the GL skips what it already has.
+        """
+        try:
+            db_run = self._resume_unfinished_run(db, request.period_end_date)
+            if db_run is None:
+                db_run = self._compute_run(db, request)
+            db.commit()
+
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error computing received-not-invoiced accrual: {str(e)}")
+            raise
+
+        try:
+            entry_count = self._post_run(db, db_run, token=token, post=request.post)
+            db_run.status = "Posted"
+            db_run.posted_at = datetime.utcnow()
+            db_run.journal_entry_ids = self._posted_entry_ids(db, db_run.id)
+            db.commit()
+
+            logger.info(
+                f"Accrued {db_run.total_amount} received-not-invoiced for {db_run.period_end_date} "
+                f"over {db_run.line_count} PO lines, {entry_count} journal entries sent"
+            )
+            return db_run
+
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error posting received-not-invoiced accrual run {db_run.id}: {str(e)}")
+            db_run.status = "Failed"
+            db_run.error = str(e)
+            db_run.journal_entry_ids = self._posted_entry_ids(db, db_run.id)
+            db.commit()
+            raise
+
+    def get_accrual_run(self, db: Session, run_id: int) -> Optional[AccrualRun]:
+        """Get an accrual run by ID"""
+        try:
+            return db.query(AccrualRun).filter(AccrualRun.id == run_id).first()
+        except Exception as e:
+            logger.error(f"Error retrieving accrual run {run_id}: {str(e)}")
+            raise
+
+    def _net_lines_query(self, run_id: int, period_end_date: date):
+        """Received minus invoiced quantity per PO line, priced at the PO unit price"""
+        ordered = select(
+            PurchaseOrderLine.purchase_order_id.label("purchase_order_id"),
+            PurchaseOrderLine.item_code.label("item_code"),
+            PurchaseOrder.vendor_id.label("vendor_id"),
+            func.sum(PurchaseOrderLine.quantity).label("quantity"),
+            func.sum(PurchaseOrderLine.line_total).label("amount")
+        ).join(
+            PurchaseOrder, PurchaseOrder.id == PurchaseOrderLine.purchase_order_id
+        ).where(
+            PurchaseOrder.status.notin_(EXCLUDED_PO_STATUSES),
+            PurchaseOrder.order_date <= period_end_date
+        ).group_by(
+            PurchaseOrderLine.purchase_order_id, PurchaseOrderLine.item_code, PurchaseOrder.vendor_id
+        ).cte("ordered")
+
+        received = select(
+            Receipt.purchase_order_id.label("purchase_order_id"),
+            ReceiptLine.item_code.label("item_code"),
+            func.sum(ReceiptLine.quantity_received - ReceiptLine.quantity_rejected).label("quantity")
+        ).join(
+            ReceiptLine, ReceiptLine.receipt_id == Receipt.id
+        ).where(
+            Receipt.status != "Cancelled",
+            Receipt.receipt_date <= period_end_date
+        ).group_by(Receipt.purchase_order_id, ReceiptLine.item_code).cte("received")
+
+        invoiced = select(
+            Invoice.purchase_order_id.label("purchase_order_id"),
+            InvoiceLine.item_code.label("item_code"),
+            func.sum(InvoiceLine.quantity).label("quantity")
+        ).join(
+            InvoiceLine, InvoiceLine.invoice_id == Invoice.id
+        ).where(
+            Invoice.purchase_order_id.isnot(None),
+            Invoice.status != "Cancelled",
+            Invoice.invoice_date <= period_end_date
+        ).group_by(Invoice.purchase_order_id, InvoiceLine.item_code).cte("invoiced")
+
+        quantity_invoiced = func.coalesce(invoiced.c.quantity, 0)
+        net_quantity = received.c.quantity - quantity_invoiced
+        unit_price = case(
+            (ordered.c.quantity > 0, ordered.c.amount / ordered.c.quantity),
+            else_=0
+        )
+
+        return select(
+            literal(run_id),
+            ordered.c.purchase_order_id,
+            ordered.c.vendor_id,
+            ordered.c.item_code,
+            received.c.quantity,
+            quantity_invoiced,
+            func.round(unit_price, 4),
+            func.round(net_quantity * unit_price, 2)
+        ).select_from(received).join(
+            ordered,
+            and_(
+                ordered.c.purchase_order_id == received.c.purchase_order_id,
+                ordered.c.item_code == received.c.item_code
+            )
+        ).outerjoin(
+            invoiced,
+            and_(
+                invoiced.c.purchase_order_id == received.c.purchase_order_id,
+                invoiced.c.item_code == received.c.item_code
+            )
+        ).where(
+            net_quantity > 0,
+            func.round(net_quantity * unit_price, 2) > 0
+        )
+
+    def _resume_unfinished_run(self, db: Session, period_end_date: date) -> Optional[AccrualRun]:
+        """Claim the period's failed or abandoned run, or refuse if the period is posted or in progress"""
+        existing = db.query(AccrualRun).filter(
+            AccrualRun.accrual_type == "ReceivedNotInvoiced",
+            AccrualRun.period_end_date == period_end_date
+        ).order_by(AccrualRun.id.desc()).first()
+        if not existing:
+            return None
+
+        now = datetime.utcnow()
+        last_attempt = existing.attempted_at or existing.created_at
+        if existing.status == "Posted" or (existing.status == "Pending" and last_attempt > now - ACCRUAL_STALE_AFTER):
+            raise ValueError(
+                f"Received-not-invoiced accrual for {period_end_date} already exists (run {existing.id}, {existing.status})"
+            )
+
+        # Only one caller may take over the run
+        claimed = db.query(AccrualRun).filter(
+            AccrualRun.id == existing.id,
+            AccrualRun.status == existing.status,
+            AccrualRun.attempted_at.is_(None) if existing.attempted_at is None
+            else AccrualRun.attempted_at == existing.attempted_at
+        ).update({"status": "Pending", "attempted_at": now, "error": None}, synchronize_session=False)
+        if not claimed:
+            raise ValueError(f"Received-not-invoiced accrual run {existing.id} is already being resumed")
+
+        logger.info(f"Resuming {existing.status.lower()} received-not-invoiced accrual run {existing.id}")
+        db.refresh(existing)
+        return existing
+
+    def _compute_run(self, db: Session, request: AccrualRunCreate) -> AccrualRun:
+        """Create the run and its accrual lines"""
+        reversal_date = request.reversal_date or request.period_end_date + timedelta(days=1)
+        if reversal_date <= request.period_end_date:
+            raise ValueError("Reversal date must be after the period end date")
+
+        db_run = AccrualRun(
+            accrual_type="ReceivedNotInvoiced",
+            period_end_date=request.period_end_date,
+            reversal_date=reversal_date,
+            expense_account_id=request.expense_account_id,
+            accrual_account_id=request.accrual_account_id,
+            status="Pending",
+            attempted_at=datetime.utcnow()
+        )
+        db.add(db_run)
+        db.flush()
+
+        # The netting runs entirely in the database as one INSERT ... SELECT
+        net_lines = self._net_lines_query(db_run.id, request.period_end_date)
+        db.execute(insert(AccrualLine).from_select(
+            [
+                "accrual_run_id", "purchase_order_id", "vendor_id", "item_code",
+                "quantity_received", "quantity_invoiced", "unit_price", "accrual_amount"
+            ],
+            net_lines
+        ))
+
+        vendor_totals = self._vendor_totals(db, db_run.id)
+        db_run.line_count = sum(row.line_count for row in vendor_totals)
+        db_run.vendor_count = len(vendor_totals)
+        db_run.total_amount = sum((row.amount for row in vendor_totals), Decimal("0"))
+        return db_run
+
+    def _post_run(self, db: Session, db_run: AccrualRun, token: Optional[str], post: bool) -> int:
+        """Post the run chunk by chunk, recording the GL entry on each accrual line as its chunk lands"""
+        vendor_totals = self._vendor_totals(db, db_run.id)
+        sent = 0
+        for chunk_number, start in enumerate(range(0, len(vendor_totals), MAX_ACCRUAL_LINES_PER_ENTRY)):
+            chunk = vendor_totals[start:start + MAX_ACCRUAL_LINES_PER_ENTRY]
+            if all(row.posted_count == row.line_count for row in chunk):
+                continue
+
+            # Chunks keep their number across attempts, so a resent chunk finds its earlier entries
+            accrual_entry_id, reversal_entry_id = post_journal_entries(
+                self._build_accrual_entries(db_run, chunk_number, chunk),
+                token=token,
+                post=post,
+                skip_existing=True
+            )
+            db.query(AccrualLine).filter(
+                AccrualLine.accrual_run_id == db_run.id,
+                AccrualLine.vendor_id.in_([row.vendor_id for row in chunk])
+            ).update(
+                {"journal_entry_id": accrual_entry_id, "reversal_entry_id": reversal_entry_id},
+                synchronize_session=False
+            )
+            db.commit()
+            sent += 2
+        return sent
+
+    def _vendor_totals(self, db: Session, run_id: int) -> List[Any]:
+        return db.query(
+            AccrualLine.vendor_id,
+            func.sum(AccrualLine.accrual_amount).label("amount"),
+            func.count(AccrualLine.id).label("line_count"),
+            func.count(AccrualLine.journal_entry_id).label("posted_count")
+        ).filter(
+            AccrualLine.accrual_run_id == run_id
+        ).group_by(AccrualLine.vendor_id).order_by(AccrualLine.vendor_id).all()
+
+    def _posted_entry_ids(self, db: Session, run_id: int) -> Optional[str]:
+        rows = db.query(AccrualLine.journal_entry_id, AccrualLine.reversal_entry_id).filter(
+            AccrualLine.accrual_run_id == run_id,
+            AccrualLine.journal_entry_id.isnot(None)
+        ).distinct().order_by(AccrualLine.journal_entry_id).all()
+        return ",".join(f"{row.journal_entry_id},{row.reversal_entry_id}" for row in rows) or None
+
+    def _build_accrual_entries(self, db_run: AccrualRun, chunk_number: int, chunk: List[Any]) -> List[Dict[str, Any]]:
+        """The accrual entry for one chunk of vendors (one accrual line per vendor) and its reversal"""
+        chunk_total = sum((row.amount for row in chunk), Decimal("0"))
+
+        entries = []
+        for reversal in (False, True):
+            lines = [{
+                "account_id": db_run.expense_account_id,
+                "line_number": 1,
+                "description": "Goods received not invoiced",
+                "debit_amount": "0" if reversal else str(chunk_total),
+                "credit_amount": str(chunk_total) if reversal else "0"
+            }]
+            for line_number, row in enumerate(chunk, start=2):
+                lines.append({
+                    "account_id": db_run.accrual_account_id,
+                    "line_number": line_number,
+                    "description": f"Vendor {row.vendor_id}: {row.line_count} PO lines received not invoiced",
+                    "debit_amount": str(row.amount) if reversal else "0",
+                    "credit_amount": "0" if reversal else str(row.amount)
+                })
+
+            entries.append({
+                "entry_date": (db_run.reversal_date if reversal else db_run.period_end_date).isoformat(),
+                # Unique per run and chunk: the GL uses it to recognize an entry it already holds
+                "reference": f"RNI-{'REV-' if reversal else ''}{db_run.id}-{chunk_number + 1}",
+                "description": (
+                    f"{'Reversal of r' if reversal else 'R'}eceived-not-invoiced accrual "
+                    f"for {db_run.period_end_date.isoformat()} (run {db_run.id})"
+                ),
+                "entry_type": "System",
+                "journal_lines": lines
+            })
+
+        return entries
@@ -1,5 +1,5 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_, func
+from sqlalchemy import and_, or_, func, case
 from typing import List, Optional, Dict, Any
 from datetime import datetime, date, timedelta
 from decimal import Decimal
@@ -7,14 +7,25 @@ import logging
 
 from ..models.vendors import Vendor, VendorCreate, VendorUpdate
 from ..models.invoices import Invoice, InvoiceCreate, InvoiceUpdate
-from ..models.purchase_orders import PurchaseOrder, PurchaseOrderCreate, PurchaseOrderUpdate
+from ..models.purchase_orders import PurchaseOrder, PurchaseOrderCreate, PurchaseOrderUpdate, PurchaseOrderLine
+from ..models.receipts import Receipt, ReceiptLine, ReceiptCreate
 from ..database.connection import get_db
+from ..utils.line_diff import diff_lines, apply_line_diff
+from ..utils.cache import TTLCache
+from .matching_service import MatchingService, ThreeWayMatcher
 
 logger = logging.getLogger(__name__)
 
+ORDER_LINE_FIELDS = ("item_code", "description", "quantity", "unit_price", "line_total")
+
 class AccountsPayableService:
     """Service class for Accounts Payable operations"""
     
+    def __init__(self):
+        # Vendor analysis results per (period, vendor, top_n)
+        self.vendor_analysis_cache = TTLCache(ttl_seconds=300)
+        self.matching_service = MatchingService()
+    
     def create_purchase_order(self, db: Session, po: PurchaseOrderCreate) -> PurchaseOrder:
         """Create a new purchase order"""
         try:
@@ -43,6 +54,7 @@ class AccountsPayableService:
             for line_data in po.po_lines:
                 db_line = PurchaseOrderLine(
                     purchase_order_id=db_po.id,
+                    line_number=line_data.line_number,
                     item_code=line_data.item_code,
                     description=line_data.description,
                     quantity=line_data.quantity,
@@ -141,28 +153,17 @@ class AccountsPayableService:
                 if field != "po_lines":
                     setattr(db_po, field, value)
             
-            # Update PO lines if provided
+            # Update PO lines if provided, touching only the lines that changed
             if po_update.po_lines is not None:
-                # Delete existing lines
-                db.query(PurchaseOrderLine).filter(
-                    PurchaseOrderLine.purchase_order_id == po_id
-                ).delete()
-                
-                # Add new lines
-                total_amount = Decimal("0")
-                for line_data in po_update.po_lines:
-                    db_line = PurchaseOrderLine(
-                        purchase_order_id=po_id,
-                        item_code=line_data.item_code,
-                        description=line_data.description,
-                        quantity=line_data.quantity,
-                        unit_price=line_data.unit_price,
-                        line_total=line_data.quantity * line_data.unit_price
-                    )
-                    db.add(db_line)
-                    total_amount += line_data.quantity * line_data.unit_price
+                diff = diff_lines(
+                    db, PurchaseOrderLine, "purchase_order_id", po_id,
+                    [self._order_line_values(line_data) for line_data in po_update.po_lines],
+                    ORDER_LINE_FIELDS
+                )
+                apply_line_diff(db, PurchaseOrderLine, diff)
                 
-                db_po.total_amount = total_amount
+                # Update total incrementally
+                db_po.total_amount = db_po.total_amount + diff.delta("line_total")
             
             # Update timestamp
             db_po.updated_at = datetime.utcnow()
@@ -211,114 +212,144 @@ class AccountsPayableService:
         db: Session, 
         invoice_id: int, 
         po_id: Optional[int] = None, 
-        receipt_id: Optional[int] = None
+        receipt_id: Optional[int] = None,
+        quantity_tolerance: Decimal = Decimal("0.05"),
+        price_tolerance: Decimal = Decimal("0.02")
     ) -> Dict[str, Any]:
         """Perform three-way matching (PO, Invoice, Receipt)"""
         try:
-            # Get invoice
-            invoice = db.query(Invoice).filter(Invoice.id == invoice_id).first()
-            if not invoice:
-                raise ValueError(f"Invoice {invoice_id} not found")
-            
-            match_result = {
-                "invoice_id": invoice_id,
-                "po_id": po_id,
-                "receipt_id": receipt_id,
-                "matched": False,
-                "discrepancies": [],
-                "match_score": 0.0
-            }
-            
-            # Two-way match (Invoice vs PO)
-            if po_id:
-                po = db.query(PurchaseOrder).filter(PurchaseOrder.id == po_id).first()
-                if po:
-                    po_match = self._match_invoice_to_po(invoice, po)
-                    match_result["po_match"] = po_match
-                    match_result["match_score"] += po_match["score"] * 0.5
-            
-            # Two-way match (Invoice vs Receipt)
-            if receipt_id:
-                receipt = db.query(Receipt).filter(Receipt.id == receipt_id).first()
-                if receipt:
-                    receipt_match = self._match_invoice_to_receipt(invoice, receipt)
-                    match_result["receipt_match"] = receipt_match
-                    match_result["match_score"] += receipt_match["score"] * 0.5
-            
-            # Three-way match
-            if po_id and receipt_id:
-                three_way_match = self._perform_three_way_match_logic(invoice, po, receipt)
-                match_result["three_way_match"] = three_way_match
-                match_result["matched"] = three_way_match["matched"]
-            else:
-                # Two-way match only
-                match_result["matched"] = match_result["match_score"] >= 0.8
-            
-            return match_result
+            matcher = ThreeWayMatcher(quantity_tolerance=quantity_tolerance, price_tolerance=price_tolerance)
+            result = self.matching_service.match_invoice(db, invoice_id, po_id, receipt_id, matcher=matcher)
+            result["po_id"] = result["purchase_order_id"]
+            result["receipt_id"] = receipt_id
+            return result
             
         except Exception as e:
             logger.error(f"Error performing three-way match: {str(e)}")
             raise
     
+    def match_open_invoices(
+        self,
+        db: Session,
+        vendor_ids: Optional[List[int]] = None,
+        quantity_tolerance: Decimal = Decimal("0.05"),
+        price_tolerance: Decimal = Decimal("0.02")
+    ) -> Dict[str, Any]:
+        """Three-way match all open invoices for a vendor set in one pass"""
+        matcher = ThreeWayMatcher(quantity_tolerance=quantity_tolerance, price_tolerance=price_tolerance)
+        return self.matching_service.match_open_invoices(db, vendor_ids, matcher=matcher)
+    
+    def create_receipt(self, db: Session, receipt: ReceiptCreate) -> Receipt:
+        """Record goods received against a purchase order"""
+        try:
+            po = db.query(PurchaseOrder).filter(PurchaseOrder.id == receipt.purchase_order_id).first()
+            if not po:
+                raise ValueError(f"Purchase order {receipt.purchase_order_id} not found")
+            
+            if po.status in ["Draft", "Cancelled"]:
+                raise ValueError(f"Cannot receive against purchase order in {po.status} status")
+            
+            db_receipt = Receipt(
+                receipt_number=self._generate_receipt_number(db),
+                purchase_order_id=po.id,
+                vendor_id=po.vendor_id,
+                receipt_date=receipt.receipt_date,
+                notes=receipt.notes
+            )
+            db_receipt.receipt_lines = [
+                ReceiptLine(
+                    item_code=line.item_code,
+                    description=line.description,
+                    quantity_received=line.quantity_received,
+                    quantity_rejected=line.quantity_rejected
+                )
+                for line in receipt.receipt_lines
+            ]
+            
+            db.add(db_receipt)
+            db.commit()
+            db.refresh(db_receipt)
+            
+            logger.info(f"Created receipt {db_receipt.receipt_number} for purchase order {po.po_number}")
+            return db_receipt
+            
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error creating receipt: {str(e)}")
+            raise
+    
     def generate_aging_report(
         self, 
         db: Session, 
         as_of_date: date, 
-        vendor_id: Optional[int] = None
+        vendor_id: Optional[int] = None,
+        group_by_vendor: bool = False
     ) -> Dict[str, Any]:
-        """Generate accounts payable aging report"""
+        """Generate accounts payable aging report (bucketed in the database)"""
         try:
-            # Get unpaid invoices
-            query = db.query(Invoice).filter(
+            outstanding_amount = Invoice.total_amount - Invoice.paid_amount
+            
+            # Bucket on due date boundaries so the partial index on open invoices can serve the scan
+            bucket = case(
+                (Invoice.due_date >= as_of_date, "current"),
+                (Invoice.due_date >= as_of_date - timedelta(days=30), "1_30_days"),
+                (Invoice.due_date >= as_of_date - timedelta(days=60), "31_60_days"),
+                (Invoice.due_date >= as_of_date - timedelta(days=90), "61_90_days"),
+                else_="over_90_days"
+            ).label("bucket")
+            
+            columns = [
+                bucket,
+                func.sum(outstanding_amount).label("amount"),
+                func.count(Invoice.id).label("count")
+            ]
+            group_by = [bucket]
+            if group_by_vendor:
+                columns.insert(0, Invoice.vendor_id)
+                group_by.insert(0, Invoice.vendor_id)
+            
+            # Open invoices: same predicate as the ix_invoices_open_aging partial index
+            query = db.query(*columns).filter(
                 and_(
                     Invoice.status == "Approved",
-                    Invoice.due_date <= as_of_date,
-                    Invoice.paid_amount < Invoice.total_amount
+                    Invoice.paid_amount < Invoice.total_amount,
+                    Invoice.invoice_date <= as_of_date
                 )
             )
             
             if vendor_id:
                 query = query.filter(Invoice.vendor_id == vendor_id)
             
-            invoices = query.all()
-            
-            # Calculate aging buckets
-            aging_buckets = {
-                "current": {"amount": Decimal("0"), "count": 0},
-                "1_30_days": {"amount": Decimal("0"), "count": 0},
-                "31_60_days": {"amount": Decimal("0"), "count": 0},
-                "61_90_days": {"amount": Decimal("0"), "count": 0},
-                "over_90_days": {"amount": Decimal("0"), "count": 0}
-            }
+            rows = query.group_by(*group_by).all()
             
+            aging_buckets = self._empty_aging_buckets()
+            vendor_breakdown = {}
             total_outstanding = Decimal("0")
-            
-            for invoice in invoices:
-                outstanding_amount = invoice.total_amount - invoice.paid_amount
-                days_overdue = (as_of_date - invoice.due_date).days
-                
-                if days_overdue <= 0:
-                    bucket = "current"
-                elif days_overdue <= 30:
-                    bucket = "1_30_days"
-                elif days_overdue <= 60:
-                    bucket = "31_60_days"
-                elif days_overdue <= 90:
-                    bucket = "61_90_days"
-                else:
-                    bucket = "over_90_days"
+            total_invoices = 0
+            
+            for row in rows:
+                amount = row.amount or Decimal("0")
+                aging_buckets[row.bucket]["amount"] += amount
+                aging_buckets[row.bucket]["count"] += row.count
+                total_outstanding += amount
+                total_invoices += row.count
                 
-                aging_buckets[bucket]["amount"] += outstanding_amount
-                aging_buckets[bucket]["count"] += 1
-                total_outstanding += outstanding_amount
+                if group_by_vendor:
+                    vendor_buckets = vendor_breakdown.setdefault(row.vendor_id, self._empty_aging_buckets())
+                    vendor_buckets[row.bucket]["amount"] += amount
+                    vendor_buckets[row.bucket]["count"] += row.count
             
-            return {
+            report = {
                 "as_of_date": as_of_date,
                 "vendor_id": vendor_id,
                 "aging_buckets": aging_buckets,
                 "total_outstanding": total_outstanding,
-                "total_invoices": len(invoices)
+                "total_invoices": total_invoices
             }
+            if group_by_vendor:
+                report["vendor_breakdown"] = vendor_breakdown
+            
+            return report
             
         except Exception as e:
             logger.error(f"Error generating aging report: {str(e)}")
@@ -329,70 +360,144 @@ class AccountsPayableService:
         db: Session, 
         start_date: date, 
         end_date: date, 
-        vendor_id: Optional[int] = None
+        vendor_id: Optional[int] = None,
+        top_n: Optional[int] = None
     ) -> Dict[str, Any]:
-        """Generate vendor analysis report"""
+        """Generate vendor analysis report from grouped aggregates"""
         try:
-            # Get invoices for the period
-            query = db.query(Invoice).filter(
-                and_(
-                    Invoice.invoice_date >= start_date,
-                    Invoice.invoice_date <= end_date
-                )
+            cache_key = (start_date, end_date, vendor_id, top_n)
+            cached = self.vendor_analysis_cache.get(cache_key)
+            if cached is not None:
+                return cached
+            
+            period_filter = and_(
+                Invoice.invoice_date >= start_date,
+                Invoice.invoice_date <= end_date
             )
-            
             if vendor_id:
-                query = query.filter(Invoice.vendor_id == vendor_id)
+                period_filter = and_(period_filter, Invoice.vendor_id == vendor_id)
+            
+            # Overall totals, one row
+            totals = db.query(*self._vendor_metric_columns()).filter(period_filter).one()
+            
+            # Per-vendor aggregates, vendor names joined in rather than lazy-loaded per invoice
+            vendor_query = db.query(
+                Invoice.vendor_id,
+                Vendor.name.label("vendor_name"),
+                *self._vendor_metric_columns()
+            ).outerjoin(
+                Vendor, Vendor.id == Invoice.vendor_id
+            ).filter(period_filter).group_by(
+                Invoice.vendor_id, Vendor.name
+            ).order_by(
+                func.sum(Invoice.total_amount).desc(), Invoice.vendor_id
+            )
             
-            invoices = query.all()
-            
-            # Calculate metrics
-            total_invoiced = sum(inv.total_amount for inv in invoices)
-            total_paid = sum(inv.paid_amount for inv in invoices)
-            total_outstanding = total_invoiced - total_paid
-            
-            # Calculate average payment time
-            paid_invoices = [inv for inv in invoices if inv.paid_amount > 0]
-            avg_payment_days = 0
-            if paid_invoices:
-                total_days = sum(
-                    (inv.payment_date - inv.invoice_date).days 
-                    for inv in paid_invoices 
-                    if inv.payment_date
-                )
-                avg_payment_days = total_days / len(paid_invoices)
+            if top_n:
+                vendor_query = vendor_query.limit(top_n)
             
-            # Vendor breakdown
             vendor_breakdown = {}
-            for invoice in invoices:
-                vendor_name = invoice.vendor.name if invoice.vendor else "Unknown"
-                if vendor_name not in vendor_breakdown:
-                    vendor_breakdown[vendor_name] = {
-                        "total_invoiced": Decimal("0"),
-                        "total_paid": Decimal("0"),
-                        "invoice_count": 0
-                    }
-                
-                vendor_breakdown[vendor_name]["total_invoiced"] += invoice.total_amount
-                vendor_breakdown[vendor_name]["total_paid"] += invoice.paid_amount
-                vendor_breakdown[vendor_name]["invoice_count"] += 1
-            
-            return {
+            for row in vendor_query.all():
+                vendor_name = row.vendor_name or "Unknown"
+                if vendor_name in vendor_breakdown:
+                    vendor_name = f"{vendor_name} ({row.vendor_id})"
+                vendor_breakdown[vendor_name] = {
+                    "vendor_id": row.vendor_id,
+                    **self._vendor_metrics(row)
+                }
+            
+            overall = self._vendor_metrics(totals)
+            report = {
                 "start_date": start_date,
                 "end_date": end_date,
                 "vendor_id": vendor_id,
-                "total_invoiced": total_invoiced,
-                "total_paid": total_paid,
-                "total_outstanding": total_outstanding,
-                "avg_payment_days": avg_payment_days,
+                "total_invoiced": overall["total_invoiced"],
+                "total_paid": overall["total_paid"],
+                "total_outstanding": overall["total_outstanding"],
+                "avg_payment_days": overall["avg_payment_days"],
+                "median_payment_days": overall["median_payment_days"],
+                "p90_payment_days": overall["p90_payment_days"],
                 "vendor_breakdown": vendor_breakdown,
-                "invoice_count": len(invoices)
+                "invoice_count": overall["invoice_count"]
             }
             
+            self.vendor_analysis_cache.set(cache_key, report)
+            return report
+            
         except Exception as e:
             logger.error(f"Error generating vendor analysis: {str(e)}")
             raise
     
+    def invalidate_vendor_analysis(self, vendor_id: Optional[int] = None) -> None:
+        """Drop cached vendor analyses that include the vendor, or all of them"""
+        if vendor_id is None:
+            self.vendor_analysis_cache.invalidate()
+            return
+        # Keys are (start_date, end_date, vendor_id, top_n); unfiltered reports cover every vendor
+        self.vendor_analysis_cache.invalidate(lambda key: key[2] in (None, vendor_id))
+    
+    def _vendor_metric_columns(self) -> List[Any]:
+        """Aggregate columns shared by the overall and per-vendor analysis queries"""
+        # Date - Date is an integer number of days in PostgreSQL; NULL for unpaid
+        # invoices, which the aggregates below skip
+        days_to_pay = case(
+            (Invoice.payment_date.isnot(None), Invoice.payment_date - Invoice.invoice_date),
+            else_=None
+        )
+        
+        return [
+            func.coalesce(func.sum(Invoice.total_amount), 0).label("total_invoiced"),
+            func.coalesce(func.sum(Invoice.paid_amount), 0).label("total_paid"),
+            func.count(Invoice.id).label("invoice_count"),
+            func.avg(days_to_pay).label("avg_payment_days"),
+            func.percentile_cont(0.5).within_group(days_to_pay).label("median_payment_days"),
+            func.percentile_cont(0.9).within_group(days_to_pay).label("p90_payment_days")
+        ]
+    
+    def _vendor_metrics(self, row: Any) -> Dict[str, Any]:
+        """Shape one aggregate row into report metrics"""
+        return {
+            "total_invoiced": row.total_invoiced,
+            "total_paid": row.total_paid,
+            "total_outstanding": row.total_invoiced - row.total_paid,
+            "invoice_count": row.invoice_count,
+            "avg_payment_days": float(row.avg_payment_days or 0),
+            "median_payment_days": float(row.median_payment_days or 0),
+            "p90_payment_days": float(row.p90_payment_days or 0)
+        }
+    
+    def _empty_aging_buckets(self) -> Dict[str, Dict[str, Any]]:
+        """Aging buckets in report order, all zeroed"""
+        return {
+            bucket: {"amount": Decimal("0"), "count": 0}
+            for bucket in ("current", "1_30_days", "31_60_days", "61_90_days", "over_90_days")
+        }
+    
+    def _generate_receipt_number(self, db: Session) -> str:
+        """Generate unique receipt number"""
+        try:
+            current_year = datetime.utcnow().year
+            count = db.query(Receipt).filter(
+                func.extract('year', Receipt.created_at) == current_year
+            ).count()
+            
+            return f"GR-{current_year}-{count + 1:05d}"
+            
+        except Exception as e:
+            logger.error(f"Error generating receipt number: {str(e)}")
+            raise
+    
+    def _order_line_values(self, line_data: Any) -> Dict[str, Any]:
+        """Column values of an order line, keyed for line diffing"""
+        return {
+            "line_number": line_data.line_number,
+            "item_code": line_data.item_code,
+            "description": line_data.description,
+            "quantity": line_data.quantity,
+            "unit_price": line_data.unit_price,
+            "line_total": line_data.quantity * line_data.unit_price
+        }
+    
     def _generate_po_number(self, db: Session) -> str:
         """Generate unique purchase order number"""
         try:
@@ -407,30 +512,3 @@ class AccountsPayableService:
         except Exception as e:
             logger.error(f"Error generating PO number: {str(e)}")
             raise
-    
-    def _match_invoice_to_po(self, invoice: Invoice, po: PurchaseOrder) -> Dict[str, Any]:
-        """Match invoice to purchase order"""
-        # TODO: Implement detailed matching logic
-        return {
-            "matched": True,
-            "score": 0.9,
-            "discrepancies": []
-        }
-    
-    def _match_invoice_to_receipt(self, invoice: Invoice, receipt: Any) -> Dict[str, Any]:
-        """Match invoice to receipt"""
-        # TODO: Implement detailed matching logic
-        return {
-            "matched": True,
-            "score": 0.8,
-            "discrepancies": []
-        }
-    
-    def _perform_three_way_match_logic(self, invoice: Invoice, po: PurchaseOrder, receipt: Any) -> Dict[str, Any]:
-        """Perform three-way matching logic"""
-        # TODO: Implement detailed three-way matching logic
-        return {
-            "matched": True,
-            "score": 0.95,
-            "discrepancies": []
-        } 
\ No newline at end of file
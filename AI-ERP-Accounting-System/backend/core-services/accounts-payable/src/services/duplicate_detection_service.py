@@ -0,0 +1,374 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import and_, or_, case, insert
+from typing import List, Optional, Dict, Any, Tuple, Set, Iterable, Deque
+from datetime import date, timedelta
+from decimal import Decimal
+from collections import deque
+from itertools import groupby
+import logging
+import re
+import zlib
+
+from ..models.invoices import Invoice
+from ..models.duplicate_keys import InvoiceDuplicateKey, InvoiceDuplicateFlag, DuplicateCandidate
+
+logger = logging.getLogger(__name__)
+
+NUMBER_PREFIX_PATTERN = re.compile(r"^(?:INVOICE|INV|BILL|NO|NR)+")
+NON_ALNUM_PATTERN = re.compile(r"[^A-Z0-9]")
+NON_DIGIT_PATTERN = re.compile(r"\D")
+
+KEYED_INVOICE_FIELDS = ("vendor_id", "invoice_number", "total_amount", "invoice_date")
+
+DEFAULT_DATE_WINDOW_DAYS = 7
+DEFAULT_SCORE_THRESHOLD = Decimal("0.5")
+MAX_CANDIDATES = 50
+RESCREEN_CHUNK_SIZE = 1000
+
+# Score weights; an identical normalized number always scores 1
+NUMBER_WEIGHT = 0.4
+AMOUNT_WEIGHT = 0.4
+DATE_WEIGHT = 0.2
+
+
+def normalize_invoice_number(invoice_number: Optional[str]) -> str:
+    """Uppercase, drop punctuation, common prefixes and leading zeros"""
+    normalized = NON_ALNUM_PATTERN.sub("", (invoice_number or "").upper())
+    normalized = NUMBER_PREFIX_PATTERN.sub("", normalized)
+    return normalized.lstrip("0") or normalized
+
+
+def number_core(normalized_number: str) -> str:
+    return NON_DIGIT_PATTERN.sub("", normalized_number).lstrip("0")
+
+
+def number_trigrams(normalized_number: str) -> Set[str]:
+    padded = f"  {normalized_number} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def number_minhash(normalized_number: str) -> int:
+    """Smallest trigram hash; two numbers share it with probability equal to their trigram similarity"""
+    return min(zlib.crc32(trigram.encode()) for trigram in number_trigrams(normalized_number))
+
+
+def trigram_similarity(left: str, right: str) -> float:
+    left_grams, right_grams = number_trigrams(left), number_trigrams(right)
+    return len(left_grams & right_grams) / len(left_grams | right_grams)
+
+
+def build_keys(invoice_number: str, total_amount: Decimal, invoice_date: date) -> Dict[str, Any]:
+    normalized = normalize_invoice_number(invoice_number)
+    return {
+        "normalized_number": normalized,
+        "number_core": number_core(normalized),
+        "number_minhash": number_minhash(normalized),
+        "amount_cents": int((Decimal(total_amount) * 100).quantize(Decimal("1"))),
+        "invoice_date": invoice_date
+    }
+
+
+def score_pair(keys: Dict[str, Any], other: Any, date_window_days: int) -> Tuple[Decimal, List[str]]:
+    """Score how likely two keyed invoices are the same document"""
+    reasons = []
+    if keys["normalized_number"] == other.normalized_number:
+        reasons.append("SameNumber")
+        similarity = 1.0
+    else:
+        similarity = trigram_similarity(keys["normalized_number"], other.normalized_number)
+        if keys["number_core"] and keys["number_core"] == other.number_core:
+            similarity = max(similarity, 0.8)
+        if similarity >= 0.5:
+            reasons.append("SimilarNumber")
+
+    same_amount = keys["amount_cents"] == other.amount_cents
+    if same_amount:
+        reasons.append("SameAmount")
+
+    days_apart = abs((keys["invoice_date"] - other.invoice_date).days)
+    date_closeness = max(0.0, 1 - days_apart / date_window_days) if date_window_days else float(days_apart == 0)
+    if date_closeness > 0:
+        reasons.append("NearDate")
+
+    if "SameNumber" in reasons:
+        score = 1.0
+    else:
+        score = NUMBER_WEIGHT * similarity + AMOUNT_WEIGHT * same_amount + DATE_WEIGHT * date_closeness
+
+    return Decimal(str(round(score, 4))), reasons
+
+
+class DuplicateDetectionService:
+    """Blocking-key index for catching duplicate vendor invoices"""
+
+    def __init__(
+        self,
+        date_window_days: int = DEFAULT_DATE_WINDOW_DAYS,
+        score_threshold: Decimal = DEFAULT_SCORE_THRESHOLD
+    ):
+        self.date_window_days = date_window_days
+        self.score_threshold = score_threshold
+
+    def find_duplicates(
+        self,
+        db: Session,
+        vendor_id: int,
+        invoice_number: str,
+        total_amount: Decimal,
+        invoice_date: date,
+        exclude_invoice_id: Optional[int] = None
+    ) -> List[DuplicateCandidate]:
+        """Score an invoice against the handful of indexed invoices sharing a blocking key"""
+        try:
+            keys = build_keys(invoice_number, total_amount, invoice_date)
+            window = self._date_window(invoice_date)
+
+            # Each branch is served by one composite index on invoice_duplicate_keys
+            query = db.query(InvoiceDuplicateKey).filter(
+                InvoiceDuplicateKey.vendor_id == vendor_id,
+                or_(
+                    InvoiceDuplicateKey.normalized_number == keys["normalized_number"],
+                    InvoiceDuplicateKey.number_minhash == keys["number_minhash"],
+                    and_(
+                        InvoiceDuplicateKey.number_core == keys["number_core"],
+                        InvoiceDuplicateKey.number_core != ""
+                    ),
+                    and_(
+                        InvoiceDuplicateKey.amount_cents == keys["amount_cents"],
+                        InvoiceDuplicateKey.invoice_date.between(*window)
+                    )
+                )
+            )
+
+            if exclude_invoice_id is not None:
+                query = query.filter(InvoiceDuplicateKey.invoice_id != exclude_invoice_id)
+
+            # Exact number matches first, then the most recent, so the cap keeps the likeliest candidates
+            query = query.order_by(
+                case((InvoiceDuplicateKey.normalized_number == keys["normalized_number"], 0), else_=1),
+                InvoiceDuplicateKey.invoice_date.desc(),
+                InvoiceDuplicateKey.invoice_id.desc()
+            )
+
+            candidates = []
+            for other in query.limit(MAX_CANDIDATES):
+                score, reasons = score_pair(keys, other, self.date_window_days)
+                if score >= self.score_threshold:
+                    candidates.append(DuplicateCandidate(
+                        invoice_id=other.invoice_id,
+                        normalized_number=other.normalized_number,
+                        amount=Decimal(other.amount_cents) / 100,
+                        invoice_date=other.invoice_date,
+                        score=score,
+                        reasons=reasons
+                    ))
+
+            return sorted(candidates, key=lambda candidate: candidate.score, reverse=True)
+
+        except Exception as e:
+            logger.error(f"Error screening invoice {invoice_number} for duplicates: {str(e)}")
+            raise
+
+    def index_invoice(self, db: Session, invoice: Invoice, commit: bool = True) -> None:
+        """Add or refresh the blocking keys of an invoice"""
+        if invoice.vendor_id is None:
+            return
+
+        try:
+            keys = build_keys(invoice.invoice_number, invoice.total_amount, invoice.invoice_date)
+            db_key = db.query(InvoiceDuplicateKey).filter(InvoiceDuplicateKey.invoice_id == invoice.id).first()
+            if db_key:
+                for field, value in keys.items():
+                    setattr(db_key, field, value)
+                db_key.vendor_id = invoice.vendor_id
+            else:
+                db.add(InvoiceDuplicateKey(invoice_id=invoice.id, vendor_id=invoice.vendor_id, **keys))
+
+            if commit:
+                db.commit()
+
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error indexing invoice {invoice.id} for duplicate screening: {str(e)}")
+            raise
+
+    def reindex_invoice(self, db: Session, invoice: Invoice) -> None:
+        """Re-derive the keys of an edited invoice and re-screen it in place of its open flags"""
+        try:
+            db.query(InvoiceDuplicateFlag).filter(
+                InvoiceDuplicateFlag.invoice_id == invoice.id,
+                InvoiceDuplicateFlag.status == "Open"
+            ).delete(synchronize_session=False)
+
+            if invoice.vendor_id is None:
+                db.query(InvoiceDuplicateKey).filter(
+                    InvoiceDuplicateKey.invoice_id == invoice.id
+                ).delete(synchronize_session=False)
+                db.commit()
+                return
+
+            dismissed = {
+                row.duplicate_of_invoice_id for row in db.query(InvoiceDuplicateFlag.duplicate_of_invoice_id).filter(
+                    InvoiceDuplicateFlag.invoice_id == invoice.id,
+                    InvoiceDuplicateFlag.status == "Dismissed"
+                )
+            }
+            duplicates = self.find_duplicates(
+                db, invoice.vendor_id, invoice.invoice_number, invoice.total_amount or Decimal("0"),
+                invoice.invoice_date, exclude_invoice_id=invoice.id
+            )
+            self.flag_duplicates(
+                db, invoice.id, [candidate for candidate in duplicates if candidate.invoice_id not in dismissed]
+            )
+            self.index_invoice(db, invoice, commit=False)
+            db.commit()
+
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error re-indexing invoice {invoice.id} for duplicate screening: {str(e)}")
+            raise
+
+    def flag_duplicates(self, db: Session, invoice_id: int, candidates: List[DuplicateCandidate]) -> None:
+        """Record open duplicate flags for an invoice (no commit)"""
+        if candidates:
+            db.execute(insert(InvoiceDuplicateFlag), [
+                {
+                    "invoice_id": invoice_id,
+                    "duplicate_of_invoice_id": candidate.invoice_id,
+                    "score": candidate.score,
+                    "reasons": ",".join(candidate.reasons),
+                    "status": "Open"
+                }
+                for candidate in candidates
+            ])
+
+    def rescreen_history(self, db: Session, vendor_ids: Optional[List[int]] = None) -> Dict[str, Any]:
+        """Backfill missing keys, then re-screen every invoice within its vendor's blocks"""
+        try:
+            indexed = self._backfill_keys(db, vendor_ids)
+
+            dismissed = {
+                (row.invoice_id, row.duplicate_of_invoice_id)
+                for row in db.query(
+                    InvoiceDuplicateFlag.invoice_id, InvoiceDuplicateFlag.duplicate_of_invoice_id
+                ).filter(InvoiceDuplicateFlag.status == "Dismissed")
+            }
+
+            key_query = db.query(InvoiceDuplicateKey)
+            open_flags = db.query(InvoiceDuplicateFlag).filter(InvoiceDuplicateFlag.status == "Open")
+            if vendor_ids:
+                key_query = key_query.filter(InvoiceDuplicateKey.vendor_id.in_(vendor_ids))
+                open_flags = open_flags.filter(InvoiceDuplicateFlag.invoice_id.in_(
+                    db.query(InvoiceDuplicateKey.invoice_id).filter(InvoiceDuplicateKey.vendor_id.in_(vendor_ids))
+                ))
+            open_flags.delete(synchronize_session=False)
+
+            keys = key_query.order_by(
+                InvoiceDuplicateKey.vendor_id, InvoiceDuplicateKey.invoice_date, InvoiceDuplicateKey.invoice_id
+            ).yield_per(RESCREEN_CHUNK_SIZE)
+
+            flag_rows = []
+            vendors_screened = 0
+            pairs_compared = 0
+            for _, vendor_keys in groupby(keys, key=lambda key: key.vendor_id):
+                vendors_screened += 1
+                for later, earlier, score, reasons in self._screen_vendor(list(vendor_keys)):
+                    pairs_compared += 1
+                    if score < self.score_threshold or (later.invoice_id, earlier.invoice_id) in dismissed:
+                        continue
+                    flag_rows.append({
+                        "invoice_id": later.invoice_id,
+                        "duplicate_of_invoice_id": earlier.invoice_id,
+                        "score": score,
+                        "reasons": ",".join(reasons),
+                        "status": "Open"
+                    })
+
+            if flag_rows:
+                db.execute(insert(InvoiceDuplicateFlag), flag_rows)
+
+            db.commit()
+
+            logger.info(
+                f"Re-screened {vendors_screened} vendors: {pairs_compared} candidate pairs, "
+                f"{len(flag_rows)} flagged"
+            )
+            return {
+                "keys_backfilled": indexed,
+                "vendors_screened": vendors_screened,
+                "pairs_compared": pairs_compared,
+                "duplicates_flagged": len(flag_rows)
+            }
+
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error re-screening invoice history: {str(e)}")
+            raise
+
+    def _screen_vendor(self, vendor_keys: List[InvoiceDuplicateKey]) -> Iterable[Tuple[Any, Any, Decimal, List[str]]]:
+        """Compare each invoice only with earlier invoices sharing one of its blocks.
+
+        Keys arrive in invoice date order, so an amount block drops invoices that fell out of
+        the date window before it is scanned; same-amount invoices cost the window, not the history.
+        """
+        blocks: Dict[Tuple[str, Any], Deque[InvoiceDuplicateKey]] = {}
+
+        for key in vendor_keys:
+            key_fields = {
+                "normalized_number": key.normalized_number,
+                "number_core": key.number_core,
+                "amount_cents": key.amount_cents,
+                "invoice_date": key.invoice_date
+            }
+            block_keys = [
+                ("number", key.normalized_number),
+                ("minhash", key.number_minhash),
+                ("amount", key.amount_cents)
+            ]
+            if key.number_core:
+                block_keys.append(("core", key.number_core))
+
+            amount_block = blocks.get(("amount", key.amount_cents))
+            while amount_block and (key.invoice_date - amount_block[0].invoice_date).days > self.date_window_days:
+                amount_block.popleft()
+
+            seen: Set[int] = set()
+            for block_key in block_keys:
+                for earlier in blocks.get(block_key, ()):
+                    if earlier.invoice_id in seen:
+                        continue
+                    seen.add(earlier.invoice_id)
+                    score, reasons = score_pair(key_fields, earlier, self.date_window_days)
+                    yield key, earlier, score, reasons
+
+            for block_key in block_keys:
+                blocks.setdefault(block_key, deque()).append(key)
+
+    def _backfill_keys(self, db: Session, vendor_ids: Optional[List[int]]) -> int:
+        """Insert keys for invoices created before the index existed"""
+        missing = db.query(
+            Invoice.id, Invoice.vendor_id, Invoice.invoice_number, Invoice.total_amount, Invoice.invoice_date
+        ).filter(
+            Invoice.vendor_id.isnot(None),
+            ~db.query(InvoiceDuplicateKey.id).filter(InvoiceDuplicateKey.invoice_id == Invoice.id).exists()
+        )
+        if vendor_ids:
+            missing = missing.filter(Invoice.vendor_id.in_(vendor_ids))
+
+        rows = [
+            {
+                "invoice_id": row.id,
+                "vendor_id": row.vendor_id,
+                **build_keys(row.invoice_number, row.total_amount or Decimal("0"), row.invoice_date)
+            }
+            for row in missing.all()
+        ]
+
+        for start in range(0, len(rows), RESCREEN_CHUNK_SIZE):
+            db.execute(insert(InvoiceDuplicateKey), rows[start:start + RESCREEN_CHUNK_SIZE])
+
+        return len(rows)
+
+    def _date_window(self, invoice_date: date) -> Tuple[date, date]:
+        delta = timedelta(days=self.date_window_days)
+        return invoice_date - delta, invoice_date + delta
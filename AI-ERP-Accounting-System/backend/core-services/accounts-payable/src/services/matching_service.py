@@ -0,0 +1,404 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import and_, or_, not_, true, func, insert
+from typing import List, Optional, Dict, Any, Iterable, Tuple
+from datetime import datetime
+from decimal import Decimal
+from itertools import groupby
+import logging
+
+from ..models.invoices import Invoice, InvoiceLine
+from ..models.purchase_orders import PurchaseOrder, PurchaseOrderLine
+from ..models.receipts import Receipt, ReceiptLine
+from ..models.match_results import InvoiceMatchResult, MatchDiscrepancy
+
+logger = logging.getLogger(__name__)
+
+# Invoices that have not been approved yet and still need matching
+OPEN_INVOICE_STATUSES = ("Draft", "Pending")
+# Invoices that never consumed PO or receipt quantity
+VOID_INVOICE_STATUSES = ("Cancelled", "Rejected", "Void")
+
+MatchKey = Tuple[str, str]  # (po_number, item_code)
+
+
+class ThreeWayMatcher:
+    """Line-level matching of invoice lines against PO terms and received quantities"""
+
+    def __init__(
+        self,
+        quantity_tolerance: Decimal = Decimal("0.05"),
+        price_tolerance: Decimal = Decimal("0.02")
+    ):
+        self.quantity_tolerance = quantity_tolerance
+        self.price_tolerance = price_tolerance
+
+    def match_invoice(
+        self,
+        invoice_id: int,
+        po_number: Optional[str],
+        invoice_lines: Iterable[Tuple[str, Decimal, Decimal]],
+        po_terms: Dict[MatchKey, Tuple[Decimal, Decimal]],
+        received: Dict[MatchKey, Decimal],
+        invoiced: Optional[Dict[MatchKey, Decimal]] = None
+    ) -> Dict[str, Any]:
+        """Match one invoice; invoice_lines are (item_code, quantity, unit_price).
+
+        invoiced holds the quantity other invoices already billed per (po_number, item_code);
+        only what is left of the order and the receipt is available to this invoice.
+        """
+        invoiced = invoiced or {}
+        # Collapse repeated items so quantities are compared in total
+        quantities: Dict[str, Decimal] = {}
+        amounts: Dict[str, Decimal] = {}
+        for item_code, quantity, unit_price in invoice_lines:
+            quantities[item_code] = quantities.get(item_code, Decimal("0")) + quantity
+            amounts[item_code] = amounts.get(item_code, Decimal("0")) + quantity * unit_price
+
+        discrepancies = []
+        lines_matched = 0
+
+        for item_code, invoiced_quantity in quantities.items():
+            line_discrepancies = []
+            invoiced_price = amounts[item_code] / invoiced_quantity if invoiced_quantity else Decimal("0")
+
+            if po_number is None:
+                line_discrepancies.append(self._discrepancy(
+                    item_code, "NoPurchaseOrder", None, None, "Invoice is not linked to a purchase order"
+                ))
+            elif (po_number, item_code) not in po_terms:
+                line_discrepancies.append(self._discrepancy(
+                    item_code, "NoPOLine", None, invoiced_quantity,
+                    f"Item {item_code} is not on purchase order {po_number}"
+                ))
+            else:
+                ordered_quantity, po_price = po_terms[(po_number, item_code)]
+                received_quantity = received.get((po_number, item_code), Decimal("0"))
+                already_invoiced = invoiced.get((po_number, item_code), Decimal("0"))
+                total_invoiced = already_invoiced + invoiced_quantity
+
+                if total_invoiced > ordered_quantity * (1 + self.quantity_tolerance):
+                    line_discrepancies.append(self._discrepancy(
+                        item_code, "QuantityExceedsOrder", max(ordered_quantity - already_invoiced, Decimal("0")),
+                        invoiced_quantity,
+                        f"Invoiced quantity {invoiced_quantity} plus {already_invoiced} already invoiced "
+                        f"exceeds ordered quantity {ordered_quantity}"
+                    ))
+
+                if received_quantity <= 0:
+                    line_discrepancies.append(self._discrepancy(
+                        item_code, "NotReceived", Decimal("0"), invoiced_quantity,
+                        f"No goods received for item {item_code}"
+                    ))
+                elif total_invoiced > received_quantity * (1 + self.quantity_tolerance):
+                    line_discrepancies.append(self._discrepancy(
+                        item_code, "QuantityExceedsReceipt", max(received_quantity - already_invoiced, Decimal("0")),
+                        invoiced_quantity,
+                        f"Invoiced quantity {invoiced_quantity} plus {already_invoiced} already invoiced "
+                        f"exceeds received quantity {received_quantity}"
+                    ))
+
+                if abs(invoiced_price - po_price) > po_price * self.price_tolerance:
+                    line_discrepancies.append(self._discrepancy(
+                        item_code, "PriceVariance", po_price, invoiced_price,
+                        f"Invoiced price {invoiced_price:.4f} differs from PO price {po_price:.4f}"
+                    ))
+
+            if not line_discrepancies:
+                lines_matched += 1
+            discrepancies.extend(line_discrepancies)
+
+        lines_total = len(quantities)
+        return {
+            "invoice_id": invoice_id,
+            "po_number": po_number,
+            "matched": lines_total > 0 and not discrepancies,
+            "match_score": Decimal(lines_matched) / Decimal(lines_total) if lines_total else Decimal("0"),
+            "lines_matched": lines_matched,
+            "lines_total": lines_total,
+            "discrepancies": discrepancies
+        }
+
+    def _discrepancy(
+        self,
+        item_code: str,
+        discrepancy_type: str,
+        expected_value: Optional[Decimal],
+        actual_value: Optional[Decimal],
+        message: str
+    ) -> Dict[str, Any]:
+        return {
+            "item_code": item_code,
+            "type": discrepancy_type,
+            "expected": expected_value,
+            "actual": actual_value,
+            "message": message
+        }
+
+
+class MatchingService:
+    """Service class for three-way matching of invoices, purchase orders and receipts"""
+
+    def match_invoice(
+        self,
+        db: Session,
+        invoice_id: int,
+        po_id: Optional[int] = None,
+        receipt_id: Optional[int] = None,
+        matcher: Optional[ThreeWayMatcher] = None
+    ) -> Dict[str, Any]:
+        """Match a single invoice and store the result"""
+        try:
+            invoice = db.query(Invoice).filter(Invoice.id == invoice_id).first()
+            if not invoice:
+                raise ValueError(f"Invoice {invoice_id} not found")
+
+            po_id = po_id or invoice.purchase_order_id
+            po_number = None
+            if po_id:
+                po = db.query(PurchaseOrder).filter(PurchaseOrder.id == po_id).first()
+                if not po:
+                    raise ValueError(f"Purchase order {po_id} not found")
+                po_number = po.po_number
+
+            if receipt_id:
+                receipt = db.query(Receipt).filter(Receipt.id == receipt_id).first()
+                if not receipt:
+                    raise ValueError(f"Receipt {receipt_id} not found")
+                if po_id and receipt.purchase_order_id != po_id:
+                    raise ValueError(f"Receipt {receipt_id} does not belong to purchase order {po_id}")
+
+            invoice_lines = db.query(
+                InvoiceLine.item_code, InvoiceLine.quantity, InvoiceLine.unit_price
+            ).filter(InvoiceLine.invoice_id == invoice_id).all()
+
+            po_ids = [po_id] if po_id else []
+            result = (matcher or ThreeWayMatcher()).match_invoice(
+                invoice_id,
+                po_number,
+                [(line.item_code, line.quantity, line.unit_price) for line in invoice_lines],
+                self._load_po_terms(db, po_ids),
+                self._load_received(db, po_ids, receipt_id),
+                self._load_invoiced(db, po_ids, Invoice.id == invoice_id)
+            )
+            result["purchase_order_id"] = po_id
+
+            self._write_results(db, [result])
+            db.commit()
+
+            return result
+
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error matching invoice {invoice_id}: {str(e)}")
+            raise
+
+    def match_open_invoices(
+        self,
+        db: Session,
+        vendor_ids: Optional[List[int]] = None,
+        matcher: Optional[ThreeWayMatcher] = None
+    ) -> Dict[str, Any]:
+        """Match every open invoice for a vendor set in one pass"""
+        try:
+            matcher = matcher or ThreeWayMatcher()
+
+            # All open invoice lines with their PO number, ordered by invoice
+            query = db.query(
+                Invoice.id.label("invoice_id"),
+                Invoice.purchase_order_id,
+                PurchaseOrder.po_number,
+                InvoiceLine.item_code,
+                InvoiceLine.quantity,
+                InvoiceLine.unit_price
+            ).join(
+                InvoiceLine, InvoiceLine.invoice_id == Invoice.id
+            ).outerjoin(
+                PurchaseOrder, PurchaseOrder.id == Invoice.purchase_order_id
+            ).filter(Invoice.status.in_(OPEN_INVOICE_STATUSES))
+
+            if vendor_ids:
+                query = query.filter(Invoice.vendor_id.in_(vendor_ids))
+
+            invoice_rows = query.order_by(Invoice.id).all()
+
+            po_ids = {row.purchase_order_id for row in invoice_rows if row.purchase_order_id}
+            po_terms = self._load_po_terms(db, po_ids)
+            received = self._load_received(db, po_ids)
+            # Open invoices in this batch are matched again below, oldest first
+            rematched = and_(
+                Invoice.status.in_(OPEN_INVOICE_STATUSES),
+                Invoice.vendor_id.in_(vendor_ids) if vendor_ids else true()
+            )
+            invoiced = self._load_invoiced(db, po_ids, rematched)
+
+            results = []
+            for invoice_id, rows in groupby(invoice_rows, key=lambda row: row.invoice_id):
+                rows = list(rows)
+                result = matcher.match_invoice(
+                    invoice_id,
+                    rows[0].po_number,
+                    [(row.item_code, row.quantity, row.unit_price) for row in rows],
+                    po_terms,
+                    received,
+                    invoiced
+                )
+                result["purchase_order_id"] = rows[0].purchase_order_id
+                results.append(result)
+
+                # A matched invoice uses up its quantity for the invoices after it
+                if result["matched"]:
+                    for row in rows:
+                        key = (row.po_number, row.item_code)
+                        invoiced[key] = invoiced.get(key, Decimal("0")) + row.quantity
+
+            self._write_results(db, results)
+            db.commit()
+
+            matched_count = sum(1 for result in results if result["matched"])
+            logger.info(f"Batch matched {len(results)} invoices, {matched_count} fully matched")
+            return {
+                "invoices_processed": len(results),
+                "invoices_matched": matched_count,
+                "invoices_with_discrepancies": len(results) - matched_count,
+                "discrepancy_count": sum(len(result["discrepancies"]) for result in results)
+            }
+
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error batch matching invoices: {str(e)}")
+            raise
+
+    def _load_po_terms(self, db: Session, po_ids: Iterable[int]) -> Dict[MatchKey, Tuple[Decimal, Decimal]]:
+        """Ordered quantity and unit price per (po_number, item_code)"""
+        po_ids = list(po_ids)
+        if not po_ids:
+            return {}
+
+        rows = db.query(
+            PurchaseOrder.po_number,
+            PurchaseOrderLine.item_code,
+            func.sum(PurchaseOrderLine.quantity).label("ordered_quantity"),
+            func.sum(PurchaseOrderLine.line_total).label("ordered_amount")
+        ).join(
+            PurchaseOrderLine, PurchaseOrderLine.purchase_order_id == PurchaseOrder.id
+        ).filter(
+            PurchaseOrder.id.in_(po_ids)
+        ).group_by(PurchaseOrder.po_number, PurchaseOrderLine.item_code).all()
+
+        return {
+            (row.po_number, row.item_code): (
+                row.ordered_quantity,
+                row.ordered_amount / row.ordered_quantity if row.ordered_quantity else Decimal("0")
+            )
+            for row in rows
+        }
+
+    def _load_received(
+        self,
+        db: Session,
+        po_ids: Iterable[int],
+        receipt_id: Optional[int] = None
+    ) -> Dict[MatchKey, Decimal]:
+        """Net received quantity (received minus rejected) per (po_number, item_code)"""
+        po_ids = list(po_ids)
+        if not po_ids:
+            return {}
+
+        query = db.query(
+            PurchaseOrder.po_number,
+            ReceiptLine.item_code,
+            func.sum(ReceiptLine.quantity_received - ReceiptLine.quantity_rejected).label("net_received")
+        ).join(
+            Receipt, Receipt.purchase_order_id == PurchaseOrder.id
+        ).join(
+            ReceiptLine, ReceiptLine.receipt_id == Receipt.id
+        ).filter(
+            and_(
+                PurchaseOrder.id.in_(po_ids),
+                Receipt.status != "Cancelled"
+            )
+        )
+
+        if receipt_id:
+            query = query.filter(Receipt.id == receipt_id)
+
+        rows = query.group_by(PurchaseOrder.po_number, ReceiptLine.item_code).all()
+        return {(row.po_number, row.item_code): row.net_received for row in rows}
+
+    def _load_invoiced(self, db: Session, po_ids: Iterable[int], excluded: Any) -> Dict[MatchKey, Decimal]:
+        """Quantity already invoiced per (po_number, item_code) by invoices outside `excluded`.
+
+        Invoices past approval count, and so do open invoices whose last match succeeded.
+        """
+        po_ids = list(po_ids)
+        if not po_ids:
+            return {}
+
+        rows = db.query(
+            PurchaseOrder.po_number,
+            InvoiceLine.item_code,
+            func.sum(InvoiceLine.quantity).label("invoiced_quantity")
+        ).join(
+            Invoice, Invoice.purchase_order_id == PurchaseOrder.id
+        ).join(
+            InvoiceLine, InvoiceLine.invoice_id == Invoice.id
+        ).outerjoin(
+            InvoiceMatchResult, InvoiceMatchResult.invoice_id == Invoice.id
+        ).filter(
+            and_(
+                PurchaseOrder.id.in_(po_ids),
+                Invoice.status.notin_(VOID_INVOICE_STATUSES),
+                or_(Invoice.status.notin_(OPEN_INVOICE_STATUSES), InvoiceMatchResult.matched == True),
+                not_(excluded)
+            )
+        ).group_by(PurchaseOrder.po_number, InvoiceLine.item_code).all()
+
+        return {(row.po_number, row.item_code): row.invoiced_quantity for row in rows}
+
+    def _write_results(self, db: Session, results: List[Dict[str, Any]]) -> None:
+        """Replace stored match results and discrepancies with set-based statements"""
+        if not results:
+            return
+
+        invoice_ids = [result["invoice_id"] for result in results]
+        db.query(MatchDiscrepancy).filter(
+            MatchDiscrepancy.invoice_id.in_(invoice_ids)
+        ).delete(synchronize_session=False)
+        db.query(InvoiceMatchResult).filter(
+            InvoiceMatchResult.invoice_id.in_(invoice_ids)
+        ).delete(synchronize_session=False)
+
+        now = datetime.utcnow()
+        inserted = db.execute(
+            insert(InvoiceMatchResult).returning(InvoiceMatchResult.id, InvoiceMatchResult.invoice_id),
+            [
+                {
+                    "invoice_id": result["invoice_id"],
+                    "purchase_order_id": result["purchase_order_id"],
+                    "matched": result["matched"],
+                    "match_score": result["match_score"],
+                    "lines_matched": result["lines_matched"],
+                    "lines_total": result["lines_total"],
+                    "matched_at": now
+                }
+                for result in results
+            ]
+        )
+        result_ids = {row.invoice_id: row.id for row in inserted}
+
+        discrepancy_rows = [
+            {
+                "match_result_id": result_ids[result["invoice_id"]],
+                "invoice_id": result["invoice_id"],
+                "item_code": discrepancy["item_code"],
+                "discrepancy_type": discrepancy["type"],
+                "expected_value": discrepancy["expected"],
+                "actual_value": discrepancy["actual"],
+                "message": discrepancy["message"],
+                "created_at": now
+            }
+            for result in results
+            for discrepancy in result["discrepancies"]
+        ]
+        if discrepancy_rows:
+            db.execute(insert(MatchDiscrepancy), discrepancy_rows)
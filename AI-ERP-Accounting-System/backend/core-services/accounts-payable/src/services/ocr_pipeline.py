@@ -0,0 +1,319 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import or_
+from fastapi import UploadFile
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Dict, Any, Set
+from datetime import datetime, date, timedelta
+from decimal import Decimal, InvalidOperation
+import asyncio
+import logging
+import os
+import re
+import uuid
+
+from ..models.invoices import Invoice
+from ..models.upload_jobs import InvoiceUploadJob
+from ..database.connection import SessionLocal
+from .duplicate_detection_service import DuplicateDetectionService
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_DIR = os.getenv("INVOICE_UPLOAD_DIR", "/app/uploads")
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # Stream uploads to disk 1 MB at a time
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", str(os.cpu_count() or 2)))
+OCR_MAX_CONCURRENT_JOBS = int(os.getenv("OCR_MAX_CONCURRENT_JOBS", str(OCR_WORKERS)))
+OCR_DPI = int(os.getenv("OCR_DPI", "300"))
+OCR_CLAIM_STALE_AFTER = timedelta(minutes=int(os.getenv("OCR_CLAIM_STALE_MINUTES", "15")))
+OPEN_JOB_STATUSES = ("Queued", "Processing")
+
+INVOICE_NUMBER_PATTERN = re.compile(
+    r"invoice\s*(?:no\.?|number|#)\s*[:#]?\s*([A-Z0-9][A-Z0-9\-/]{2,})", re.IGNORECASE
+)
+INVOICE_DATE_PATTERN = re.compile(
+    r"invoice\s*date\s*:?\s*(\d{4}-\d{2}-\d{2}|\d{1,2}[/.-]\d{1,2}[/.-]\d{2,4})", re.IGNORECASE
+)
+DUE_DATE_PATTERN = re.compile(
+    r"due\s*date\s*:?\s*(\d{4}-\d{2}-\d{2}|\d{1,2}[/.-]\d{1,2}[/.-]\d{2,4})", re.IGNORECASE
+)
+TOTAL_PATTERN = re.compile(
+    r"(?:total\s*(?:amount)?\s*(?:due)?|amount\s*due|balance\s*due)\s*:?\s*[$€£]?\s*([\d,]+\.\d{2})",
+    re.IGNORECASE
+)
+
+
+# Worker functions run in the process pool and must stay module-level for pickling
+def _count_pages(path: str) -> int:
+    """Number of pages to OCR (images are a single page)"""
+    if path.lower().endswith(".pdf"):
+        from pdf2image import pdfinfo_from_path
+        return int(pdfinfo_from_path(path)["Pages"])
+    return 1
+
+
+def _ocr_page(path: str, page_number: int, dpi: int) -> str:
+    """Rasterize a single page and extract its text"""
+    import pytesseract
+
+    if path.lower().endswith(".pdf"):
+        from pdf2image import convert_from_path
+        images = convert_from_path(path, dpi=dpi, first_page=page_number, last_page=page_number)
+        return "\n".join(pytesseract.image_to_string(image) for image in images)
+
+    from PIL import Image
+    with Image.open(path) as image:
+        return pytesseract.image_to_string(image)
+
+
+def _parse_date(value: str) -> Optional[date]:
+    from dateutil import parser as date_parser
+    try:
+        return date_parser.parse(value).date()
+    except (ValueError, OverflowError):
+        return None
+
+
+def parse_invoice_fields(text: str) -> Dict[str, Any]:
+    """Extract header fields from OCR text"""
+    fields: Dict[str, Any] = {}
+
+    match = INVOICE_NUMBER_PATTERN.search(text)
+    if match:
+        fields["invoice_number"] = match.group(1).strip()
+
+    match = INVOICE_DATE_PATTERN.search(text)
+    if match:
+        fields["invoice_date"] = _parse_date(match.group(1))
+
+    match = DUE_DATE_PATTERN.search(text)
+    if match:
+        fields["due_date"] = _parse_date(match.group(1))
+
+    # The grand total is normally the last total on the document
+    totals = TOTAL_PATTERN.findall(text)
+    if totals:
+        try:
+            fields["total_amount"] = Decimal(totals[-1].replace(",", ""))
+        except InvalidOperation:
+            pass
+
+    return fields
+
+
+class InvoiceUploadPipeline:
+    """Streams invoice uploads to disk and OCRs them in a bounded process pool"""
+
+    def __init__(
+        self,
+        upload_dir: str = UPLOAD_DIR,
+        workers: int = OCR_WORKERS,
+        duplicate_service: Optional[DuplicateDetectionService] = None
+    ):
+        self.upload_dir = upload_dir
+        self.workers = workers
+        self.duplicate_service = duplicate_service or DuplicateDetectionService()
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._job_slots: Optional[asyncio.Semaphore] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+    @property
+    def pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self._pool
+
+    @property
+    def job_slots(self) -> asyncio.Semaphore:
+        if self._job_slots is None:
+            self._job_slots = asyncio.Semaphore(OCR_MAX_CONCURRENT_JOBS)
+        return self._job_slots
+
+    async def submit_upload(
+        self,
+        db: Session,
+        file: UploadFile,
+        vendor_id: Optional[int] = None
+    ) -> InvoiceUploadJob:
+        """Stream the upload to disk, record a queued job and schedule processing"""
+        job_id = str(uuid.uuid4())
+        extension = os.path.splitext(file.filename or "")[1].lower() or ".pdf"
+        os.makedirs(self.upload_dir, exist_ok=True)
+        stored_path = os.path.join(self.upload_dir, f"{job_id}{extension}")
+        partial_path = f"{stored_path}.part"
+
+        file_size = 0
+        try:
+            with open(partial_path, "wb") as output:
+                while True:
+                    chunk = await file.read(UPLOAD_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    output.write(chunk)
+                    file_size += len(chunk)
+            os.replace(partial_path, stored_path)
+        except Exception:
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+            raise
+
+        try:
+            job = InvoiceUploadJob(
+                job_id=job_id,
+                filename=file.filename or os.path.basename(stored_path),
+                stored_path=stored_path,
+                content_type=file.content_type,
+                file_size=file_size,
+                vendor_id=vendor_id,
+                status="Queued",
+                claim_token=str(uuid.uuid4()),
+                claimed_at=datetime.utcnow()
+            )
+            db.add(job)
+            db.commit()
+            db.refresh(job)
+        except Exception as e:
+            db.rollback()
+            os.remove(stored_path)
+            logger.error(f"Error queuing invoice upload: {str(e)}")
+            raise
+
+        self._schedule(job_id, job.claim_token)
+        logger.info(f"Queued invoice upload {job_id} ({file_size} bytes)")
+        return job
+
+    def get_job(self, db: Session, job_id: str) -> Optional[InvoiceUploadJob]:
+        """Get an upload job by its public job ID"""
+        return db.query(InvoiceUploadJob).filter(InvoiceUploadJob.job_id == job_id).first()
+
+    def resume_pending_jobs(self) -> int:
+        """Reschedule jobs left queued or half-processed by a previous process.
+
+        Each job is claimed with a conditional update first, so a job another process
+        is still working on, or that another instance resumed first, is left alone.
+        """
+        db = SessionLocal()
+        claimed = []
+        try:
+            job_ids = [
+                row.job_id for row in db.query(InvoiceUploadJob.job_id).filter(
+                    InvoiceUploadJob.status.in_(OPEN_JOB_STATUSES)
+                )
+            ]
+            for job_id in job_ids:
+                claim_token = self._claim_job(db, job_id)
+                if claim_token:
+                    claimed.append((job_id, claim_token))
+        finally:
+            db.close()
+
+        for job_id, claim_token in claimed:
+            self._schedule(job_id, claim_token)
+        return len(claimed)
+
+    def _claim_job(self, db: Session, job_id: str) -> Optional[str]:
+        """Take over an open job whose claim is missing or stale; returns the new claim token"""
+        now = datetime.utcnow()
+        claim_token = str(uuid.uuid4())
+        updated = db.query(InvoiceUploadJob).filter(
+            InvoiceUploadJob.job_id == job_id,
+            InvoiceUploadJob.status.in_(OPEN_JOB_STATUSES),
+            or_(
+                InvoiceUploadJob.claimed_at.is_(None),
+                InvoiceUploadJob.claimed_at < now - OCR_CLAIM_STALE_AFTER
+            )
+        ).update({"claim_token": claim_token, "claimed_at": now}, synchronize_session=False)
+        db.commit()
+        return claim_token if updated else None
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def _schedule(self, job_id: str, claim_token: str) -> None:
+        task = asyncio.get_running_loop().create_task(self.process_job(job_id, claim_token))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def process_job(self, job_id: str, claim_token: str) -> None:
+        """OCR every page in parallel, parse the fields and create a draft invoice.
+
+        The job is processed only while it still carries this process's claim token;
+        every progress commit refreshes the claim so it does not go stale.
+        """
+        async with self.job_slots:
+            loop = asyncio.get_running_loop()
+            db = SessionLocal()
+            try:
+                job = self.get_job(db, job_id)
+                if not job or job.status not in OPEN_JOB_STATUSES or job.claim_token != claim_token:
+                    return
+
+                job.claimed_at = datetime.utcnow()
+                job.status = "Processing"
+                job.started_at = datetime.utcnow()
+                job.pages_done = 0
+                job.pages_total = await loop.run_in_executor(self.pool, _count_pages, job.stored_path)
+                db.commit()
+
+                page_futures = [
+                    loop.run_in_executor(self.pool, _ocr_page, job.stored_path, page_number, OCR_DPI)
+                    for page_number in range(1, job.pages_total + 1)
+                ]
+
+                # Report progress as pages finish, in whatever order they complete
+                for completed in asyncio.as_completed(page_futures):
+                    await completed
+                    job.pages_done += 1
+                    job.claimed_at = datetime.utcnow()
+                    db.commit()
+
+                page_texts: List[str] = [future.result() for future in page_futures]
+                fields = parse_invoice_fields("\n".join(page_texts))
+
+                invoice = self._create_draft_invoice(db, job, fields)
+
+                job.invoice_id = invoice.id
+                job.status = "Completed"
+                job.completed_at = datetime.utcnow()
+                db.commit()
+
+                logger.info(f"Processed invoice upload {job_id} into draft invoice {invoice.id}")
+
+            except Exception as e:
+                db.rollback()
+                logger.error(f"Error processing invoice upload {job_id}: {str(e)}")
+                job = self.get_job(db, job_id)
+                if job:
+                    job.status = "Failed"
+                    job.error = str(e)
+                    job.completed_at = datetime.utcnow()
+                    db.commit()
+            finally:
+                db.close()
+
+    def _create_draft_invoice(self, db: Session, job: InvoiceUploadJob, fields: Dict[str, Any]) -> Invoice:
+        """Create a draft invoice from parsed fields for review"""
+        invoice_date = fields.get("invoice_date") or date.today()
+        invoice = Invoice(
+            invoice_number=fields.get("invoice_number") or f"UPLOAD-{job.job_id[:8].upper()}",
+            vendor_id=job.vendor_id,
+            invoice_date=invoice_date,
+            due_date=fields.get("due_date") or invoice_date + timedelta(days=30),
+            status="Draft",
+            total_amount=fields.get("total_amount") or Decimal("0"),
+            paid_amount=Decimal("0"),
+            notes=f"Created from uploaded document {job.filename}"
+        )
+        db.add(invoice)
+        db.flush()
+
+        # Drafts are reviewed by a person, so possible duplicates are flagged rather than rejected
+        if invoice.vendor_id is not None:
+            duplicates = self.duplicate_service.find_duplicates(
+                db, invoice.vendor_id, invoice.invoice_number, invoice.total_amount,
+                invoice.invoice_date, exclude_invoice_id=invoice.id
+            )
+            self.duplicate_service.flag_duplicates(db, invoice.id, duplicates)
+            self.duplicate_service.index_invoice(db, invoice, commit=False)
+
+        return invoice
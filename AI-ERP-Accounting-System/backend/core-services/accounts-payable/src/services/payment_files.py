@@ -0,0 +1,196 @@
+from typing import Iterable, Iterator, NamedTuple, Optional
+from datetime import datetime, date
+from decimal import Decimal
+from xml.sax.saxutils import escape
+import os
+
+# Originator settings for payment files
+NACHA_IMMEDIATE_DESTINATION = os.getenv("NACHA_IMMEDIATE_DESTINATION", "000000000")
+NACHA_IMMEDIATE_DESTINATION_NAME = os.getenv("NACHA_IMMEDIATE_DESTINATION_NAME", "")
+NACHA_IMMEDIATE_ORIGIN = os.getenv("NACHA_IMMEDIATE_ORIGIN", "000000000")
+NACHA_COMPANY_NAME = os.getenv("NACHA_COMPANY_NAME", "FINS ERP")
+NACHA_COMPANY_ID = os.getenv("NACHA_COMPANY_ID", "0000000000")
+NACHA_ODFI_ID = os.getenv("NACHA_ODFI_ID", NACHA_IMMEDIATE_ORIGIN[:8])
+DEBTOR_NAME = os.getenv("PAYMENT_DEBTOR_NAME", NACHA_COMPANY_NAME)
+DEBTOR_IBAN = os.getenv("PAYMENT_DEBTOR_IBAN", "")
+DEBTOR_BIC = os.getenv("PAYMENT_DEBTOR_BIC", "")
+
+NACHA_RECORD_LENGTH = 94
+NACHA_BLOCKING_FACTOR = 10
+
+
+class PaymentFileRow(NamedTuple):
+    payment_number: str
+    vendor_name: str
+    routing_number: Optional[str]
+    account_number: Optional[str]
+    amount: Decimal
+    currency: str
+
+
+def _alpha(value: Optional[str], length: int) -> str:
+    """Left-justified, space-padded alphanumeric NACHA field"""
+    return (value or "").upper()[:length].ljust(length)
+
+
+def _numeric(value: int, length: int) -> str:
+    """Right-justified, zero-padded numeric NACHA field"""
+    return str(value)[-length:].rjust(length, "0")
+
+
+def _cents(amount: Decimal) -> int:
+    return int((amount * 100).quantize(Decimal("1")))
+
+
+def write_nacha(
+    rows: Iterable[PaymentFileRow],
+    effective_date: date,
+    entry_description: str = "PAYMENT"
+) -> Iterator[str]:
+    """Stream a NACHA CCD credit file, one record per yielded line"""
+    now = datetime.utcnow()
+    batch_number = 1
+
+    yield (
+        "1" + "01"
+        + " " + _numeric(int(NACHA_IMMEDIATE_DESTINATION), 9)
+        + " " + _numeric(int(NACHA_IMMEDIATE_ORIGIN), 9)
+        + now.strftime("%y%m%d") + now.strftime("%H%M")
+        + "A" + "094" + "10" + "1"
+        + _alpha(NACHA_IMMEDIATE_DESTINATION_NAME, 23)
+        + _alpha(NACHA_COMPANY_NAME, 23)
+        + _alpha("", 8)
+        + "\n"
+    )
+    yield (
+        "5" + "220"
+        + _alpha(NACHA_COMPANY_NAME, 16)
+        + _alpha("", 20)
+        + _alpha(NACHA_COMPANY_ID, 10)
+        + "CCD"
+        + _alpha(entry_description, 10)
+        + _alpha("", 6)
+        + effective_date.strftime("%y%m%d")
+        + "   " + "1"
+        + _numeric(int(NACHA_ODFI_ID), 8)
+        + _numeric(batch_number, 7)
+        + "\n"
+    )
+
+    entry_count = 0
+    entry_hash = 0
+    total_credit = 0
+    for row in rows:
+        if (row.currency or "").upper() != "USD":
+            raise ValueError(f"Payment {row.payment_number} is in {row.currency}; NACHA entries are USD only")
+        routing_number = (row.routing_number or "").strip().rjust(9, "0")
+        entry_count += 1
+        entry_hash += int(routing_number[:8])
+        amount_cents = _cents(row.amount)
+        total_credit += amount_cents
+
+        yield (
+            "6" + "22"
+            + routing_number[:8] + routing_number[8]
+            + _alpha(row.account_number, 17)
+            + _numeric(amount_cents, 10)
+            + _alpha(row.payment_number, 15)
+            + _alpha(row.vendor_name, 22)
+            + "  " + "0"
+            + _numeric(int(NACHA_ODFI_ID), 8) + _numeric(entry_count, 7)
+            + "\n"
+        )
+
+    yield (
+        "8" + "220"
+        + _numeric(entry_count, 6)
+        + _numeric(entry_hash, 10)
+        + _numeric(0, 12)
+        + _numeric(total_credit, 12)
+        + _alpha(NACHA_COMPANY_ID, 10)
+        + _alpha("", 19) + _alpha("", 6)
+        + _numeric(int(NACHA_ODFI_ID), 8)
+        + _numeric(batch_number, 7)
+        + "\n"
+    )
+
+    record_count = entry_count + 4
+    block_count = -(-record_count // NACHA_BLOCKING_FACTOR)
+    yield (
+        "9"
+        + _numeric(1, 6)
+        + _numeric(block_count, 6)
+        + _numeric(entry_count, 8)
+        + _numeric(entry_hash, 10)
+        + _numeric(0, 12)
+        + _numeric(total_credit, 12)
+        + _alpha("", 39)
+        + "\n"
+    )
+
+    # Pad the file to a whole number of blocks
+    for _ in range(block_count * NACHA_BLOCKING_FACTOR - record_count):
+        yield "9" * NACHA_RECORD_LENGTH + "\n"
+
+
+def write_pain001(
+    rows: Iterable[PaymentFileRow],
+    message_id: str,
+    execution_date: date,
+    transaction_count: int,
+    control_sum: Decimal
+) -> Iterator[str]:
+    """Stream an ISO 20022 pain.001.001.03 credit transfer document.
+
+    Rows must be ordered by currency; each currency gets its own PmtInf block.
+    """
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+    yield '<Document xmlns="urn:iso:std:iso:20022:tech:xsd:pain.001.001.03">\n<CstmrCdtTrfInitn>\n'
+    yield (
+        "<GrpHdr>"
+        f"<MsgId>{escape(message_id)}</MsgId>"
+        f"<CreDtTm>{datetime.utcnow().replace(microsecond=0).isoformat()}</CreDtTm>"
+        f"<NbOfTxs>{transaction_count}</NbOfTxs>"
+        f"<CtrlSum>{control_sum:.2f}</CtrlSum>"
+        f"<InitgPty><Nm>{escape(DEBTOR_NAME)}</Nm></InitgPty>"
+        "</GrpHdr>\n"
+    )
+
+    current_currency = None
+    for row in rows:
+        if row.currency != current_currency:
+            if current_currency is not None:
+                yield "</PmtInf>\n"
+            current_currency = row.currency
+            yield (
+                "<PmtInf>"
+                f"<PmtInfId>{escape(message_id)}-{escape(current_currency)}</PmtInfId>"
+                "<PmtMtd>TRF</PmtMtd>"
+                f"<ReqdExctnDt>{execution_date.isoformat()}</ReqdExctnDt>"
+                f"<Dbtr><Nm>{escape(DEBTOR_NAME)}</Nm></Dbtr>"
+                f"<DbtrAcct><Id><IBAN>{escape(DEBTOR_IBAN)}</IBAN></Id></DbtrAcct>"
+                f"<DbtrAgt><FinInstnId><BIC>{escape(DEBTOR_BIC)}</BIC></FinInstnId></DbtrAgt>\n"
+            )
+
+        creditor_agent = ""
+        if row.routing_number:
+            creditor_agent = (
+                "<CdtrAgt><FinInstnId><ClrSysMmbId>"
+                f"<MmbId>{escape(row.routing_number)}</MmbId>"
+                "</ClrSysMmbId></FinInstnId></CdtrAgt>"
+            )
+
+        yield (
+            "<CdtTrfTxInf>"
+            f"<PmtId><EndToEndId>{escape(row.payment_number)}</EndToEndId></PmtId>"
+            f'<Amt><InstdAmt Ccy="{escape(row.currency)}">{row.amount:.2f}</InstdAmt></Amt>'
+            f"{creditor_agent}"
+            f"<Cdtr><Nm>{escape(row.vendor_name or '')}</Nm></Cdtr>"
+            f"<CdtrAcct><Id><Othr><Id>{escape(row.account_number or '')}</Id></Othr></Id></CdtrAcct>"
+            f"<RmtInf><Ustrd>{escape(row.payment_number)}</Ustrd></RmtInf>"
+            "</CdtTrfTxInf>\n"
+        )
+
+    if current_currency is not None:
+        yield "</PmtInf>\n"
+    yield "</CstmrCdtTrfInitn>\n</Document>\n"
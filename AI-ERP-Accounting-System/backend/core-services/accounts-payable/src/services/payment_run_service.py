@@ -0,0 +1,246 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import and_, or_, func, case, insert, exists
+from typing import List, Optional, Any, Iterator
+from datetime import datetime, date
+from decimal import Decimal
+from itertools import groupby
+import logging
+
+from ..models.invoices import Invoice
+from ..models.payments import Payment
+from ..models.vendors import Vendor
+from ..models.payment_runs import PaymentRun, PaymentRunItem, PaymentRunCreate
+from .payment_files import PaymentFileRow, write_nacha, write_pain001
+
+logger = logging.getLogger(__name__)
+
+PAYMENT_FILE_FORMATS = ("nacha", "pain.001")
+ACH_CURRENCY = "USD"  # NACHA files carry USD cents only
+PAYMENT_FILE_FETCH_SIZE = 1000
+
+
+class PaymentRunService:
+    """Service class for batched vendor payment runs"""
+
+    def create_payment_run(self, db: Session, run: PaymentRunCreate) -> PaymentRun:
+        """Select due invoices, create one payment per vendor and currency, and record the run"""
+        try:
+            pay_through_date = run.pay_through_date or run.payment_date
+            if run.payment_method == "ACH" and run.currency and run.currency.upper() != ACH_CURRENCY:
+                raise ValueError(f"ACH payment runs can only pay {ACH_CURRENCY} invoices; use a Wire or SEPA run")
+            invoices = self._select_due_invoices(db, run, pay_through_date)
+
+            run_number = self._generate_run_number(db)
+            db_run = PaymentRun(
+                run_number=run_number,
+                run_date=date.today(),
+                payment_date=run.payment_date,
+                pay_through_date=pay_through_date,
+                take_discounts=run.take_discounts,
+                payment_method=run.payment_method,
+                status="Created"
+            )
+            db.add(db_run)
+            db.flush()
+
+            # Rows arrive ordered by vendor and currency, so grouping is a single pass
+            groups = []
+            for (vendor_id, currency), group_rows in groupby(invoices, key=lambda row: (row.vendor_id, row.currency)):
+                items = []
+                for row in group_rows:
+                    discount = row.discount_available if run.take_discounts else Decimal("0")
+                    items.append({
+                        "invoice_id": row.id,
+                        "amount": row.open_amount - discount,
+                        "discount_taken": discount
+                    })
+                groups.append((vendor_id, currency, items))
+
+            payment_numbers = self._generate_payment_numbers(db, len(groups))
+            payment_rows = [
+                {
+                    "payment_number": payment_number,
+                    "vendor_id": vendor_id,
+                    "payment_date": run.payment_date,
+                    "amount": sum(item["amount"] for item in items),
+                    "currency": currency,
+                    "payment_method": run.payment_method,
+                    "status": "Pending",
+                    "reference_number": run_number
+                }
+                for payment_number, (vendor_id, currency, items) in zip(payment_numbers, groups)
+            ]
+
+            item_rows = []
+            if payment_rows:
+                payment_ids = db.execute(
+                    insert(Payment).returning(Payment.id, sort_by_parameter_order=True), payment_rows
+                ).scalars().all()
+
+                for payment_id, (_, _, items) in zip(payment_ids, groups):
+                    for item in items:
+                        item_rows.append({"payment_run_id": db_run.id, "payment_id": payment_id, **item})
+
+                db.execute(insert(PaymentRunItem), item_rows)
+
+            db_run.invoice_count = len(item_rows)
+            db_run.payment_count = len(payment_rows)
+            db_run.total_amount = sum((row["amount"] for row in payment_rows), Decimal("0"))
+            db_run.discount_amount = sum((row["discount_taken"] for row in item_rows), Decimal("0"))
+
+            db.commit()
+            db.refresh(db_run)
+
+            logger.info(
+                f"Created payment run {run_number}: {db_run.payment_count} payments "
+                f"for {db_run.invoice_count} invoices"
+            )
+            return db_run
+
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error creating payment run: {str(e)}")
+            raise
+
+    def get_payment_run(self, db: Session, run_id: int) -> Optional[PaymentRun]:
+        """Get a payment run by ID"""
+        try:
+            return db.query(PaymentRun).filter(PaymentRun.id == run_id).first()
+        except Exception as e:
+            logger.error(f"Error retrieving payment run {run_id}: {str(e)}")
+            raise
+
+    def check_payment_file(self, db: Session, run: PaymentRun, file_format: str) -> None:
+        """Reject a file format the run's payments cannot be written in, before streaming starts"""
+        if file_format not in PAYMENT_FILE_FORMATS:
+            raise ValueError(f"Unsupported payment file format: {file_format}")
+
+        if file_format == "nacha":
+            other_currencies = db.query(Payment.currency).join(
+                PaymentRunItem, PaymentRunItem.payment_id == Payment.id
+            ).filter(
+                PaymentRunItem.payment_run_id == run.id,
+                func.upper(Payment.currency) != ACH_CURRENCY
+            ).distinct().all()
+            if other_currencies:
+                currencies = ", ".join(sorted(row.currency for row in other_currencies))
+                raise ValueError(f"NACHA files carry {ACH_CURRENCY} only; run {run.run_number} has {currencies} payments")
+
+    def stream_payment_file(self, db: Session, run: PaymentRun, file_format: str) -> Iterator[str]:
+        """Stream the bank file for a run without materializing the payments"""
+        if file_format not in PAYMENT_FILE_FORMATS:
+            raise ValueError(f"Unsupported payment file format: {file_format}")
+
+        rows = self._iter_payment_file_rows(db, run.id)
+        if file_format == "nacha":
+            yield from write_nacha(rows, effective_date=run.payment_date)
+        else:
+            yield from write_pain001(
+                rows,
+                message_id=run.run_number,
+                execution_date=run.payment_date,
+                transaction_count=run.payment_count,
+                control_sum=run.total_amount
+            )
+
+        if run.status == "Created":
+            run.status = "Exported"
+            run.exported_at = datetime.utcnow()
+            db.commit()
+
+    def _select_due_invoices(self, db: Session, run: PaymentRunCreate, pay_through_date: date) -> List[Any]:
+        """One query for every payable invoice, ordered for grouping"""
+        open_amount = Invoice.total_amount - Invoice.paid_amount
+
+        discount_eligible = and_(
+            Invoice.discount_date.isnot(None),
+            Invoice.discount_date >= run.payment_date,
+            Invoice.paid_amount == 0
+        )
+
+        # An invoice is due when it falls due in the window, or when paying it
+        # now still earns its early-payment discount
+        due_filter = Invoice.due_date <= pay_through_date
+        if run.take_discounts:
+            due_filter = or_(due_filter, discount_eligible)
+
+        already_scheduled = exists().where(and_(
+            PaymentRunItem.invoice_id == Invoice.id,
+            PaymentRunItem.payment_run_id == PaymentRun.id,
+            PaymentRun.status != "Cancelled"
+        ))
+
+        query = db.query(
+            Invoice.id,
+            Invoice.vendor_id,
+            Invoice.currency,
+            open_amount.label("open_amount"),
+            case(
+                (discount_eligible, func.coalesce(Invoice.discount_amount, 0)),
+                else_=0
+            ).label("discount_available")
+        ).filter(
+            Invoice.status == "Approved",
+            Invoice.paid_amount < Invoice.total_amount,
+            due_filter,
+            ~already_scheduled
+        )
+
+        if run.vendor_ids:
+            query = query.filter(Invoice.vendor_id.in_(run.vendor_ids))
+
+        if run.payment_method == "ACH":
+            # Other currencies stay open for a Wire or SEPA run
+            query = query.filter(Invoice.currency == ACH_CURRENCY)
+        elif run.currency:
+            query = query.filter(Invoice.currency == run.currency)
+
+        return query.order_by(Invoice.vendor_id, Invoice.currency, Invoice.due_date, Invoice.id).all()
+
+    def _iter_payment_file_rows(self, db: Session, run_id: int) -> Iterator[PaymentFileRow]:
+        """Yield file rows in currency order, fetching from the database in chunks"""
+        query = db.query(
+            Payment.payment_number,
+            Vendor.name,
+            Vendor.bank_routing_number,
+            Vendor.bank_account_number,
+            Payment.amount,
+            Payment.currency
+        ).join(
+            Vendor, Vendor.id == Payment.vendor_id
+        ).filter(
+            Payment.id.in_(
+                db.query(PaymentRunItem.payment_id).filter(PaymentRunItem.payment_run_id == run_id)
+            )
+        ).order_by(Payment.currency, Payment.id).yield_per(PAYMENT_FILE_FETCH_SIZE)
+
+        for row in query:
+            yield PaymentFileRow(*row)
+
+    def _generate_run_number(self, db: Session) -> str:
+        """Generate unique payment run number"""
+        try:
+            current_year = datetime.utcnow().year
+            count = db.query(PaymentRun).filter(
+                func.extract('year', PaymentRun.created_at) == current_year
+            ).count()
+
+            return f"PR-{current_year}-{count + 1:05d}"
+
+        except Exception as e:
+            logger.error(f"Error generating payment run number: {str(e)}")
+            raise
+
+    def _generate_payment_numbers(self, db: Session, count: int) -> List[str]:
+        """Allocate a contiguous block of payment numbers"""
+        try:
+            current_year = datetime.utcnow().year
+            existing = db.query(Payment).filter(
+                func.extract('year', Payment.created_at) == current_year
+            ).count()
+
+            return [f"PAY-{current_year}-{existing + offset:06d}" for offset in range(1, count + 1)]
+
+        except Exception as e:
+            logger.error(f"Error generating payment numbers: {str(e)}")
+            raise
@@ -0,0 +1,49 @@
+from typing import Any, Dict, List, Optional
+import logging
+import os
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+GL_SERVICE_URL = os.getenv("GL_SERVICE_URL", "http://gl-service:8000")
+GL_BULK_CHUNK_SIZE = 500  # Journal entries per bulk request
+GL_TIMEOUT_SECONDS = 60.0
+
+
+class GLPostingError(ValueError):
+    """A bulk request failed; entry_ids holds the entries created by earlier requests"""
+
+    def __init__(self, message: str, entry_ids: List[int]):
+        super().__init__(message)
+        self.entry_ids = entry_ids
+
+
+def post_journal_entries(
+    entries: List[Dict[str, Any]],
+    token: Optional[str] = None,
+    post: bool = True,
+    skip_existing: bool = False
+) -> List[int]:
+    """Create journal entries through the GL bulk endpoint and return their IDs.
+
+    Entries go out in chunks of GL_BULK_CHUNK_SIZE, each created atomically by the GL.
+    With skip_existing, entries whose reference the GL already holds are not created again
+    and their existing IDs are returned, which makes resending after a failure safe.
+    """
+    headers = {"Authorization": f"Bearer {token}"} if token else {}
+    entry_ids: List[int] = []
+
+    with httpx.Client(base_url=GL_SERVICE_URL, timeout=GL_TIMEOUT_SECONDS, headers=headers) as client:
+        for start in range(0, len(entries), GL_BULK_CHUNK_SIZE):
+            response = client.post(
+                "/journal-entries/bulk",
+                params={"post": post, "skip_existing_references": skip_existing},
+                json=entries[start:start + GL_BULK_CHUNK_SIZE]
+            )
+            if response.status_code >= 400:
+                raise GLPostingError(f"General ledger rejected journal entries: {response.text}", entry_ids)
+            entry_ids.extend(response.json()["entry_ids"])
+
+    logger.info(f"Created {len(entry_ids)} journal entries in the general ledger")
+    return entry_ids
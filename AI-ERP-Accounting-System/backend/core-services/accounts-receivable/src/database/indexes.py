@@ -0,0 +1,47 @@
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Performance indexes that the ORM models cannot express portably.
+# Every statement must be idempotent; they run on each service start.
+PERFORMANCE_INDEXES = [
+    # Open (sent, not fully paid) invoices for the aging snapshot build. The
+    # predicate must match AgingSnapshotService._open_invoice_filter.
+    """
+    CREATE INDEX IF NOT EXISTS ix_ar_invoices_open_aging
+    ON invoices (customer_id, due_date)
+    INCLUDE (total_amount, paid_amount, invoice_date)
+    WHERE status = 'Sent' AND paid_amount < total_amount
+    """,
+    # Billing run eligibility: sales orders without an invoice (NOT EXISTS probe)
+    """
+    CREATE INDEX IF NOT EXISTS ix_invoices_sales_order
+    ON invoices (sales_order_id)
+    WHERE sales_order_id IS NOT NULL
+    """,
+    # Name search and typeahead for NameSearch (GET /customers?search=, /customers/typeahead)
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    """
+    CREATE INDEX IF NOT EXISTS ix_customers_name_trgm
+    ON customers USING gin (name gin_trgm_ops)
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS ix_customers_name_prefix
+    ON customers (lower(name) text_pattern_ops)
+    """,
+]
+
+
+def create_performance_indexes(engine: Engine) -> None:
+    """Create the service's performance indexes if they do not exist yet"""
+    if engine.dialect.name != "postgresql":
+        logger.info(f"Skipping performance indexes on {engine.dialect.name}")
+        return
+
+    with engine.begin() as connection:
+        for statement in PERFORMANCE_INDEXES:
+            connection.execute(text(statement))
+
+    logger.info(f"Ensured {len(PERFORMANCE_INDEXES)} performance indexes")
@@ -0,0 +1,47 @@
+from contextlib import contextmanager
+from typing import Callable, Iterator
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from .connection import engine, SessionLocal
+
+AFTER_COMMIT_KEY = "after_commit_callbacks"
+
+
+@contextmanager
+def unit_of_work() -> Iterator[Session]:
+    """A session whose commits all land in one database transaction, committed on exit.
+
+    Service calls that commit on their own only release a savepoint here, so the derived
+    writes that follow them (aging deltas, rollups, exposure counters) commit together with
+    the change that caused them, or not at all.
+    """
+    connection = engine.connect()
+    transaction = connection.begin()
+    db = SessionLocal(bind=connection, join_transaction_mode="create_savepoint")
+    db.info[AFTER_COMMIT_KEY] = []
+    try:
+        yield db
+        db.flush()
+        transaction.commit()
+    except Exception:
+        transaction.rollback()
+        raise
+    finally:
+        callbacks = db.info.pop(AFTER_COMMIT_KEY)
+        db.close()
+        connection.close()
+
+    for callback in callbacks:
+        callback()
+
+
+def after_commit(db: Session, callback: Callable[[], None]) -> None:
+    """Run a callback (e.g. a cache invalidation) once the session's work is really committed"""
+    callbacks = db.info.get(AFTER_COMMIT_KEY)
+    if callbacks is not None:
+        # Inside a unit of work a session commit only releases a savepoint
+        callbacks.append(callback)
+    else:
+        event.listen(db, "after_commit", lambda session: callback(), once=True)
@@ -1,25 +1,51 @@
 from fastapi import FastAPI, HTTPException, Depends, status, UploadFile, File
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi.responses import FileResponse
 from sqlalchemy.orm import Session
 from typing import List, Optional
+import asyncio
 import logging
 from datetime import datetime, date
 from decimal import Decimal
 
-from .database.connection import get_db
+from .database.connection import get_db, engine
+from .database.indexes import create_performance_indexes
+from .database.unit_of_work import unit_of_work
 from .models.customers import Customer, CustomerCreate, CustomerUpdate
 from .models.invoices import Invoice, InvoiceCreate, InvoiceUpdate, InvoiceLine
 from .models.payments import Payment, PaymentCreate, PaymentUpdate
 from .models.sales_orders import SalesOrder, SalesOrderCreate, SalesOrderUpdate
 from .models.collections import Collection, CollectionCreate, CollectionUpdate
+from .models.dunning import DunningRunSummary
+from .models.credit_exposure import CreditCheckResult, CreditExposureReconciliation
+from .models.billing_runs import BillingRunCreate, BillingRunSummary
+from .models.statement_runs import StatementRunSummary
+from .models.collector_rollups import CollectionsPerformanceReport
+from .models.subscriptions import (
+    SubscriptionCreate, SubscriptionUpdate, SubscriptionResponse,
+    SubscriptionBillingRunCreate, SubscriptionBillingRunSummary
+)
+from .models.revenue_recognition import (
+    RevenueScheduleCreate, RevenueScheduleResponse, RevenueScheduleEventCreate,
+    RevenueRecognitionRunCreate, RevenueRecognitionRunSummary
+)
+from .models.cash_application import (
+    CashApplicationRequest, CashApplicationBatchSummary, UnappliedCashItemResponse, UnappliedCashResolve
+)
 from .services.ar_service import AccountsReceivableService
 from .services.invoice_service import InvoiceService
 from .services.payment_service import PaymentService
 from .services.customer_service import CustomerService
 from .services.collection_service import CollectionService
+from .services.cash_application_service import CashApplicationService
+from .services.dunning_service import DunningService
+from .services.document_service import DocumentService
+from .services.revenue_recognition_service import RevenueRecognitionService
+from .services.subscription_service import SubscriptionService
 from .utils.validators import validate_invoice, validate_payment
 from .utils.helpers import format_currency
+from .utils.search import NameSearch
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -48,7 +74,89 @@ ar_service = AccountsReceivableService()
 invoice_service = InvoiceService()
 payment_service = PaymentService()
 customer_service = CustomerService()
+customer_search = NameSearch(Customer)
 collection_service = CollectionService()
+dunning_service = DunningService(collection_rollup_service=ar_service.collection_rollup_service)
+document_service = DocumentService()
+revenue_recognition_service = RevenueRecognitionService()
+subscription_service = SubscriptionService(
+    ar_service.credit_exposure_service, ar_service.generate_invoice_numbers
+)
+cash_application_service = CashApplicationService(
+    ar_service.aging_snapshot_service, ar_service.customer_rollup_service, ar_service.credit_exposure_service
+)
+
+@app.on_event("startup")
+async def ensure_performance_indexes():
+    """Create performance indexes that migrations do not manage"""
+    try:
+        create_performance_indexes(engine)
+    except Exception as e:
+        logger.error(f"Error creating performance indexes: {str(e)}")
+
+@app.on_event("startup")
+async def schedule_aging_snapshots():
+    """Build today's aging snapshot if missing and schedule the nightly build"""
+    snapshot_service = ar_service.aging_snapshot_service
+    try:
+        await asyncio.get_running_loop().run_in_executor(None, snapshot_service.ensure_today_snapshot)
+    except Exception as e:
+        logger.error(f"Error building AR aging snapshot: {str(e)}")
+    app.state.aging_snapshot_task = asyncio.get_running_loop().create_task(snapshot_service.run_nightly())
+
+@app.on_event("startup")
+async def backfill_customer_rollups():
+    """Build the customer monthly rollups from invoices on the first start after they were added"""
+    try:
+        await asyncio.get_running_loop().run_in_executor(
+            None, ar_service.customer_rollup_service.ensure_backfilled
+        )
+    except Exception as e:
+        logger.error(f"Error backfilling customer rollups: {str(e)}")
+
+@app.on_event("startup")
+async def resume_dunning_runs():
+    """Resume dunning runs interrupted by a restart"""
+    app.state.dunning_tasks = {}
+    try:
+        run_ids = await asyncio.get_running_loop().run_in_executor(None, dunning_service.get_interrupted_run_ids)
+        for run_id in run_ids:
+            logger.info(f"Resuming dunning run {run_id}")
+            start_dunning_task(run_id)
+    except Exception as e:
+        logger.error(f"Error resuming dunning runs: {str(e)}")
+
+@app.on_event("startup")
+async def schedule_credit_exposure_reconciliation():
+    """Periodically verify the credit exposure counters against invoices and orders"""
+    app.state.credit_exposure_task = asyncio.get_running_loop().create_task(
+        ar_service.credit_exposure_service.run_reconciliation()
+    )
+
+@app.on_event("startup")
+async def resume_statement_runs():
+    """Resume statement runs interrupted by a restart"""
+    app.state.statement_tasks = {}
+    try:
+        run_ids = await asyncio.get_running_loop().run_in_executor(None, document_service.get_interrupted_run_ids)
+        for run_id in run_ids:
+            logger.info(f"Resuming statement run {run_id}")
+            start_statement_task(run_id)
+    except Exception as e:
+        logger.error(f"Error resuming statement runs: {str(e)}")
+
+@app.on_event("shutdown")
+async def stop_aging_snapshots():
+    """Cancel the nightly aging snapshot and credit exposure reconciliation tasks"""
+    for name in ("aging_snapshot_task", "credit_exposure_task"):
+        task = getattr(app.state, name, None)
+        if task:
+            task.cancel()
+
+@app.on_event("shutdown")
+async def stop_render_farm():
+    """Stop the document rendering worker processes"""
+    document_service.farm.shutdown()
 
 @app.get("/")
 async def root():
@@ -79,7 +187,9 @@ async def create_customer(
 ):
     """Create a new customer"""
     try:
-        return customer_service.create_customer(db, customer)
+        db_customer = customer_service.create_customer(db, customer)
+        customer_search.invalidate()
+        return db_customer
     except Exception as e:
         logger.error(f"Error creating customer: {str(e)}")
         raise HTTPException(status_code=400, detail=str(e))
@@ -95,11 +205,34 @@ async def get_customers(
 ):
     """Get customers with optional filtering"""
     try:
+        if search:
+            # Ranked trigram search instead of a wildcard scan
+            filters = []
+            if active is not None:
+                filters.append(Customer.is_active == active)
+            return customer_search.search(db, search, skip=skip, limit=limit, filters=filters)
+        
         return customer_service.get_customers(db, skip=skip, limit=limit, active=active, search=search)
     except Exception as e:
         logger.error(f"Error retrieving customers: {str(e)}")
         raise HTTPException(status_code=400, detail=str(e))
 
+@app.get("/customers/typeahead")
+async def customer_typeahead(
+    prefix: str,
+    limit: int = 10,
+    active: Optional[bool] = True,
+    db: Session = Depends(get_db),
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    """Suggest customers whose name starts with the prefix"""
+    try:
+        filters = [Customer.is_active == active] if active is not None else []
+        return customer_search.typeahead(db, prefix, limit=min(limit, 50), filters=filters)
+    except Exception as e:
+        logger.error(f"Error retrieving customer suggestions: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+
 @app.get("/customers/{customer_id}", response_model=Customer)
 async def get_customer(
     customer_id: int,
@@ -130,6 +263,8 @@ async def update_customer(
         updated_customer = customer_service.update_customer(db, customer_id, customer)
         if not updated_customer:
             raise HTTPException(status_code=404, detail="Customer not found")
+        customer_search.invalidate()
+        ar_service.credit_exposure_service.invalidate([customer_id])
         return updated_customer
     except HTTPException:
         raise
@@ -137,21 +272,107 @@ async def update_customer(
         logger.error(f"Error updating customer {customer_id}: {str(e)}")
         raise HTTPException(status_code=400, detail=str(e))
 
-@app.post("/customers/{customer_id}/credit-check")
+@app.post("/customers/{customer_id}/credit-check", response_model=CreditCheckResult)
 async def perform_credit_check(
     customer_id: int,
     amount: Decimal,
     db: Session = Depends(get_db),
     credentials: HTTPAuthorizationCredentials = Depends(security)
 ):
-    """Perform credit check for a customer"""
+    """Perform credit check for a customer against the cached exposure counters"""
     try:
-        result = customer_service.perform_credit_check(db, customer_id, amount)
-        return {"credit_approved": result["approved"], "credit_limit": result["limit"], "risk_score": result["risk_score"]}
+        return ar_service.credit_exposure_service.check_credit(db, customer_id, amount)
     except Exception as e:
         logger.error(f"Error performing credit check: {str(e)}")
         raise HTTPException(status_code=400, detail=str(e))
 
+@app.post("/credit-exposure/reconcile", response_model=CreditExposureReconciliation)
+async def reconcile_credit_exposure(
+    correct: bool = True,
+    db: Session = Depends(get_db),
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    """Verify the exposure counters against invoices and orders, correcting drift by default"""
+    try:
+        return ar_service.credit_exposure_service.reconcile(db, correct)
+    except Exception as e:
+        logger.error(f"Error reconciling credit exposure: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/customers/{customer_id}/statement")
+async def get_customer_statement(
+    customer_id: int,
+    statement_date: Optional[date] = None,
+    db: Session = Depends(get_db),
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    """Get the rendered statement PDF for a customer (today if no date given)"""
+    try:
+        document = await asyncio.get_running_loop().run_in_executor(
+            None, document_service.get_customer_statement, customer_id, statement_date
+        )
+        if not document:
+            raise HTTPException(status_code=404, detail="Customer not found")
+        return FileResponse(document[0], media_type="application/pdf", filename=f"statement-{customer_id}.pdf")
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error rendering statement for customer {customer_id}: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+
+def start_statement_task(run_id: int) -> None:
+    """Render a statement run on a worker thread, keeping a reference until it finishes"""
+    tasks = app.state.statement_tasks
+    if run_id in tasks and not tasks[run_id].done():
+        return
+    tasks[run_id] = asyncio.get_running_loop().create_task(process_statement_run(run_id))
+
+async def process_statement_run(run_id: int) -> None:
+    """Await the worker so a failure that escapes it is still recorded on the run"""
+    loop = asyncio.get_running_loop()
+    try:
+        await loop.run_in_executor(None, document_service.process_statement_run, run_id)
+    except Exception as e:
+        logger.error(f"Statement run {run_id} failed: {str(e)}")
+        try:
+            await loop.run_in_executor(None, document_service.record_run_failure, run_id, str(e))
+        except Exception as record_error:
+            logger.error(f"Error recording failure of statement run {run_id}: {str(record_error)}")
+
+@app.post("/statements/runs", response_model=StatementRunSummary, status_code=status.HTTP_202_ACCEPTED)
+async def run_statements(
+    statement_date: date,
+    db: Session = Depends(get_db),
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    """Start (or resume) rendering statements for every customer with open invoices"""
+    try:
+        db_run = document_service.start_statement_run(db, statement_date)
+        if db_run.status == "Running":
+            start_statement_task(db_run.id)
+        return db_run
+    except Exception as e:
+        logger.error(f"Error starting statement run: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/statements/runs/{run_id}", response_model=StatementRunSummary)
+async def get_statement_run(
+    run_id: int,
+    db: Session = Depends(get_db),
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    """Get statement run progress by ID"""
+    try:
+        db_run = document_service.get_statement_run(db, run_id)
+        if not db_run:
+            raise HTTPException(status_code=404, detail="Statement run not found")
+        return db_run
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error retrieving statement run {run_id}: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+
 # Sales Order endpoints
 @app.post("/sales-orders", response_model=SalesOrder, status_code=status.HTTP_201_CREATED)
 async def create_sales_order(
@@ -238,7 +459,12 @@ async def create_invoice(
         if not validation_result["valid"]:
             raise HTTPException(status_code=400, detail=validation_result["errors"])
         
-        return invoice_service.create_invoice(db, invoice)
+        with unit_of_work() as uow_db:
+            invoice_id = invoice_service.create_invoice(uow_db, invoice).id
+            ar_service.credit_exposure_service.record_changes(
+                uow_db, {}, invoice_ids=[invoice_id], commit=False
+            )
+        return invoice_service.get_invoice(db, invoice_id)
     except HTTPException:
         raise
     except Exception as e:
@@ -259,6 +485,37 @@ async def generate_invoice_from_order(
         logger.error(f"Error generating invoice from order: {str(e)}")
         raise HTTPException(status_code=400, detail=str(e))
 
+@app.post("/billing-runs", response_model=BillingRunSummary, status_code=status.HTTP_201_CREATED)
+async def run_billing(
+    request: BillingRunCreate,
+    db: Session = Depends(get_db),
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    """Invoice all approved and shipped sales orders that have no invoice yet"""
+    try:
+        return await asyncio.get_running_loop().run_in_executor(None, ar_service.run_billing, db, request)
+    except Exception as e:
+        logger.error(f"Error running billing: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/billing-runs/{run_id}", response_model=BillingRunSummary)
+async def get_billing_run(
+    run_id: int,
+    db: Session = Depends(get_db),
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    """Get a billing run by ID"""
+    try:
+        db_run = ar_service.get_billing_run(db, run_id)
+        if not db_run:
+            raise HTTPException(status_code=404, detail="Billing run not found")
+        return db_run
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error retrieving billing run {run_id}: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+
 @app.get("/invoices", response_model=List[Invoice])
 async def get_invoices(
     skip: int = 0,
@@ -307,16 +564,46 @@ async def update_invoice(
 ):
     """Update an existing invoice"""
     try:
-        updated_invoice = invoice_service.update_invoice(db, invoice_id, invoice)
-        if not updated_invoice:
-            raise HTTPException(status_code=404, detail="Invoice not found")
-        return updated_invoice
+        with unit_of_work() as uow_db:
+            before = ar_service.aging_snapshot_service.capture_open_balances(uow_db, [invoice_id], lock=True)
+            rollups_before = ar_service.customer_rollup_service.capture_invoices(uow_db, [invoice_id])
+            exposure_before = ar_service.credit_exposure_service.capture(uow_db, invoice_ids=[invoice_id])
+            updated_invoice = invoice_service.update_invoice(uow_db, invoice_id, invoice)
+            if not updated_invoice:
+                raise HTTPException(status_code=404, detail="Invoice not found")
+            # Amount, date or customer edits move the invoice's contribution between aging buckets and rollups
+            ar_service.aging_snapshot_service.record_balance_changes(
+                uow_db, before, "Invoice", invoice_id, commit=False
+            )
+            ar_service.customer_rollup_service.record_changes(uow_db, rollups_before, commit=False)
+            ar_service.credit_exposure_service.record_changes(uow_db, exposure_before, commit=False)
+        return invoice_service.get_invoice(db, invoice_id)
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"Error updating invoice {invoice_id}: {str(e)}")
         raise HTTPException(status_code=400, detail=str(e))
 
+@app.get("/invoices/{invoice_id}/pdf")
+async def get_invoice_pdf(
+    invoice_id: int,
+    db: Session = Depends(get_db),
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    """Get the rendered invoice PDF"""
+    try:
+        document = await asyncio.get_running_loop().run_in_executor(
+            None, document_service.get_invoice_document, invoice_id
+        )
+        if not document:
+            raise HTTPException(status_code=404, detail="Invoice not found")
+        return FileResponse(document[0], media_type="application/pdf", filename=f"invoice-{invoice_id}.pdf")
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error rendering invoice {invoice_id}: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+
 @app.post("/invoices/{invoice_id}/send")
 async def send_invoice(
     invoice_id: int,
@@ -325,7 +612,21 @@ async def send_invoice(
 ):
     """Send invoice to customer"""
     try:
-        result = invoice_service.send_invoice(db, invoice_id)
+        # Render (or reuse) the invoice document so the send and later re-sends find it cached
+        await asyncio.get_running_loop().run_in_executor(
+            None, document_service.get_invoice_document, invoice_id
+        )
+        # The send and the aging, rollup and exposure updates it causes commit as one transaction
+        with unit_of_work() as uow_db:
+            before = ar_service.aging_snapshot_service.capture_open_balances(uow_db, [invoice_id], lock=True)
+            rollups_before = ar_service.customer_rollup_service.capture_invoices(uow_db, [invoice_id])
+            exposure_before = ar_service.credit_exposure_service.capture(uow_db, invoice_ids=[invoice_id])
+            result = invoice_service.send_invoice(uow_db, invoice_id)
+            ar_service.aging_snapshot_service.record_balance_changes(
+                uow_db, before, "Invoice", invoice_id, commit=False
+            )
+            ar_service.customer_rollup_service.record_changes(uow_db, rollups_before, commit=False)
+            ar_service.credit_exposure_service.record_changes(uow_db, exposure_before, commit=False)
         return {"message": "Invoice sent successfully", "invoice_id": invoice_id}
     except Exception as e:
         logger.error(f"Error sending invoice {invoice_id}: {str(e)}")
@@ -361,12 +662,87 @@ async def apply_payment(
 ):
     """Apply payment to specific invoices"""
     try:
-        result = payment_service.apply_payment_to_invoices(db, payment_id, invoice_ids)
+        with unit_of_work() as uow_db:
+            before = ar_service.aging_snapshot_service.capture_open_balances(uow_db, invoice_ids, lock=True)
+            rollups_before = ar_service.customer_rollup_service.capture_invoices(uow_db, invoice_ids)
+            exposure_before = ar_service.credit_exposure_service.capture(uow_db, invoice_ids=invoice_ids)
+            result = payment_service.apply_payment_to_invoices(uow_db, payment_id, invoice_ids)
+            ar_service.aging_snapshot_service.record_balance_changes(
+                uow_db, before, "Payment", payment_id, commit=False
+            )
+            ar_service.customer_rollup_service.record_changes(uow_db, rollups_before, commit=False)
+            ar_service.credit_exposure_service.record_changes(uow_db, exposure_before, commit=False)
         return {"message": "Payment applied successfully", "payment_id": payment_id}
     except Exception as e:
         logger.error(f"Error applying payment: {str(e)}")
         raise HTTPException(status_code=400, detail=str(e))
 
+@app.post("/payments/auto-apply", response_model=CashApplicationBatchSummary, status_code=status.HTTP_201_CREATED)
+async def auto_apply_payments(
+    request: CashApplicationRequest,
+    db: Session = Depends(get_db),
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    """Match payments (e.g. a lockbox file) to open invoices; unmatched cash goes to the unapplied queue"""
+    try:
+        return cash_application_service.auto_apply(db, request)
+    except Exception as e:
+        logger.error(f"Error auto-applying payments: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/payments/auto-apply/{batch_id}", response_model=CashApplicationBatchSummary)
+async def get_cash_application_batch(
+    batch_id: int,
+    db: Session = Depends(get_db),
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    """Get a cash application batch by ID"""
+    try:
+        db_batch = cash_application_service.get_batch(db, batch_id)
+        if not db_batch:
+            raise HTTPException(status_code=404, detail="Cash application batch not found")
+        return db_batch
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error retrieving cash application batch {batch_id}: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/payments/unapplied", response_model=List[UnappliedCashItemResponse])
+async def get_unapplied_cash(
+    skip: int = 0,
+    limit: int = 100,
+    status: Optional[str] = "Open",
+    customer_id: Optional[int] = None,
+    db: Session = Depends(get_db),
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    """Get the unapplied cash queue"""
+    try:
+        return cash_application_service.get_unapplied_items(db, skip, limit, status, customer_id)
+    except Exception as e:
+        logger.error(f"Error retrieving unapplied cash: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/payments/unapplied/{item_id}/resolve", response_model=UnappliedCashItemResponse)
+async def resolve_unapplied_cash(
+    item_id: int,
+    resolution: UnappliedCashResolve,
+    db: Session = Depends(get_db),
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    """Close an unapplied cash item after it was applied manually or refunded"""
+    try:
+        db_item = cash_application_service.resolve_unapplied_item(db, item_id, resolution.resolution_notes)
+        if not db_item:
+            raise HTTPException(status_code=404, detail="Unapplied cash item not found")
+        return db_item
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error resolving unapplied cash item {item_id}: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+
 @app.get("/payments", response_model=List[Payment])
 async def get_payments(
     skip: int = 0,
@@ -415,7 +791,11 @@ async def create_collection(
 ):
     """Create a new collection activity"""
     try:
-        return collection_service.create_collection(db, collection)
+        # The activity and its collector rollup increment commit together
+        with unit_of_work() as uow_db:
+            collection_id = collection_service.create_collection(uow_db, collection).id
+            ar_service.collection_rollup_service.record_collections(uow_db, [collection_id], commit=False)
+        return db.query(Collection).filter(Collection.id == collection_id).first()
     except Exception as e:
         logger.error(f"Error creating collection: {str(e)}")
         raise HTTPException(status_code=400, detail=str(e))
@@ -441,19 +821,223 @@ async def get_collections(
         logger.error(f"Error retrieving collections: {str(e)}")
         raise HTTPException(status_code=400, detail=str(e))
 
-@app.post("/collections/automated-dunning")
+def start_dunning_task(run_id: int) -> None:
+    """Run a dunning job in the background, keeping a reference until it finishes"""
+    tasks = app.state.dunning_tasks
+    if run_id in tasks and not tasks[run_id].done():
+        return
+    tasks[run_id] = asyncio.get_running_loop().create_task(dunning_service.process_run(run_id))
+
+@app.post("/collections/automated-dunning", response_model=DunningRunSummary, status_code=status.HTTP_202_ACCEPTED)
 async def run_automated_dunning(
+    as_of_date: Optional[date] = None,
     db: Session = Depends(get_db),
     credentials: HTTPAuthorizationCredentials = Depends(security)
 ):
-    """Run automated dunning process"""
+    """Start (or resume) the dunning run for a date; letters are sent in the background"""
     try:
-        result = collection_service.run_automated_dunning(db)
-        return {"message": "Automated dunning completed", "processed": result["processed"]}
+        db_run = dunning_service.start_run(db, as_of_date)
+        if db_run.status == "Running":
+            start_dunning_task(db_run.id)
+        return db_run
     except Exception as e:
         logger.error(f"Error running automated dunning: {str(e)}")
         raise HTTPException(status_code=400, detail=str(e))
 
+@app.get("/collections/dunning-runs/{run_id}", response_model=DunningRunSummary)
+async def get_dunning_run(
+    run_id: int,
+    db: Session = Depends(get_db),
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    """Get dunning run progress by ID"""
+    try:
+        db_run = dunning_service.get_run(db, run_id)
+        if not db_run:
+            raise HTTPException(status_code=404, detail="Dunning run not found")
+        return db_run
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error retrieving dunning run {run_id}: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+
+# Subscription endpoints
+@app.post("/subscriptions", response_model=SubscriptionResponse, status_code=status.HTTP_201_CREATED)
+async def create_subscription(
+    subscription: SubscriptionCreate,
+    db: Session = Depends(get_db),
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    """Create a recurring subscription"""
+    try:
+        return subscription_service.create_subscription(db, subscription)
+    except Exception as e:
+        logger.error(f"Error creating subscription: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/subscriptions/{subscription_id}", response_model=SubscriptionResponse)
+async def get_subscription(
+    subscription_id: int,
+    db: Session = Depends(get_db),
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    """Get a specific subscription by ID"""
+    try:
+        db_subscription = subscription_service.get_subscription(db, subscription_id)
+        if not db_subscription:
+            raise HTTPException(status_code=404, detail="Subscription not found")
+        return db_subscription
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error retrieving subscription {subscription_id}: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.put("/subscriptions/{subscription_id}", response_model=SubscriptionResponse)
+async def update_subscription(
+    subscription_id: int,
+    subscription_update: SubscriptionUpdate,
+    db: Session = Depends(get_db),
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    """Pause, resume or cancel a subscription, or set its end date"""
+    try:
+        db_subscription = subscription_service.update_subscription(db, subscription_id, subscription_update)
+        if not db_subscription:
+            raise HTTPException(status_code=404, detail="Subscription not found")
+        return db_subscription
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error updating subscription {subscription_id}: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post(
+    "/subscription-billing-runs",
+    response_model=SubscriptionBillingRunSummary,
+    status_code=status.HTTP_201_CREATED
+)
+async def run_subscription_billing(
+    request: SubscriptionBillingRunCreate,
+    db: Session = Depends(get_db),
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    """Invoice every subscription period due on or before the cycle date"""
+    try:
+        return await asyncio.get_running_loop().run_in_executor(
+            None, subscription_service.run_billing, db, request
+        )
+    except Exception as e:
+        logger.error(f"Error running subscription billing: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/subscription-billing-runs/{run_id}", response_model=SubscriptionBillingRunSummary)
+async def get_subscription_billing_run(
+    run_id: int,
+    db: Session = Depends(get_db),
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    """Get a subscription billing run by ID"""
+    try:
+        db_run = subscription_service.get_billing_run(db, run_id)
+        if not db_run:
+            raise HTTPException(status_code=404, detail="Subscription billing run not found")
+        return db_run
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error retrieving subscription billing run {run_id}: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+
+# Revenue recognition endpoints
+@app.post(
+    "/invoices/{invoice_id}/revenue-schedules",
+    response_model=List[RevenueScheduleResponse],
+    status_code=status.HTTP_201_CREATED
+)
+async def create_revenue_schedules(
+    invoice_id: int,
+    schedules: List[RevenueScheduleCreate],
+    db: Session = Depends(get_db),
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    """Defer invoice lines onto straight-line, milestone or usage recognition schedules"""
+    try:
+        return revenue_recognition_service.create_schedules(db, invoice_id, schedules)
+    except Exception as e:
+        logger.error(f"Error creating revenue schedules: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/invoices/{invoice_id}/revenue-schedules", response_model=List[RevenueScheduleResponse])
+async def get_revenue_schedules(
+    invoice_id: int,
+    db: Session = Depends(get_db),
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    """Get the revenue schedules of an invoice"""
+    try:
+        return revenue_recognition_service.get_invoice_schedules(db, invoice_id)
+    except Exception as e:
+        logger.error(f"Error retrieving revenue schedules: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/revenue-schedules/{schedule_id}/events", response_model=RevenueScheduleResponse)
+async def add_revenue_schedule_event(
+    schedule_id: int,
+    event: RevenueScheduleEventCreate,
+    db: Session = Depends(get_db),
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    """Report milestone progress (percent points) or usage against a schedule"""
+    try:
+        db_schedule = revenue_recognition_service.add_event(db, schedule_id, event)
+        if not db_schedule:
+            raise HTTPException(status_code=404, detail="Revenue schedule not found")
+        return db_schedule
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error recording revenue schedule event: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post(
+    "/revenue-recognition/runs",
+    response_model=RevenueRecognitionRunSummary,
+    status_code=status.HTTP_201_CREATED
+)
+async def run_revenue_recognition(
+    request: RevenueRecognitionRunCreate,
+    db: Session = Depends(get_db),
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    """Recognize revenue through a period end and post it to the GL as summarized entries"""
+    try:
+        return await asyncio.get_running_loop().run_in_executor(
+            None, revenue_recognition_service.run_recognition, db, request, credentials.credentials
+        )
+    except Exception as e:
+        logger.error(f"Error running revenue recognition: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/revenue-recognition/runs/{run_id}", response_model=RevenueRecognitionRunSummary)
+async def get_revenue_recognition_run(
+    run_id: int,
+    db: Session = Depends(get_db),
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    """Get a revenue recognition run by ID"""
+    try:
+        db_run = revenue_recognition_service.get_run(db, run_id)
+        if not db_run:
+            raise HTTPException(status_code=404, detail="Revenue recognition run not found")
+        return db_run
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error retrieving revenue recognition run {run_id}: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+
 # Reporting endpoints
 @app.get("/reports/aging")
 async def get_aging_report(
@@ -469,6 +1053,40 @@ async def get_aging_report(
         logger.error(f"Error generating aging report: {str(e)}")
         raise HTTPException(status_code=400, detail=str(e))
 
+@app.get("/reports/aging/trend")
+async def get_aging_trend(
+    start_date: date,
+    end_date: date,
+    customer_id: Optional[int] = None,
+    db: Session = Depends(get_db),
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    """Get daily aging totals from stored snapshots"""
+    try:
+        return ar_service.aging_snapshot_service.get_aging_trend(db, start_date, end_date, customer_id)
+    except Exception as e:
+        logger.error(f"Error generating aging trend: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/reports/aging/snapshots", status_code=status.HTTP_201_CREATED)
+async def build_aging_snapshot(
+    snapshot_date: Optional[date] = None,
+    db: Session = Depends(get_db),
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    """(Re)build the aging snapshot for a date (today if omitted)"""
+    try:
+        db_run = ar_service.aging_snapshot_service.build_snapshot(db, snapshot_date)
+        return {
+            "message": "Aging snapshot built successfully",
+            "snapshot_date": db_run.snapshot_date,
+            "customer_count": db_run.customer_count,
+            "total_outstanding": db_run.total_outstanding
+        }
+    except Exception as e:
+        logger.error(f"Error building aging snapshot: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+
 @app.get("/reports/customer-analysis")
 async def get_customer_analysis(
     start_date: date,
@@ -484,6 +1102,21 @@ async def get_customer_analysis(
         logger.error(f"Error generating customer analysis: {str(e)}")
         raise HTTPException(status_code=400, detail=str(e))
 
+@app.post("/reports/customer-analysis/rollups")
+async def rebuild_customer_rollups(
+    start_month: Optional[date] = None,
+    end_month: Optional[date] = None,
+    db: Session = Depends(get_db),
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    """Recompute customer monthly rollups from invoices (all months if no range given)"""
+    try:
+        rows = ar_service.customer_rollup_service.rebuild(db, start_month, end_month)
+        return {"message": "Customer rollups rebuilt successfully", "rollup_rows": rows}
+    except Exception as e:
+        logger.error(f"Error rebuilding customer rollups: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+
 @app.get("/reports/collections-performance")
 async def get_collections_performance(
     start_date: date,
@@ -498,6 +1131,39 @@ async def get_collections_performance(
         logger.error(f"Error generating collections performance report: {str(e)}")
         raise HTTPException(status_code=400, detail=str(e))
 
+@app.get("/reports/collections-performance/summary", response_model=CollectionsPerformanceReport)
+async def get_collections_performance_summary(
+    start_date: date,
+    end_date: date,
+    group_by: str = "collector",
+    collector: Optional[str] = None,
+    db: Session = Depends(get_db),
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    """Collections performance from the collector daily rollups, grouped by collector and/or day, week or month"""
+    try:
+        return ar_service.collection_rollup_service.get_performance_report(
+            db, start_date, end_date, group_by=group_by, collector=collector
+        )
+    except Exception as e:
+        logger.error(f"Error generating collections performance summary: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/reports/collections-performance/rollups")
+async def rebuild_collector_rollups(
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    db: Session = Depends(get_db),
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    """Recompute collector daily rollups from collection activity (all dates if no range given)"""
+    try:
+        rows = ar_service.collection_rollup_service.rebuild(db, start_date, end_date)
+        return {"message": "Collector rollups rebuilt successfully", "rollup_rows": rows}
+    except Exception as e:
+        logger.error(f"Error rebuilding collector rollups: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000) 
\ No newline at end of file
@@ -0,0 +1,52 @@
+from sqlalchemy import Column, Integer, String, DateTime, Date, Numeric, UniqueConstraint, Index
+from sqlalchemy.ext.declarative import declarative_base
+from datetime import datetime
+
+Base = declarative_base()
+
+# SQLAlchemy Models
+class AgingSnapshotRun(Base):
+    """One nightly aging build; deltas recorded after built_at are applied on top of it"""
+    __tablename__ = "ar_aging_snapshot_runs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    snapshot_date = Column(Date, nullable=False, unique=True, index=True)
+    built_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    customer_count = Column(Integer, default=0)
+    total_outstanding = Column(Numeric(15, 2), default=0)
+    total_invoices = Column(Integer, default=0)
+
+class AgingSnapshot(Base):
+    __tablename__ = "ar_aging_snapshots"
+
+    id = Column(Integer, primary_key=True, index=True)
+    snapshot_date = Column(Date, nullable=False)
+    customer_id = Column(Integer, nullable=False)
+    bucket = Column(String(20), nullable=False)  # current, 1_30_days, 31_60_days, 61_90_days, over_90_days
+    amount = Column(Numeric(15, 2), nullable=False, default=0)
+    invoice_count = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        UniqueConstraint("snapshot_date", "customer_id", "bucket", name="uq_ar_aging_snapshot"),
+        Index("ix_ar_aging_snapshots_customer", "customer_id", "snapshot_date"),
+    )
+
+class AgingDelta(Base):
+    """Intraday change to a customer's aging from an invoice or payment event"""
+    __tablename__ = "ar_aging_deltas"
+
+    id = Column(Integer, primary_key=True, index=True)
+    snapshot_date = Column(Date, nullable=False)
+    customer_id = Column(Integer, nullable=False)
+    bucket = Column(String(20), nullable=False)
+    amount_delta = Column(Numeric(15, 2), nullable=False)
+    count_delta = Column(Integer, nullable=False, default=0)
+    source_type = Column(String(20), nullable=False)  # Invoice, Payment
+    source_id = Column(Integer, nullable=True)
+    invoice_id = Column(Integer, nullable=False)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_ar_aging_deltas_date", "snapshot_date", "created_at"),
+        Index("ix_ar_aging_deltas_customer", "customer_id", "snapshot_date"),
+    )
@@ -0,0 +1,68 @@
+from sqlalchemy import Column, Integer, String, DateTime, Date, Numeric, Text, Index, text
+from sqlalchemy.ext.declarative import declarative_base
+from pydantic import BaseModel, Field
+from typing import Optional
+from datetime import datetime, date
+from decimal import Decimal
+
+Base = declarative_base()
+
+# SQLAlchemy Models
+class BillingRun(Base):
+    """One bulk invoicing pass over all invoiceable sales orders"""
+    __tablename__ = "ar_billing_runs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    billing_date = Column(Date, nullable=False)
+    status = Column(String(20), nullable=False, default="Running")  # Running, Completed, Failed
+    customer_id = Column(Integer, nullable=True)  # Set when the run was limited to one customer
+    order_count = Column(Integer, default=0)
+    invoice_count = Column(Integer, default=0)
+    line_count = Column(Integer, default=0)
+    total_amount = Column(Numeric(15, 2), default=0)
+    first_invoice_number = Column(String(50))
+    last_invoice_number = Column(String(50))
+    error = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    completed_at = Column(DateTime)
+
+    __table_args__ = (
+        # At most one run is in progress at a time
+        Index(
+            "uq_ar_billing_runs_running", "status", unique=True,
+            postgresql_where=text("status = 'Running'"), sqlite_where=text("status = 'Running'")
+        ),
+    )
+
+class InvoiceNumberCounter(Base):
+    """Last invoice number issued in a year; blocks are claimed with UPDATE ... RETURNING"""
+    __tablename__ = "ar_invoice_number_counters"
+
+    year = Column(Integer, primary_key=True)
+    last_number = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+# Pydantic Models
+class BillingRunCreate(BaseModel):
+    billing_date: Optional[date] = None  # Defaults to today
+    payment_terms_days: int = Field(30, ge=0, le=365)
+    customer_id: Optional[int] = None
+    max_orders: Optional[int] = Field(None, gt=0)
+
+class BillingRunSummary(BaseModel):
+    id: int
+    billing_date: date
+    status: str
+    customer_id: Optional[int] = None
+    order_count: int
+    invoice_count: int
+    line_count: int
+    total_amount: Decimal
+    first_invoice_number: Optional[str] = None
+    last_invoice_number: Optional[str] = None
+    error: Optional[str] = None
+    created_at: datetime
+    completed_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
@@ -0,0 +1,104 @@
+from sqlalchemy import Column, Integer, String, DateTime, Numeric, Text, Index
+from sqlalchemy.ext.declarative import declarative_base
+from pydantic import BaseModel, Field
+from typing import Optional, List
+from datetime import datetime
+from decimal import Decimal
+
+Base = declarative_base()
+
+# SQLAlchemy Models
+class CashApplicationBatch(Base):
+    """One automatic cash application pass over a set of incoming payments"""
+    __tablename__ = "ar_cash_application_batches"
+
+    id = Column(Integer, primary_key=True, index=True)
+    source = Column(String(20), nullable=False, default="Lockbox")  # Lockbox, API
+    status = Column(String(20), nullable=False, default="Processing")  # Processing, Completed, Failed
+    payment_count = Column(Integer, default=0)
+    matched_count = Column(Integer, default=0)
+    unmatched_count = Column(Integer, default=0)
+    skipped_count = Column(Integer, default=0)  # Payments that already had applications
+    amount_applied = Column(Numeric(15, 2), default=0)
+    amount_unapplied = Column(Numeric(15, 2), default=0)
+    error = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    completed_at = Column(DateTime)
+
+class CashApplication(Base):
+    """Part of a payment applied to one invoice"""
+    __tablename__ = "ar_cash_applications"
+
+    id = Column(Integer, primary_key=True, index=True)
+    batch_id = Column(Integer, nullable=True, index=True)
+    payment_id = Column(Integer, nullable=False, index=True)
+    invoice_id = Column(Integer, nullable=False, index=True)
+    customer_id = Column(Integer, nullable=False)
+    amount_applied = Column(Numeric(15, 2), nullable=False)
+    match_method = Column(String(20), nullable=False)  # Reference, ExactAmount, Combination
+    applied_at = Column(DateTime, default=datetime.utcnow)
+
+class UnappliedCashItem(Base):
+    """Payment amount the engine could not apply, waiting for a collector"""
+    __tablename__ = "ar_unapplied_cash_queue"
+
+    id = Column(Integer, primary_key=True, index=True)
+    batch_id = Column(Integer, nullable=True, index=True)
+    payment_id = Column(Integer, nullable=False, index=True)
+    customer_id = Column(Integer, nullable=True)
+    amount = Column(Numeric(15, 2), nullable=False)
+    remittance = Column(Text)
+    reason = Column(String(30), nullable=False)  # NoMatch, UnknownCustomer, Overpayment
+    status = Column(String(20), nullable=False, default="Open")  # Open, Resolved
+    resolution_notes = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    resolved_at = Column(DateTime)
+
+    __table_args__ = (
+        Index("ix_ar_unapplied_cash_queue_status", "status", "created_at"),
+    )
+
+# Pydantic Models
+class CashApplicationItem(BaseModel):
+    payment_id: int
+    remittance: Optional[str] = None  # Lockbox remittance text; defaults to the payment reference
+
+class CashApplicationRequest(BaseModel):
+    items: List[CashApplicationItem] = Field(..., min_length=1)
+    source: str = "Lockbox"
+    max_combination_size: int = Field(4, ge=1, le=10)
+
+class CashApplicationBatchSummary(BaseModel):
+    id: int
+    source: str
+    status: str
+    payment_count: int
+    matched_count: int
+    unmatched_count: int
+    skipped_count: int
+    amount_applied: Decimal
+    amount_unapplied: Decimal
+    created_at: datetime
+    completed_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+class UnappliedCashItemResponse(BaseModel):
+    id: int
+    batch_id: Optional[int] = None
+    payment_id: int
+    customer_id: Optional[int] = None
+    amount: Decimal
+    remittance: Optional[str] = None
+    reason: str
+    status: str
+    resolution_notes: Optional[str] = None
+    created_at: datetime
+    resolved_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+class UnappliedCashResolve(BaseModel):
+    resolution_notes: Optional[str] = None
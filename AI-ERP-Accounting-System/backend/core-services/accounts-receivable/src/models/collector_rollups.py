@@ -0,0 +1,47 @@
+from sqlalchemy import Column, Integer, String, DateTime, Date, Numeric, UniqueConstraint
+from sqlalchemy.ext.declarative import declarative_base
+from pydantic import BaseModel
+from typing import List, Optional
+from datetime import datetime, date
+from decimal import Decimal
+
+Base = declarative_base()
+
+# SQLAlchemy Models
+class CollectorDailyRollup(Base):
+    """Collection activity totals per collector per activity day"""
+    __tablename__ = "ar_collector_daily_rollups"
+
+    id = Column(Integer, primary_key=True, index=True)
+    collector = Column(String(100), nullable=False)  # Collection.assigned_to, "Unassigned" when empty
+    activity_date = Column(Date, nullable=False)
+    contact_count = Column(Integer, nullable=False, default=0)
+    promise_count = Column(Integer, nullable=False, default=0)
+    promised_amount = Column(Numeric(15, 2), nullable=False, default=0)
+    recovery_count = Column(Integer, nullable=False, default=0)
+    recovered_amount = Column(Numeric(15, 2), nullable=False, default=0)
+    time_to_pay_days_sum = Column(Integer, nullable=False, default=0)  # Days past due when recovered
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        UniqueConstraint("collector", "activity_date", name="uq_ar_collector_daily_rollup"),
+    )
+
+# Pydantic Models
+class CollectionsPerformanceRow(BaseModel):
+    collector: Optional[str] = None
+    period_start: Optional[date] = None
+    contact_count: int
+    promise_count: int
+    promised_amount: Decimal
+    recovery_count: int
+    recovered_amount: Decimal
+    promise_rate: float
+    avg_time_to_pay_days: float
+
+class CollectionsPerformanceReport(BaseModel):
+    start_date: date
+    end_date: date
+    group_by: str
+    totals: CollectionsPerformanceRow
+    rows: List[CollectionsPerformanceRow]
@@ -0,0 +1,37 @@
+from sqlalchemy import Column, Integer, DateTime, Numeric
+from sqlalchemy.ext.declarative import declarative_base
+from pydantic import BaseModel
+from typing import List
+from datetime import datetime
+from decimal import Decimal
+
+Base = declarative_base()
+
+# SQLAlchemy Models
+class CustomerCreditExposure(Base):
+    """Running credit exposure per customer, kept in step with invoice, payment and order changes"""
+    __tablename__ = "ar_customer_credit_exposure"
+
+    customer_id = Column(Integer, primary_key=True)
+    open_invoice_amount = Column(Numeric(15, 2), nullable=False, default=0)
+    open_order_amount = Column(Numeric(15, 2), nullable=False, default=0)  # Accepted orders not yet invoiced
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+# Pydantic Models
+class CreditCheckResult(BaseModel):
+    customer_id: int
+    credit_approved: bool
+    credit_limit: Decimal
+    open_invoice_amount: Decimal
+    open_order_amount: Decimal
+    exposure: Decimal
+    available_credit: Decimal
+    requested_amount: Decimal
+    risk_score: int
+
+class CreditExposureReconciliation(BaseModel):
+    customers_checked: int
+    mismatches: int
+    corrected: bool
+    mismatched_customer_ids: List[int]
+    checked_at: datetime
@@ -0,0 +1,24 @@
+from sqlalchemy import Column, Integer, DateTime, Date, Numeric, UniqueConstraint
+from sqlalchemy.ext.declarative import declarative_base
+from datetime import datetime
+
+Base = declarative_base()
+
+# SQLAlchemy Models
+class CustomerMonthlyRollup(Base):
+    """Collection metrics per customer for invoices dated in one month"""
+    __tablename__ = "ar_customer_monthly_rollups"
+
+    id = Column(Integer, primary_key=True, index=True)
+    customer_id = Column(Integer, nullable=False)
+    period_month = Column(Date, nullable=False)  # First day of the invoice month
+    invoiced_amount = Column(Numeric(15, 2), nullable=False, default=0)
+    invoice_count = Column(Integer, nullable=False, default=0)
+    collected_amount = Column(Numeric(15, 2), nullable=False, default=0)
+    paid_invoice_count = Column(Integer, nullable=False, default=0)
+    collection_days_sum = Column(Integer, nullable=False, default=0)  # Days from invoice to full payment
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        UniqueConstraint("customer_id", "period_month", name="uq_ar_customer_monthly_rollup"),
+    )
@@ -0,0 +1,64 @@
+from sqlalchemy import Column, Integer, String, DateTime, Date, Numeric, Text, UniqueConstraint, Index
+from sqlalchemy.ext.declarative import declarative_base
+from pydantic import BaseModel
+from typing import Optional
+from datetime import datetime, date
+
+Base = declarative_base()
+
+# SQLAlchemy Models
+class DunningRun(Base):
+    """One dunning pass over overdue customers; last_customer_id is the resume checkpoint"""
+    __tablename__ = "ar_dunning_runs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    as_of_date = Column(Date, nullable=False, unique=True)
+    status = Column(String(20), nullable=False, default="Running")  # Running, Completed, Failed
+    last_customer_id = Column(Integer, nullable=False, default=0)
+    customers_processed = Column(Integer, default=0)
+    letters_sent = Column(Integer, default=0)
+    letters_failed = Column(Integer, default=0)
+    error = Column(Text)
+    started_at = Column(DateTime, default=datetime.utcnow)
+    completed_at = Column(DateTime)
+
+class DunningLetter(Base):
+    """Rendered dunning letter; written before sending so a resumed run never mails a customer twice"""
+    __tablename__ = "ar_dunning_letters"
+
+    id = Column(Integer, primary_key=True, index=True)
+    run_id = Column(Integer, nullable=False)
+    customer_id = Column(Integer, nullable=False)
+    dunning_level = Column(Integer, nullable=False)
+    email = Column(String(255))
+    subject = Column(String(255), nullable=False)
+    body = Column(Text, nullable=False)
+    total_overdue = Column(Numeric(15, 2), nullable=False)
+    invoice_count = Column(Integer, nullable=False)
+    # Pending, Sending, Sent, Failed, NoEmail; Unconfirmed = interrupted mid-send, never resent automatically
+    status = Column(String(20), nullable=False, default="Pending")
+    attempts = Column(Integer, nullable=False, default=0)
+    error = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    sent_at = Column(DateTime)
+
+    __table_args__ = (
+        UniqueConstraint("run_id", "customer_id", name="uq_ar_dunning_letter"),
+        Index("ix_ar_dunning_letters_status", "run_id", "status"),
+    )
+
+# Pydantic Models
+class DunningRunSummary(BaseModel):
+    id: int
+    as_of_date: date
+    status: str
+    last_customer_id: int
+    customers_processed: int
+    letters_sent: int
+    letters_failed: int
+    error: Optional[str] = None
+    started_at: datetime
+    completed_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
@@ -0,0 +1,129 @@
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Date, Text, Numeric, ForeignKey
+from sqlalchemy.ext.declarative import declarative_base
+from pydantic import BaseModel, Field
+from typing import Optional
+from datetime import datetime, date
+from decimal import Decimal
+
+Base = declarative_base()
+
+# SQLAlchemy Models
+class RevenueSchedule(Base):
+    """Deferred revenue of one invoice line and how it is released to revenue"""
+    __tablename__ = "ar_revenue_schedules"
+
+    id = Column(Integer, primary_key=True, index=True)
+    invoice_id = Column(Integer, nullable=False, index=True)
+    invoice_line_id = Column(Integer, nullable=False, unique=True)
+    customer_id = Column(Integer, nullable=False)
+    method = Column(String(20), nullable=False)  # StraightLine, Milestone, Usage
+    total_amount = Column(Numeric(15, 2), nullable=False)
+    recognized_amount = Column(Numeric(15, 2), nullable=False, default=0)
+    start_date = Column(Date, nullable=True)  # StraightLine service period
+    end_date = Column(Date, nullable=True)
+    total_units = Column(Numeric(15, 4), nullable=True)  # Milestone: 100 (percent); Usage: contracted quantity
+    deferred_account_id = Column(Integer, nullable=False)
+    revenue_account_id = Column(Integer, nullable=False)
+    department_id = Column(Integer, nullable=True)
+    cost_center_id = Column(Integer, nullable=True)
+    status = Column(String(20), nullable=False, default="Active", index=True)  # Active, Completed, Cancelled
+    recognized_through = Column(Date, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class RevenueScheduleEvent(Base):
+    """Milestone completion or usage reported against a schedule"""
+    __tablename__ = "ar_revenue_schedule_events"
+
+    id = Column(Integer, primary_key=True, index=True)
+    schedule_id = Column(Integer, ForeignKey("ar_revenue_schedules.id", ondelete="CASCADE"), nullable=False, index=True)
+    event_date = Column(Date, nullable=False)
+    units = Column(Numeric(15, 4), nullable=False)
+    description = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class RevenueRecognitionRun(Base):
+    """One period-end recognition pass over all active schedules"""
+    __tablename__ = "ar_revenue_recognition_runs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    period_end_date = Column(Date, nullable=False, index=True)
+    status = Column(String(20), nullable=False, default="Pending")  # Pending, Posted, Failed
+    attempted_at = Column(DateTime, nullable=True)  # Start of the latest attempt; old Pending runs are resumed
+    schedule_count = Column(Integer, default=0)  # Schedules with revenue released in the run
+    completed_count = Column(Integer, default=0)
+    journal_line_count = Column(Integer, default=0)
+    total_amount = Column(Numeric(15, 2), default=0)
+    journal_entry_ids = Column(Text, nullable=True)  # Comma separated GL entry IDs
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    posted_at = Column(DateTime, nullable=True)
+
+class RevenueRecognitionLine(Base):
+    """Revenue released from one schedule by one run"""
+    __tablename__ = "ar_revenue_recognition_lines"
+
+    id = Column(Integer, primary_key=True, index=True)
+    run_id = Column(Integer, ForeignKey("ar_revenue_recognition_runs.id", ondelete="CASCADE"), nullable=False, index=True)
+    schedule_id = Column(Integer, nullable=False)
+    amount = Column(Numeric(15, 2), nullable=False)
+    completes_schedule = Column(Boolean, nullable=False, default=False)
+    journal_entry_id = Column(Integer, nullable=True)  # GL entry carrying this line's amount
+
+# Pydantic Models
+class RevenueScheduleCreate(BaseModel):
+    invoice_line_id: int
+    method: str = Field(..., pattern="^(StraightLine|Milestone|Usage)$")
+    start_date: Optional[date] = None
+    end_date: Optional[date] = None
+    total_units: Optional[Decimal] = Field(None, gt=0)
+    deferred_account_id: int
+    revenue_account_id: int
+    department_id: Optional[int] = None
+    cost_center_id: Optional[int] = None
+
+class RevenueScheduleResponse(BaseModel):
+    id: int
+    invoice_id: int
+    invoice_line_id: int
+    customer_id: int
+    method: str
+    total_amount: Decimal
+    recognized_amount: Decimal
+    start_date: Optional[date] = None
+    end_date: Optional[date] = None
+    total_units: Optional[Decimal] = None
+    deferred_account_id: int
+    revenue_account_id: int
+    department_id: Optional[int] = None
+    cost_center_id: Optional[int] = None
+    status: str
+    recognized_through: Optional[date] = None
+
+    class Config:
+        from_attributes = True
+
+class RevenueScheduleEventCreate(BaseModel):
+    event_date: date
+    units: Decimal = Field(..., gt=0)
+    description: Optional[str] = None
+
+class RevenueRecognitionRunCreate(BaseModel):
+    period_end_date: date
+    post: bool = True
+
+class RevenueRecognitionRunSummary(BaseModel):
+    id: int
+    period_end_date: date
+    status: str
+    schedule_count: int
+    completed_count: int
+    journal_line_count: int
+    total_amount: Decimal
+    journal_entry_ids: Optional[str] = None
+    error: Optional[str] = None
+    created_at: datetime
+    posted_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
@@ -0,0 +1,39 @@
+from sqlalchemy import Column, Integer, String, DateTime, Date, Text
+from sqlalchemy.ext.declarative import declarative_base
+from pydantic import BaseModel
+from typing import Optional
+from datetime import datetime, date
+
+Base = declarative_base()
+
+# SQLAlchemy Models
+class StatementRun(Base):
+    """Month-end customer statement rendering; last_customer_id is the resume checkpoint"""
+    __tablename__ = "ar_statement_runs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    statement_date = Column(Date, nullable=False, unique=True)
+    status = Column(String(20), nullable=False, default="Running")  # Running, Completed, Failed
+    last_customer_id = Column(Integer, nullable=False, default=0)
+    customer_count = Column(Integer, default=0)
+    rendered_count = Column(Integer, default=0)
+    cached_count = Column(Integer, default=0)  # Statements whose content was already rendered
+    error = Column(Text)
+    started_at = Column(DateTime, default=datetime.utcnow)
+    completed_at = Column(DateTime)
+
+# Pydantic Models
+class StatementRunSummary(BaseModel):
+    id: int
+    statement_date: date
+    status: str
+    last_customer_id: int
+    customer_count: int
+    rendered_count: int
+    cached_count: int
+    error: Optional[str] = None
+    started_at: datetime
+    completed_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
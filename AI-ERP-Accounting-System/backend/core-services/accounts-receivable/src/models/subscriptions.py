@@ -0,0 +1,161 @@
+from sqlalchemy import (
+    Column, Integer, String, Boolean, DateTime, Date, Text, Numeric, ForeignKey, Index, UniqueConstraint
+)
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import relationship
+from pydantic import BaseModel, Field
+from typing import List, Optional
+from datetime import datetime, date
+from decimal import Decimal
+
+Base = declarative_base()
+
+# SQLAlchemy Models
+class Subscription(Base):
+    """Recurring billing contract: the same lines invoiced every interval on a billing day"""
+    __tablename__ = "ar_subscriptions"
+
+    id = Column(Integer, primary_key=True, index=True)
+    customer_id = Column(Integer, nullable=False, index=True)
+    status = Column(String(20), nullable=False, default="Active")  # Active, Paused, Cancelled, Expired
+    start_date = Column(Date, nullable=False)
+    end_date = Column(Date, nullable=True)  # Last day of service; the final period is prorated
+    billing_day = Column(Integer, nullable=False)  # Day of month periods start on, clamped to short months
+    billing_interval_months = Column(Integer, nullable=False, default=1)
+    next_billing_date = Column(Date, nullable=False)  # Start of the next period to invoice
+    payment_terms_days = Column(Integer, nullable=False, default=30)
+    currency = Column(String(3), default="USD")
+    notes = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    lines = relationship("SubscriptionLine", order_by="SubscriptionLine.line_number", cascade="all, delete-orphan")
+
+    __table_args__ = (
+        # Billing runs select due subscriptions by status and date
+        Index("ix_ar_subscriptions_due", "status", "next_billing_date"),
+    )
+
+class SubscriptionLine(Base):
+    __tablename__ = "ar_subscription_lines"
+
+    id = Column(Integer, primary_key=True, index=True)
+    subscription_id = Column(Integer, ForeignKey("ar_subscriptions.id", ondelete="CASCADE"), nullable=False, index=True)
+    line_number = Column(Integer, nullable=False)
+    item_code = Column(String(50))
+    description = Column(Text)
+    quantity = Column(Numeric(15, 4), nullable=False)
+    unit_price = Column(Numeric(15, 4), nullable=False)
+
+class SubscriptionBillingCycle(Base):
+    """One billed period of a subscription; the unique key makes billing idempotent"""
+    __tablename__ = "ar_subscription_billing_cycles"
+
+    id = Column(Integer, primary_key=True, index=True)
+    subscription_id = Column(Integer, nullable=False)
+    period_start = Column(Date, nullable=False)
+    period_end = Column(Date, nullable=False)
+    next_billing_date = Column(Date, nullable=False)
+    billed_days = Column(Integer, nullable=False)
+    period_days = Column(Integer, nullable=False)  # billed_days < period_days when prorated
+    expires_subscription = Column(Boolean, nullable=False, default=False)
+    amount = Column(Numeric(15, 2), nullable=False, default=0)
+    invoice_number = Column(String(50))
+    invoice_id = Column(Integer)
+    run_id = Column(Integer, nullable=False, index=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        UniqueConstraint("subscription_id", "period_start", name="uq_ar_subscription_billing_cycle"),
+    )
+
+class SubscriptionBillingRun(Base):
+    __tablename__ = "ar_subscription_billing_runs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    cycle_date = Column(Date, nullable=False)
+    status = Column(String(20), nullable=False, default="Running")  # Running, Completed, Failed
+    subscription_count = Column(Integer, default=0)
+    invoice_count = Column(Integer, default=0)
+    prorated_count = Column(Integer, default=0)
+    skipped_count = Column(Integer, default=0)  # Periods already billed by an earlier run
+    line_count = Column(Integer, default=0)
+    total_amount = Column(Numeric(15, 2), default=0)
+    first_invoice_number = Column(String(50))
+    last_invoice_number = Column(String(50))
+    error = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    completed_at = Column(DateTime)
+
+# Pydantic Models
+class SubscriptionLineCreate(BaseModel):
+    item_code: Optional[str] = None
+    description: Optional[str] = None
+    quantity: Decimal = Field(..., gt=0)
+    unit_price: Decimal = Field(..., ge=0)
+
+class SubscriptionCreate(BaseModel):
+    customer_id: int
+    start_date: date
+    end_date: Optional[date] = None
+    billing_day: Optional[int] = Field(None, ge=1, le=31)  # Defaults to the start date's day
+    billing_interval_months: int = Field(1, ge=1, le=36)
+    payment_terms_days: int = Field(30, ge=0, le=365)
+    currency: str = "USD"
+    notes: Optional[str] = None
+    lines: List[SubscriptionLineCreate] = Field(..., min_length=1)
+
+class SubscriptionUpdate(BaseModel):
+    status: Optional[str] = Field(None, pattern="^(Active|Paused|Cancelled)$")
+    end_date: Optional[date] = None
+    notes: Optional[str] = None
+
+class SubscriptionLineResponse(BaseModel):
+    id: int
+    line_number: int
+    item_code: Optional[str] = None
+    description: Optional[str] = None
+    quantity: Decimal
+    unit_price: Decimal
+
+    class Config:
+        from_attributes = True
+
+class SubscriptionResponse(BaseModel):
+    id: int
+    customer_id: int
+    status: str
+    start_date: date
+    end_date: Optional[date] = None
+    billing_day: int
+    billing_interval_months: int
+    next_billing_date: date
+    payment_terms_days: int
+    currency: Optional[str] = None
+    notes: Optional[str] = None
+    lines: List[SubscriptionLineResponse]
+
+    class Config:
+        from_attributes = True
+
+class SubscriptionBillingRunCreate(BaseModel):
+    cycle_date: Optional[date] = None  # Defaults to today
+
+class SubscriptionBillingRunSummary(BaseModel):
+    id: int
+    cycle_date: date
+    status: str
+    subscription_count: int
+    invoice_count: int
+    prorated_count: int
+    skipped_count: int
+    line_count: int
+    total_amount: Decimal
+    first_invoice_number: Optional[str] = None
+    last_invoice_number: Optional[str] = None
+    error: Optional[str] = None
+    created_at: datetime
+    completed_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
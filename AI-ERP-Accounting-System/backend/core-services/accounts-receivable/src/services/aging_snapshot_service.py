@@ -0,0 +1,344 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import and_, func, case, insert, select, literal
+from typing import List, Optional, Dict, Any, Iterable, Tuple
+from datetime import datetime, date, timedelta
+from decimal import Decimal
+import asyncio
+import logging
+import os
+
+from ..models.invoices import Invoice
+from ..models.aging_snapshots import AgingSnapshotRun, AgingSnapshot, AgingDelta
+from ..database.connection import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+AGING_BUCKETS = ("current", "1_30_days", "31_60_days", "61_90_days", "over_90_days")
+OPEN_INVOICE_STATUS = "Sent"
+SNAPSHOT_TIME_UTC = os.getenv("AR_AGING_SNAPSHOT_TIME", "00:05")  # HH:MM
+
+
+def aging_bucket(due_date: date, as_of_date: date) -> str:
+    """Python twin of the bucket CASE used by the snapshot build"""
+    days_overdue = (as_of_date - due_date).days
+    if days_overdue <= 0:
+        return "current"
+    if days_overdue <= 30:
+        return "1_30_days"
+    if days_overdue <= 60:
+        return "31_60_days"
+    if days_overdue <= 90:
+        return "61_90_days"
+    return "over_90_days"
+
+
+def empty_aging_buckets() -> Dict[str, Dict[str, Any]]:
+    return {bucket: {"amount": Decimal("0"), "count": 0} for bucket in AGING_BUCKETS}
+
+
+class AgingSnapshotService:
+    """Nightly AR aging snapshots per customer and bucket, kept current with intraday deltas"""
+
+    def build_snapshot(self, db: Session, snapshot_date: Optional[date] = None) -> AgingSnapshotRun:
+        """(Re)build the aging snapshot for a date with one INSERT ... SELECT"""
+        snapshot_date = snapshot_date or datetime.utcnow().date()
+        try:
+            built_at = datetime.utcnow()
+
+            db.query(AgingSnapshot).filter(
+                AgingSnapshot.snapshot_date == snapshot_date
+            ).delete(synchronize_session=False)
+            db.query(AgingSnapshotRun).filter(
+                AgingSnapshotRun.snapshot_date == snapshot_date
+            ).delete(synchronize_session=False)
+
+            bucket = self._bucket_case(snapshot_date)
+            grouped = select(
+                literal(snapshot_date),
+                Invoice.customer_id,
+                bucket,
+                func.sum(Invoice.total_amount - Invoice.paid_amount),
+                func.count(Invoice.id)
+            ).where(
+                self._open_invoice_filter(snapshot_date)
+            ).group_by(Invoice.customer_id, bucket)
+
+            db.execute(insert(AgingSnapshot).from_select(
+                ["snapshot_date", "customer_id", "bucket", "amount", "invoice_count"], grouped
+            ))
+
+            totals = db.query(
+                func.count(func.distinct(AgingSnapshot.customer_id)).label("customers"),
+                func.coalesce(func.sum(AgingSnapshot.amount), 0).label("amount"),
+                func.coalesce(func.sum(AgingSnapshot.invoice_count), 0).label("invoices")
+            ).filter(AgingSnapshot.snapshot_date == snapshot_date).one()
+
+            # Deltas recorded from here on are applied on top of this snapshot
+            db_run = AgingSnapshotRun(
+                snapshot_date=snapshot_date,
+                built_at=built_at,
+                customer_count=totals.customers,
+                total_outstanding=totals.amount,
+                total_invoices=totals.invoices
+            )
+            db.add(db_run)
+            db.commit()
+            db.refresh(db_run)
+
+            logger.info(
+                f"Built AR aging snapshot for {snapshot_date}: {db_run.customer_count} customers, "
+                f"{db_run.total_outstanding} outstanding"
+            )
+            return db_run
+
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error building AR aging snapshot for {snapshot_date}: {str(e)}")
+            raise
+
+    def ensure_today_snapshot(self) -> None:
+        """Build today's snapshot if the nightly run has not produced it yet"""
+        db = SessionLocal()
+        try:
+            today = datetime.utcnow().date()
+            exists = db.query(AgingSnapshotRun.id).filter(AgingSnapshotRun.snapshot_date == today).first()
+            if not exists:
+                self.build_snapshot(db, today)
+        finally:
+            db.close()
+
+    async def run_nightly(self) -> None:
+        """Build each day's snapshot shortly after midnight UTC"""
+        hour, minute = (int(part) for part in SNAPSHOT_TIME_UTC.split(":"))
+        loop = asyncio.get_running_loop()
+        while True:
+            now = datetime.utcnow()
+            next_run = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+            if next_run <= now:
+                next_run += timedelta(days=1)
+            await asyncio.sleep((next_run - now).total_seconds())
+
+            try:
+                await loop.run_in_executor(None, self.ensure_today_snapshot)
+            except Exception as e:
+                logger.error(f"Nightly AR aging snapshot failed: {str(e)}")
+
+    def get_aging(
+        self,
+        db: Session,
+        as_of_date: Optional[date] = None,
+        customer_id: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """Aging for one customer or the whole book, read from the snapshot plus deltas"""
+        as_of_date = as_of_date or datetime.utcnow().date()
+        try:
+            db_run = db.query(AgingSnapshotRun).filter(
+                AgingSnapshotRun.snapshot_date == as_of_date
+            ).first()
+
+            if db_run is None:
+                # No snapshot for that day (e.g. before tonight's build): aggregate live
+                rows = self._live_rows(db, as_of_date, customer_id)
+                source = "live"
+            else:
+                rows = self._snapshot_rows(db, db_run, customer_id)
+                source = "snapshot"
+
+            aging_buckets = empty_aging_buckets()
+            for bucket, amount, count in rows:
+                aging_buckets[bucket]["amount"] += amount or Decimal("0")
+                aging_buckets[bucket]["count"] += count or 0
+
+            return {
+                "as_of_date": as_of_date,
+                "customer_id": customer_id,
+                "aging_buckets": aging_buckets,
+                "total_outstanding": sum((values["amount"] for values in aging_buckets.values()), Decimal("0")),
+                "total_invoices": sum(values["count"] for values in aging_buckets.values()),
+                "source": source,
+                "snapshot_built_at": db_run.built_at if db_run else None
+            }
+
+        except Exception as e:
+            logger.error(f"Error reading AR aging for {as_of_date}: {str(e)}")
+            raise
+
+    def get_aging_trend(
+        self,
+        db: Session,
+        start_date: date,
+        end_date: date,
+        customer_id: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """Bucket totals per snapshot date, straight from stored snapshots"""
+        try:
+            query = db.query(
+                AgingSnapshot.snapshot_date,
+                AgingSnapshot.bucket,
+                func.sum(AgingSnapshot.amount).label("amount"),
+                func.sum(AgingSnapshot.invoice_count).label("count")
+            ).filter(
+                AgingSnapshot.snapshot_date.between(start_date, end_date)
+            )
+
+            if customer_id:
+                query = query.filter(AgingSnapshot.customer_id == customer_id)
+
+            rows = query.group_by(AgingSnapshot.snapshot_date, AgingSnapshot.bucket).order_by(
+                AgingSnapshot.snapshot_date
+            ).all()
+
+            trend: Dict[date, Dict[str, Any]] = {}
+            for row in rows:
+                point = trend.setdefault(row.snapshot_date, {
+                    "snapshot_date": row.snapshot_date,
+                    "aging_buckets": empty_aging_buckets(),
+                    "total_outstanding": Decimal("0")
+                })
+                point["aging_buckets"][row.bucket]["amount"] += row.amount
+                point["aging_buckets"][row.bucket]["count"] += row.count
+                point["total_outstanding"] += row.amount
+
+            return list(trend.values())
+
+        except Exception as e:
+            logger.error(f"Error reading AR aging trend: {str(e)}")
+            raise
+
+    def capture_open_balances(
+        self,
+        db: Session,
+        invoice_ids: Iterable[int],
+        lock: bool = False
+    ) -> Dict[int, Tuple[Any, ...]]:
+        """Aging contribution of invoices before an event changes them.
+
+        With lock, the invoice rows stay locked until the caller's transaction ends, so a
+        concurrent change cannot land between this capture and the one after the event.
+        """
+        invoice_ids = list(invoice_ids)
+        if not invoice_ids:
+            return {}
+
+        query = db.query(
+            Invoice.id, Invoice.customer_id, Invoice.due_date, Invoice.status,
+            Invoice.total_amount, Invoice.paid_amount
+        ).filter(Invoice.id.in_(invoice_ids))
+        if lock:
+            query = query.order_by(Invoice.id).with_for_update()
+        as_of_date = datetime.utcnow().date()
+        return {row.id: self._contribution(row, as_of_date) for row in query.all()}
+
+    def record_balance_changes(
+        self,
+        db: Session,
+        before: Dict[int, Tuple[Any, ...]],
+        source_type: str,
+        source_id: Optional[int] = None,
+        commit: bool = True
+    ) -> int:
+        """Write deltas for the invoices whose aging contribution changed since capture"""
+        try:
+            after = self.capture_open_balances(db, before.keys())
+            snapshot_date = datetime.utcnow().date()
+
+            delta_rows = []
+            for invoice_id, (customer_id, due_date, amount_before, count_before) in before.items():
+                _, _, amount_after, count_after = after.get(invoice_id, (customer_id, due_date, Decimal("0"), 0))
+                if amount_after == amount_before and count_after == count_before:
+                    continue
+                delta_rows.append({
+                    "snapshot_date": snapshot_date,
+                    "customer_id": customer_id,
+                    "bucket": aging_bucket(due_date, snapshot_date),
+                    "amount_delta": amount_after - amount_before,
+                    "count_delta": count_after - count_before,
+                    "source_type": source_type,
+                    "source_id": source_id,
+                    "invoice_id": invoice_id
+                })
+
+            if delta_rows:
+                db.execute(insert(AgingDelta), delta_rows)
+            if commit:
+                db.commit()
+            return len(delta_rows)
+
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error recording AR aging deltas: {str(e)}")
+            raise
+
+    def _contribution(self, row: Any, as_of_date: date) -> Tuple[Any, ...]:
+        outstanding = (row.total_amount or Decimal("0")) - (row.paid_amount or Decimal("0"))
+        is_open = (
+            row.status == OPEN_INVOICE_STATUS and outstanding > 0
+            and row.due_date is not None and row.due_date <= as_of_date
+        )
+        return (
+            row.customer_id,
+            row.due_date,
+            outstanding if is_open else Decimal("0"),
+            1 if is_open else 0
+        )
+
+    def _snapshot_rows(
+        self,
+        db: Session,
+        db_run: AgingSnapshotRun,
+        customer_id: Optional[int]
+    ) -> List[Tuple[str, Decimal, int]]:
+        snapshot_query = db.query(
+            AgingSnapshot.bucket,
+            func.sum(AgingSnapshot.amount),
+            func.sum(AgingSnapshot.invoice_count)
+        ).filter(AgingSnapshot.snapshot_date == db_run.snapshot_date)
+
+        delta_query = db.query(
+            AgingDelta.bucket,
+            func.sum(AgingDelta.amount_delta),
+            func.sum(AgingDelta.count_delta)
+        ).filter(
+            AgingDelta.snapshot_date == db_run.snapshot_date,
+            AgingDelta.created_at >= db_run.built_at
+        )
+
+        if customer_id:
+            snapshot_query = snapshot_query.filter(AgingSnapshot.customer_id == customer_id)
+            delta_query = delta_query.filter(AgingDelta.customer_id == customer_id)
+
+        return (
+            snapshot_query.group_by(AgingSnapshot.bucket).all()
+            + delta_query.group_by(AgingDelta.bucket).all()
+        )
+
+    def _live_rows(self, db: Session, as_of_date: date, customer_id: Optional[int]) -> List[Tuple[str, Decimal, int]]:
+        bucket = self._bucket_case(as_of_date)
+        query = db.query(
+            bucket,
+            func.sum(Invoice.total_amount - Invoice.paid_amount),
+            func.count(Invoice.id)
+        ).filter(self._open_invoice_filter(as_of_date))
+
+        if customer_id:
+            query = query.filter(Invoice.customer_id == customer_id)
+
+        return query.group_by(bucket).all()
+
+    def _open_invoice_filter(self, as_of_date: date):
+        # Same population as the original aging report: invoices not yet due are left out
+        return and_(
+            Invoice.status == OPEN_INVOICE_STATUS,
+            Invoice.paid_amount < Invoice.total_amount,
+            Invoice.due_date <= as_of_date
+        )
+
+    def _bucket_case(self, as_of_date: date):
+        # Bucket on due date boundaries so the scan can use an index on due_date
+        return case(
+            (Invoice.due_date >= as_of_date, "current"),
+            (Invoice.due_date >= as_of_date - timedelta(days=30), "1_30_days"),
+            (Invoice.due_date >= as_of_date - timedelta(days=60), "31_60_days"),
+            (Invoice.due_date >= as_of_date - timedelta(days=90), "61_90_days"),
+            else_="over_90_days"
+        )
@@ -1,21 +1,39 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_, func
+from sqlalchemy import and_, or_, func, exists, insert, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
 from typing import List, Optional, Dict, Any
 from datetime import datetime, date, timedelta
 from decimal import Decimal
 import logging
 
 from ..models.customers import Customer, CustomerCreate, CustomerUpdate
-from ..models.invoices import Invoice, InvoiceCreate, InvoiceUpdate
-from ..models.sales_orders import SalesOrder, SalesOrderCreate, SalesOrderUpdate
+from ..models.invoices import Invoice, InvoiceCreate, InvoiceUpdate, InvoiceLine
+from ..models.sales_orders import SalesOrder, SalesOrderCreate, SalesOrderUpdate, SalesOrderLine
 from ..models.collections import Collection, CollectionCreate, CollectionUpdate
+from ..models.billing_runs import BillingRun, BillingRunCreate, InvoiceNumberCounter
 from ..database.connection import get_db
+from ..utils.line_diff import diff_lines, apply_line_diff
+from .aging_snapshot_service import AgingSnapshotService
+from .customer_rollup_service import CustomerRollupService
+from .collection_rollup_service import CollectionRollupService
+from .credit_exposure_service import CreditExposureService
 
 logger = logging.getLogger(__name__)
 
+ORDER_LINE_FIELDS = ("item_code", "description", "quantity", "unit_price", "line_total")
+INVOICEABLE_ORDER_STATUSES = ("Approved", "Shipped")
+BILLING_CHUNK_SIZE = 5000  # Invoices inserted per statement in a billing run
+
 class AccountsReceivableService:
     """Service class for Accounts Receivable operations"""
     
+    def __init__(self):
+        self.aging_snapshot_service = AgingSnapshotService()
+        self.customer_rollup_service = CustomerRollupService()
+        self.credit_exposure_service = CreditExposureService()
+        self.collection_rollup_service = CollectionRollupService()
+    
     def create_sales_order(self, db: Session, so: SalesOrderCreate) -> SalesOrder:
         """Create a new sales order"""
         try:
@@ -44,6 +62,7 @@ class AccountsReceivableService:
             for line_data in so.so_lines:
                 db_line = SalesOrderLine(
                     sales_order_id=db_so.id,
+                    line_number=line_data.line_number,
                     item_code=line_data.item_code,
                     description=line_data.description,
                     quantity=line_data.quantity,
@@ -135,6 +154,8 @@ class AccountsReceivableService:
             if db_so.status in ["Shipped", "Delivered", "Cancelled"]:
                 raise ValueError(f"Cannot update sales order in {db_so.status} status")
             
+            exposure_before = self.credit_exposure_service.capture(db, order_ids=[so_id])
+            
             # Update fields
             update_data = so_update.dict(exclude_unset=True)
             
@@ -142,32 +163,23 @@ class AccountsReceivableService:
                 if field != "so_lines":
                     setattr(db_so, field, value)
             
-            # Update SO lines if provided
+            # Update SO lines if provided, touching only the lines that changed
             if so_update.so_lines is not None:
-                # Delete existing lines
-                db.query(SalesOrderLine).filter(
-                    SalesOrderLine.sales_order_id == so_id
-                ).delete()
-                
-                # Add new lines
-                total_amount = Decimal("0")
-                for line_data in so_update.so_lines:
-                    db_line = SalesOrderLine(
-                        sales_order_id=so_id,
-                        item_code=line_data.item_code,
-                        description=line_data.description,
-                        quantity=line_data.quantity,
-                        unit_price=line_data.unit_price,
-                        line_total=line_data.quantity * line_data.unit_price
-                    )
-                    db.add(db_line)
-                    total_amount += line_data.quantity * line_data.unit_price
+                diff = diff_lines(
+                    db, SalesOrderLine, "sales_order_id", so_id,
+                    [self._order_line_values(line_data) for line_data in so_update.so_lines],
+                    ORDER_LINE_FIELDS
+                )
+                apply_line_diff(db, SalesOrderLine, diff)
                 
-                db_so.total_amount = total_amount
+                # Update total incrementally
+                db_so.total_amount = db_so.total_amount + diff.delta("line_total")
             
             # Update timestamp
             db_so.updated_at = datetime.utcnow()
             
+            db.flush()
+            self.credit_exposure_service.record_changes(db, exposure_before, commit=False)
             db.commit()
             db.refresh(db_so)
             
@@ -190,7 +202,7 @@ class AccountsReceivableService:
             if not so:
                 raise ValueError(f"Sales order {so_id} not found")
             
-            if so.status not in ["Approved", "Shipped"]:
+            if so.status not in INVOICEABLE_ORDER_STATUSES:
                 raise ValueError(f"Cannot generate invoice from sales order in {so.status} status")
             
             # Check if invoice already exists
@@ -201,6 +213,8 @@ class AccountsReceivableService:
             if existing_invoice:
                 raise ValueError(f"Invoice already exists for sales order {so_id}")
             
+            exposure_before = self.credit_exposure_service.capture(db, order_ids=[so_id])
+            
             # Generate invoice number
             invoice_number = self._generate_invoice_number(db)
             
@@ -236,6 +250,11 @@ class AccountsReceivableService:
                 )
                 db.add(invoice_line)
             
+            # The order's exposure moves to the new invoice
+            db.flush()
+            self.credit_exposure_service.record_changes(
+                db, exposure_before, invoice_ids=[invoice.id], commit=False
+            )
             db.commit()
             db.refresh(invoice)
             
@@ -247,69 +266,167 @@ class AccountsReceivableService:
             logger.error(f"Error generating invoice from order: {str(e)}")
             raise
     
+    def run_billing(self, db: Session, request: BillingRunCreate) -> BillingRun:
+        """Invoice every invoiceable sales order in one job with bulk inserts.
+
+        A live run holds a lock on its run row for its whole transaction. A Running row nobody
+        holds belongs to a run that died; its work was rolled back, so it is closed as Failed
+        and the orders it would have billed are picked up by this run.
+        """
+        self._close_abandoned_runs(db)
+
+        billing_date = request.billing_date or date.today()
+        due_date = billing_date + timedelta(days=request.payment_terms_days)
+
+        # Committed on its own so other runs see it as in progress and a failure can be recorded on it;
+        # the partial unique index on Running rows turns a concurrent start into an IntegrityError
+        db_run = BillingRun(billing_date=billing_date, customer_id=request.customer_id, status="Running")
+        db.add(db_run)
+        try:
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+            raise ValueError("Another billing run is still in progress")
+        run_id = db_run.id
+
+        db_run = db.query(BillingRun).filter(BillingRun.id == run_id).with_for_update().one()
+        if db_run.status != "Running":
+            # Taken for abandoned between the commit and the lock
+            db.rollback()
+            raise ValueError(f"Billing run {run_id} was closed by another run before it started")
+
+        try:
+            # Same eligibility as generate_invoice_from_order, for all orders in one query
+            query = db.query(
+                SalesOrder.id, SalesOrder.so_number, SalesOrder.customer_id,
+                SalesOrder.total_amount, SalesOrder.currency
+            ).filter(
+                SalesOrder.status.in_(INVOICEABLE_ORDER_STATUSES),
+                ~exists().where(Invoice.sales_order_id == SalesOrder.id)
+            )
+
+            if request.customer_id:
+                query = query.filter(SalesOrder.customer_id == request.customer_id)
+
+            query = query.order_by(SalesOrder.id)
+            if request.max_orders:
+                query = query.limit(request.max_orders)
+
+            orders = query.all()
+            db_run.order_count = len(orders)
+
+            if orders:
+                exposure_before = self.credit_exposure_service.capture(db, order_ids=[so.id for so in orders])
+                invoice_numbers = self.generate_invoice_numbers(db, len(orders), billing_date.year)
+                invoice_rows = [
+                    {
+                        "invoice_number": invoice_number,
+                        "customer_id": so.customer_id,
+                        "sales_order_id": so.id,
+                        "invoice_date": billing_date,
+                        "due_date": due_date,
+                        "status": "Draft",
+                        "total_amount": so.total_amount,
+                        "currency": so.currency,
+                        "notes": f"Invoice generated from sales order {so.so_number}"
+                    }
+                    for invoice_number, so in zip(invoice_numbers, orders)
+                ]
+
+                invoice_ids = []
+                for start in range(0, len(invoice_rows), BILLING_CHUNK_SIZE):
+                    chunk_ids = db.execute(
+                        insert(Invoice).returning(Invoice.id, sort_by_parameter_order=True),
+                        invoice_rows[start:start + BILLING_CHUNK_SIZE]
+                    ).scalars().all()
+                    invoice_ids.extend(chunk_ids)
+
+                    # Copy the order lines of this chunk with one INSERT ... SELECT
+                    order_lines = select(
+                        Invoice.id,
+                        SalesOrderLine.item_code,
+                        SalesOrderLine.description,
+                        SalesOrderLine.quantity,
+                        SalesOrderLine.unit_price,
+                        SalesOrderLine.line_total
+                    ).join(
+                        Invoice, Invoice.sales_order_id == SalesOrderLine.sales_order_id
+                    ).where(
+                        Invoice.id.in_(chunk_ids)
+                    ).order_by(Invoice.id, SalesOrderLine.line_number)
+
+                    result = db.execute(insert(InvoiceLine).from_select(
+                        ["invoice_id", "item_code", "description", "quantity", "unit_price", "line_total"],
+                        order_lines
+                    ))
+                    db_run.line_count = (db_run.line_count or 0) + result.rowcount
+
+                self.credit_exposure_service.record_changes(
+                    db, exposure_before, invoice_ids=invoice_ids, commit=False
+                )
+
+                db_run.invoice_count = len(invoice_ids)
+                db_run.total_amount = sum((row["total_amount"] or Decimal("0") for row in invoice_rows), Decimal("0"))
+                db_run.first_invoice_number = invoice_numbers[0]
+                db_run.last_invoice_number = invoice_numbers[-1]
+
+            db_run.status = "Completed"
+            db_run.completed_at = datetime.utcnow()
+            db.commit()
+            db.refresh(db_run)
+
+            logger.info(
+                f"Billing run {db_run.id}: {db_run.invoice_count} invoices with {db_run.line_count} lines "
+                f"({db_run.first_invoice_number} to {db_run.last_invoice_number}), total {db_run.total_amount}"
+            )
+            return db_run
+
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error running billing: {str(e)}")
+            db.query(BillingRun).filter(BillingRun.id == run_id).update({
+                BillingRun.status: "Failed",
+                BillingRun.error: str(e),
+                BillingRun.completed_at: datetime.utcnow()
+            }, synchronize_session=False)
+            db.commit()
+            raise
+    
+    def _close_abandoned_runs(self, db: Session) -> None:
+        """Mark Running rows that no live run holds as Failed"""
+        abandoned = db.query(BillingRun.id).filter(
+            BillingRun.status == "Running"
+        ).with_for_update(skip_locked=True).all()
+        for run in abandoned:
+            # Only one caller may close the run
+            closed = db.query(BillingRun).filter(
+                BillingRun.id == run.id,
+                BillingRun.status == "Running"
+            ).update({
+                BillingRun.status: "Failed",
+                BillingRun.error: "Interrupted before completing",
+                BillingRun.completed_at: datetime.utcnow()
+            }, synchronize_session=False)
+            if closed:
+                logger.warning(f"Billing run {run.id} was interrupted; marked as failed")
+        db.commit()
+    
+    def get_billing_run(self, db: Session, run_id: int) -> Optional[BillingRun]:
+        """Get a billing run by ID"""
+        try:
+            return db.query(BillingRun).filter(BillingRun.id == run_id).first()
+        except Exception as e:
+            logger.error(f"Error retrieving billing run {run_id}: {str(e)}")
+            raise
+    
     def generate_aging_report(
         self, 
         db: Session, 
         as_of_date: date, 
         customer_id: Optional[int] = None
     ) -> Dict[str, Any]:
-        """Generate accounts receivable aging report"""
-        try:
-            # Get unpaid invoices
-            query = db.query(Invoice).filter(
-                and_(
-                    Invoice.status == "Sent",
-                    Invoice.due_date <= as_of_date,
-                    Invoice.paid_amount < Invoice.total_amount
-                )
-            )
-            
-            if customer_id:
-                query = query.filter(Invoice.customer_id == customer_id)
-            
-            invoices = query.all()
-            
-            # Calculate aging buckets
-            aging_buckets = {
-                "current": {"amount": Decimal("0"), "count": 0},
-                "1_30_days": {"amount": Decimal("0"), "count": 0},
-                "31_60_days": {"amount": Decimal("0"), "count": 0},
-                "61_90_days": {"amount": Decimal("0"), "count": 0},
-                "over_90_days": {"amount": Decimal("0"), "count": 0}
-            }
-            
-            total_outstanding = Decimal("0")
-            
-            for invoice in invoices:
-                outstanding_amount = invoice.total_amount - invoice.paid_amount
-                days_overdue = (as_of_date - invoice.due_date).days
-                
-                if days_overdue <= 0:
-                    bucket = "current"
-                elif days_overdue <= 30:
-                    bucket = "1_30_days"
-                elif days_overdue <= 60:
-                    bucket = "31_60_days"
-                elif days_overdue <= 90:
-                    bucket = "61_90_days"
-                else:
-                    bucket = "over_90_days"
-                
-                aging_buckets[bucket]["amount"] += outstanding_amount
-                aging_buckets[bucket]["count"] += 1
-                total_outstanding += outstanding_amount
-            
-            return {
-                "as_of_date": as_of_date,
-                "customer_id": customer_id,
-                "aging_buckets": aging_buckets,
-                "total_outstanding": total_outstanding,
-                "total_invoices": len(invoices)
-            }
-            
-        except Exception as e:
-            logger.error(f"Error generating aging report: {str(e)}")
-            raise
+        """Generate accounts receivable aging report from the snapshot and intraday deltas"""
+        return self.aging_snapshot_service.get_aging(db, as_of_date, customer_id)
     
     def generate_customer_analysis(
         self, 
@@ -318,67 +435,19 @@ class AccountsReceivableService:
         end_date: date, 
         customer_id: Optional[int] = None
     ) -> Dict[str, Any]:
-        """Generate customer analysis report"""
-        try:
-            # Get invoices for the period
-            query = db.query(Invoice).filter(
-                and_(
-                    Invoice.invoice_date >= start_date,
-                    Invoice.invoice_date <= end_date
-                )
-            )
-            
-            if customer_id:
-                query = query.filter(Invoice.customer_id == customer_id)
-            
-            invoices = query.all()
-            
-            # Calculate metrics
-            total_invoiced = sum(inv.total_amount for inv in invoices)
-            total_paid = sum(inv.paid_amount for inv in invoices)
-            total_outstanding = total_invoiced - total_paid
-            
-            # Calculate average collection time
-            paid_invoices = [inv for inv in invoices if inv.paid_amount > 0]
-            avg_collection_days = 0
-            if paid_invoices:
-                total_days = sum(
-                    (inv.payment_date - inv.invoice_date).days 
-                    for inv in paid_invoices 
-                    if inv.payment_date
-                )
-                avg_collection_days = total_days / len(paid_invoices)
-            
-            # Customer breakdown
-            customer_breakdown = {}
-            for invoice in invoices:
-                customer_name = invoice.customer.name if invoice.customer else "Unknown"
-                if customer_name not in customer_breakdown:
-                    customer_breakdown[customer_name] = {
-                        "total_invoiced": Decimal("0"),
-                        "total_paid": Decimal("0"),
-                        "invoice_count": 0
-                    }
-                
-                customer_breakdown[customer_name]["total_invoiced"] += invoice.total_amount
-                customer_breakdown[customer_name]["total_paid"] += invoice.paid_amount
-                customer_breakdown[customer_name]["invoice_count"] += 1
-            
-            return {
-                "start_date": start_date,
-                "end_date": end_date,
-                "customer_id": customer_id,
-                "total_invoiced": total_invoiced,
-                "total_paid": total_paid,
-                "total_outstanding": total_outstanding,
-                "avg_collection_days": avg_collection_days,
-                "customer_breakdown": customer_breakdown,
-                "invoice_count": len(invoices)
-            }
-            
-        except Exception as e:
-            logger.error(f"Error generating customer analysis: {str(e)}")
-            raise
+        """Generate customer analysis report from the per-customer monthly rollups"""
+        return self.customer_rollup_service.get_customer_analysis(db, start_date, end_date, customer_id)
+    
+    def _order_line_values(self, line_data: Any) -> Dict[str, Any]:
+        """Column values of an order line, keyed for line diffing"""
+        return {
+            "line_number": line_data.line_number,
+            "item_code": line_data.item_code,
+            "description": line_data.description,
+            "quantity": line_data.quantity,
+            "unit_price": line_data.unit_price,
+            "line_total": line_data.quantity * line_data.unit_price
+        }
     
     def _generate_so_number(self, db: Session) -> str:
         """Generate unique sales order number"""
@@ -397,15 +466,38 @@ class AccountsReceivableService:
     
     def _generate_invoice_number(self, db: Session) -> str:
         """Generate unique invoice number"""
+        return self.generate_invoice_numbers(db, 1)[0]
+    
+    def generate_invoice_numbers(self, db: Session, count: int, year: Optional[int] = None) -> List[str]:
+        """Allocate a contiguous block of invoice numbers from the year's counter row.
+
+        The year is the invoice date's, defaulting to the current one. The counter row stays
+        locked until the caller commits, so concurrent allocations queue behind each other
+        instead of handing out the same numbers.
+        """
         try:
-            current_year = datetime.utcnow().year
-            count = db.query(Invoice).filter(
-                func.extract('year', Invoice.created_at) == current_year
-            ).count()
-            
-            invoice_number = f"INV-{current_year}-{count + 1:05d}"
-            return invoice_number
+            current_year = year or datetime.utcnow().year
+            last_number = db.execute(
+                update(InvoiceNumberCounter)
+                .where(InvoiceNumberCounter.year == current_year)
+                .values(last_number=InvoiceNumberCounter.last_number + count, updated_at=datetime.utcnow())
+                .returning(InvoiceNumberCounter.last_number)
+            ).scalar()
+
+            if last_number is None:
+                # First allocation of the year: continue after the invoices already numbered this year
+                existing = db.query(Invoice).filter(
+                    Invoice.invoice_number.like(f"INV-{current_year}-%")
+                ).count()
+                dialect_insert = postgresql.insert if db.get_bind().dialect.name == "postgresql" else sqlite.insert
+                db.execute(dialect_insert(InvoiceNumberCounter).values(
+                    year=current_year, last_number=existing
+                ).on_conflict_do_nothing(index_elements=["year"]))
+                return self.generate_invoice_numbers(db, count, current_year)
+
+            first_number = last_number - count + 1
+            return [f"INV-{current_year}-{number:05d}" for number in range(first_number, last_number + 1)]
             
         except Exception as e:
-            logger.error(f"Error generating invoice number: {str(e)}")
-            raise 
\ No newline at end of file
+            logger.error(f"Error generating invoice numbers: {str(e)}")
+            raise
@@ -0,0 +1,407 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import and_, or_, func, insert, update
+from typing import List, Optional, Dict, Any, Iterable, Tuple
+from collections import deque
+from datetime import datetime, date
+from decimal import Decimal
+import logging
+import re
+
+from ..models.invoices import Invoice
+from ..models.payments import Payment
+from ..models.cash_application import (
+    CashApplicationBatch, CashApplication, UnappliedCashItem, CashApplicationRequest
+)
+from .aging_snapshot_service import AgingSnapshotService, OPEN_INVOICE_STATUS
+from .customer_rollup_service import CustomerRollupService
+from .credit_exposure_service import CreditExposureService
+
+logger = logging.getLogger(__name__)
+
+# Invoice numbers are INV-YYYY-NNNNN; remitters drop or mangle the separators
+INVOICE_REFERENCE_PATTERN = re.compile(r"INV[\s\-_#:./]*(\d{4})[\s\-_./]*(\d{1,6})(?!\d)", re.IGNORECASE)
+MAX_SUBSET_CANDIDATES = 40  # Oldest open invoices of a customer considered for combinations
+MAX_SUBSET_STATES = 50000  # Reachable sums kept by the combination search
+PAID_INVOICE_STATUS = "Paid"
+APPLIED_PAYMENT_STATUS = "Applied"
+
+
+def parse_invoice_references(remittance: Optional[str]) -> List[str]:
+    """Invoice numbers mentioned in remittance text, normalized and in order of appearance"""
+    if not remittance:
+        return []
+    numbers = []
+    for year, sequence in INVOICE_REFERENCE_PATTERN.findall(remittance):
+        number = f"INV-{year}-{int(sequence):05d}"
+        if number not in numbers:
+            numbers.append(number)
+    return numbers
+
+
+def to_cents(amount: Optional[Decimal]) -> int:
+    return int((Decimal(amount or 0) * 100).quantize(Decimal("1")))
+
+
+def from_cents(cents: int) -> Decimal:
+    return Decimal(cents) / 100
+
+
+class OpenInvoiceIndex:
+    """Open invoices indexed by number, by customer and by (customer, outstanding amount)"""
+
+    def __init__(self, rows: Iterable[Any]):
+        # Rows arrive oldest due date first, so every list below is in collection order
+        self.invoices: Dict[int, Any] = {}
+        self.outstanding: Dict[int, int] = {}
+        self.by_number: Dict[str, int] = {}
+        self.by_customer: Dict[int, List[int]] = {}
+        self.by_amount: Dict[Tuple[int, int], deque] = {}
+
+        for row in rows:
+            cents = to_cents(row.total_amount) - to_cents(row.paid_amount)
+            if cents <= 0:
+                continue
+            self.invoices[row.id] = row
+            self.outstanding[row.id] = cents
+            if row.invoice_number:
+                self.by_number[row.invoice_number.upper()] = row.id
+            self.by_customer.setdefault(row.customer_id, []).append(row.id)
+            self.by_amount.setdefault((row.customer_id, cents), deque()).append(row.id)
+
+    def apply(self, invoice_id: int, cents: int) -> None:
+        # The entry under the old amount goes stale and is dropped lazily by exact_match
+        self.outstanding[invoice_id] -= cents
+        if self.outstanding[invoice_id] > 0:
+            customer_id = self.invoices[invoice_id].customer_id
+            self.by_amount.setdefault((customer_id, self.outstanding[invoice_id]), deque()).append(invoice_id)
+
+    def exact_match(self, customer_id: int, cents: int) -> Optional[int]:
+        """Oldest open invoice of the customer whose outstanding amount equals the payment"""
+        candidates = self.by_amount.get((customer_id, cents))
+        while candidates:
+            invoice_id = candidates[0]
+            if self.outstanding[invoice_id] == cents:
+                return invoice_id
+            candidates.popleft()
+        return None
+
+    def combination_match(self, customer_id: int, cents: int, max_size: int) -> Optional[Tuple[int, ...]]:
+        """Oldest-first set of up to max_size open invoices whose outstanding amounts sum to the payment"""
+        candidates = [
+            invoice_id for invoice_id in self.by_customer.get(customer_id, [])
+            if 0 < self.outstanding[invoice_id] <= cents
+        ][:MAX_SUBSET_CANDIDATES]
+        if len(candidates) < 2:
+            return None
+
+        # Bounded subset-sum: reachable sum -> shortest combination reaching it, oldest invoices on ties.
+        # Keeping the shortest rather than the first one found means the size cap never hides a match.
+        reachable: Dict[int, Tuple[int, ...]] = {0: ()}
+        for invoice_id in candidates:
+            amount = self.outstanding[invoice_id]
+            for total, combination in list(reachable.items()):
+                new_total = total + amount
+                if new_total > cents or len(combination) >= max_size:
+                    continue
+                existing = reachable.get(new_total)
+                if existing is not None and len(existing) <= len(combination) + 1:
+                    continue
+                reachable[new_total] = combination + (invoice_id,)
+            if cents in reachable or len(reachable) > MAX_SUBSET_STATES:
+                break
+
+        combination = reachable.get(cents)
+        return combination if combination and len(combination) > 1 else None
+
+
+class CashApplicationService:
+    """Automatic application of incoming payments to open invoices"""
+
+    def __init__(
+        self,
+        aging_snapshot_service: Optional[AgingSnapshotService] = None,
+        customer_rollup_service: Optional[CustomerRollupService] = None,
+        credit_exposure_service: Optional[CreditExposureService] = None
+    ):
+        self.aging_snapshot_service = aging_snapshot_service or AgingSnapshotService()
+        self.customer_rollup_service = customer_rollup_service or CustomerRollupService()
+        self.credit_exposure_service = credit_exposure_service or CreditExposureService()
+
+    def auto_apply(self, db: Session, request: CashApplicationRequest) -> CashApplicationBatch:
+        """Match a batch of payments to open invoices and post the applications in bulk"""
+        try:
+            db_batch = CashApplicationBatch(
+                source=request.source,
+                status="Processing",
+                payment_count=len(request.items)
+            )
+            db.add(db_batch)
+            db.flush()
+
+            remittances = {item.payment_id: item.remittance for item in request.items}
+            payments = self._load_payments(db, list(remittances))
+            db_batch.skipped_count = len(remittances) - len(payments)
+
+            references = {
+                payment.id: parse_invoice_references(remittances[payment.id] or payment.reference_number)
+                for payment in payments
+            }
+            index = OpenInvoiceIndex(self._load_open_invoices(
+                db,
+                {payment.customer_id for payment in payments if payment.customer_id},
+                {number for numbers in references.values() for number in numbers}
+            ))
+
+            application_rows = []
+            queue_rows = []
+            invoice_payment_dates: Dict[int, date] = {}
+            for payment in payments:
+                matches, remaining, customer_id = self._match_payment(
+                    index, payment, references[payment.id], request.max_combination_size
+                )
+                for invoice_id, cents, method in matches:
+                    application_rows.append({
+                        "batch_id": db_batch.id,
+                        "payment_id": payment.id,
+                        "invoice_id": invoice_id,
+                        "customer_id": index.invoices[invoice_id].customer_id,
+                        "amount_applied": from_cents(cents),
+                        "match_method": method
+                    })
+                    invoice_payment_dates[invoice_id] = payment.payment_date
+
+                if remaining > 0:
+                    if matches:
+                        reason = "Overpayment"
+                    elif customer_id is None:
+                        reason = "UnknownCustomer"
+                    else:
+                        reason = "NoMatch"
+                    queue_rows.append({
+                        "batch_id": db_batch.id,
+                        "payment_id": payment.id,
+                        "customer_id": customer_id,
+                        "amount": from_cents(remaining),
+                        "remittance": remittances[payment.id] or payment.reference_number,
+                        "reason": reason,
+                        "status": "Open"
+                    })
+
+            if invoice_payment_dates:
+                aging_before = self.aging_snapshot_service.capture_open_balances(db, invoice_payment_dates)
+                rollups_before = self.customer_rollup_service.capture_invoices(db, invoice_payment_dates)
+                exposure_before = self.credit_exposure_service.capture(db, invoice_ids=invoice_payment_dates)
+
+                # The open invoices were loaded under a row lock, so the amounts computed from them are current
+                db.execute(update(Invoice), [
+                    {
+                        "id": invoice_id,
+                        "paid_amount": from_cents(
+                            to_cents(index.invoices[invoice_id].total_amount) - index.outstanding[invoice_id]
+                        ),
+                        "payment_date": payment_date,
+                        "status": PAID_INVOICE_STATUS if index.outstanding[invoice_id] <= 0 else OPEN_INVOICE_STATUS
+                    }
+                    for invoice_id, payment_date in invoice_payment_dates.items()
+                ])
+                db.execute(insert(CashApplication), application_rows)
+                self._record_payment_applications(db, payments, application_rows)
+
+                self.aging_snapshot_service.record_balance_changes(
+                    db, aging_before, "CashApplication", db_batch.id, commit=False
+                )
+                self.customer_rollup_service.record_changes(db, rollups_before, commit=False)
+                self.credit_exposure_service.record_changes(db, exposure_before, commit=False)
+
+            if queue_rows:
+                db.execute(insert(UnappliedCashItem), queue_rows)
+
+            db_batch.matched_count = len({row["payment_id"] for row in application_rows})
+            db_batch.unmatched_count = len(queue_rows)
+            db_batch.amount_applied = sum((row["amount_applied"] for row in application_rows), Decimal("0"))
+            db_batch.amount_unapplied = sum((row["amount"] for row in queue_rows), Decimal("0"))
+            db_batch.status = "Completed"
+            db_batch.completed_at = datetime.utcnow()
+            db.commit()
+            db.refresh(db_batch)
+
+            logger.info(
+                f"Cash application batch {db_batch.id}: {db_batch.matched_count} of {len(payments)} payments "
+                f"matched, {db_batch.unmatched_count} queued, {db_batch.amount_applied} applied"
+            )
+            return db_batch
+
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error applying cash automatically: {str(e)}")
+            raise
+
+    def get_batch(self, db: Session, batch_id: int) -> Optional[CashApplicationBatch]:
+        """Get a cash application batch by ID"""
+        try:
+            return db.query(CashApplicationBatch).filter(CashApplicationBatch.id == batch_id).first()
+        except Exception as e:
+            logger.error(f"Error retrieving cash application batch {batch_id}: {str(e)}")
+            raise
+
+    def get_unapplied_items(
+        self,
+        db: Session,
+        skip: int = 0,
+        limit: int = 100,
+        status: Optional[str] = "Open",
+        customer_id: Optional[int] = None
+    ) -> List[UnappliedCashItem]:
+        """Get unapplied cash queue items, oldest first"""
+        try:
+            query = db.query(UnappliedCashItem)
+
+            if status:
+                query = query.filter(UnappliedCashItem.status == status)
+            if customer_id:
+                query = query.filter(UnappliedCashItem.customer_id == customer_id)
+
+            return query.order_by(UnappliedCashItem.created_at, UnappliedCashItem.id).offset(skip).limit(limit).all()
+
+        except Exception as e:
+            logger.error(f"Error retrieving unapplied cash items: {str(e)}")
+            raise
+
+    def resolve_unapplied_item(
+        self,
+        db: Session,
+        item_id: int,
+        resolution_notes: Optional[str] = None
+    ) -> Optional[UnappliedCashItem]:
+        """Close a queue item once the collector has applied or refunded the cash"""
+        try:
+            db_item = db.query(UnappliedCashItem).filter(UnappliedCashItem.id == item_id).first()
+            if not db_item:
+                return None
+            if db_item.status != "Open":
+                raise ValueError(f"Unapplied cash item {item_id} is already {db_item.status}")
+
+            db_item.status = "Resolved"
+            db_item.resolution_notes = resolution_notes
+            db_item.resolved_at = datetime.utcnow()
+            db.commit()
+            db.refresh(db_item)
+            return db_item
+
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error resolving unapplied cash item {item_id}: {str(e)}")
+            raise
+
+    def _match_payment(
+        self,
+        index: OpenInvoiceIndex,
+        payment: Any,
+        references: List[str],
+        max_combination_size: int
+    ) -> Tuple[List[Tuple[int, int, str]], int, Optional[int]]:
+        """Applications for one payment: remittance references first, then exact amount, then combinations"""
+        remaining = to_cents(payment.unapplied_amount)
+        customer_id = payment.customer_id
+        matches: List[Tuple[int, int, str]] = []
+
+        for number in references:
+            invoice_id = index.by_number.get(number)
+            if invoice_id is None or index.outstanding[invoice_id] <= 0:
+                continue
+            invoice_customer_id = index.invoices[invoice_id].customer_id
+            if customer_id is not None and invoice_customer_id != customer_id:
+                continue
+            customer_id = invoice_customer_id
+            cents = min(index.outstanding[invoice_id], remaining)
+            index.apply(invoice_id, cents)
+            matches.append((invoice_id, cents, "Reference"))
+            remaining -= cents
+            if remaining == 0:
+                break
+
+        if matches or customer_id is None or remaining <= 0:
+            return matches, remaining, customer_id
+
+        invoice_id = index.exact_match(customer_id, remaining)
+        if invoice_id is not None:
+            index.apply(invoice_id, remaining)
+            return [(invoice_id, remaining, "ExactAmount")], 0, customer_id
+
+        combination = index.combination_match(customer_id, remaining, max_combination_size)
+        if combination:
+            for invoice_id in combination:
+                cents = index.outstanding[invoice_id]
+                index.apply(invoice_id, cents)
+                matches.append((invoice_id, cents, "Combination"))
+            return matches, 0, customer_id
+
+        return matches, remaining, customer_id
+
+    def _load_payments(self, db: Session, payment_ids: List[int]) -> List[Any]:
+        """Requested payments with cash left to apply and no applications or queue items yet"""
+        # Lock the payments first: a concurrent batch for the same payments waits here and then
+        # sees this batch's applications, so no payment is applied twice
+        unapplied_amount = Payment.amount - func.coalesce(Payment.applied_amount, 0)
+        rows = db.query(
+            Payment.id, Payment.customer_id, Payment.amount, Payment.reference_number, Payment.payment_date,
+            Payment.status, unapplied_amount.label("unapplied_amount")
+        ).filter(
+            Payment.id.in_(payment_ids),
+            or_(Payment.status.is_(None), Payment.status != APPLIED_PAYMENT_STATUS),
+            unapplied_amount > 0
+        ).order_by(Payment.id).with_for_update().all()
+
+        handled = {
+            row.payment_id for row in db.query(CashApplication.payment_id).filter(
+                CashApplication.payment_id.in_(payment_ids)
+            ).distinct()
+        } | {
+            row.payment_id for row in db.query(UnappliedCashItem.payment_id).filter(
+                UnappliedCashItem.payment_id.in_(payment_ids)
+            ).distinct()
+        }
+        return [row for row in rows if row.id not in handled]
+
+    def _record_payment_applications(
+        self,
+        db: Session,
+        payments: List[Any],
+        application_rows: List[Dict[str, Any]]
+    ) -> None:
+        """Add this batch's applications to each payment's applied amount (no commit)"""
+        applied_cents: Dict[int, int] = {}
+        for row in application_rows:
+            applied_cents[row["payment_id"]] = applied_cents.get(row["payment_id"], 0) + to_cents(row["amount_applied"])
+
+        # The payments are locked by _load_payments, so the amounts read there are current
+        db.execute(update(Payment), [
+            {
+                "id": payment.id,
+                "applied_amount": payment.amount - payment.unapplied_amount + from_cents(applied_cents[payment.id]),
+                "status": APPLIED_PAYMENT_STATUS if applied_cents[payment.id] >= to_cents(payment.unapplied_amount)
+                else payment.status
+            }
+            for payment in payments if payment.id in applied_cents
+        ])
+
+    def _load_open_invoices(self, db: Session, customer_ids: set, invoice_numbers: set) -> List[Any]:
+        """Open invoices of the paying customers plus any invoice named in a remittance"""
+        selectors = []
+        if customer_ids:
+            selectors.append(Invoice.customer_id.in_(customer_ids))
+        if invoice_numbers:
+            selectors.append(Invoice.invoice_number.in_(invoice_numbers))
+        if not selectors:
+            return []
+
+        return db.query(
+            Invoice.id, Invoice.customer_id, Invoice.invoice_number,
+            Invoice.total_amount, Invoice.paid_amount, Invoice.due_date
+        ).filter(
+            and_(
+                Invoice.status == OPEN_INVOICE_STATUS,
+                Invoice.paid_amount < Invoice.total_amount,
+                or_(*selectors)
+            )
+        ).order_by(Invoice.due_date, Invoice.id).with_for_update().all()
@@ -0,0 +1,228 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import and_, func, case, insert, select, cast, literal, Integer
+from sqlalchemy.dialects import postgresql, sqlite
+from typing import List, Optional, Dict, Any, Iterable, Tuple
+from datetime import datetime, date, timedelta
+from decimal import Decimal
+import logging
+
+from ..models.collections import Collection
+from ..models.invoices import Invoice
+from ..models.collector_rollups import CollectorDailyRollup
+
+logger = logging.getLogger(__name__)
+
+UNASSIGNED_COLLECTOR = "Unassigned"
+ROLLUP_METRICS = (
+    "contact_count", "promise_count", "promised_amount", "recovery_count", "recovered_amount", "time_to_pay_days_sum"
+)
+GROUPINGS = ("total", "collector", "day", "week", "month", "collector_day", "collector_week", "collector_month")
+
+
+def period_start(value: date, period: Optional[str]) -> Optional[date]:
+    if period == "day":
+        return value
+    if period == "week":
+        return value - timedelta(days=value.weekday())
+    if period == "month":
+        return value.replace(day=1)
+    return None
+
+
+def collection_contribution(row: Any) -> Tuple[Any, ...]:
+    """Rollup metrics one collection activity contributes, in ROLLUP_METRICS order"""
+    promised = row.promised_amount or Decimal("0")
+    recovered = row.amount_collected or Decimal("0")
+    days_past_due = (row.collection_date - row.due_date).days if recovered > 0 and row.due_date else 0
+    return (
+        1,
+        1 if promised > 0 else 0,
+        promised,
+        1 if recovered > 0 else 0,
+        recovered,
+        max(days_past_due, 0)
+    )
+
+
+class CollectionRollupService:
+    """Per-collector, per-day collections rollups maintained as activities are recorded"""
+
+    def record_collections(self, db: Session, collection_ids: Iterable[int], commit: bool = True) -> int:
+        """Add newly created collection activities to their collector-day rollups"""
+        try:
+            collection_ids = list(collection_ids)
+            if not collection_ids:
+                return 0
+
+            rows = db.query(
+                Collection.assigned_to, Collection.collection_date, Collection.promised_amount,
+                Collection.amount_collected, Invoice.due_date
+            ).outerjoin(
+                Invoice, Invoice.id == Collection.invoice_id
+            ).filter(Collection.id.in_(collection_ids)).all()
+
+            increments: Dict[Tuple[str, date], List[Any]] = {}
+            for row in rows:
+                totals = increments.setdefault(
+                    (row.assigned_to or UNASSIGNED_COLLECTOR, row.collection_date), [0] * len(ROLLUP_METRICS)
+                )
+                for index, value in enumerate(collection_contribution(row)):
+                    totals[index] += value
+
+            if increments:
+                self._upsert_increments(db, increments)
+            if commit:
+                db.commit()
+            return len(increments)
+
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error updating collector rollups: {str(e)}")
+            raise
+
+    def rebuild(self, db: Session, start_date: Optional[date] = None, end_date: Optional[date] = None) -> int:
+        """Recompute rollups from collection activity for a date range (all dates if omitted)"""
+        try:
+            delete_query = db.query(CollectorDailyRollup)
+            source_filters = []
+            if start_date:
+                delete_query = delete_query.filter(CollectorDailyRollup.activity_date >= start_date)
+                source_filters.append(Collection.collection_date >= start_date)
+            if end_date:
+                delete_query = delete_query.filter(CollectorDailyRollup.activity_date <= end_date)
+                source_filters.append(Collection.collection_date <= end_date)
+            delete_query.delete(synchronize_session=False)
+
+            collector = func.coalesce(Collection.assigned_to, literal(UNASSIGNED_COLLECTOR))
+            grouped = select(
+                collector, Collection.collection_date, *self._metric_columns(db)
+            ).select_from(Collection).outerjoin(
+                Invoice, Invoice.id == Collection.invoice_id
+            ).where(*source_filters).group_by(collector, Collection.collection_date)
+
+            result = db.execute(insert(CollectorDailyRollup).from_select(
+                ["collector", "activity_date", *ROLLUP_METRICS], grouped
+            ))
+            db.commit()
+
+            logger.info(f"Rebuilt {result.rowcount} collector daily rollups")
+            return result.rowcount
+
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error rebuilding collector rollups: {str(e)}")
+            raise
+
+    def get_performance_report(
+        self,
+        db: Session,
+        start_date: date,
+        end_date: date,
+        group_by: str = "collector",
+        collector: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Collections performance for any range and grouping, read from the daily rollups"""
+        try:
+            if group_by not in GROUPINGS:
+                raise ValueError(f"group_by must be one of: {', '.join(GROUPINGS)}")
+            by_collector = group_by.startswith("collector")
+            period = group_by.split("_")[-1] if group_by not in ("total", "collector") else None
+
+            day_columns = [CollectorDailyRollup.activity_date] if period else []
+            collector_columns = [CollectorDailyRollup.collector] if by_collector else []
+            query = db.query(
+                *collector_columns,
+                *day_columns,
+                *[func.sum(getattr(CollectorDailyRollup, metric)).label(metric) for metric in ROLLUP_METRICS]
+            ).filter(
+                CollectorDailyRollup.activity_date.between(start_date, end_date)
+            )
+            if collector:
+                query = query.filter(CollectorDailyRollup.collector == collector)
+            if collector_columns or day_columns:
+                query = query.group_by(*collector_columns, *day_columns)
+
+            grouped: Dict[Tuple[Optional[str], Optional[date]], List[Any]] = {}
+            totals = [0] * len(ROLLUP_METRICS)
+            for row in query.all():
+                key = (
+                    row.collector if by_collector else None,
+                    period_start(row.activity_date, period) if period else None
+                )
+                values = grouped.setdefault(key, [0] * len(ROLLUP_METRICS))
+                for index, metric in enumerate(ROLLUP_METRICS):
+                    value = getattr(row, metric) or 0
+                    values[index] += value
+                    totals[index] += value
+
+            return {
+                "start_date": start_date,
+                "end_date": end_date,
+                "group_by": group_by,
+                "totals": self._report_row(None, None, totals),
+                "rows": [
+                    self._report_row(key[0], key[1], values)
+                    for key, values in sorted(grouped.items(), key=lambda item: (item[0][0] or "", item[0][1] or date.min))
+                ] if group_by != "total" else []
+            }
+
+        except Exception as e:
+            logger.error(f"Error generating collections performance report: {str(e)}")
+            raise
+
+    def _report_row(self, collector: Optional[str], start: Optional[date], values: List[Any]) -> Dict[str, Any]:
+        metrics = dict(zip(ROLLUP_METRICS, values))
+        contacts = int(metrics["contact_count"])
+        recoveries = int(metrics["recovery_count"])
+        return {
+            "collector": collector,
+            "period_start": start,
+            "contact_count": contacts,
+            "promise_count": int(metrics["promise_count"]),
+            "promised_amount": Decimal(metrics["promised_amount"] or 0),
+            "recovery_count": recoveries,
+            "recovered_amount": Decimal(metrics["recovered_amount"] or 0),
+            "promise_rate": int(metrics["promise_count"]) / contacts if contacts else 0,
+            "avg_time_to_pay_days": int(metrics["time_to_pay_days_sum"]) / recoveries if recoveries else 0
+        }
+
+    def _metric_columns(self, db: Session) -> List[Any]:
+        """Aggregates matching collection_contribution, in ROLLUP_METRICS order"""
+        recovered = Collection.amount_collected > 0
+        if db.get_bind().dialect.name == "postgresql":
+            days_past_due = Collection.collection_date - Invoice.due_date
+        else:
+            days_past_due = cast(func.julianday(Collection.collection_date) - func.julianday(Invoice.due_date), Integer)
+
+        return [
+            func.count(Collection.id).label("contact_count"),
+            func.sum(case((Collection.promised_amount > 0, 1), else_=0)).label("promise_count"),
+            func.coalesce(func.sum(case((Collection.promised_amount > 0, Collection.promised_amount), else_=0)), 0)
+                .label("promised_amount"),
+            func.sum(case((recovered, 1), else_=0)).label("recovery_count"),
+            func.coalesce(func.sum(case((recovered, Collection.amount_collected), else_=0)), 0)
+                .label("recovered_amount"),
+            func.sum(case((and_(recovered, days_past_due > 0), days_past_due), else_=0)).label("time_to_pay_days_sum")
+        ]
+
+    def _upsert_increments(self, db: Session, increments: Dict[Tuple[str, date], List[Any]]) -> None:
+        """Add the increments to existing rollup rows, creating rows that do not exist yet"""
+        dialect = db.get_bind().dialect.name
+        dialect_insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+
+        rows = [
+            {"collector": collector, "activity_date": activity_date, **dict(zip(ROLLUP_METRICS, values))}
+            for (collector, activity_date), values in increments.items()
+        ]
+        statement = dialect_insert(CollectorDailyRollup)
+        statement = statement.on_conflict_do_update(
+            index_elements=["collector", "activity_date"],
+            set_={
+                **{
+                    metric: getattr(CollectorDailyRollup, metric) + getattr(statement.excluded, metric)
+                    for metric in ROLLUP_METRICS
+                },
+                "updated_at": datetime.utcnow()
+            }
+        )
+        db.execute(statement, rows)
@@ -0,0 +1,288 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import and_, func, exists
+from sqlalchemy.dialects import postgresql, sqlite
+from typing import List, Optional, Dict, Any, Iterable, Tuple
+from datetime import datetime
+from decimal import Decimal
+import asyncio
+import logging
+import os
+
+from ..models.customers import Customer
+from ..models.invoices import Invoice
+from ..models.sales_orders import SalesOrder
+from ..models.credit_exposure import CustomerCreditExposure
+from ..database.connection import SessionLocal
+from ..database.unit_of_work import after_commit
+from ..utils.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+EXPOSURE_INVOICE_STATUSES = ("Draft", "Sent")  # Billed, not yet fully paid
+NON_EXPOSURE_ORDER_STATUSES = ("Draft", "Cancelled")  # Orders not yet accepted or withdrawn
+EXPOSURE_CACHE_TTL_SECONDS = int(os.getenv("CREDIT_EXPOSURE_CACHE_TTL", "15"))
+RECONCILE_INTERVAL_MINUTES = int(os.getenv("CREDIT_EXPOSURE_RECONCILE_MINUTES", "360"))
+ZERO = Decimal("0")
+
+
+class CreditExposureService:
+    """Per-customer exposure counters for O(1) credit checks"""
+
+    def __init__(self):
+        self.exposure_cache = TTLCache(ttl_seconds=EXPOSURE_CACHE_TTL_SECONDS, max_entries=10000)
+        self.credit_limit_cache = TTLCache(ttl_seconds=300, max_entries=10000)
+
+    def capture(
+        self,
+        db: Session,
+        invoice_ids: Iterable[int] = (),
+        order_ids: Iterable[int] = ()
+    ) -> Dict[Tuple[str, int], Tuple[int, Decimal]]:
+        """Exposure contribution of invoices and orders before an event changes them"""
+        contributions = {}
+        invoice_ids = list(invoice_ids)
+        order_ids = list(order_ids)
+
+        if invoice_ids:
+            rows = db.query(
+                Invoice.id, Invoice.customer_id, Invoice.status, Invoice.total_amount, Invoice.paid_amount
+            ).filter(Invoice.id.in_(invoice_ids)).all()
+            for row in rows:
+                outstanding = (row.total_amount or ZERO) - (row.paid_amount or ZERO)
+                is_exposure = row.status in EXPOSURE_INVOICE_STATUSES and outstanding > 0
+                contributions[("invoice", row.id)] = (row.customer_id, outstanding if is_exposure else ZERO)
+
+        if order_ids:
+            invoiced = exists().where(
+                Invoice.sales_order_id == SalesOrder.id,
+                Invoice.status != "Cancelled"
+            )
+            rows = db.query(
+                SalesOrder.id, SalesOrder.customer_id, SalesOrder.status, SalesOrder.total_amount,
+                invoiced.label("invoiced")
+            ).filter(SalesOrder.id.in_(order_ids)).all()
+            for row in rows:
+                is_exposure = row.status not in NON_EXPOSURE_ORDER_STATUSES and not row.invoiced
+                contributions[("order", row.id)] = (row.customer_id, (row.total_amount or ZERO) if is_exposure else ZERO)
+
+        return contributions
+
+    def record_changes(
+        self,
+        db: Session,
+        before: Dict[Tuple[str, int], Tuple[int, Decimal]],
+        invoice_ids: Iterable[int] = (),
+        order_ids: Iterable[int] = (),
+        commit: bool = True
+    ) -> int:
+        """Apply exposure changes since capture; invoice_ids/order_ids name entities created since.
+
+        With commit=False the caller commits; cached exposure is dropped only once it has,
+        so a credit check in between cannot cache the pre-change counters again.
+        """
+        try:
+            invoice_ids = {key[1] for key in before if key[0] == "invoice"} | set(invoice_ids)
+            order_ids = {key[1] for key in before if key[0] == "order"} | set(order_ids)
+            after = self.capture(db, invoice_ids, order_ids)
+
+            increments: Dict[int, List[Decimal]] = {}
+            for key in set(before) | set(after):
+                column = 0 if key[0] == "invoice" else 1
+                for (customer_id, amount), sign in ((before.get(key, (None, ZERO)), -1), (after.get(key, (None, ZERO)), 1)):
+                    if customer_id is None or not amount:
+                        continue
+                    increments.setdefault(customer_id, [ZERO, ZERO])[column] += sign * amount
+
+            changed = {customer_id: values for customer_id, values in increments.items() if any(values)}
+            if changed:
+                self._upsert(db, [
+                    {"customer_id": customer_id, "open_invoice_amount": values[0], "open_order_amount": values[1]}
+                    for customer_id, values in changed.items()
+                ], increment=True)
+            if commit:
+                db.commit()
+                self.invalidate(changed)
+            elif changed:
+                after_commit(db, lambda: self.invalidate(changed))
+            return len(changed)
+
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error updating credit exposure: {str(e)}")
+            raise
+
+    def invalidate(self, customer_ids: Optional[Iterable[int]] = None) -> None:
+        """Drop cached exposure (and credit limits) for the given customers, or for everyone"""
+        if customer_ids is None:
+            self.exposure_cache.invalidate()
+            self.credit_limit_cache.invalidate()
+            return
+        customer_ids = set(customer_ids)
+        if customer_ids:
+            self.exposure_cache.invalidate(lambda key: key in customer_ids)
+            self.credit_limit_cache.invalidate(lambda key: key in customer_ids)
+
+    def get_exposure(self, db: Session, customer_id: int) -> Tuple[Decimal, Decimal]:
+        """(open invoice amount, open order amount) for a customer from the counters"""
+        cached = self.exposure_cache.get(customer_id)
+        if cached is not None:
+            return cached
+
+        row = db.query(
+            CustomerCreditExposure.open_invoice_amount, CustomerCreditExposure.open_order_amount
+        ).filter(CustomerCreditExposure.customer_id == customer_id).first()
+        exposure = (row.open_invoice_amount, row.open_order_amount) if row else (ZERO, ZERO)
+        self.exposure_cache.set(customer_id, exposure)
+        return exposure
+
+    def check_credit(self, db: Session, customer_id: int, amount: Decimal) -> Dict[str, Any]:
+        """Approve an order amount against the customer's limit using the exposure counters"""
+        try:
+            credit_limit = self.credit_limit_cache.get(customer_id)
+            if credit_limit is None:
+                row = db.query(Customer.credit_limit).filter(Customer.id == customer_id).first()
+                if row is None:
+                    raise ValueError(f"Customer {customer_id} not found")
+                credit_limit = row.credit_limit or ZERO
+                self.credit_limit_cache.set(customer_id, credit_limit)
+
+            open_invoice_amount, open_order_amount = self.get_exposure(db, customer_id)
+            exposure = open_invoice_amount + open_order_amount
+            projected = exposure + amount
+
+            # 0 at no usage, 50 at the limit, capped at 100 for twice the limit or no limit at all
+            if credit_limit > 0:
+                risk_score = min(100, int(projected / credit_limit * 50))
+            else:
+                risk_score = 100 if projected > 0 else 0
+
+            return {
+                "customer_id": customer_id,
+                "credit_approved": projected <= credit_limit,
+                "credit_limit": credit_limit,
+                "open_invoice_amount": open_invoice_amount,
+                "open_order_amount": open_order_amount,
+                "exposure": exposure,
+                "available_credit": credit_limit - exposure,
+                "requested_amount": amount,
+                "risk_score": risk_score
+            }
+
+        except Exception as e:
+            logger.error(f"Error checking credit for customer {customer_id}: {str(e)}")
+            raise
+
+    def reconcile(self, db: Session, correct: bool = True) -> Dict[str, Any]:
+        """Compare every counter with exposure recomputed from invoices and orders"""
+        try:
+            actual: Dict[int, List[Decimal]] = {}
+            for customer_id, amount in self._invoice_exposure(db):
+                actual.setdefault(customer_id, [ZERO, ZERO])[0] = amount
+            for customer_id, amount in self._order_exposure(db):
+                actual.setdefault(customer_id, [ZERO, ZERO])[1] = amount
+
+            counters = {
+                row.customer_id: [row.open_invoice_amount, row.open_order_amount]
+                for row in db.query(
+                    CustomerCreditExposure.customer_id,
+                    CustomerCreditExposure.open_invoice_amount,
+                    CustomerCreditExposure.open_order_amount
+                )
+            }
+
+            mismatched = sorted(
+                customer_id for customer_id in set(actual) | set(counters)
+                if actual.get(customer_id, [ZERO, ZERO]) != counters.get(customer_id, [ZERO, ZERO])
+            )
+
+            if mismatched and correct:
+                self._upsert(db, [
+                    {
+                        "customer_id": customer_id,
+                        "open_invoice_amount": actual.get(customer_id, [ZERO, ZERO])[0],
+                        "open_order_amount": actual.get(customer_id, [ZERO, ZERO])[1]
+                    }
+                    for customer_id in mismatched
+                ], increment=False)
+                db.commit()
+                self.invalidate(mismatched)
+
+            if mismatched:
+                logger.warning(f"Credit exposure drift for {len(mismatched)} customers: {mismatched[:20]}")
+
+            return {
+                "customers_checked": len(set(actual) | set(counters)),
+                "mismatches": len(mismatched),
+                "corrected": bool(mismatched) and correct,
+                "mismatched_customer_ids": mismatched[:1000],
+                "checked_at": datetime.utcnow()
+            }
+
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error reconciling credit exposure: {str(e)}")
+            raise
+
+    def reconcile_now(self) -> Dict[str, Any]:
+        db = SessionLocal()
+        try:
+            return self.reconcile(db)
+        finally:
+            db.close()
+
+    async def run_reconciliation(self) -> None:
+        """Reconcile the counters on a fixed interval"""
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                await loop.run_in_executor(None, self.reconcile_now)
+            except Exception as e:
+                logger.error(f"Scheduled credit exposure reconciliation failed: {str(e)}")
+            await asyncio.sleep(RECONCILE_INTERVAL_MINUTES * 60)
+
+    def _invoice_exposure(self, db: Session) -> List[Tuple[int, Decimal]]:
+        return db.query(
+            Invoice.customer_id,
+            func.sum(Invoice.total_amount - Invoice.paid_amount)
+        ).filter(
+            Invoice.status.in_(EXPOSURE_INVOICE_STATUSES),
+            Invoice.paid_amount < Invoice.total_amount
+        ).group_by(Invoice.customer_id).all()
+
+    def _order_exposure(self, db: Session) -> List[Tuple[int, Decimal]]:
+        invoiced = exists().where(
+            Invoice.sales_order_id == SalesOrder.id,
+            Invoice.status != "Cancelled"
+        )
+        return db.query(
+            SalesOrder.customer_id,
+            func.sum(SalesOrder.total_amount)
+        ).filter(
+            and_(
+                SalesOrder.status.notin_(NON_EXPOSURE_ORDER_STATUSES),
+                SalesOrder.total_amount > 0,
+                ~invoiced
+            )
+        ).group_by(SalesOrder.customer_id).all()
+
+    def _upsert(self, db: Session, rows: List[Dict[str, Any]], increment: bool) -> None:
+        """Insert counters, or on conflict add to (increment) or overwrite the existing values"""
+        dialect = db.get_bind().dialect.name
+        dialect_insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+
+        statement = dialect_insert(CustomerCreditExposure)
+        amounts = ("open_invoice_amount", "open_order_amount")
+        statement = statement.on_conflict_do_update(
+            index_elements=["customer_id"],
+            set_={
+                **{
+                    column: (
+                        getattr(CustomerCreditExposure, column) + getattr(statement.excluded, column)
+                        if increment else getattr(statement.excluded, column)
+                    )
+                    for column in amounts
+                },
+                "updated_at": datetime.utcnow()
+            }
+        )
+        db.execute(statement, rows)
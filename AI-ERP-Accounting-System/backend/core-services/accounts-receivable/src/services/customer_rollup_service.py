@@ -0,0 +1,301 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import and_, func, case, insert, select, cast, Date, Integer
+from sqlalchemy.dialects import postgresql, sqlite
+from typing import List, Optional, Dict, Any, Iterable, Tuple
+from datetime import datetime, date, timedelta
+from decimal import Decimal
+import logging
+
+from ..models.customers import Customer
+from ..models.invoices import Invoice
+from ..models.customer_rollups import CustomerMonthlyRollup
+from ..database.connection import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+NOT_ISSUED_STATUSES = ("Draft", "Cancelled")
+ROLLUP_METRICS = ("invoiced_amount", "invoice_count", "collected_amount", "paid_invoice_count", "collection_days_sum")
+
+
+def month_start(value: date) -> date:
+    return value.replace(day=1)
+
+
+def next_month(value: date) -> date:
+    return (value.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def invoice_contribution(row: Any) -> Tuple[Any, ...]:
+    """Rollup metrics one invoice contributes, in ROLLUP_METRICS order"""
+    if row.status in NOT_ISSUED_STATUSES:
+        return (Decimal("0"), 0, Decimal("0"), 0, 0)
+
+    total = row.total_amount or Decimal("0")
+    paid = row.paid_amount or Decimal("0")
+    fully_paid = total > 0 and paid >= total and row.payment_date is not None
+    return (
+        total,
+        1,
+        paid,
+        1 if fully_paid else 0,
+        (row.payment_date - row.invoice_date).days if fully_paid else 0
+    )
+
+
+class CustomerRollupService:
+    """Per-customer, per-month collection rollups maintained as invoices are issued and paid"""
+
+    def capture_invoices(self, db: Session, invoice_ids: Iterable[int]) -> Dict[int, Tuple[Any, ...]]:
+        """Rollup key and contribution of invoices before an event changes them"""
+        invoice_ids = list(invoice_ids)
+        if not invoice_ids:
+            return {}
+
+        rows = db.query(
+            Invoice.id, Invoice.customer_id, Invoice.invoice_date, Invoice.status,
+            Invoice.total_amount, Invoice.paid_amount, Invoice.payment_date
+        ).filter(Invoice.id.in_(invoice_ids)).all()
+        return {
+            row.id: ((row.customer_id, month_start(row.invoice_date)), invoice_contribution(row))
+            for row in rows
+        }
+
+    def record_changes(self, db: Session, before: Dict[int, Tuple[Any, ...]], commit: bool = True) -> int:
+        """Apply the change in each invoice's contribution to its customer-month rollup"""
+        try:
+            after = self.capture_invoices(db, before.keys())
+
+            increments: Dict[Tuple[int, date], List[Any]] = {}
+            for invoice_id, (key_before, contribution_before) in before.items():
+                key_after, contribution_after = after.get(invoice_id, (key_before, (0, 0, 0, 0, 0)))
+                if key_after == key_before and contribution_after == contribution_before:
+                    continue
+                for key, contribution, sign in (
+                    (key_before, contribution_before, -1),
+                    (key_after, contribution_after, 1)
+                ):
+                    totals = increments.setdefault(key, [0] * len(ROLLUP_METRICS))
+                    for index, value in enumerate(contribution):
+                        totals[index] += sign * value
+
+            changed = {key: values for key, values in increments.items() if any(values)}
+            if changed:
+                self._upsert_increments(db, changed)
+            if commit:
+                db.commit()
+            return len(changed)
+
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error updating customer rollups: {str(e)}")
+            raise
+
+    def ensure_backfilled(self) -> None:
+        """Build the rollups from invoices once, when the table is empty but invoices have been issued"""
+        db = SessionLocal()
+        try:
+            has_rollups = db.query(CustomerMonthlyRollup.id).first()
+            has_invoices = db.query(Invoice.id).filter(Invoice.status.notin_(NOT_ISSUED_STATUSES)).first()
+            if not has_rollups and has_invoices:
+                self.rebuild(db)
+        finally:
+            db.close()
+
+    def rebuild(self, db: Session, start_month: Optional[date] = None, end_month: Optional[date] = None) -> int:
+        """Recompute rollups from invoices for a month range (all months if omitted)"""
+        try:
+            delete_query = db.query(CustomerMonthlyRollup)
+            source_filters = []
+            if start_month:
+                delete_query = delete_query.filter(CustomerMonthlyRollup.period_month >= month_start(start_month))
+                source_filters.append(Invoice.invoice_date >= month_start(start_month))
+            if end_month:
+                delete_query = delete_query.filter(CustomerMonthlyRollup.period_month <= month_start(end_month))
+                source_filters.append(Invoice.invoice_date < next_month(end_month))
+            delete_query.delete(synchronize_session=False)
+
+            period_month = self._month_expression(db)
+            metrics = self._metric_columns(db)
+            grouped = select(
+                Invoice.customer_id, period_month, *metrics
+            ).where(
+                Invoice.status.notin_(NOT_ISSUED_STATUSES), *source_filters
+            ).group_by(Invoice.customer_id, period_month)
+
+            result = db.execute(insert(CustomerMonthlyRollup).from_select(
+                ["customer_id", "period_month", *ROLLUP_METRICS], grouped
+            ))
+            db.commit()
+
+            logger.info(f"Rebuilt {result.rowcount} customer monthly rollups")
+            return result.rowcount
+
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error rebuilding customer rollups: {str(e)}")
+            raise
+
+    def get_customer_analysis(
+        self,
+        db: Session,
+        start_date: date,
+        end_date: date,
+        customer_id: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """Customer analysis from rollups; only partial months at the edges read invoices"""
+        try:
+            first_full_month = month_start(start_date) if start_date.day == 1 else next_month(start_date)
+            end_of_full_months = month_start(end_date + timedelta(days=1)) - timedelta(days=1)
+
+            per_customer: Dict[Any, Dict[str, Any]] = {}
+            if first_full_month <= end_of_full_months:
+                self._accumulate(per_customer, self._rollup_rows(
+                    db, first_full_month, month_start(end_of_full_months), customer_id
+                ))
+                edge_ranges = [
+                    (start_date, first_full_month - timedelta(days=1)),
+                    (end_of_full_months + timedelta(days=1), end_date)
+                ]
+            else:
+                edge_ranges = [(start_date, end_date)]
+
+            for range_start, range_end in edge_ranges:
+                if range_start <= range_end:
+                    self._accumulate(per_customer, self._invoice_rows(db, range_start, range_end, customer_id))
+
+            total_invoiced = sum((values["total_invoiced"] for values in per_customer.values()), Decimal("0"))
+            total_paid = sum((values["total_paid"] for values in per_customer.values()), Decimal("0"))
+            invoice_count = sum(values["invoice_count"] for values in per_customer.values())
+            paid_count = sum(values["paid_invoice_count"] for values in per_customer.values())
+            days_sum = sum(values["collection_days_sum"] for values in per_customer.values())
+            period_days = (end_date - start_date).days + 1
+            total_outstanding = total_invoiced - total_paid
+
+            customer_breakdown = {
+                key: {
+                    "customer_id": key,
+                    "customer_name": values["customer_name"],
+                    "total_invoiced": values["total_invoiced"],
+                    "total_paid": values["total_paid"],
+                    "invoice_count": values["invoice_count"],
+                    "avg_collection_days": (
+                        values["collection_days_sum"] / values["paid_invoice_count"]
+                        if values["paid_invoice_count"] else 0
+                    )
+                }
+                for key, values in per_customer.items()
+            }
+
+            return {
+                "start_date": start_date,
+                "end_date": end_date,
+                "customer_id": customer_id,
+                "total_invoiced": total_invoiced,
+                "total_paid": total_paid,
+                "total_outstanding": total_outstanding,
+                "avg_collection_days": days_sum / paid_count if paid_count else 0,
+                # Period DSO: share of the period's billings still open, in days of the period
+                "dso": float(total_outstanding / total_invoiced) * period_days if total_invoiced else 0,
+                "customer_breakdown": customer_breakdown,
+                "invoice_count": invoice_count
+            }
+
+        except Exception as e:
+            logger.error(f"Error generating customer analysis: {str(e)}")
+            raise
+
+    def _accumulate(self, per_customer: Dict[Any, Dict[str, Any]], rows: List[Any]) -> None:
+        for row in rows:
+            values = per_customer.setdefault(row.customer_id, {
+                "customer_name": row.customer_name or "Unknown",
+                "total_invoiced": Decimal("0"),
+                "total_paid": Decimal("0"),
+                "invoice_count": 0,
+                "paid_invoice_count": 0,
+                "collection_days_sum": 0
+            })
+            values["total_invoiced"] += row.invoiced_amount or Decimal("0")
+            values["total_paid"] += row.collected_amount or Decimal("0")
+            values["invoice_count"] += row.invoice_count or 0
+            values["paid_invoice_count"] += row.paid_invoice_count or 0
+            values["collection_days_sum"] += int(row.collection_days_sum or 0)
+
+    def _rollup_rows(self, db: Session, first_month: date, last_month: date, customer_id: Optional[int]) -> List[Any]:
+        query = db.query(
+            CustomerMonthlyRollup.customer_id,
+            Customer.name.label("customer_name"),
+            *[func.sum(getattr(CustomerMonthlyRollup, metric)).label(metric) for metric in ROLLUP_METRICS]
+        ).outerjoin(
+            Customer, Customer.id == CustomerMonthlyRollup.customer_id
+        ).filter(
+            CustomerMonthlyRollup.period_month.between(first_month, last_month)
+        )
+
+        if customer_id:
+            query = query.filter(CustomerMonthlyRollup.customer_id == customer_id)
+
+        return query.group_by(CustomerMonthlyRollup.customer_id, Customer.name).all()
+
+    def _invoice_rows(self, db: Session, start_date: date, end_date: date, customer_id: Optional[int]) -> List[Any]:
+        query = db.query(
+            Invoice.customer_id,
+            Customer.name.label("customer_name"),
+            *self._metric_columns(db)
+        ).outerjoin(
+            Customer, Customer.id == Invoice.customer_id
+        ).filter(
+            Invoice.invoice_date.between(start_date, end_date),
+            Invoice.status.notin_(NOT_ISSUED_STATUSES)
+        )
+
+        if customer_id:
+            query = query.filter(Invoice.customer_id == customer_id)
+
+        return query.group_by(Invoice.customer_id, Customer.name).all()
+
+    def _metric_columns(self, db: Session) -> List[Any]:
+        """Aggregates matching invoice_contribution, in ROLLUP_METRICS order"""
+        fully_paid = and_(
+            Invoice.total_amount > 0,
+            Invoice.paid_amount >= Invoice.total_amount,
+            Invoice.payment_date.isnot(None)
+        )
+        if db.get_bind().dialect.name == "postgresql":
+            days_to_collect = Invoice.payment_date - Invoice.invoice_date
+        else:
+            days_to_collect = cast(func.julianday(Invoice.payment_date) - func.julianday(Invoice.invoice_date), Integer)
+
+        return [
+            func.coalesce(func.sum(Invoice.total_amount), 0).label("invoiced_amount"),
+            func.count(Invoice.id).label("invoice_count"),
+            func.coalesce(func.sum(Invoice.paid_amount), 0).label("collected_amount"),
+            func.sum(case((fully_paid, 1), else_=0)).label("paid_invoice_count"),
+            func.sum(case((fully_paid, days_to_collect), else_=0)).label("collection_days_sum")
+        ]
+
+    def _month_expression(self, db: Session) -> Any:
+        if db.get_bind().dialect.name == "postgresql":
+            return cast(func.date_trunc("month", Invoice.invoice_date), Date)
+        return func.date(Invoice.invoice_date, "start of month")
+
+    def _upsert_increments(self, db: Session, increments: Dict[Tuple[int, date], List[Any]]) -> None:
+        """Add the increments to existing rollup rows, creating rows that do not exist yet"""
+        dialect = db.get_bind().dialect.name
+        dialect_insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+
+        rows = [
+            {"customer_id": customer_id, "period_month": period_month, **dict(zip(ROLLUP_METRICS, values))}
+            for (customer_id, period_month), values in increments.items()
+        ]
+        statement = dialect_insert(CustomerMonthlyRollup)
+        statement = statement.on_conflict_do_update(
+            index_elements=["customer_id", "period_month"],
+            set_={
+                **{
+                    metric: getattr(CustomerMonthlyRollup, metric) + getattr(statement.excluded, metric)
+                    for metric in ROLLUP_METRICS
+                },
+                "updated_at": datetime.utcnow()
+            }
+        )
+        db.execute(statement, rows)
@@ -0,0 +1,185 @@
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import hashlib
+import io
+import json
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfgen import canvas
+
+logger = logging.getLogger(__name__)
+
+# Bump when a layout changes so cached documents are re-rendered
+TEMPLATE_VERSIONS = {"invoice": "1", "statement": "1"}
+DOCUMENT_CACHE_DIR = os.getenv("AR_DOCUMENT_CACHE_DIR", "/app/documents")
+RENDER_WORKERS = int(os.getenv("AR_RENDER_WORKERS", "0")) or os.cpu_count() or 1
+
+PAGE_WIDTH, PAGE_HEIGHT = letter
+MARGIN = 54
+LINE_HEIGHT = 14
+
+
+def document_key(kind: str, payload: Dict[str, Any]) -> str:
+    """Content address of a document: its data plus the template version that lays it out"""
+    content = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(f"{kind}:{TEMPLATE_VERSIONS[kind]}:{content}".encode("utf-8")).hexdigest()
+
+
+def document_path(key: str, cache_dir: str = DOCUMENT_CACHE_DIR) -> str:
+    return os.path.join(cache_dir, key[:2], f"{key}.pdf")
+
+
+class _PageWriter:
+    """Top-down text layout on a reportlab canvas with automatic page breaks"""
+
+    def __init__(self, pdf: canvas.Canvas, title: str):
+        self.pdf = pdf
+        self.title = title
+        self.y = 0
+        self._start_page()
+
+    def _start_page(self) -> None:
+        self.y = PAGE_HEIGHT - MARGIN
+        self.pdf.setFont("Helvetica-Bold", 16)
+        self.pdf.drawString(MARGIN, self.y, self.title)
+        self.y -= LINE_HEIGHT * 2
+
+    def line(self, text: str = "", bold: bool = False, columns: Optional[List[Tuple[float, str]]] = None) -> None:
+        if self.y < MARGIN:
+            self.pdf.showPage()
+            self._start_page()
+        self.pdf.setFont("Helvetica-Bold" if bold else "Helvetica", 10)
+        if columns:
+            for x, value in columns:
+                if x < 0:
+                    self.pdf.drawRightString(PAGE_WIDTH + x, self.y, value)
+                else:
+                    self.pdf.drawString(x, self.y, value)
+        else:
+            self.pdf.drawString(MARGIN, self.y, text)
+        self.y -= LINE_HEIGHT
+
+
+def render_invoice_pdf(payload: Dict[str, Any]) -> bytes:
+    buffer = io.BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=letter, invariant=1)
+    page = _PageWriter(pdf, f"Invoice {payload['invoice_number']}")
+
+    page.line(payload["customer_name"], bold=True)
+    for label, key in (("Invoice date", "invoice_date"), ("Due date", "due_date"), ("Currency", "currency")):
+        page.line(f"{label}: {payload[key]}")
+    page.line()
+
+    page.line(bold=True, columns=[(MARGIN, "Item"), (MARGIN + 90, "Description"), (-200, "Qty"),
+                                  (-130, "Unit price"), (-MARGIN, "Amount")])
+    for line in payload["lines"]:
+        page.line(columns=[(MARGIN, line["item_code"] or ""), (MARGIN + 90, (line["description"] or "")[:45]),
+                           (-200, line["quantity"]), (-130, line["unit_price"]), (-MARGIN, line["line_total"])])
+    page.line()
+    page.line(bold=True, columns=[(-130, "Total"), (-MARGIN, payload["total_amount"])])
+    page.line(columns=[(-130, "Paid"), (-MARGIN, payload["paid_amount"])])
+    page.line(bold=True, columns=[(-130, "Balance due"), (-MARGIN, payload["balance_due"])])
+
+    pdf.save()
+    return buffer.getvalue()
+
+
+def render_statement_pdf(payload: Dict[str, Any]) -> bytes:
+    buffer = io.BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=letter, invariant=1)
+    page = _PageWriter(pdf, f"Statement as of {payload['statement_date']}")
+
+    page.line(payload["customer_name"], bold=True)
+    page.line()
+    page.line(bold=True, columns=[(MARGIN, "Invoice"), (MARGIN + 110, "Date"), (MARGIN + 190, "Due"),
+                                  (-130, "Total"), (-MARGIN, "Outstanding")])
+    for invoice in payload["invoices"]:
+        page.line(columns=[(MARGIN, invoice["invoice_number"] or ""), (MARGIN + 110, invoice["invoice_date"]),
+                           (MARGIN + 190, invoice["due_date"]), (-130, invoice["total_amount"]),
+                           (-MARGIN, invoice["outstanding"])])
+    page.line()
+    for bucket, amount in payload["aging"].items():
+        page.line(columns=[(-130, bucket.replace("_", " ")), (-MARGIN, amount)])
+    page.line(bold=True, columns=[(-130, "Total due"), (-MARGIN, payload["total_outstanding"])])
+
+    pdf.save()
+    return buffer.getvalue()
+
+
+RENDERERS = {"invoice": render_invoice_pdf, "statement": render_statement_pdf}
+
+
+def render_to_cache(kind: str, payload: Dict[str, Any], key: str, cache_dir: str) -> str:
+    """Render one document into the cache (runs in a worker process)"""
+    path = document_path(key, cache_dir)
+    if os.path.exists(path):
+        return path
+
+    content = RENDERERS[kind](payload)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Write then rename so readers never see a partial file
+    fd, temporary_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "wb") as handle:
+        handle.write(content)
+    os.replace(temporary_path, path)
+    return path
+
+
+def _render_job(job: Tuple[str, Dict[str, Any], str, str]) -> str:
+    return render_to_cache(*job)
+
+
+class RenderFarm:
+    """Renders documents in a process pool into a content-addressed disk cache"""
+
+    def __init__(self, cache_dir: str = DOCUMENT_CACHE_DIR, workers: int = RENDER_WORKERS):
+        self.cache_dir = cache_dir
+        self.workers = workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # Spawned workers: forking the threaded web server process is unsafe
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._executor
+
+    def render(self, kind: str, payload: Dict[str, Any]) -> Tuple[str, bool]:
+        """Path of the document and whether it was served from the cache"""
+        key = document_key(kind, payload)
+        path = document_path(key, self.cache_dir)
+        if os.path.exists(path):
+            return path, True
+        return self._pool().submit(render_to_cache, kind, payload, key, self.cache_dir).result(), False
+
+    def render_many(self, documents: Iterable[Tuple[str, Dict[str, Any]]]) -> Dict[str, int]:
+        """Render a batch across all workers, skipping documents already cached"""
+        jobs = []
+        cached = 0
+        for kind, payload in documents:
+            key = document_key(kind, payload)
+            if os.path.exists(document_path(key, self.cache_dir)):
+                cached += 1
+            else:
+                jobs.append((kind, payload, key, self.cache_dir))
+
+        if jobs:
+            chunksize = max(1, len(jobs) // (self.workers * 4))
+            for _ in self._pool().map(_render_job, jobs, chunksize=chunksize):
+                pass
+
+        return {"rendered": len(jobs), "cached": cached}
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True, cancel_futures=True)
+                self._executor = None
@@ -0,0 +1,255 @@
+from sqlalchemy.orm import Session
+from typing import List, Optional, Dict, Any, Tuple
+from itertools import groupby
+from datetime import datetime, date
+from decimal import Decimal
+import logging
+import threading
+
+from ..models.customers import Customer
+from ..models.invoices import Invoice, InvoiceLine
+from ..models.statement_runs import StatementRun
+from ..database.connection import SessionLocal
+from .aging_snapshot_service import OPEN_INVOICE_STATUS, AGING_BUCKETS, aging_bucket
+from .document_renderer import RenderFarm
+
+logger = logging.getLogger(__name__)
+
+STATEMENT_CHUNK_SIZE = 2000  # Customers loaded and rendered per checkpoint
+
+
+def money(value: Optional[Decimal]) -> str:
+    return f"{(value or Decimal('0')):,.2f}"
+
+
+class DocumentService:
+    """Builds invoice and statement documents and hands them to the render farm"""
+
+    def __init__(self, farm: Optional[RenderFarm] = None):
+        self.farm = farm or RenderFarm()
+        self._active_runs = set()
+        self._active_runs_lock = threading.Lock()
+
+    def get_invoice_document(self, invoice_id: int) -> Optional[Tuple[str, bool]]:
+        """Rendered invoice PDF path, re-rendered only when the invoice content changed.
+
+        Runs in an executor thread, so it reads through its own session rather than the request's.
+        """
+        db = SessionLocal()
+        try:
+            payload = self._invoice_payload(db, invoice_id)
+            if payload is None:
+                return None
+            return self.farm.render("invoice", payload)
+        except Exception as e:
+            logger.error(f"Error rendering invoice {invoice_id}: {str(e)}")
+            raise
+        finally:
+            db.close()
+
+    def get_customer_statement(
+        self,
+        customer_id: int,
+        statement_date: Optional[date] = None
+    ) -> Optional[Tuple[str, bool]]:
+        """Rendered statement PDF path for one customer, read through the worker's own session"""
+        statement_date = statement_date or datetime.utcnow().date()
+        db = SessionLocal()
+        try:
+            customer = db.query(Customer.id, Customer.name).filter(Customer.id == customer_id).first()
+            if not customer:
+                return None
+
+            payloads = self._statement_payloads(db, statement_date, [customer_id])
+            payload = payloads[0] if payloads else self._statement_payload(
+                customer.id, customer.name, statement_date, []
+            )
+            return self.farm.render("statement", payload)
+        except Exception as e:
+            logger.error(f"Error rendering statement for customer {customer_id}: {str(e)}")
+            raise
+        finally:
+            db.close()
+
+    def start_statement_run(self, db: Session, statement_date: date) -> StatementRun:
+        """Create the statement run for a date, or reopen an interrupted one"""
+        try:
+            db_run = db.query(StatementRun).filter(StatementRun.statement_date == statement_date).first()
+            if db_run is None:
+                db_run = StatementRun(statement_date=statement_date, status="Running", last_customer_id=0)
+                db.add(db_run)
+            elif db_run.status != "Completed":
+                db_run.status = "Running"
+                db_run.error = None
+
+            db.commit()
+            db.refresh(db_run)
+            return db_run
+
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error starting statement run for {statement_date}: {str(e)}")
+            raise
+
+    def get_statement_run(self, db: Session, run_id: int) -> Optional[StatementRun]:
+        """Get a statement run by ID"""
+        try:
+            return db.query(StatementRun).filter(StatementRun.id == run_id).first()
+        except Exception as e:
+            logger.error(f"Error retrieving statement run {run_id}: {str(e)}")
+            raise
+
+    def process_statement_run(self, run_id: int) -> None:
+        """Render statements chunk by chunk from the checkpoint, spreading each chunk over all workers"""
+        with self._active_runs_lock:
+            if run_id in self._active_runs:
+                return
+            self._active_runs.add(run_id)
+
+        db = SessionLocal()
+        try:
+            db_run = db.query(StatementRun).filter(StatementRun.id == run_id).one()
+            while True:
+                customer_ids = [
+                    row.customer_id for row in db.query(Invoice.customer_id).filter(
+                        *self._open_invoice_filter(db_run.statement_date),
+                        Invoice.customer_id > db_run.last_customer_id
+                    ).distinct().order_by(Invoice.customer_id).limit(STATEMENT_CHUNK_SIZE)
+                ]
+                if not customer_ids:
+                    break
+
+                payloads = self._statement_payloads(db, db_run.statement_date, customer_ids)
+                result = self.farm.render_many(("statement", payload) for payload in payloads)
+
+                db_run.last_customer_id = customer_ids[-1]
+                db_run.customer_count = (db_run.customer_count or 0) + len(customer_ids)
+                db_run.rendered_count = (db_run.rendered_count or 0) + result["rendered"]
+                db_run.cached_count = (db_run.cached_count or 0) + result["cached"]
+                db.commit()
+
+            db_run.status = "Completed"
+            db_run.completed_at = datetime.utcnow()
+            db.commit()
+            logger.info(
+                f"Statement run {run_id}: {db_run.customer_count} customers, "
+                f"{db_run.rendered_count} rendered, {db_run.cached_count} from cache"
+            )
+
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Statement run {run_id} failed: {str(e)}")
+            self.record_run_failure(run_id, str(e))
+        finally:
+            db.close()
+            with self._active_runs_lock:
+                self._active_runs.discard(run_id)
+
+    def record_run_failure(self, run_id: int, error: str) -> None:
+        """Mark a statement run Failed in a fresh session, whatever state the worker's session is in"""
+        db = SessionLocal()
+        try:
+            db.query(StatementRun).filter(
+                StatementRun.id == run_id,
+                StatementRun.status != "Completed"
+            ).update({StatementRun.status: "Failed", StatementRun.error: error}, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    def get_interrupted_run_ids(self) -> List[int]:
+        """Statement runs left Running by a crash or restart"""
+        db = SessionLocal()
+        try:
+            return [row.id for row in db.query(StatementRun.id).filter(StatementRun.status == "Running")]
+        finally:
+            db.close()
+
+    def _invoice_payload(self, db: Session, invoice_id: int) -> Optional[Dict[str, Any]]:
+        invoice = db.query(
+            Invoice.id, Invoice.invoice_number, Invoice.invoice_date, Invoice.due_date, Invoice.currency,
+            Invoice.total_amount, Invoice.paid_amount, Customer.name.label("customer_name")
+        ).outerjoin(
+            Customer, Customer.id == Invoice.customer_id
+        ).filter(Invoice.id == invoice_id).first()
+        if not invoice:
+            return None
+
+        lines = db.query(
+            InvoiceLine.item_code, InvoiceLine.description, InvoiceLine.quantity,
+            InvoiceLine.unit_price, InvoiceLine.line_total
+        ).filter(InvoiceLine.invoice_id == invoice_id).order_by(InvoiceLine.id).all()
+
+        return {
+            "invoice_number": invoice.invoice_number,
+            "customer_name": invoice.customer_name or "",
+            "invoice_date": invoice.invoice_date.isoformat(),
+            "due_date": invoice.due_date.isoformat(),
+            "currency": invoice.currency or "",
+            "lines": [
+                {
+                    "item_code": line.item_code,
+                    "description": line.description,
+                    "quantity": str(line.quantity),
+                    "unit_price": money(line.unit_price),
+                    "line_total": money(line.line_total)
+                }
+                for line in lines
+            ],
+            "total_amount": money(invoice.total_amount),
+            "paid_amount": money(invoice.paid_amount),
+            "balance_due": money((invoice.total_amount or Decimal("0")) - (invoice.paid_amount or Decimal("0")))
+        }
+
+    def _statement_payloads(self, db: Session, statement_date: date, customer_ids: List[int]) -> List[Dict[str, Any]]:
+        """Statement content for a set of customers from one invoice query"""
+        rows = db.query(
+            Invoice.customer_id, Customer.name.label("customer_name"), Invoice.invoice_number,
+            Invoice.invoice_date, Invoice.due_date, Invoice.total_amount, Invoice.paid_amount
+        ).join(
+            Customer, Customer.id == Invoice.customer_id
+        ).filter(
+            *self._open_invoice_filter(statement_date),
+            Invoice.customer_id.in_(customer_ids)
+        ).order_by(Invoice.customer_id, Invoice.due_date, Invoice.id).all()
+
+        return [
+            self._statement_payload(customer_id, invoices[0].customer_name, statement_date, invoices)
+            for customer_id, invoices in ((key, list(group)) for key, group in groupby(rows, key=lambda row: row.customer_id))
+        ]
+
+    def _statement_payload(
+        self,
+        customer_id: int,
+        customer_name: str,
+        statement_date: date,
+        invoices: List[Any]
+    ) -> Dict[str, Any]:
+        aging = {bucket: Decimal("0") for bucket in AGING_BUCKETS}
+        lines = []
+        for invoice in invoices:
+            outstanding = invoice.total_amount - invoice.paid_amount
+            aging[aging_bucket(invoice.due_date, statement_date)] += outstanding
+            lines.append({
+                "invoice_number": invoice.invoice_number,
+                "invoice_date": invoice.invoice_date.isoformat(),
+                "due_date": invoice.due_date.isoformat(),
+                "total_amount": money(invoice.total_amount),
+                "outstanding": money(outstanding)
+            })
+
+        return {
+            "customer_id": customer_id,
+            "customer_name": customer_name or "",
+            "statement_date": statement_date.isoformat(),
+            "invoices": lines,
+            "aging": {bucket: money(amount) for bucket, amount in aging.items()},
+            "total_outstanding": money(sum(aging.values(), Decimal("0")))
+        }
+
+    def _open_invoice_filter(self, statement_date: date) -> List[Any]:
+        return [
+            Invoice.status == OPEN_INVOICE_STATUS,
+            Invoice.paid_amount < Invoice.total_amount,
+            Invoice.invoice_date <= statement_date
+        ]
@@ -0,0 +1,97 @@
+from email.message import EmailMessage
+from typing import List, NamedTuple, Optional
+import asyncio
+import logging
+import os
+import smtplib
+
+logger = logging.getLogger(__name__)
+
+SMTP_HOST = os.getenv("SMTP_HOST", "localhost")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "25"))
+SMTP_USERNAME = os.getenv("SMTP_USERNAME")
+SMTP_PASSWORD = os.getenv("SMTP_PASSWORD")
+SMTP_USE_TLS = os.getenv("SMTP_USE_TLS", "false").lower() == "true"
+DUNNING_FROM_ADDRESS = os.getenv("DUNNING_FROM_ADDRESS", "collections@fins-erp.local")
+DUNNING_MAIL_TRANSPORT = os.getenv("DUNNING_MAIL_TRANSPORT", "smtp")  # smtp, outbox
+DUNNING_OUTBOX_DIR = os.getenv("DUNNING_OUTBOX_DIR")
+DUNNING_MAIL_CONCURRENCY = int(os.getenv("DUNNING_MAIL_CONCURRENCY", "10"))
+
+
+class OutgoingMail(NamedTuple):
+    letter_id: int
+    to: str
+    subject: str
+    body: str
+
+
+class SendResult(NamedTuple):
+    letter_id: int
+    sent: bool
+    error: Optional[str]
+
+
+def build_message(mail: OutgoingMail) -> EmailMessage:
+    message = EmailMessage()
+    message["From"] = DUNNING_FROM_ADDRESS
+    message["To"] = mail.to
+    message["Subject"] = mail.subject
+    # Stable per letter so relays and mailboxes can drop a duplicate delivery
+    message["Message-ID"] = f"<dunning-letter-{mail.letter_id}@{DUNNING_FROM_ADDRESS.split('@')[-1]}>"
+    message.set_content(mail.body)
+    return message
+
+
+class SMTPTransport:
+    """Blocking smtplib delivery, one connection per message"""
+
+    def send(self, mail: OutgoingMail) -> None:
+        with smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=30) as smtp:
+            if SMTP_USE_TLS:
+                smtp.starttls()
+            if SMTP_USERNAME:
+                smtp.login(SMTP_USERNAME, SMTP_PASSWORD or "")
+            smtp.send_message(build_message(mail))
+
+
+class OutboxTransport:
+    """Local SMTP stand-in: keeps messages in memory and optionally writes .eml files"""
+
+    def __init__(self, directory: Optional[str] = None):
+        self.directory = directory
+        self.sent: List[OutgoingMail] = []
+
+    def send(self, mail: OutgoingMail) -> None:
+        self.sent.append(mail)
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(os.path.join(self.directory, f"dunning-letter-{mail.letter_id}.eml"), "wb") as handle:
+                handle.write(bytes(build_message(mail)))
+
+
+def default_transport():
+    if DUNNING_MAIL_TRANSPORT == "outbox":
+        return OutboxTransport(DUNNING_OUTBOX_DIR)
+    return SMTPTransport()
+
+
+class MailDispatcher:
+    """Sends mail concurrently with at most `concurrency` deliveries in flight"""
+
+    def __init__(self, transport=None, concurrency: int = DUNNING_MAIL_CONCURRENCY):
+        self.transport = transport or default_transport()
+        self.concurrency = concurrency
+
+    async def send_all(self, mails: List[OutgoingMail]) -> List[SendResult]:
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def deliver(mail: OutgoingMail) -> SendResult:
+            async with semaphore:
+                try:
+                    await asyncio.to_thread(self.transport.send, mail)
+                    return SendResult(mail.letter_id, True, None)
+                except Exception as e:
+                    logger.error(f"Error sending dunning letter {mail.letter_id} to {mail.to}: {str(e)}")
+                    return SendResult(mail.letter_id, False, str(e))
+
+        return await asyncio.gather(*(deliver(mail) for mail in mails))
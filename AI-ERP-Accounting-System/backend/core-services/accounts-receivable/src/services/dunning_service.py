@@ -0,0 +1,316 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import and_, or_, func, insert, update
+from typing import List, Optional, Any
+from datetime import datetime, date
+from jinja2 import Environment, StrictUndefined
+import asyncio
+import logging
+
+from ..models.customers import Customer
+from ..models.invoices import Invoice
+from ..models.collections import Collection
+from ..models.dunning import DunningRun, DunningLetter
+from ..database.connection import SessionLocal
+from .aging_snapshot_service import OPEN_INVOICE_STATUS
+from .dunning_mailer import MailDispatcher, OutgoingMail, SendResult
+from .collection_rollup_service import CollectionRollupService
+
+logger = logging.getLogger(__name__)
+
+CUSTOMER_CHUNK_SIZE = 500  # Overdue customers rendered and recorded per transaction
+SEND_BATCH_SIZE = 200  # Letters claimed for one dispatcher pass
+MAX_SEND_ATTEMPTS = 3
+
+# Level by days the oldest open invoice is overdue
+DUNNING_LEVELS = ((61, 3), (31, 2), (1, 1))
+DUNNING_TEMPLATES = {
+    1: {
+        "subject": "Payment reminder: {{ total_overdue }} overdue",
+        "body": (
+            "Dear {{ customer_name }},\n\n"
+            "Our records show {{ invoice_count }} invoice(s) totalling {{ total_overdue }} past due, "
+            "the oldest since {{ oldest_due_date }}.\n"
+            "If you have already paid, please disregard this reminder.\n\n"
+            "Accounts Receivable"
+        )
+    },
+    2: {
+        "subject": "Second notice: {{ total_overdue }} overdue",
+        "body": (
+            "Dear {{ customer_name }},\n\n"
+            "{{ invoice_count }} invoice(s) totalling {{ total_overdue }} are now {{ days_overdue }} days past due. "
+            "Please arrange payment or contact us to discuss.\n\n"
+            "Accounts Receivable"
+        )
+    },
+    3: {
+        "subject": "Final notice: {{ total_overdue }} overdue",
+        "body": (
+            "Dear {{ customer_name }},\n\n"
+            "Despite earlier reminders, {{ invoice_count }} invoice(s) totalling {{ total_overdue }} remain unpaid, "
+            "the oldest {{ days_overdue }} days past due. Please pay immediately to avoid further action "
+            "on your account.\n\n"
+            "Accounts Receivable"
+        )
+    },
+}
+
+# Compiled once at import instead of per letter
+_template_environment = Environment(undefined=StrictUndefined, autoescape=False)
+COMPILED_TEMPLATES = {
+    level: {part: _template_environment.from_string(source) for part, source in templates.items()}
+    for level, templates in DUNNING_TEMPLATES.items()
+}
+
+
+def dunning_level(days_overdue: int) -> int:
+    for minimum_days, level in DUNNING_LEVELS:
+        if days_overdue >= minimum_days:
+            return level
+    return DUNNING_LEVELS[-1][1]
+
+
+class DunningService:
+    """Chunked, resumable dunning runs with concurrent letter delivery"""
+
+    def __init__(
+        self,
+        dispatcher: Optional[MailDispatcher] = None,
+        collection_rollup_service: Optional[CollectionRollupService] = None
+    ):
+        self.dispatcher = dispatcher or MailDispatcher()
+        self.collection_rollup_service = collection_rollup_service or CollectionRollupService()
+
+    def start_run(self, db: Session, as_of_date: Optional[date] = None) -> DunningRun:
+        """Create the run for a date, or reopen an interrupted one so it resumes from its checkpoint"""
+        as_of_date = as_of_date or datetime.utcnow().date()
+        try:
+            db_run = db.query(DunningRun).filter(DunningRun.as_of_date == as_of_date).first()
+            if db_run is None:
+                db_run = DunningRun(as_of_date=as_of_date, status="Running", last_customer_id=0)
+                db.add(db_run)
+            elif db_run.status != "Completed":
+                db_run.status = "Running"
+                db_run.error = None
+
+            db.commit()
+            db.refresh(db_run)
+            return db_run
+
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error starting dunning run for {as_of_date}: {str(e)}")
+            raise
+
+    def get_run(self, db: Session, run_id: int) -> Optional[DunningRun]:
+        """Get a dunning run by ID"""
+        try:
+            return db.query(DunningRun).filter(DunningRun.id == run_id).first()
+        except Exception as e:
+            logger.error(f"Error retrieving dunning run {run_id}: {str(e)}")
+            raise
+
+    def get_interrupted_run_ids(self) -> List[int]:
+        """Runs left Running by a crash or restart"""
+        db = SessionLocal()
+        try:
+            return [row.id for row in db.query(DunningRun.id).filter(DunningRun.status == "Running")]
+        finally:
+            db.close()
+
+    async def process_run(self, run_id: int) -> None:
+        """Render letters chunk by chunk from the checkpoint and send them"""
+        try:
+            await asyncio.to_thread(self._release_interrupted_sends, run_id)
+            await self._send_pending(run_id)
+
+            while await asyncio.to_thread(self._render_next_chunk, run_id):
+                await self._send_pending(run_id)
+
+            await asyncio.to_thread(self._finish_run, run_id, "Completed", None)
+
+        except Exception as e:
+            logger.error(f"Dunning run {run_id} failed: {str(e)}")
+            await asyncio.to_thread(self._finish_run, run_id, "Failed", str(e))
+
+    async def _send_pending(self, run_id: int) -> None:
+        while True:
+            mails = await asyncio.to_thread(self._claim_letters, run_id)
+            if not mails:
+                return
+            results = await self.dispatcher.send_all(mails)
+            await asyncio.to_thread(self._record_results, run_id, results)
+
+    def _release_interrupted_sends(self, run_id: int) -> None:
+        """Letters caught mid-send may have been delivered; park them instead of resending"""
+        db = SessionLocal()
+        try:
+            released = db.query(DunningLetter).filter(
+                DunningLetter.run_id == run_id,
+                DunningLetter.status == "Sending"
+            ).update({DunningLetter.status: "Unconfirmed"}, synchronize_session=False)
+            db.commit()
+            if released:
+                logger.warning(f"Dunning run {run_id}: {released} letters interrupted mid-send, not resending")
+        finally:
+            db.close()
+
+    def _render_next_chunk(self, run_id: int) -> int:
+        """Render and store letters for the next overdue customers after the checkpoint"""
+        db = SessionLocal()
+        try:
+            db_run = db.query(DunningRun).filter(DunningRun.id == run_id).one()
+            customers = self._overdue_customers(db, db_run.as_of_date, db_run.last_customer_id)
+            if not customers:
+                return 0
+
+            letter_rows = []
+            for row in customers:
+                days_overdue = (db_run.as_of_date - row.oldest_due_date).days
+                level = dunning_level(days_overdue)
+                context = {
+                    "customer_name": row.customer_name,
+                    "total_overdue": f"{row.total_overdue:,.2f}",
+                    "invoice_count": row.invoice_count,
+                    "oldest_due_date": row.oldest_due_date.isoformat(),
+                    "days_overdue": days_overdue
+                }
+                templates = COMPILED_TEMPLATES[level]
+                letter_rows.append({
+                    "run_id": run_id,
+                    "customer_id": row.customer_id,
+                    "dunning_level": level,
+                    "email": row.email,
+                    "subject": templates["subject"].render(context),
+                    "body": templates["body"].render(context),
+                    "total_overdue": row.total_overdue,
+                    "invoice_count": row.invoice_count,
+                    "status": "Pending" if row.email else "NoEmail"
+                })
+
+            # Letters and the checkpoint move together: a crash either keeps or loses the whole chunk
+            db.execute(insert(DunningLetter), letter_rows)
+            db_run.last_customer_id = customers[-1].customer_id
+            db_run.customers_processed = (db_run.customers_processed or 0) + len(customers)
+            db.commit()
+            return len(customers)
+
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _claim_letters(self, run_id: int) -> List[OutgoingMail]:
+        """Mark the next letters as Sending before they leave, so a crash cannot resend them"""
+        db = SessionLocal()
+        try:
+            letters = db.query(
+                DunningLetter.id, DunningLetter.email, DunningLetter.subject, DunningLetter.body
+            ).filter(
+                DunningLetter.run_id == run_id,
+                or_(
+                    DunningLetter.status == "Pending",
+                    and_(DunningLetter.status == "Failed", DunningLetter.attempts < MAX_SEND_ATTEMPTS)
+                )
+            ).order_by(DunningLetter.id).limit(SEND_BATCH_SIZE).all()
+            if not letters:
+                return []
+
+            db.query(DunningLetter).filter(
+                DunningLetter.id.in_([letter.id for letter in letters])
+            ).update({
+                DunningLetter.status: "Sending",
+                DunningLetter.attempts: DunningLetter.attempts + 1
+            }, synchronize_session=False)
+            db.commit()
+
+            return [OutgoingMail(letter.id, letter.email, letter.subject, letter.body) for letter in letters]
+
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _record_results(self, run_id: int, results: List[SendResult]) -> None:
+        """Store delivery outcomes and the matching collection activities in one transaction"""
+        db = SessionLocal()
+        try:
+            sent_at = datetime.utcnow()
+            db.execute(update(DunningLetter), [
+                {
+                    "id": result.letter_id,
+                    "status": "Sent" if result.sent else "Failed",
+                    "error": result.error,
+                    "sent_at": sent_at if result.sent else None
+                }
+                for result in results
+            ])
+
+            sent_ids = [result.letter_id for result in results if result.sent]
+            if sent_ids:
+                letters = db.query(
+                    DunningLetter.customer_id, DunningLetter.dunning_level, DunningLetter.subject
+                ).filter(DunningLetter.id.in_(sent_ids)).all()
+                collection_ids = db.scalars(insert(Collection).returning(Collection.id), [
+                    {
+                        "customer_id": letter.customer_id,
+                        "collection_date": sent_at.date(),
+                        "collection_type": "Dunning Letter",
+                        "status": "Completed",
+                        "notes": f"Level {letter.dunning_level}: {letter.subject}"
+                    }
+                    for letter in letters
+                ]).all()
+                self.collection_rollup_service.record_collections(db, collection_ids, commit=False)
+
+            db_run = db.query(DunningRun).filter(DunningRun.id == run_id).one()
+            db_run.letters_sent = (db_run.letters_sent or 0) + len(sent_ids)
+            db.commit()
+
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _finish_run(self, run_id: int, status: str, error: Optional[str]) -> None:
+        db = SessionLocal()
+        try:
+            db_run = db.query(DunningRun).filter(DunningRun.id == run_id).one()
+            db_run.status = status
+            db_run.error = error
+            db_run.letters_failed = db.query(func.count(DunningLetter.id)).filter(
+                DunningLetter.run_id == run_id,
+                DunningLetter.status == "Failed"
+            ).scalar()
+            if status == "Completed":
+                db_run.completed_at = datetime.utcnow()
+            db.commit()
+            logger.info(
+                f"Dunning run {run_id} {status.lower()}: {db_run.customers_processed} customers, "
+                f"{db_run.letters_sent} letters sent, {db_run.letters_failed} failed"
+            )
+        finally:
+            db.close()
+
+    def _overdue_customers(self, db: Session, as_of_date: date, after_customer_id: int) -> List[Any]:
+        """Next keyset chunk of customers with overdue open invoices, in customer_id order"""
+        return db.query(
+            Invoice.customer_id,
+            Customer.name.label("customer_name"),
+            Customer.email.label("email"),
+            func.sum(Invoice.total_amount - Invoice.paid_amount).label("total_overdue"),
+            func.count(Invoice.id).label("invoice_count"),
+            func.min(Invoice.due_date).label("oldest_due_date")
+        ).join(
+            Customer, Customer.id == Invoice.customer_id
+        ).filter(
+            Invoice.status == OPEN_INVOICE_STATUS,
+            Invoice.paid_amount < Invoice.total_amount,
+            Invoice.due_date < as_of_date,
+            Invoice.customer_id > after_customer_id
+        ).group_by(
+            Invoice.customer_id, Customer.name, Customer.email
+        ).order_by(Invoice.customer_id).limit(CUSTOMER_CHUNK_SIZE).all()
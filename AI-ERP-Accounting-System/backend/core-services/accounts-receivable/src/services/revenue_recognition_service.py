@@ -0,0 +1,516 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import func, case, cast, select, insert, update, tuple_, BigInteger, Integer, literal
+from typing import List, Optional, Dict, Any, Tuple
+from datetime import datetime, date, timedelta
+from decimal import Decimal
+import logging
+import os
+
+import numpy as np
+
+from ..models.invoices import Invoice, InvoiceLine
+from ..models.revenue_recognition import (
+    RevenueSchedule, RevenueScheduleEvent, RevenueRecognitionRun, RevenueRecognitionLine,
+    RevenueScheduleCreate, RevenueScheduleEventCreate, RevenueRecognitionRunCreate
+)
+from ..utils.gl_client import post_journal_entries, GLPostingError
+
+logger = logging.getLogger(__name__)
+
+STRAIGHT_LINE, MILESTONE, USAGE = 0, 1, 2
+METHOD_CODES = {"StraightLine": STRAIGHT_LINE, "Milestone": MILESTONE, "Usage": USAGE}
+MILESTONE_TOTAL_UNITS = Decimal("100")  # Milestone events report percent complete
+UNIT_SCALE = 10000  # Units are Numeric(15, 4); scaled to integers so recognition is exact
+MAX_RECOGNITION_GROUPS_PER_ENTRY = 500  # Account/dimension groups (two lines each) per journal entry
+RECOGNITION_LINE_CHUNK_SIZE = 10000  # Recognition lines inserted per statement
+# A Pending run not attempted for this long was interrupted and is resumed by the next request
+STALE_RUN_MINUTES = int(os.getenv("REVENUE_RECOGNITION_STALE_MINUTES", "60"))
+INT64_MAX = np.iinfo(np.int64).max
+
+
+def recognized_to_date(
+    method: np.ndarray,
+    total_cents: np.ndarray,
+    term_days: np.ndarray,
+    elapsed_days: np.ndarray,
+    total_units: np.ndarray,
+    units_to_date: np.ndarray
+) -> np.ndarray:
+    """Cumulative cents each schedule should have recognized, for all schedules at once.
+
+    Straight-line schedules accrue per day of their service period; milestone and usage
+    schedules by the share of units reported (as integers scaled by UNIT_SCALE). Amounts are
+    floored in integer arithmetic so the cumulative total never exceeds the line and the
+    last day or unit releases the exact remainder.
+    """
+    straight_line = method == STRAIGHT_LINE
+    days = np.clip(elapsed_days, 0, np.maximum(term_days, 1))
+    by_days = total_cents * days // np.maximum(term_days, 1)
+
+    units = np.clip(units_to_date, 0, np.maximum(total_units, 0))
+    if len(units) and int(np.abs(total_cents).max()) * int(units.max()) > INT64_MAX:
+        # Products beyond int64 fall back to Python integers rather than wrapping around
+        total_cents, units = total_cents.astype(object), units.astype(object)
+    by_units = np.where(total_units > 0, total_cents * units // np.maximum(total_units, 1), 0)
+
+    return np.where(straight_line, by_days, by_units).astype(np.int64)
+
+
+def summarize_by_account(
+    increments: np.ndarray,
+    deferred_account: np.ndarray,
+    revenue_account: np.ndarray,
+    department: np.ndarray,
+    cost_center: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Total increment per (deferred account, revenue account, department, cost center).
+
+    Returns the group keys as an (n, 4) array, the cents per group and the schedule count per group.
+    """
+    keys = np.column_stack((deferred_account, revenue_account, department, cost_center))
+    if not len(keys):
+        return keys, increments, np.zeros(0, dtype=np.int64)
+    order = np.lexsort(keys.T[::-1])
+    keys = keys[order]
+    starts = np.flatnonzero(np.concatenate(([True], np.any(keys[1:] != keys[:-1], axis=1))))
+    amounts = np.add.reduceat(increments[order], starts)
+    counts = np.diff(np.append(starts, len(order)))
+    return keys[starts], amounts, counts
+
+
+def cents_to_decimal(cents: int) -> Decimal:
+    return Decimal(int(cents)).scaleb(-2)
+
+
+class RevenueRecognitionService:
+    """Deferred revenue schedules on invoice lines, recognized per period in one vectorized pass"""
+
+    def create_schedules(
+        self,
+        db: Session,
+        invoice_id: int,
+        schedules: List[RevenueScheduleCreate]
+    ) -> List[RevenueSchedule]:
+        """Defer invoice lines onto recognition schedules"""
+        try:
+            invoice = db.query(Invoice).filter(Invoice.id == invoice_id).first()
+            if not invoice:
+                raise ValueError(f"Invoice {invoice_id} not found")
+            if invoice.status == "Cancelled":
+                raise ValueError("Cannot schedule revenue for a cancelled invoice")
+
+            line_ids = [schedule.invoice_line_id for schedule in schedules]
+            if len(set(line_ids)) != len(line_ids):
+                raise ValueError("Each invoice line can only have one revenue schedule")
+            lines = {
+                line.id: line for line in db.query(InvoiceLine.id, InvoiceLine.line_total).filter(
+                    InvoiceLine.invoice_id == invoice_id, InvoiceLine.id.in_(line_ids)
+                )
+            }
+            missing = [line_id for line_id in line_ids if line_id not in lines]
+            if missing:
+                raise ValueError(f"Invoice lines not on invoice {invoice_id}: {missing}")
+
+            already_scheduled = [
+                row.invoice_line_id for row in db.query(RevenueSchedule.invoice_line_id).filter(
+                    RevenueSchedule.invoice_line_id.in_(line_ids)
+                )
+            ]
+            if already_scheduled:
+                raise ValueError(f"Invoice lines already have revenue schedules: {already_scheduled}")
+
+            db_schedules = []
+            for schedule in schedules:
+                if schedule.method == "StraightLine" and (
+                    not schedule.start_date or not schedule.end_date or schedule.end_date < schedule.start_date
+                ):
+                    raise ValueError("Straight-line schedules need a start date on or before the end date")
+                if schedule.method == "Usage" and schedule.total_units is None:
+                    raise ValueError("Usage schedules need the contracted total_units")
+
+                db_schedules.append(RevenueSchedule(
+                    invoice_id=invoice_id,
+                    invoice_line_id=schedule.invoice_line_id,
+                    customer_id=invoice.customer_id,
+                    method=schedule.method,
+                    total_amount=lines[schedule.invoice_line_id].line_total,
+                    recognized_amount=Decimal("0"),
+                    start_date=schedule.start_date if schedule.method == "StraightLine" else None,
+                    end_date=schedule.end_date if schedule.method == "StraightLine" else None,
+                    total_units=(
+                        MILESTONE_TOTAL_UNITS if schedule.method == "Milestone"
+                        else schedule.total_units if schedule.method == "Usage" else None
+                    ),
+                    deferred_account_id=schedule.deferred_account_id,
+                    revenue_account_id=schedule.revenue_account_id,
+                    department_id=schedule.department_id,
+                    cost_center_id=schedule.cost_center_id,
+                    status="Active"
+                ))
+
+            db.add_all(db_schedules)
+            db.commit()
+            for db_schedule in db_schedules:
+                db.refresh(db_schedule)
+            return db_schedules
+
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error creating revenue schedules for invoice {invoice_id}: {str(e)}")
+            raise
+
+    def get_invoice_schedules(self, db: Session, invoice_id: int) -> List[RevenueSchedule]:
+        """Get the revenue schedules of an invoice"""
+        try:
+            return db.query(RevenueSchedule).filter(
+                RevenueSchedule.invoice_id == invoice_id
+            ).order_by(RevenueSchedule.invoice_line_id).all()
+        except Exception as e:
+            logger.error(f"Error retrieving revenue schedules for invoice {invoice_id}: {str(e)}")
+            raise
+
+    def add_event(self, db: Session, schedule_id: int, event: RevenueScheduleEventCreate) -> Optional[RevenueSchedule]:
+        """Report milestone progress (percent points) or usage against a schedule"""
+        try:
+            db_schedule = db.query(RevenueSchedule).filter(RevenueSchedule.id == schedule_id).first()
+            if not db_schedule:
+                return None
+            if db_schedule.method == "StraightLine":
+                raise ValueError("Straight-line schedules are recognized over time, not by events")
+            if db_schedule.status != "Active":
+                raise ValueError(f"Revenue schedule {schedule_id} is {db_schedule.status}")
+
+            db.add(RevenueScheduleEvent(
+                schedule_id=schedule_id,
+                event_date=event.event_date,
+                units=event.units,
+                description=event.description
+            ))
+            db.commit()
+            db.refresh(db_schedule)
+            return db_schedule
+
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error recording event for revenue schedule {schedule_id}: {str(e)}")
+            raise
+
+    def run_recognition(
+        self,
+        db: Session,
+        request: RevenueRecognitionRunCreate,
+        token: Optional[str] = None
+    ) -> RevenueRecognitionRun:
+        """Recognize revenue through a period end for every active schedule and post one summarized entry.
+
+        A run that failed or was interrupted after computing its lines is resumed rather than
+        recomputed: its entries are resent under the same references and the GL returns the
+        ones it already holds, so a rerun never posts the same revenue twice.
+        """
+        period_end_date = request.period_end_date
+        try:
+            db_run = self._claim_unfinished_run(db, period_end_date)
+            if db_run is None:
+                db_run = self._compute_run(db, period_end_date)
+            db.commit()
+
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error computing revenue recognition for {period_end_date}: {str(e)}")
+            raise
+
+        return self._post_run(db, db_run, request.post, token)
+
+    def _claim_unfinished_run(self, db: Session, period_end_date: date) -> Optional[RevenueRecognitionRun]:
+        """The failed or interrupted run since the last posted one, reopened for another attempt"""
+        last_posted_id = db.query(func.max(RevenueRecognitionRun.id)).filter(
+            RevenueRecognitionRun.status == "Posted"
+        ).scalar() or 0
+        db_run = db.query(RevenueRecognitionRun).filter(
+            RevenueRecognitionRun.id > last_posted_id,
+            RevenueRecognitionRun.status.in_(("Pending", "Failed"))
+        ).order_by(RevenueRecognitionRun.id.desc()).with_for_update().first()
+        if db_run is None:
+            return None
+
+        stale_before = datetime.utcnow() - timedelta(minutes=STALE_RUN_MINUTES)
+        if db_run.status == "Pending" and (db_run.attempted_at or db_run.created_at) > stale_before:
+            raise ValueError(f"Revenue recognition run {db_run.id} is still in progress")
+        if db_run.period_end_date != period_end_date:
+            raise ValueError(
+                f"Revenue recognition run {db_run.id} through {db_run.period_end_date} did not finish; "
+                f"run that period again first"
+            )
+
+        logger.info(f"Resuming revenue recognition run {db_run.id} ({db_run.status})")
+        db_run.status = "Pending"
+        db_run.error = None
+        db_run.attempted_at = datetime.utcnow()
+        return db_run
+
+    def _compute_run(self, db: Session, period_end_date: date) -> RevenueRecognitionRun:
+        """Create a run and its recognition lines; nothing is applied to the schedules until it posts"""
+        existing = db.query(RevenueRecognitionRun).filter(
+            RevenueRecognitionRun.period_end_date >= period_end_date,
+            RevenueRecognitionRun.status == "Posted"
+        ).order_by(RevenueRecognitionRun.period_end_date.desc()).first()
+        if existing:
+            raise ValueError(
+                f"Revenue is already recognized through {existing.period_end_date} (run {existing.id})"
+            )
+
+        db_run = RevenueRecognitionRun(
+            period_end_date=period_end_date, status="Pending", attempted_at=datetime.utcnow()
+        )
+        db.add(db_run)
+        db.flush()
+
+        schedules = self._load_schedules(db, period_end_date)
+        targets = recognized_to_date(
+            schedules["method"], schedules["total_cents"], schedules["term_days"],
+            schedules["elapsed_days"], schedules["total_units"], schedules["units_to_date"]
+        )
+        increments = targets - schedules["recognized_cents"]
+        completed = targets == schedules["total_cents"]
+        changed = np.flatnonzero(increments)
+        # Schedules whose balance moves, plus any that complete without moving (zero amount lines)
+        to_update = np.flatnonzero((increments != 0) | completed)
+        self._insert_lines(db, db_run.id, schedules["id"][to_update], increments[to_update], completed[to_update])
+
+        _, amounts, _ = summarize_by_account(
+            increments[changed],
+            schedules["deferred_account_id"][changed],
+            schedules["revenue_account_id"][changed],
+            schedules["department_id"][changed],
+            schedules["cost_center_id"][changed]
+        )
+
+        db_run.schedule_count = len(changed)
+        db_run.completed_count = int(np.count_nonzero(completed))
+        db_run.journal_line_count = int(np.count_nonzero(amounts)) * 2
+        db_run.total_amount = cents_to_decimal(increments[changed].sum())
+        return db_run
+
+    def _post_run(
+        self,
+        db: Session,
+        db_run: RevenueRecognitionRun,
+        post: bool,
+        token: Optional[str]
+    ) -> RevenueRecognitionRun:
+        """Post the run's stored lines to the GL, then apply them to the schedules"""
+        entry_keys: List[List[Tuple[int, ...]]] = []
+        entry_ids: List[int] = []
+        try:
+            keys, amounts, counts = self._line_groups(db, db_run.id)
+            groups = np.flatnonzero(amounts)
+            if len(groups):
+                entries, entry_keys = self._build_recognition_entries(
+                    db_run, keys[groups], amounts[groups], counts[groups]
+                )
+                entry_ids = post_journal_entries(entries, token=token, post=post, skip_existing=True)
+                self._record_entry_ids(db, db_run.id, entry_keys, entry_ids)
+
+            self._apply_lines(db, db_run)
+            db_run.status = "Posted"
+            db_run.posted_at = datetime.utcnow()
+            db_run.journal_entry_ids = ",".join(str(entry_id) for entry_id in entry_ids) or None
+            db.commit()
+
+            logger.info(
+                f"Recognized {db_run.total_amount} through {db_run.period_end_date} from {db_run.schedule_count} "
+                f"schedules in {db_run.journal_line_count} journal lines"
+            )
+            return db_run
+
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error posting revenue recognition run {db_run.id}: {str(e)}")
+            db_run.status = "Failed"
+            db_run.error = str(e)
+            # Entries the GL already created must be traceable from the failed run
+            posted_ids = e.entry_ids if isinstance(e, GLPostingError) else entry_ids
+            if posted_ids:
+                db_run.journal_entry_ids = ",".join(str(entry_id) for entry_id in posted_ids)
+                self._record_entry_ids(db, db_run.id, entry_keys, posted_ids)
+            db.commit()
+            raise
+
+    def get_run(self, db: Session, run_id: int) -> Optional[RevenueRecognitionRun]:
+        """Get a revenue recognition run by ID"""
+        try:
+            return db.query(RevenueRecognitionRun).filter(RevenueRecognitionRun.id == run_id).first()
+        except Exception as e:
+            logger.error(f"Error retrieving revenue recognition run {run_id}: {str(e)}")
+            raise
+
+    def _load_schedules(self, db: Session, period_end_date: date) -> Dict[str, np.ndarray]:
+        """Active schedules as column arrays, with day counts and units to date computed in the database"""
+        if db.get_bind().dialect.name == "postgresql":
+            term_days = RevenueSchedule.end_date - RevenueSchedule.start_date + 1
+            elapsed_days = literal(period_end_date) - RevenueSchedule.start_date + 1
+        else:
+            term_days = cast(func.julianday(RevenueSchedule.end_date) - func.julianday(RevenueSchedule.start_date), Integer) + 1
+            elapsed_days = cast(func.julianday(literal(period_end_date)) - func.julianday(RevenueSchedule.start_date), Integer) + 1
+
+        units_to_date = select(
+            RevenueScheduleEvent.schedule_id,
+            func.sum(RevenueScheduleEvent.units).label("units")
+        ).where(
+            RevenueScheduleEvent.event_date <= period_end_date
+        ).group_by(RevenueScheduleEvent.schedule_id).subquery()
+
+        rows = db.execute(select(
+            RevenueSchedule.id,
+            case(*[(RevenueSchedule.method == name, code) for name, code in METHOD_CODES.items()], else_=-1),
+            cast(func.round(RevenueSchedule.total_amount * 100), BigInteger),
+            cast(func.round(RevenueSchedule.recognized_amount * 100), BigInteger),
+            func.coalesce(term_days, 0),
+            func.coalesce(elapsed_days, 0),
+            cast(func.round(func.coalesce(RevenueSchedule.total_units, 0) * UNIT_SCALE), BigInteger),
+            cast(func.round(func.coalesce(units_to_date.c.units, 0) * UNIT_SCALE), BigInteger),
+            RevenueSchedule.deferred_account_id,
+            RevenueSchedule.revenue_account_id,
+            func.coalesce(RevenueSchedule.department_id, 0),
+            func.coalesce(RevenueSchedule.cost_center_id, 0)
+        ).outerjoin(
+            units_to_date, units_to_date.c.schedule_id == RevenueSchedule.id
+        ).where(
+            RevenueSchedule.status == "Active"
+        )).all()
+
+        names = (
+            "id", "method", "total_cents", "recognized_cents", "term_days", "elapsed_days", "total_units",
+            "units_to_date", "deferred_account_id", "revenue_account_id", "department_id", "cost_center_id"
+        )
+        columns = list(zip(*rows)) if rows else [()] * len(names)
+        return {name: np.array(column, dtype=np.int64) for name, column in zip(names, columns)}
+
+    def _line_groups(self, db: Session, run_id: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """The run's stored lines summed per account and dimension group"""
+        rows = db.execute(select(
+            cast(func.round(RevenueRecognitionLine.amount * 100), BigInteger),
+            RevenueSchedule.deferred_account_id,
+            RevenueSchedule.revenue_account_id,
+            func.coalesce(RevenueSchedule.department_id, 0),
+            func.coalesce(RevenueSchedule.cost_center_id, 0)
+        ).join(
+            RevenueSchedule, RevenueSchedule.id == RevenueRecognitionLine.schedule_id
+        ).where(
+            RevenueRecognitionLine.run_id == run_id,
+            RevenueRecognitionLine.amount != 0
+        )).all()
+
+        columns = [np.array(column, dtype=np.int64) for column in zip(*rows)] if rows else [
+            np.zeros(0, dtype=np.int64) for _ in range(5)
+        ]
+        return summarize_by_account(*columns)
+
+    def _record_entry_ids(
+        self,
+        db: Session,
+        run_id: int,
+        entry_keys: List[List[Tuple[int, ...]]],
+        entry_ids: List[int]
+    ) -> None:
+        """Stamp each recognition line with the GL entry that carries its account group"""
+        group_key = tuple_(
+            RevenueSchedule.deferred_account_id,
+            RevenueSchedule.revenue_account_id,
+            func.coalesce(RevenueSchedule.department_id, 0),
+            func.coalesce(RevenueSchedule.cost_center_id, 0)
+        )
+        for keys, entry_id in zip(entry_keys, entry_ids):
+            db.execute(
+                update(RevenueRecognitionLine).where(
+                    RevenueRecognitionLine.run_id == run_id,
+                    RevenueRecognitionLine.schedule_id == RevenueSchedule.id,
+                    RevenueRecognitionLine.amount != 0,
+                    group_key.in_(keys)
+                ).values(journal_entry_id=entry_id).execution_options(synchronize_session=False)
+            )
+
+    def _insert_lines(
+        self,
+        db: Session,
+        run_id: int,
+        schedule_ids: np.ndarray,
+        increments: np.ndarray,
+        completed: np.ndarray
+    ) -> None:
+        for start in range(0, len(schedule_ids), RECOGNITION_LINE_CHUNK_SIZE):
+            end = start + RECOGNITION_LINE_CHUNK_SIZE
+            db.execute(insert(RevenueRecognitionLine), [
+                {
+                    "run_id": run_id,
+                    "schedule_id": schedule_id,
+                    "amount": cents_to_decimal(cents),
+                    "completes_schedule": is_completed
+                }
+                for schedule_id, cents, is_completed in zip(
+                    schedule_ids[start:end].tolist(), increments[start:end].tolist(), completed[start:end].tolist()
+                )
+            ])
+
+    def _apply_lines(self, db: Session, db_run: RevenueRecognitionRun) -> None:
+        """Move the run's lines onto their schedules in one set-based UPDATE ... FROM"""
+        db.execute(
+            update(RevenueSchedule).where(
+                RevenueSchedule.id == RevenueRecognitionLine.schedule_id,
+                RevenueRecognitionLine.run_id == db_run.id
+            ).values(
+                recognized_amount=RevenueSchedule.recognized_amount + RevenueRecognitionLine.amount,
+                recognized_through=db_run.period_end_date,
+                status=case((RevenueRecognitionLine.completes_schedule, "Completed"), else_=RevenueSchedule.status),
+                updated_at=datetime.utcnow()
+            ).execution_options(synchronize_session=False)
+        )
+
+    def _build_recognition_entries(
+        self,
+        db_run: RevenueRecognitionRun,
+        keys: np.ndarray,
+        amounts: np.ndarray,
+        counts: np.ndarray
+    ) -> Tuple[List[Dict[str, Any]], List[List[Tuple[int, ...]]]]:
+        """Journal entries releasing deferred revenue, two lines per account and dimension group.
+
+        Also returns the group keys each entry carries. References are unique per run and
+        entry, so a resent entry is recognized by the GL.
+        """
+        entries = []
+        entry_keys = []
+        for start in range(0, len(keys), MAX_RECOGNITION_GROUPS_PER_ENTRY):
+            lines = []
+            for (deferred_account_id, revenue_account_id, department_id, cost_center_id), cents, count in zip(
+                keys[start:start + MAX_RECOGNITION_GROUPS_PER_ENTRY].tolist(),
+                amounts[start:start + MAX_RECOGNITION_GROUPS_PER_ENTRY].tolist(),
+                counts[start:start + MAX_RECOGNITION_GROUPS_PER_ENTRY].tolist()
+            ):
+                amount = str(cents_to_decimal(abs(cents)))
+                dimensions = {"department_id": department_id or None, "cost_center_id": cost_center_id or None}
+                description = f"Revenue recognized from {count} schedules"
+                # A negative net reverses the direction of the release
+                for account_id, is_debit in ((deferred_account_id, cents > 0), (revenue_account_id, cents < 0)):
+                    lines.append({
+                        "account_id": account_id,
+                        "line_number": len(lines) + 1,
+                        "description": description,
+                        **dimensions,
+                        "debit_amount": amount if is_debit else "0",
+                        "credit_amount": "0" if is_debit else amount
+                    })
+
+            entries.append({
+                "entry_date": db_run.period_end_date.isoformat(),
+                "reference": (
+                    f"REVREC-{db_run.period_end_date.isoformat()}-{db_run.id}-"
+                    f"{start // MAX_RECOGNITION_GROUPS_PER_ENTRY + 1}"
+                ),
+                "description": f"Revenue recognition through {db_run.period_end_date.isoformat()} (run {db_run.id})",
+                "entry_type": "System",
+                "journal_lines": lines
+            })
+            entry_keys.append([tuple(key) for key in keys[start:start + MAX_RECOGNITION_GROUPS_PER_ENTRY].tolist()])
+
+        return entries, entry_keys
@@ -0,0 +1,397 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import func, case, cast, insert, update, BigInteger
+from sqlalchemy.dialects import postgresql, sqlite
+from typing import List, Optional, Dict, Any, Callable
+from datetime import datetime, date, timedelta
+from decimal import Decimal
+import logging
+
+import numpy as np
+
+from ..models.invoices import Invoice, InvoiceLine
+from ..models.subscriptions import (
+    Subscription, SubscriptionLine, SubscriptionBillingCycle, SubscriptionBillingRun,
+    SubscriptionCreate, SubscriptionUpdate, SubscriptionBillingRunCreate
+)
+from .credit_exposure_service import CreditExposureService
+
+logger = logging.getLogger(__name__)
+
+SUBSCRIPTION_CHUNK_SIZE = 5000  # Subscriptions billed per set of bulk statements
+MAX_BILLING_PASSES = 36  # Periods a subscription that fell behind can catch up in one run
+
+
+def anchor_dates(months: np.ndarray, billing_day: np.ndarray) -> np.ndarray:
+    """The billing day in each month, clamped to the month's last day"""
+    month_length = ((months + 1).astype("datetime64[D]") - months.astype("datetime64[D]")).astype(np.int64)
+    return months.astype("datetime64[D]") + (np.minimum(billing_day, month_length) - 1)
+
+
+def billing_periods(
+    period_start: np.ndarray,
+    end_date: np.ndarray,
+    billing_day: np.ndarray,
+    interval_months: np.ndarray
+) -> Dict[str, np.ndarray]:
+    """Period to invoice for each due subscription, with its proration in days.
+
+    period_start is the subscription's next billing date. The full period runs between the
+    billing-day anchors around it; the billed part starts at period_start (a mid-period start)
+    and stops at end_date (a cancellation), so billed_days / period_days is the proration.
+    A subscription that ended before period_start gets an empty period (billed_days 0) and expires.
+    """
+    interval = interval_months.astype("timedelta64[M]")
+    month = period_start.astype("datetime64[M]")
+    anchor = anchor_dates(month, billing_day)
+    on_or_after_anchor = anchor <= period_start
+
+    previous_anchor = np.where(on_or_after_anchor, anchor, anchor_dates(month - interval, billing_day))
+    next_anchor = np.where(on_or_after_anchor, anchor_dates(month + interval, billing_day), anchor)
+
+    period_end = next_anchor - 1
+    has_end = ~np.isnat(end_date)
+    period_end = np.where(has_end & (end_date < period_end), end_date, period_end)
+    period_end = np.maximum(period_end, period_start - 1)
+
+    return {
+        "period_end": period_end,
+        "next_billing_date": next_anchor,
+        "billed_days": (period_end - period_start).astype(np.int64) + 1,
+        "period_days": (next_anchor - previous_anchor).astype(np.int64),
+        "expires": has_end & (next_anchor > end_date)
+    }
+
+
+def prorate_cents(cents: np.ndarray, billed_days: np.ndarray, period_days: np.ndarray) -> np.ndarray:
+    """cents * billed_days / period_days rounded half up, exact for whole periods"""
+    return (cents * billed_days * 2 + period_days) // (period_days * 2)
+
+
+def cents_to_decimal(cents: int) -> Decimal:
+    return Decimal(int(cents)).scaleb(-2)
+
+
+class SubscriptionService:
+    """Recurring subscriptions and the cycle billing run that invoices them in bulk"""
+
+    def __init__(
+        self,
+        credit_exposure_service: CreditExposureService,
+        generate_invoice_numbers: Callable[[Session, int, Optional[int]], List[str]]
+    ):
+        self.credit_exposure_service = credit_exposure_service
+        self.generate_invoice_numbers = generate_invoice_numbers
+
+    def create_subscription(self, db: Session, subscription: SubscriptionCreate) -> Subscription:
+        """Create a subscription; it is first billed from its start date"""
+        try:
+            if subscription.end_date and subscription.end_date < subscription.start_date:
+                raise ValueError("End date must not be before the start date")
+
+            db_subscription = Subscription(
+                customer_id=subscription.customer_id,
+                status="Active",
+                start_date=subscription.start_date,
+                end_date=subscription.end_date,
+                billing_day=subscription.billing_day or subscription.start_date.day,
+                billing_interval_months=subscription.billing_interval_months,
+                next_billing_date=subscription.start_date,
+                payment_terms_days=subscription.payment_terms_days,
+                currency=subscription.currency,
+                notes=subscription.notes,
+                lines=[
+                    SubscriptionLine(line_number=line_number, **line.model_dump())
+                    for line_number, line in enumerate(subscription.lines, start=1)
+                ]
+            )
+            db.add(db_subscription)
+            db.commit()
+            db.refresh(db_subscription)
+            return db_subscription
+
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error creating subscription: {str(e)}")
+            raise
+
+    def get_subscription(self, db: Session, subscription_id: int) -> Optional[Subscription]:
+        """Get a subscription by ID"""
+        try:
+            return db.query(Subscription).filter(Subscription.id == subscription_id).first()
+        except Exception as e:
+            logger.error(f"Error retrieving subscription {subscription_id}: {str(e)}")
+            raise
+
+    def update_subscription(
+        self,
+        db: Session,
+        subscription_id: int,
+        subscription_update: SubscriptionUpdate
+    ) -> Optional[Subscription]:
+        """Pause, resume or cancel a subscription, or set its end date"""
+        try:
+            db_subscription = db.query(Subscription).filter(Subscription.id == subscription_id).first()
+            if not db_subscription:
+                return None
+            if db_subscription.status in ("Cancelled", "Expired"):
+                raise ValueError(f"Subscription {subscription_id} is {db_subscription.status}")
+
+            update_data = subscription_update.model_dump(exclude_unset=True)
+            if update_data.get("end_date") and update_data["end_date"] < db_subscription.start_date:
+                raise ValueError("End date must not be before the start date")
+
+            # Resuming does not bill the paused months; the first period after resume is prorated
+            if db_subscription.status == "Paused" and update_data.get("status") == "Active":
+                db_subscription.next_billing_date = max(db_subscription.next_billing_date, date.today())
+
+            for field, value in update_data.items():
+                setattr(db_subscription, field, value)
+
+            db.commit()
+            db.refresh(db_subscription)
+            return db_subscription
+
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error updating subscription {subscription_id}: {str(e)}")
+            raise
+
+    def run_billing(self, db: Session, request: SubscriptionBillingRunCreate) -> SubscriptionBillingRun:
+        """Invoice every subscription period starting on or before the cycle date.
+
+        A live run holds a lock on its run row for its whole transaction. A Running row nobody
+        holds belongs to a run that died, and is resumed for the cycle date it was started with.
+        """
+        db_run = db.query(SubscriptionBillingRun).filter(
+            SubscriptionBillingRun.status == "Running"
+        ).order_by(SubscriptionBillingRun.id).with_for_update(skip_locked=True).first()
+        if db_run is None:
+            running = db.query(SubscriptionBillingRun.id).filter(SubscriptionBillingRun.status == "Running").first()
+            if running:
+                raise ValueError(f"Subscription billing run {running.id} is still in progress")
+
+            # Committed on its own so other runs see it and a failure can be recorded on it
+            db_run = SubscriptionBillingRun(cycle_date=request.cycle_date or date.today(), status="Running")
+            db.add(db_run)
+            db.commit()
+            db_run = db.query(SubscriptionBillingRun).filter(
+                SubscriptionBillingRun.id == db_run.id
+            ).with_for_update().one()
+        else:
+            logger.info(f"Resuming subscription billing run {db_run.id} for {db_run.cycle_date}")
+        run_id = db_run.id
+        cycle_date = db_run.cycle_date
+
+        try:
+            totals = {"subscriptions": 0, "invoices": 0, "prorated": 0, "skipped": 0, "lines": 0, "cents": 0}
+            invoice_numbers: List[str] = []
+
+            # Each pass bills one period per due subscription; subscriptions that fell behind
+            # are due again in the next pass until they reach the cycle date
+            for _ in range(MAX_BILLING_PASSES):
+                billed_in_pass = 0
+                last_id = 0
+                while True:
+                    subscriptions = db.query(
+                        Subscription.id, Subscription.customer_id, Subscription.currency,
+                        Subscription.payment_terms_days, Subscription.billing_day,
+                        Subscription.billing_interval_months, Subscription.next_billing_date, Subscription.end_date
+                    ).filter(
+                        Subscription.status == "Active",
+                        Subscription.next_billing_date <= cycle_date,
+                        Subscription.id > last_id
+                    ).order_by(Subscription.id).limit(SUBSCRIPTION_CHUNK_SIZE).all()
+                    if not subscriptions:
+                        break
+
+                    last_id = subscriptions[-1].id
+                    billed_in_pass += len(subscriptions)
+                    invoice_numbers.extend(self._bill_chunk(db, db_run, subscriptions, totals))
+
+                if not billed_in_pass:
+                    break
+
+            db_run.subscription_count = totals["subscriptions"]
+            db_run.invoice_count = totals["invoices"]
+            db_run.prorated_count = totals["prorated"]
+            db_run.skipped_count = totals["skipped"]
+            db_run.line_count = totals["lines"]
+            db_run.total_amount = cents_to_decimal(totals["cents"])
+            db_run.first_invoice_number = invoice_numbers[0] if invoice_numbers else None
+            db_run.last_invoice_number = invoice_numbers[-1] if invoice_numbers else None
+            db_run.status = "Completed"
+            db_run.completed_at = datetime.utcnow()
+            db.commit()
+            db.refresh(db_run)
+
+            logger.info(
+                f"Subscription billing run {db_run.id} for {cycle_date}: {db_run.invoice_count} invoices "
+                f"({db_run.prorated_count} prorated, {db_run.skipped_count} already billed), total {db_run.total_amount}"
+            )
+            return db_run
+
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error running subscription billing: {str(e)}")
+            db.query(SubscriptionBillingRun).filter(SubscriptionBillingRun.id == run_id).update({
+                SubscriptionBillingRun.status: "Failed",
+                SubscriptionBillingRun.error: str(e),
+                SubscriptionBillingRun.completed_at: datetime.utcnow()
+            }, synchronize_session=False)
+            db.commit()
+            raise
+
+    def get_billing_run(self, db: Session, run_id: int) -> Optional[SubscriptionBillingRun]:
+        """Get a subscription billing run by ID"""
+        try:
+            return db.query(SubscriptionBillingRun).filter(SubscriptionBillingRun.id == run_id).first()
+        except Exception as e:
+            logger.error(f"Error retrieving subscription billing run {run_id}: {str(e)}")
+            raise
+
+    def _bill_chunk(
+        self,
+        db: Session,
+        db_run: SubscriptionBillingRun,
+        subscriptions: List[Any],
+        totals: Dict[str, int]
+    ) -> List[str]:
+        """Claim, price and invoice one period for a chunk of due subscriptions; returns invoice numbers used"""
+        subscription_ids = np.array([row.id for row in subscriptions], dtype=np.int64)
+        periods = billing_periods(
+            np.array([row.next_billing_date for row in subscriptions], dtype="datetime64[D]"),
+            np.array([row.end_date for row in subscriptions], dtype="datetime64[D]"),
+            np.array([row.billing_day for row in subscriptions], dtype=np.int64),
+            np.array([row.billing_interval_months for row in subscriptions], dtype=np.int64)
+        )
+
+        lines = db.query(
+            SubscriptionLine.subscription_id, SubscriptionLine.item_code, SubscriptionLine.description,
+            SubscriptionLine.quantity, SubscriptionLine.unit_price,
+            cast(func.round(SubscriptionLine.quantity * SubscriptionLine.unit_price * 100), BigInteger).label("cents")
+        ).filter(
+            SubscriptionLine.subscription_id.in_(subscription_ids.tolist())
+        ).order_by(SubscriptionLine.subscription_id, SubscriptionLine.line_number).all()
+
+        # Rows come back ordered by id, so each line finds its subscription by binary search
+        line_owner = np.searchsorted(subscription_ids, np.array([line.subscription_id for line in lines], dtype=np.int64))
+        line_cents = prorate_cents(
+            np.array([line.cents for line in lines], dtype=np.int64),
+            periods["billed_days"][line_owner],
+            periods["period_days"][line_owner]
+        )
+        invoice_cents = np.zeros(len(subscriptions), dtype=np.int64)
+        np.add.at(invoice_cents, line_owner, line_cents)
+        has_lines = np.bincount(line_owner, minlength=len(subscriptions)) > 0
+        # Empty periods (a subscription that ended before it) move the subscription on without an invoice
+        billable = (has_lines & (periods["billed_days"] > 0)).tolist()
+
+        period_start = [row.next_billing_date for row in subscriptions]
+        period_end = periods["period_end"].astype(object)
+        next_billing_date = periods["next_billing_date"].astype(object)
+        cycle_rows = [
+            {
+                "subscription_id": int(subscription_ids[index]),
+                "period_start": period_start[index],
+                "period_end": period_end[index],
+                "next_billing_date": next_billing_date[index],
+                "billed_days": int(periods["billed_days"][index]),
+                "period_days": int(periods["period_days"][index]),
+                "expires_subscription": bool(periods["expires"][index]),
+                "amount": cents_to_decimal(invoice_cents[index]),
+                "run_id": db_run.id
+            }
+            for index in range(len(subscriptions))
+        ]
+
+        # A period that already has a cycle row was billed before; only newly claimed ones are invoiced
+        dialect_insert = postgresql.insert if db.get_bind().dialect.name == "postgresql" else sqlite.insert
+        claimed = dict(db.execute(
+            dialect_insert(SubscriptionBillingCycle).on_conflict_do_nothing(
+                index_elements=["subscription_id", "period_start"]
+            ).returning(SubscriptionBillingCycle.subscription_id, SubscriptionBillingCycle.id),
+            cycle_rows
+        ).all())
+        billed = [
+            index for index in range(len(subscriptions))
+            if int(subscription_ids[index]) in claimed and billable[index]
+        ]
+
+        # Numbers are drawn only for the periods this run claimed, so none are skipped
+        invoice_numbers: Dict[int, str] = {}
+        invoice_ids: List[int] = []
+        if billed:
+            invoice_numbers = dict(zip(billed, self.generate_invoice_numbers(db, len(billed), db_run.cycle_date.year)))
+            invoice_rows = [
+                {
+                    "invoice_number": invoice_numbers[index],
+                    "customer_id": subscriptions[index].customer_id,
+                    "invoice_date": db_run.cycle_date,
+                    "due_date": db_run.cycle_date + timedelta(days=subscriptions[index].payment_terms_days),
+                    "status": "Draft",
+                    "total_amount": cycle_rows[index]["amount"],
+                    "currency": subscriptions[index].currency,
+                    "notes": (
+                        f"Subscription {int(subscription_ids[index])}: "
+                        f"{cycle_rows[index]['period_start']} to {cycle_rows[index]['period_end']}"
+                    )
+                }
+                for index in billed
+            ]
+            invoice_ids = db.execute(
+                insert(Invoice).returning(Invoice.id, sort_by_parameter_order=True), invoice_rows
+            ).scalars().all()
+
+            invoice_for = dict(zip(billed, invoice_ids))
+            db.execute(update(SubscriptionBillingCycle), [
+                {
+                    "id": claimed[int(subscription_ids[index])],
+                    "invoice_number": invoice_numbers[index],
+                    "invoice_id": invoice_for[index]
+                }
+                for index in billed
+            ])
+            line_rows = []
+            for line, owner, cents in zip(lines, line_owner.tolist(), line_cents.tolist()):
+                if owner not in invoice_for:
+                    continue
+                prorated = periods["billed_days"][owner] < periods["period_days"][owner]
+                line_rows.append({
+                    "invoice_id": invoice_for[owner],
+                    "item_code": line.item_code,
+                    "description": (
+                        f"{line.description or line.item_code or ''} "
+                        f"(prorated {periods['billed_days'][owner]}/{periods['period_days'][owner]} days)"
+                        if prorated else line.description
+                    ),
+                    "quantity": line.quantity,
+                    "unit_price": line.unit_price,
+                    "line_total": cents_to_decimal(cents)
+                })
+            if line_rows:
+                db.execute(insert(InvoiceLine), line_rows)
+            totals["lines"] += len(line_rows)
+
+            self.credit_exposure_service.record_changes(db, {}, invoice_ids=invoice_ids, commit=False)
+
+        # Move every due subscription past its period, whether billed now or earlier
+        db.execute(
+            update(Subscription).where(
+                SubscriptionBillingCycle.subscription_id == Subscription.id,
+                SubscriptionBillingCycle.period_start == Subscription.next_billing_date,
+                Subscription.id.in_(subscription_ids.tolist())
+            ).values(
+                next_billing_date=SubscriptionBillingCycle.next_billing_date,
+                status=case((SubscriptionBillingCycle.expires_subscription, "Expired"), else_=Subscription.status),
+                updated_at=datetime.utcnow()
+            ).execution_options(synchronize_session=False)
+        )
+
+        billed_mask = np.zeros(len(subscriptions), dtype=bool)
+        billed_mask[billed] = True
+        totals["subscriptions"] += len(subscriptions)
+        totals["invoices"] += len(invoice_ids)
+        totals["prorated"] += int(np.count_nonzero(billed_mask & (periods["billed_days"] < periods["period_days"])))
+        totals["skipped"] += len(subscriptions) - len(claimed)
+        totals["cents"] += int(invoice_cents[billed_mask].sum())
+        return [invoice_numbers[index] for index in billed]
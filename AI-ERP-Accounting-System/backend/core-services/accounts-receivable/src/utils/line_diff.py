@@ -0,0 +1,80 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import insert, update
+from typing import Any, Dict, List, NamedTuple, Sequence
+from datetime import datetime
+
+
+class LineDiff(NamedTuple):
+    inserts: List[Dict[str, Any]]
+    updates: List[Dict[str, Any]]  # Carry the primary key under "id"
+    deletes: List[int]
+    added: List[Dict[str, Any]]  # New values of inserted and updated lines
+    removed: List[Dict[str, Any]]  # Old values of updated and deleted lines
+
+    @property
+    def changed(self) -> bool:
+        return bool(self.inserts or self.updates or self.deletes)
+
+    def delta(self, field: str) -> Any:
+        """Change in the sum of a numeric field, for incremental header totals"""
+        return sum(row[field] for row in self.added) - sum(row[field] for row in self.removed)
+
+
+def diff_lines(
+    db: Session,
+    model: Any,
+    parent_column: str,
+    parent_id: int,
+    incoming: Sequence[Dict[str, Any]],
+    fields: Sequence[str]
+) -> LineDiff:
+    """Diff the incoming full set of lines against the stored lines, keyed on line_number"""
+    columns = [model.id, model.line_number] + [getattr(model, field) for field in fields]
+    existing = {
+        row.line_number: row._asdict()
+        for row in db.query(*columns).filter(getattr(model, parent_column) == parent_id)
+    }
+
+    inserts, updates, added, removed = [], [], [], []
+    seen = set()
+    for line in incoming:
+        line_number = line["line_number"]
+        if line_number in seen:
+            raise ValueError(f"Duplicate line number {line_number}")
+        seen.add(line_number)
+
+        current = existing.get(line_number)
+        if current is None:
+            inserts.append({parent_column: parent_id, **line})
+            added.append(line)
+        elif any(current[field] != line[field] for field in fields):
+            updates.append({"id": current["id"], **{field: line[field] for field in fields}})
+            added.append(line)
+            removed.append(current)
+
+    deleted = [row for line_number, row in existing.items() if line_number not in seen]
+    removed.extend(deleted)
+
+    return LineDiff(
+        inserts=inserts,
+        updates=updates,
+        deletes=[row["id"] for row in deleted],
+        added=added,
+        removed=removed
+    )
+
+
+def apply_line_diff(db: Session, model: Any, diff: LineDiff) -> None:
+    """Issue only the needed DELETE, UPDATE and INSERT statements, each as one bulk statement"""
+    if diff.deletes:
+        db.query(model).filter(model.id.in_(diff.deletes)).delete(synchronize_session=False)
+
+    if diff.updates:
+        updates = diff.updates
+        if hasattr(model, "updated_at"):
+            now = datetime.utcnow()
+            updates = [{**row, "updated_at": now} for row in updates]
+        db.execute(update(model), updates)
+
+    if diff.inserts:
+        db.execute(insert(model), diff.inserts)
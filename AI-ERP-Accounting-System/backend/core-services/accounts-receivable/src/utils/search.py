@@ -0,0 +1,195 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import func
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+from bisect import bisect_left
+from collections import defaultdict
+import threading
+import time
+
+from .cache import TTLCache
+
+SIMILARITY_THRESHOLD = 0.3  # pg_trgm's default similarity threshold
+TYPEAHEAD_CACHE_LIMIT = 200  # Rows kept per cached prefix
+FALLBACK_INDEX_TTL_SECONDS = 300
+
+
+def normalize_name(value: Optional[str]) -> str:
+    return " ".join((value or "").lower().split())
+
+
+def name_trigrams(value: str) -> Set[str]:
+    """Trigrams the way pg_trgm builds them: per word, padded with two leading and one trailing blank"""
+    grams = set()
+    for word in value.split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class TrigramIndex:
+    """In-process trigram and prefix index, used where pg_trgm is not available (SQLite)"""
+
+    def __init__(self, rows: Sequence[Tuple[int, str]]):
+        self.names: Dict[int, str] = {}
+        self.grams: Dict[int, Set[str]] = {}
+        self.postings: Dict[str, List[int]] = defaultdict(list)
+        for row_id, name in rows:
+            normalized = normalize_name(name)
+            self.names[row_id] = normalized
+            self.grams[row_id] = name_trigrams(normalized)
+            for gram in self.grams[row_id]:
+                self.postings[gram].append(row_id)
+
+        self.sorted_names = sorted((name, row_id) for row_id, name in self.names.items())
+        self.built_at = time.monotonic()
+
+    def search(self, query: str, limit: int) -> List[Tuple[int, float]]:
+        """Rows ranked by trigram similarity, best first"""
+        query_grams = name_trigrams(normalize_name(query))
+        if not query_grams:
+            return []
+
+        shared: Dict[int, int] = defaultdict(int)
+        for gram in query_grams:
+            for row_id in self.postings.get(gram, ()):
+                shared[row_id] += 1
+
+        ranked = []
+        for row_id, count in shared.items():
+            similarity = count / (len(query_grams) + len(self.grams[row_id]) - count)
+            if similarity >= SIMILARITY_THRESHOLD:
+                ranked.append((row_id, similarity))
+
+        ranked.sort(key=lambda item: (-item[1], self.names[item[0]]))
+        return ranked[:limit]
+
+    def prefix(self, prefix: str, limit: int) -> List[Tuple[int, str]]:
+        """Rows whose normalized name starts with the prefix, in name order"""
+        matches = []
+        position = bisect_left(self.sorted_names, (prefix, -1))
+        while position < len(self.sorted_names) and len(matches) < limit:
+            name, row_id = self.sorted_names[position]
+            if not name.startswith(prefix):
+                break
+            matches.append((row_id, name))
+            position += 1
+        return matches
+
+
+class NameSearch:
+    """Ranked name search and typeahead over one table.
+
+    PostgreSQL uses the pg_trgm GIN index for similarity search and a
+    text_pattern_ops index on lower(name) for prefixes; other databases fall
+    back to an in-process TrigramIndex rebuilt every few minutes.
+    """
+
+    def __init__(self, model: Any, name_column: str = "name"):
+        self.model = model
+        self.name_column = getattr(model, name_column)
+        self.typeahead_cache = TTLCache(ttl_seconds=60, max_entries=4096)
+        self._fallback: Optional[TrigramIndex] = None
+        self._lock = threading.Lock()
+
+    def search(
+        self,
+        db: Session,
+        query: str,
+        skip: int = 0,
+        limit: int = 100,
+        filters: Sequence[Any] = ()
+    ) -> List[Any]:
+        """Rows ranked by similarity to the query"""
+        if db.get_bind().dialect.name == "postgresql":
+            similarity = func.similarity(self.name_column, query)
+            return db.query(self.model).filter(
+                self.name_column.op("%")(query), *filters
+            ).order_by(similarity.desc(), self.name_column).offset(skip).limit(limit).all()
+
+        # Over-fetch candidates so filters applied afterwards still fill the page
+        ranked = self._fallback_index(db).search(query, (skip + limit) * 4)
+        return self._load_ranked(db, [row_id for row_id, _ in ranked], filters)[skip:skip + limit]
+
+    def typeahead(
+        self,
+        db: Session,
+        prefix: str,
+        limit: int = 10,
+        filters: Sequence[Any] = ()
+    ) -> List[Dict[str, Any]]:
+        """Names starting with the prefix, served from the prefix cache where possible"""
+        prefix = normalize_name(prefix)
+        if not prefix:
+            return []
+
+        # Filters are part of the cache key by their compiled SQL
+        filter_key = tuple(str(condition.compile(compile_kwargs={"literal_binds": True})) for condition in filters)
+        matches = self._cached_prefix(prefix, filter_key)
+        if matches is None:
+            matches = self._load_prefix(db, prefix, filters)
+            self.typeahead_cache.set((filter_key, prefix), matches)
+
+        return [{"id": row_id, "name": name} for row_id, name in matches[:limit]]
+
+    def invalidate(self) -> None:
+        """Drop cached prefixes and the fallback index after names change"""
+        self.typeahead_cache.invalidate()
+        self._fallback = None
+
+    def _cached_prefix(self, prefix: str, filter_key: Tuple[str, ...]) -> Optional[List[Tuple[int, str]]]:
+        """Answer from the longest cached shorter prefix whose result set was complete"""
+        cached = self.typeahead_cache.get((filter_key, prefix))
+        if cached is not None:
+            return cached
+
+        for length in range(len(prefix) - 1, 0, -1):
+            shorter = self.typeahead_cache.get((filter_key, prefix[:length]))
+            if shorter is None:
+                continue
+            if len(shorter) < TYPEAHEAD_CACHE_LIMIT:
+                matches = [(row_id, name) for row_id, name in shorter if normalize_name(name).startswith(prefix)]
+                self.typeahead_cache.set((filter_key, prefix), matches)
+                return matches
+            return None
+        return None
+
+    def _load_prefix(self, db: Session, prefix: str, filters: Sequence[Any]) -> List[Tuple[int, str]]:
+        if db.get_bind().dialect.name == "postgresql":
+            lowered = func.lower(self.name_column)
+            rows = db.query(self.model.id, self.name_column).filter(
+                lowered.like(prefix.replace("%", r"\%").replace("_", r"\_") + "%"), *filters
+            ).order_by(lowered).limit(TYPEAHEAD_CACHE_LIMIT).all()
+            return [(row[0], row[1]) for row in rows]
+
+        matches = self._fallback_index(db).prefix(prefix, TYPEAHEAD_CACHE_LIMIT * 4)
+        if filters:
+            allowed = {
+                row[0] for row in db.query(self.model.id).filter(
+                    self.model.id.in_([row_id for row_id, _ in matches]), *filters
+                )
+            }
+            matches = [match for match in matches if match[0] in allowed]
+        names = dict(db.query(self.model.id, self.name_column).filter(
+            self.model.id.in_([row_id for row_id, _ in matches[:TYPEAHEAD_CACHE_LIMIT]])
+        ).all())
+        return [(row_id, names[row_id]) for row_id, _ in matches[:TYPEAHEAD_CACHE_LIMIT] if row_id in names]
+
+    def _load_ranked(self, db: Session, ranked_ids: List[int], filters: Sequence[Any]) -> List[Any]:
+        if not ranked_ids:
+            return []
+        rows = {
+            row.id: row for row in db.query(self.model).filter(self.model.id.in_(ranked_ids), *filters)
+        }
+        return [rows[row_id] for row_id in ranked_ids if row_id in rows]
+
+    def _fallback_index(self, db: Session) -> TrigramIndex:
+        index = self._fallback
+        if index is not None and time.monotonic() - index.built_at < FALLBACK_INDEX_TTL_SECONDS:
+            return index
+
+        with self._lock:
+            index = self._fallback
+            if index is None or time.monotonic() - index.built_at >= FALLBACK_INDEX_TTL_SECONDS:
+                rows = db.query(self.model.id, self.name_column).all()
+                index = self._fallback = TrigramIndex([(row[0], row[1]) for row in rows])
+            return index
@@ -0,0 +1,149 @@
+import importlib.util
+import os
+import sys
+import types
+
+from pydantic import BaseModel
+from sqlalchemy import create_engine, Column, Integer, String, Date, DateTime, Numeric, Text
+from sqlalchemy.orm import declarative_base, sessionmaker
+from sqlalchemy.pool import StaticPool
+
+# Tests import the service as the "src" package, the way uvicorn loads src.main
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# The core AR models and the database connection live outside this service's tree. Where they
+# are missing, register minimal stand-ins carrying just the columns the services under test use.
+Base = declarative_base()
+
+
+class Invoice(Base):
+    __tablename__ = "invoices"
+
+    id = Column(Integer, primary_key=True)
+    invoice_number = Column(String(50))
+    customer_id = Column(Integer)
+    sales_order_id = Column(Integer)
+    invoice_date = Column(Date)
+    due_date = Column(Date)
+    status = Column(String(20))
+    subtotal = Column(Numeric(15, 2))
+    tax_amount = Column(Numeric(15, 2))
+    total_amount = Column(Numeric(15, 2))
+    paid_amount = Column(Numeric(15, 2), default=0)
+    payment_date = Column(Date)
+    currency = Column(String(3))
+    notes = Column(Text)
+    created_at = Column(DateTime)
+
+
+class InvoiceLine(Base):
+    __tablename__ = "invoice_lines"
+
+    id = Column(Integer, primary_key=True)
+    invoice_id = Column(Integer)
+    line_number = Column(Integer)
+    item_code = Column(String(50))
+    description = Column(Text)
+    quantity = Column(Numeric(15, 4))
+    unit_price = Column(Numeric(15, 4))
+    line_total = Column(Numeric(15, 2))
+
+
+class Payment(Base):
+    __tablename__ = "payments"
+
+    id = Column(Integer, primary_key=True)
+    customer_id = Column(Integer)
+    payment_date = Column(Date)
+    amount = Column(Numeric(15, 2))
+    applied_amount = Column(Numeric(15, 2), default=0)
+    status = Column(String(20))
+    reference_number = Column(String(100))
+
+
+class Customer(Base):
+    __tablename__ = "customers"
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String(255))
+    email = Column(String(255))
+    credit_limit = Column(Numeric(15, 2))
+
+
+class SalesOrder(Base):
+    __tablename__ = "sales_orders"
+
+    id = Column(Integer, primary_key=True)
+    so_number = Column(String(50))
+    customer_id = Column(Integer)
+    order_date = Column(Date)
+    status = Column(String(20))
+    total_amount = Column(Numeric(15, 2))
+    currency = Column(String(3))
+    created_at = Column(DateTime)
+
+
+class SalesOrderLine(Base):
+    __tablename__ = "sales_order_lines"
+
+    id = Column(Integer, primary_key=True)
+    sales_order_id = Column(Integer)
+    line_number = Column(Integer)
+    item_code = Column(String(50))
+    description = Column(Text)
+    quantity = Column(Numeric(15, 4))
+    unit_price = Column(Numeric(15, 4))
+    line_total = Column(Numeric(15, 2))
+
+
+class Collection(Base):
+    __tablename__ = "collections"
+
+    id = Column(Integer, primary_key=True)
+    customer_id = Column(Integer)
+    invoice_id = Column(Integer)
+    collection_type = Column(String(50))
+    collection_date = Column(Date)
+    status = Column(String(20))
+    assigned_to = Column(String(100))
+    amount_collected = Column(Numeric(15, 2))
+    promised_amount = Column(Numeric(15, 2))
+    notes = Column(Text)
+
+
+engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+SessionLocal = sessionmaker(bind=engine)
+
+
+def get_db():
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+STAND_INS = {
+    "src.database.connection": {"Base": Base, "engine": engine, "SessionLocal": SessionLocal, "get_db": get_db},
+    "src.models.invoices": {"Invoice": Invoice, "InvoiceLine": InvoiceLine},
+    "src.models.payments": {"Payment": Payment},
+    "src.models.customers": {"Customer": Customer},
+    "src.models.sales_orders": {"SalesOrder": SalesOrder, "SalesOrderLine": SalesOrderLine},
+    "src.models.collections": {"Collection": Collection},
+}
+SCHEMAS = {
+    "src.models.invoices": ("InvoiceCreate", "InvoiceUpdate"),
+    "src.models.payments": ("PaymentCreate", "PaymentUpdate"),
+    "src.models.customers": ("CustomerCreate", "CustomerUpdate"),
+    "src.models.sales_orders": ("SalesOrderCreate", "SalesOrderUpdate"),
+    "src.models.collections": ("CollectionCreate", "CollectionUpdate"),
+}
+
+for name, attributes in STAND_INS.items():
+    if importlib.util.find_spec(name) is not None:
+        continue
+    module = types.ModuleType(name)
+    module.__dict__.update(attributes)
+    for schema in SCHEMAS.get(name, ()):
+        setattr(module, schema, type(schema, (BaseModel,), {}))
+    sys.modules[name] = module
@@ -0,0 +1,103 @@
+from datetime import date, datetime
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from src.models.invoices import Invoice, InvoiceLine
+from src.models.sales_orders import SalesOrder, SalesOrderLine
+from src.models.billing_runs import BillingRun, BillingRunCreate, InvoiceNumberCounter
+from src.models.credit_exposure import CustomerCreditExposure
+from src.services.ar_service import AccountsReceivableService
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    for model in (Invoice, InvoiceLine, SalesOrder, SalesOrderLine, BillingRun, InvoiceNumberCounter,
+                  CustomerCreditExposure):
+        model.metadata.create_all(engine, tables=[model.__table__])
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+
+
+def add_order(db, order_id, status="Approved"):
+    db.add(SalesOrder(
+        id=order_id, so_number=f"SO-2024-{order_id:05d}", customer_id=1, order_date=date(2024, 1, 1),
+        status=status, total_amount=Decimal("100.00"), currency="USD"
+    ))
+    db.add(SalesOrderLine(
+        sales_order_id=order_id, line_number=1, item_code="ITEM", description="Item",
+        quantity=Decimal("1"), unit_price=Decimal("100.00"), line_total=Decimal("100.00")
+    ))
+
+
+def test_invoice_numbers_continue_after_existing_invoices(db):
+    service = AccountsReceivableService()
+    year = datetime.utcnow().year
+    db.add(Invoice(invoice_number=f"INV-{year}-00001", customer_id=1, created_at=datetime.utcnow()))
+    db.commit()
+
+    assert service.generate_invoice_numbers(db, 2) == [f"INV-{year}-00002", f"INV-{year}-00003"]
+    assert service.generate_invoice_numbers(db, 1) == [f"INV-{year}-00004"]
+    assert service.generate_invoice_numbers(db, 0) == []
+
+
+def test_billing_run_invoices_orders_once(db):
+    service = AccountsReceivableService()
+    add_order(db, 1)
+    add_order(db, 2)
+    add_order(db, 3, status="Draft")
+    db.commit()
+
+    db_run = service.run_billing(db, BillingRunCreate(billing_date=date(2024, 2, 1)))
+    assert (db_run.status, db_run.order_count, db_run.invoice_count, db_run.line_count) == ("Completed", 2, 2, 2)
+
+    db_run = service.run_billing(db, BillingRunCreate(billing_date=date(2024, 2, 1)))
+    assert (db_run.status, db_run.invoice_count) == ("Completed", 0)
+    assert db.query(Invoice).count() == 2
+
+
+def test_failed_billing_run_is_recorded_and_releases_the_guard(db, monkeypatch):
+    service = AccountsReceivableService()
+    add_order(db, 1)
+    db.commit()
+
+    def fail(*args, **kwargs):
+        raise RuntimeError("numbering unavailable")
+    monkeypatch.setattr(service, "generate_invoice_numbers", fail)
+
+    with pytest.raises(RuntimeError):
+        service.run_billing(db, BillingRunCreate())
+
+    db_run = db.query(BillingRun).one()
+    assert (db_run.status, db_run.error) == ("Failed", "numbering unavailable")
+    assert db.query(Invoice).count() == 0
+
+    monkeypatch.undo()
+    assert service.run_billing(db, BillingRunCreate()).invoice_count == 1
+
+
+def test_abandoned_run_is_closed_and_numbers_follow_the_billing_year(db):
+    service = AccountsReceivableService()
+    add_order(db, 1)
+    db.add(BillingRun(billing_date=date(2023, 12, 31), status="Running"))
+    db.commit()
+
+    # Nothing holds the Running row, so its run died and this one takes over
+    db_run = service.run_billing(db, BillingRunCreate(billing_date=date(2023, 12, 31)))
+    assert (db_run.id, db_run.status, db_run.first_invoice_number) == (2, "Completed", "INV-2023-00001")
+    assert db.get(BillingRun, 1).status == "Failed"
+
+
+def test_only_one_run_can_be_running(db):
+    db.add(BillingRun(billing_date=date(2024, 2, 1), status="Running"))
+    db.commit()
+
+    db.add(BillingRun(billing_date=date(2024, 2, 1), status="Running"))
+    with pytest.raises(IntegrityError):
+        db.commit()
@@ -0,0 +1,104 @@
+from collections import namedtuple
+from datetime import date, timedelta
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from src.models.invoices import Invoice
+from src.models.payments import Payment
+from src.models.aging_snapshots import AgingSnapshotRun, AgingSnapshot, AgingDelta
+from src.models.customer_rollups import CustomerMonthlyRollup
+from src.models.credit_exposure import CustomerCreditExposure
+from src.models.cash_application import (
+    CashApplicationBatch, CashApplication, UnappliedCashItem, CashApplicationRequest, CashApplicationItem
+)
+from src.services.cash_application_service import CashApplicationService, OpenInvoiceIndex, parse_invoice_references
+
+OpenInvoice = namedtuple("OpenInvoice", "id customer_id invoice_number total_amount paid_amount due_date")
+
+
+def build_index(amounts, customer_id=1):
+    """Open invoices of one customer with the given outstanding amounts, oldest first"""
+    return OpenInvoiceIndex(
+        OpenInvoice(
+            id=position + 1,
+            customer_id=customer_id,
+            invoice_number=f"INV-2024-{position + 1:05d}",
+            total_amount=Decimal(amount),
+            paid_amount=Decimal("0"),
+            due_date=date(2024, 1, 1) + timedelta(days=position)
+        )
+        for position, amount in enumerate(amounts)
+    )
+
+
+def test_combination_match_finds_pair_hidden_behind_longer_combination():
+    # 3 is first reached as 1 + 2; with a size cap of 2 only 3 + 4 can reach 7
+    index = build_index(["0.01", "0.02", "0.03", "0.04"])
+    assert index.combination_match(1, 7, max_size=2) == (3, 4)
+
+
+def test_combination_match_prefers_oldest_invoices_among_equal_sizes():
+    index = build_index(["10.00", "20.00", "10.00", "20.00"])
+    assert index.combination_match(1, 3000, max_size=2) == (1, 2)
+
+
+def test_combination_match_respects_size_cap():
+    index = build_index(["1.00", "1.00", "1.00"])
+    assert index.combination_match(1, 300, max_size=2) is None
+    assert index.combination_match(1, 300, max_size=3) == (1, 2, 3)
+
+
+def test_combination_match_ignores_single_invoice_and_other_customers():
+    index = build_index(["5.00", "7.00"])
+    assert index.combination_match(1, 500, max_size=3) is None
+    assert index.combination_match(2, 1200, max_size=3) is None
+
+
+def test_exact_match_skips_partially_applied_invoice():
+    index = build_index(["50.00", "50.00"])
+    index.apply(1, 2000)
+    assert index.exact_match(1, 5000) == 2
+    assert index.exact_match(1, 3000) == 1
+
+
+def test_parse_invoice_references_normalizes_separators():
+    assert parse_invoice_references("pay inv 2024/12 and INV-2024-00012, INV_2024_7") == [
+        "INV-2024-00012", "INV-2024-00007"
+    ]
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    for model in (Invoice, Payment, AgingSnapshotRun, AgingSnapshot, AgingDelta, CustomerMonthlyRollup,
+                  CustomerCreditExposure, CashApplicationBatch, CashApplication, UnappliedCashItem):
+        model.metadata.create_all(engine, tables=[model.__table__])
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+
+
+def test_auto_apply_skips_applied_payments_and_records_applications(db):
+    for invoice_id in (1, 2):
+        db.add(Invoice(
+            id=invoice_id, invoice_number=f"INV-2024-{invoice_id:05d}", customer_id=1, invoice_date=date(2024, 1, 1),
+            due_date=date(2024, 1, 31), status="Sent", total_amount=Decimal("100.00"), paid_amount=Decimal("0")
+        ))
+    # Payment 1 was already applied by hand; payment 2 has 100.00 of its 150.00 left
+    db.add(Payment(id=1, customer_id=1, payment_date=date(2024, 2, 1), amount=Decimal("100.00"),
+                   applied_amount=Decimal("100.00"), status="Applied"))
+    db.add(Payment(id=2, customer_id=1, payment_date=date(2024, 2, 1), amount=Decimal("150.00"),
+                   applied_amount=Decimal("50.00"), status="Received"))
+    db.commit()
+
+    request = CashApplicationRequest(items=[CashApplicationItem(payment_id=1), CashApplicationItem(payment_id=2)])
+    db_batch = CashApplicationService().auto_apply(db, request)
+
+    assert (db_batch.skipped_count, db_batch.matched_count, db_batch.amount_applied) == (1, 1, Decimal("100.00"))
+    assert db.query(CashApplication.payment_id).all() == [(2,)]
+    payment = db.get(Payment, 2)
+    assert (payment.applied_amount, payment.status) == (Decimal("150.00"), "Applied")
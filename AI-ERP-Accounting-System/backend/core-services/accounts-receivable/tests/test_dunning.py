@@ -0,0 +1,122 @@
+import asyncio
+from datetime import date
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from src.models.customers import Customer
+from src.models.invoices import Invoice
+from src.models.collections import Collection
+from src.models.collector_rollups import CollectorDailyRollup
+from src.models.dunning import DunningRun, DunningLetter
+from src.services import dunning_service as dunning_module
+from src.services.dunning_mailer import MailDispatcher, OutboxTransport
+from src.services.dunning_service import DunningService, MAX_SEND_ATTEMPTS, dunning_level
+
+AS_OF = date(2024, 6, 30)
+
+
+class FlakyTransport(OutboxTransport):
+    """Outbox that fails every delivery to the listed addresses"""
+
+    def __init__(self, failing=()):
+        super().__init__()
+        self.failing = set(failing)
+
+    def send(self, mail):
+        if mail.to in self.failing:
+            raise ConnectionError("relay refused")
+        super().send(mail)
+
+
+@pytest.fixture
+def session_factory(monkeypatch):
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    for model in (Customer, Invoice, Collection, CollectorDailyRollup, DunningRun, DunningLetter):
+        model.metadata.create_all(engine, tables=[model.__table__])
+    factory = sessionmaker(bind=engine)
+    monkeypatch.setattr(dunning_module, "SessionLocal", factory)
+
+    db = factory()
+    for customer_id, email in ((1, "one@example.com"), (2, "two@example.com"), (3, None)):
+        db.add(Customer(id=customer_id, name=f"Customer {customer_id}", email=email))
+        db.add(Invoice(
+            customer_id=customer_id, invoice_number=f"INV-2024-{customer_id:05d}", status="Sent",
+            invoice_date=date(2024, 4, 1), due_date=date(2024, 5, 1),
+            total_amount=Decimal("100.00"), paid_amount=Decimal("0")
+        ))
+    db.commit()
+    db.close()
+    return factory
+
+
+def run_dunning(factory, service):
+    db = factory()
+    run_id = service.start_run(db, AS_OF).id
+    db.close()
+    asyncio.run(service.process_run(run_id))
+    return run_id
+
+
+def letters_by_customer(factory, run_id):
+    db = factory()
+    try:
+        return {
+            letter.customer_id: letter
+            for letter in db.query(DunningLetter).filter(DunningLetter.run_id == run_id)
+        }
+    finally:
+        db.close()
+
+
+@pytest.mark.parametrize("days_overdue, level", [(0, 1), (1, 1), (30, 1), (31, 2), (60, 2), (61, 3), (400, 3)])
+def test_dunning_level_by_days_overdue(days_overdue, level):
+    assert dunning_level(days_overdue) == level
+
+
+def test_run_sends_each_customer_once_and_retries_failures(session_factory):
+    transport = FlakyTransport(failing={"two@example.com"})
+    service = DunningService(dispatcher=MailDispatcher(transport, concurrency=2))
+
+    run_id = run_dunning(session_factory, service)
+
+    letters = letters_by_customer(session_factory, run_id)
+    assert letters[1].status == "Sent" and letters[1].dunning_level == 2
+    assert letters[2].status == "Failed" and letters[2].attempts == MAX_SEND_ATTEMPTS
+    assert letters[3].status == "NoEmail"
+    assert [mail.to for mail in transport.sent] == ["one@example.com"]
+
+    db = session_factory()
+    db_run = db.query(DunningRun).filter(DunningRun.id == run_id).one()
+    assert (db_run.status, db_run.letters_sent, db_run.letters_failed) == ("Completed", 1, 1)
+    assert db.query(Collection).filter(Collection.customer_id == 1).count() == 1
+    db.close()
+
+
+def test_resume_parks_letters_interrupted_mid_send(session_factory):
+    db = session_factory()
+    db_run = DunningRun(as_of_date=AS_OF, status="Running", last_customer_id=1, customers_processed=1)
+    db.add(db_run)
+    db.flush()
+    interrupted_run_id = db_run.id
+    db.add(DunningLetter(
+        run_id=interrupted_run_id, customer_id=1, dunning_level=2, email="one@example.com", subject="Second notice",
+        body="...", total_overdue=Decimal("100.00"), invoice_count=1, status="Sending", attempts=1
+    ))
+    db.commit()
+    db.close()
+
+    transport = OutboxTransport()
+    service = DunningService(dispatcher=MailDispatcher(transport))
+    assert service.get_interrupted_run_ids() == [interrupted_run_id]
+
+    assert run_dunning(session_factory, service) == interrupted_run_id
+
+    letters = letters_by_customer(session_factory, interrupted_run_id)
+    # Customer 1 may already have the letter: it is parked, not resent; the rest resume from the checkpoint
+    assert letters[1].status == "Unconfirmed"
+    assert letters[2].status == "Sent"
+    assert [mail.to for mail in transport.sent] == ["two@example.com"]
@@ -0,0 +1,144 @@
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+import numpy as np
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from src.models.revenue_recognition import (
+    RevenueSchedule, RevenueScheduleEvent, RevenueRecognitionRun, RevenueRecognitionLine,
+    RevenueRecognitionRunCreate
+)
+from src.services import revenue_recognition_service as recognition_module
+from src.services.revenue_recognition_service import (
+    RevenueRecognitionService, recognized_to_date, STRAIGHT_LINE, MILESTONE, USAGE, UNIT_SCALE
+)
+from src.utils.gl_client import GLPostingError
+
+
+def recognize(method, total_cents, term_days=0, elapsed_days=0, total_units=0, units_to_date=0):
+    columns = np.broadcast_arrays(*(
+        np.array(values, dtype=np.int64)
+        for values in (method, total_cents, term_days, elapsed_days, total_units, units_to_date)
+    ))
+    return recognized_to_date(*columns).tolist()
+
+
+def test_straight_line_floors_each_day_and_releases_remainder_at_end():
+    assert recognize([STRAIGHT_LINE] * 4, [1000] * 4, [3] * 4, [0, 1, 2, 3]) == [0, 333, 666, 1000]
+    assert recognize([STRAIGHT_LINE], [1000], [3], [10]) == [1000]
+
+
+def test_unit_share_is_exact_where_floats_round_down():
+    # 100 * 0.29 is 28.999999999999996 in floating point
+    assert recognize([MILESTONE], [100], total_units=[100 * UNIT_SCALE], units_to_date=[29 * UNIT_SCALE]) == [29]
+    assert recognize(
+        [USAGE] * 3, [30] * 3, total_units=[3000] * 3, units_to_date=[1000, 2000, 3000]
+    ) == [10, 20, 30]
+
+
+def test_units_beyond_contract_or_missing_total_are_capped():
+    assert recognize([USAGE], [500], total_units=[10 * UNIT_SCALE], units_to_date=[12 * UNIT_SCALE]) == [500]
+    assert recognize([USAGE], [500], total_units=[0], units_to_date=[5 * UNIT_SCALE]) == [0]
+
+
+def test_large_products_do_not_overflow():
+    total_cents = 10 ** 13
+    total_units = 3 * 10 ** 9
+    assert recognize([USAGE], [total_cents], total_units=[total_units], units_to_date=[10 ** 9]) == [
+        total_cents // 3
+    ]
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    RevenueSchedule.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    for line_id, department_id in ((1, 10), (2, 10), (3, 20)):
+        session.add(RevenueSchedule(
+            invoice_id=1, invoice_line_id=line_id, customer_id=1, method="StraightLine",
+            total_amount=Decimal("300.00"), recognized_amount=Decimal("0"),
+            start_date=date(2024, 1, 1), end_date=date(2024, 3, 31),
+            deferred_account_id=2400, revenue_account_id=4000, department_id=department_id, status="Active"
+        ))
+    session.commit()
+    yield session
+    session.close()
+
+
+class FakeGL:
+    """Stands in for the GL bulk endpoint, honouring skip_existing like the real one"""
+
+    def __init__(self, fail_after=None):
+        self.entries = {}
+        self.fail_after = fail_after
+
+    def __call__(self, entries, token=None, post=True, skip_existing=False):
+        entry_ids = []
+        for entry in entries:
+            if skip_existing and entry["reference"] in self.entries:
+                entry_ids.append(self.entries[entry["reference"]][0])
+                continue
+            if self.fail_after is not None and len(self.entries) >= self.fail_after:
+                raise GLPostingError("General ledger rejected journal entries", entry_ids)
+            self.entries[entry["reference"]] = (len(self.entries) + 1, entry)
+            entry_ids.append(len(self.entries))
+        return entry_ids
+
+
+def test_rerun_after_partial_gl_failure_resumes_without_double_posting(db, monkeypatch):
+    monkeypatch.setattr(recognition_module, "MAX_RECOGNITION_GROUPS_PER_ENTRY", 1)
+    gl = FakeGL(fail_after=1)
+    monkeypatch.setattr(recognition_module, "post_journal_entries", gl)
+    service = RevenueRecognitionService()
+    request = RevenueRecognitionRunCreate(period_end_date=date(2024, 1, 31))
+
+    with pytest.raises(GLPostingError):
+        service.run_recognition(db, request)
+    failed_run = db.query(RevenueRecognitionRun).one()
+    assert (failed_run.status, failed_run.journal_entry_ids) == ("Failed", "1")
+    assert {schedule.recognized_amount for schedule in db.query(RevenueSchedule)} == {Decimal("0")}
+
+    gl.fail_after = None
+    db_run = service.run_recognition(db, request)
+
+    assert db_run.id == failed_run.id and db_run.status == "Posted"
+    assert db.query(RevenueRecognitionRun).count() == 1
+    assert len(gl.entries) == 2  # One entry per department group, the first one not resent
+    assert db_run.journal_entry_ids == "1,2"
+    # 31 of the 91 days of the service period
+    assert {schedule.recognized_amount for schedule in db.query(RevenueSchedule)} == {Decimal("102.19")}
+    assert {
+        (line.schedule_id, line.journal_entry_id) for line in db.query(RevenueRecognitionLine)
+    } == {(1, 1), (2, 1), (3, 2)}
+
+
+def test_failed_run_blocks_other_periods_until_rerun(db, monkeypatch):
+    monkeypatch.setattr(recognition_module, "post_journal_entries", FakeGL(fail_after=0))
+    service = RevenueRecognitionService()
+    with pytest.raises(GLPostingError):
+        service.run_recognition(db, RevenueRecognitionRunCreate(period_end_date=date(2024, 1, 31)))
+
+    with pytest.raises(ValueError, match="did not finish"):
+        service.run_recognition(db, RevenueRecognitionRunCreate(period_end_date=date(2024, 2, 29)))
+
+
+def test_interrupted_pending_run_is_resumed_once_stale(db, monkeypatch):
+    monkeypatch.setattr(recognition_module, "post_journal_entries", FakeGL())
+    service = RevenueRecognitionService()
+    request = RevenueRecognitionRunCreate(period_end_date=date(2024, 1, 31))
+
+    # A worker that computed the run and died before posting
+    db_run = service._compute_run(db, request.period_end_date)
+    db.commit()
+    with pytest.raises(ValueError, match="still in progress"):
+        service.run_recognition(db, request)
+
+    db_run.attempted_at = datetime.utcnow() - timedelta(minutes=recognition_module.STALE_RUN_MINUTES + 1)
+    db.commit()
+    resumed = service.run_recognition(db, request)
+    assert (resumed.id, resumed.status) == (db_run.id, "Posted")
+    assert db.query(RevenueRecognitionLine).count() == 3
@@ -0,0 +1,136 @@
+from datetime import date
+from decimal import Decimal
+
+import numpy as np
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from src.models.invoices import Invoice, InvoiceLine
+from src.models.billing_runs import InvoiceNumberCounter
+from src.models.credit_exposure import CustomerCreditExposure
+from src.models.subscriptions import (
+    Subscription, SubscriptionLine, SubscriptionBillingCycle, SubscriptionBillingRun, SubscriptionBillingRunCreate
+)
+from src.services.ar_service import AccountsReceivableService
+from src.services.credit_exposure_service import CreditExposureService
+from src.services.subscription_service import SubscriptionService, billing_periods, prorate_cents
+
+
+def periods_for(start, end, billing_day, interval=1):
+    return billing_periods(
+        np.array([start], dtype="datetime64[D]"),
+        np.array([end], dtype="datetime64[D]"),
+        np.array([billing_day], dtype=np.int64),
+        np.array([interval], dtype=np.int64)
+    )
+
+
+def test_mid_period_start_is_prorated_to_the_next_anchor():
+    periods = periods_for(date(2024, 1, 20), None, 1)
+    assert periods["next_billing_date"][0] == np.datetime64("2024-02-01")
+    assert (periods["billed_days"][0], periods["period_days"][0]) == (12, 31)
+    assert not periods["expires"][0]
+    assert prorate_cents(np.array([3100]), periods["billed_days"], periods["period_days"])[0] == 1200
+
+
+def test_billing_day_is_clamped_to_short_months():
+    periods = periods_for(date(2024, 1, 31), None, 31)
+    assert periods["next_billing_date"][0] == np.datetime64("2024-02-29")
+    assert periods["billed_days"][0] == periods["period_days"][0] == 29
+
+
+def test_cancellation_inside_the_period_is_prorated_and_expires():
+    periods = periods_for(date(2024, 3, 1), date(2024, 3, 10), 1)
+    assert (periods["billed_days"][0], periods["period_days"][0]) == (10, 31)
+    assert periods["expires"][0]
+
+
+def test_subscription_ended_before_the_period_bills_nothing():
+    periods = periods_for(date(2024, 3, 1), date(2024, 2, 20), 1)
+    assert periods["billed_days"][0] == 0
+    assert periods["period_end"][0] == np.datetime64("2024-02-29")
+    assert periods["expires"][0]
+
+
+def test_proration_rounds_half_up():
+    cents = np.array([1, 3, 5])
+    assert prorate_cents(cents, np.array([1, 1, 1]), np.array([2, 2, 2])).tolist() == [1, 2, 3]
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    for model in (Invoice, InvoiceLine, InvoiceNumberCounter, CustomerCreditExposure, Subscription,
+                  SubscriptionLine, SubscriptionBillingCycle, SubscriptionBillingRun):
+        model.metadata.create_all(engine, tables=[model.__table__])
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def service():
+    return SubscriptionService(CreditExposureService(), AccountsReceivableService().generate_invoice_numbers)
+
+
+def add_subscription(db, subscription_id, next_billing_date, end_date=None):
+    db.add(Subscription(
+        id=subscription_id, customer_id=1, status="Active", start_date=date(2024, 1, 1), end_date=end_date,
+        billing_day=1, billing_interval_months=1, next_billing_date=next_billing_date, payment_terms_days=30
+    ))
+    db.add(SubscriptionLine(
+        subscription_id=subscription_id, line_number=1, item_code="PLAN", description="Plan",
+        quantity=Decimal("1"), unit_price=Decimal("31.00")
+    ))
+
+
+def test_billing_run_claims_each_period_once(db, service):
+    add_subscription(db, 1, date(2024, 3, 1))
+    add_subscription(db, 2, date(2024, 3, 1), end_date=date(2024, 2, 20))
+    db.commit()
+
+    db_run = service.run_billing(db, SubscriptionBillingRunCreate(cycle_date=date(2024, 3, 1)))
+    assert (db_run.status, db_run.subscription_count, db_run.invoice_count) == ("Completed", 2, 1)
+    assert db_run.first_invoice_number == db_run.last_invoice_number
+    assert db.get(Subscription, 2).status == "Expired"
+
+    cycle = db.query(SubscriptionBillingCycle).filter(SubscriptionBillingCycle.subscription_id == 1).one()
+    invoice = db.query(Invoice).one()
+    assert (cycle.invoice_id, cycle.invoice_number) == (invoice.id, invoice.invoice_number)
+
+    # An earlier run already claimed the period: it is skipped and draws no invoice number
+    db.get(Subscription, 1).next_billing_date = date(2024, 3, 1)
+    db.commit()
+    db_run = service.run_billing(db, SubscriptionBillingRunCreate(cycle_date=date(2024, 3, 1)))
+    assert (db_run.invoice_count, db_run.skipped_count) == (0, 1)
+    assert db.query(InvoiceNumberCounter).one().last_number == 1
+
+
+def test_interrupted_run_resumes_on_its_stored_cycle_date(db, service):
+    add_subscription(db, 1, date(2024, 3, 1))
+    add_subscription(db, 2, date(2024, 4, 1))
+    db.add(SubscriptionBillingRun(cycle_date=date(2024, 3, 1), status="Running"))
+    db.commit()
+
+    db_run = service.run_billing(db, SubscriptionBillingRunCreate(cycle_date=date(2024, 4, 1)))
+    assert (db_run.id, db_run.cycle_date, db_run.status, db_run.invoice_count) == (1, date(2024, 3, 1), "Completed", 1)
+    assert db.get(Subscription, 2).next_billing_date == date(2024, 4, 1)
+
+
+def test_failed_run_is_recorded(db, service, monkeypatch):
+    add_subscription(db, 1, date(2024, 3, 1))
+    db.commit()
+
+    def fail(*args, **kwargs):
+        raise RuntimeError("numbering unavailable")
+    monkeypatch.setattr(service, "generate_invoice_numbers", fail)
+
+    with pytest.raises(RuntimeError):
+        service.run_billing(db, SubscriptionBillingRunCreate(cycle_date=date(2024, 3, 1)))
+
+    db_run = db.query(SubscriptionBillingRun).one()
+    assert (db_run.status, db_run.error) == ("Failed", "numbering unavailable")
+    assert db.query(SubscriptionBillingCycle).count() == 0
+    assert db.get(Subscription, 1).next_billing_date == date(2024, 3, 1)
@@ -10,12 +10,15 @@ from decimal import Decimal
 from .database.connection import get_db
 from .models.chart_of_accounts import ChartOfAccounts, ChartOfAccountsCreate, ChartOfAccountsUpdate
 from .models.journal_entries import JournalEntry, JournalEntryCreate, JournalEntryUpdate, JournalLine
+from .models.fiscal_years import YearEndCloseRequest
+from .models.posting_rules import PostingRuleCreate, PostingRuleResponse
 from .models.financial_statements import FinancialStatement, BalanceSheet, IncomeStatement
 from .services.gl_service import GeneralLedgerService
 from .services.journal_service import JournalService
 from .services.reporting_service import ReportingService
-from .utils.validators import validate_journal_entry
+from .services.posting_rules_service import PostingRulesService
 from .utils.helpers import format_currency
+from .utils.auth import current_user_id
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -43,6 +46,7 @@ security = HTTPBearer()
 gl_service = GeneralLedgerService()
 journal_service = JournalService()
 reporting_service = ReportingService()
+posting_rules_service = PostingRulesService()
 
 @app.get("/")
 async def root():
@@ -141,9 +145,9 @@ async def create_journal_entry(
     """Create a new journal entry"""
     try:
         # Validate journal entry
-        validation_result = validate_journal_entry(entry)
+        validation_result = posting_rules_service.validate_entries(db, [entry])
         if not validation_result["valid"]:
-            raise HTTPException(status_code=400, detail=validation_result["errors"])
+            raise HTTPException(status_code=400, detail=validation_result["results"][0]["errors"])
         
         return journal_service.create_journal_entry(db, entry)
     except HTTPException:
@@ -152,6 +156,71 @@ async def create_journal_entry(
         logger.error(f"Error creating journal entry: {str(e)}")
         raise HTTPException(status_code=400, detail=str(e))
 
+@app.post("/journal-entries/bulk", status_code=status.HTTP_201_CREATED)
+async def create_journal_entries_bulk(
+    entries: List[JournalEntryCreate],
+    post: bool = False,
+    skip_existing_references: bool = False,
+    db: Session = Depends(get_db),
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    """Create (and optionally post) a batch of journal entries"""
+    try:
+        # A resent batch: entries already in the ledger under their reference return their existing IDs
+        existing_ids = {}
+        if skip_existing_references:
+            references = [entry.reference for entry in entries]
+            if not all(references) or len(set(references)) != len(references):
+                raise HTTPException(
+                    status_code=400, detail="Every entry needs a distinct reference when skipping existing references"
+                )
+            existing_ids = journal_service.get_entry_ids_by_reference(db, references)
+        new_entries = [entry for entry in entries if entry.reference not in existing_ids]
+        
+        validation_result = posting_rules_service.validate_entries(db, new_entries)
+        if not validation_result["valid"]:
+            invalid = [result for result in validation_result["results"] if not result["valid"]]
+            raise HTTPException(status_code=400, detail=invalid)
+        
+        # Entries over an approval threshold are kept as drafts awaiting approval rather than posted
+        pending_approval = [
+            result["index"] for result in validation_result["results"] if post and result["requires_approval"]
+        ]
+        created = journal_service.create_journal_entries_bulk(
+            db, new_entries, post=post, draft_indexes=pending_approval
+        )
+        created_ids = iter(created)
+        entry_ids = [
+            existing_ids[entry.reference] if entry.reference in existing_ids else next(created_ids)
+            for entry in entries
+        ]
+        return {
+            "message": "Journal entries created successfully",
+            "created": len(new_entries),
+            "existing": len(entries) - len(new_entries),
+            "entry_ids": entry_ids,
+            "pending_approval_ids": [created[index] for index in pending_approval]
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error creating journal entries in bulk: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/journal-entries/validate")
+async def validate_journal_entries(
+    entries: List[JournalEntryCreate],
+    post: bool = False,
+    db: Session = Depends(get_db),
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    """Validate a batch of journal entries against the posting rules without saving"""
+    try:
+        return posting_rules_service.validate_entries(db, entries, posting=post)
+    except Exception as e:
+        logger.error(f"Error validating journal entries: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+
 @app.get("/journal-entries", response_model=List[JournalEntry])
 async def get_journal_entries(
     skip: int = 0,
@@ -201,6 +270,15 @@ async def update_journal_entry(
 ):
     """Update an existing journal entry"""
     try:
+        existing_entry = journal_service.get_journal_entry(db, entry_id)
+        if not existing_entry:
+            raise HTTPException(status_code=404, detail="Journal entry not found")
+        
+        # The updated entry has to pass the same rules as a new one
+        validation_result = posting_rules_service.validate_stored_entry(db, existing_entry, entry)
+        if not validation_result["valid"]:
+            raise HTTPException(status_code=400, detail=validation_result["errors"])
+        
         updated_entry = journal_service.update_journal_entry(db, entry_id, entry)
         if not updated_entry:
             raise HTTPException(status_code=404, detail="Journal entry not found")
@@ -219,12 +297,123 @@ async def post_journal_entry(
 ):
     """Post a journal entry to the general ledger"""
     try:
+        existing_entry = journal_service.get_journal_entry(db, entry_id)
+        if not existing_entry:
+            raise HTTPException(status_code=404, detail="Journal entry not found")
+        
+        # Period locks and approval thresholds are checked against the entry as it stands now
+        validation_result = posting_rules_service.validate_stored_entry(db, existing_entry, posting=True)
+        if not validation_result["valid"]:
+            raise HTTPException(status_code=400, detail=validation_result["errors"])
+        
         result = journal_service.post_journal_entry(db, entry_id)
         return {"message": "Journal entry posted successfully", "entry_id": entry_id}
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error posting journal entry {entry_id}: {str(e)}")
         raise HTTPException(status_code=400, detail=str(e))
 
+@app.post("/journal-entries/{entry_id}/approve", response_model=JournalEntry)
+async def approve_journal_entry(
+    entry_id: int,
+    db: Session = Depends(get_db),
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    """Approve a draft journal entry that exceeds an approval threshold so it can be posted"""
+    try:
+        approved_entry = journal_service.approve_journal_entry(
+            db, entry_id, approved_by=current_user_id(credentials.credentials)
+        )
+        if not approved_entry:
+            raise HTTPException(status_code=404, detail="Journal entry not found")
+        return approved_entry
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error approving journal entry {entry_id}: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+
+# Fiscal Year endpoints
+@app.post("/fiscal-years/{year}/close")
+async def close_fiscal_year(
+    year: int,
+    close_request: YearEndCloseRequest,
+    db: Session = Depends(get_db),
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    """Close P&L accounts to retained earnings and lock the fiscal year"""
+    try:
+        result = gl_service.close_fiscal_year(
+            db, year, close_request, closed_by=current_user_id(credentials.credentials)
+        )
+        posting_rules_service.invalidate()
+        return result
+    except Exception as e:
+        logger.error(f"Error closing fiscal year {year}: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/fiscal-years/{year}/reopen")
+async def reopen_fiscal_year(
+    year: int,
+    db: Session = Depends(get_db),
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    """Reopen a closed fiscal year and void its closing entries"""
+    try:
+        result = gl_service.reopen_fiscal_year(db, year)
+        posting_rules_service.invalidate()
+        return result
+    except Exception as e:
+        logger.error(f"Error reopening fiscal year {year}: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+
+# Posting Rules endpoints
+@app.post("/posting-rules", status_code=status.HTTP_201_CREATED)
+async def create_posting_rule(
+    rule: PostingRuleCreate,
+    db: Session = Depends(get_db),
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    """Create a posting rule (dimension combination, approval threshold or period lock)"""
+    try:
+        db_rule = posting_rules_service.create_rule(db, rule)
+        return {"message": "Posting rule created successfully", "rule_id": db_rule.id}
+    except Exception as e:
+        logger.error(f"Error creating posting rule: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/posting-rules", response_model=List[PostingRuleResponse])
+async def get_posting_rules(
+    rule_type: Optional[str] = None,
+    active: Optional[bool] = None,
+    db: Session = Depends(get_db),
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    """Get posting rules with optional filtering"""
+    try:
+        return posting_rules_service.get_rules(db, rule_type=rule_type, active=active)
+    except Exception as e:
+        logger.error(f"Error retrieving posting rules: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.delete("/posting-rules/{rule_id}")
+async def deactivate_posting_rule(
+    rule_id: int,
+    db: Session = Depends(get_db),
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    """Deactivate a posting rule"""
+    try:
+        if not posting_rules_service.deactivate_rule(db, rule_id):
+            raise HTTPException(status_code=404, detail="Posting rule not found")
+        return {"message": "Posting rule deactivated", "rule_id": rule_id}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error deactivating posting rule {rule_id}: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+
 # Financial Reporting endpoints
 @app.get("/reports/balance-sheet", response_model=BalanceSheet)
 async def get_balance_sheet(
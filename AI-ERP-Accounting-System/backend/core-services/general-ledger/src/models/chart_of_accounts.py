@@ -34,25 +34,25 @@ class ChartOfAccounts(Base):
 class ChartOfAccountsBase(BaseModel):
     account_code: str = Field(..., min_length=1, max_length=20)
     account_name: str = Field(..., min_length=1, max_length=100)
-    account_type: str = Field(..., regex="^(Asset|Liability|Equity|Revenue|Expense)$")
+    account_type: str = Field(..., pattern="^(Asset|Liability|Equity|Revenue|Expense)$")
     account_category: str = Field(..., min_length=1, max_length=50)
     parent_account_id: Optional[int] = None
     description: Optional[str] = None
     is_active: bool = True
     is_system_account: bool = False
-    normal_balance: str = Field(..., regex="^(Debit|Credit)$")
+    normal_balance: str = Field(..., pattern="^(Debit|Credit)$")
 
 class ChartOfAccountsCreate(ChartOfAccountsBase):
     pass
 
 class ChartOfAccountsUpdate(BaseModel):
     account_name: Optional[str] = Field(None, min_length=1, max_length=100)
-    account_type: Optional[str] = Field(None, regex="^(Asset|Liability|Equity|Revenue|Expense)$")
+    account_type: Optional[str] = Field(None, pattern="^(Asset|Liability|Equity|Revenue|Expense)$")
     account_category: Optional[str] = Field(None, min_length=1, max_length=50)
     parent_account_id: Optional[int] = None
     description: Optional[str] = None
     is_active: Optional[bool] = None
-    normal_balance: Optional[str] = Field(None, regex="^(Debit|Credit)$")
+    normal_balance: Optional[str] = Field(None, pattern="^(Debit|Credit)$")
 
 class ChartOfAccounts(ChartOfAccountsBase):
     id: int
@@ -0,0 +1,31 @@
+from sqlalchemy import Column, Integer, String, DateTime, Date
+from sqlalchemy.ext.declarative import declarative_base
+from datetime import datetime, date
+from typing import Optional
+from pydantic import BaseModel, Field
+
+Base = declarative_base()
+
+# SQLAlchemy Model
+class FiscalYear(Base):
+    __tablename__ = "fiscal_years"
+
+    id = Column(Integer, primary_key=True, index=True)
+    year = Column(Integer, unique=True, index=True, nullable=False)
+    start_date = Column(Date, nullable=False)
+    end_date = Column(Date, nullable=False)
+    status = Column(String(20), default="Open", index=True)  # Open, Closed
+    retained_earnings_account_id = Column(Integer, nullable=True)
+    closed_at = Column(DateTime, nullable=True)
+    closed_by = Column(Integer, nullable=True)
+    reopened_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+# Pydantic Models
+class YearEndCloseRequest(BaseModel):
+    retained_earnings_account_id: int
+    start_date: Optional[date] = None  # Defaults to January 1st of the fiscal year
+    end_date: Optional[date] = None  # Defaults to December 31st of the fiscal year
+    closing_date: Optional[date] = None  # Defaults to the fiscal year end date
+    description: Optional[str] = Field(None, max_length=200)
@@ -18,12 +18,15 @@ class JournalEntry(Base):
     reference = Column(String(100), nullable=True)
     description = Column(Text, nullable=False)
     status = Column(String(20), default="Draft")  # Draft, Posted, Void
-    entry_type = Column(String(50), nullable=False)  # Manual, System, Recurring
+    entry_type = Column(String(50), nullable=False)  # Manual, System, Recurring, Closing
+    closes_fiscal_year_id = Column(Integer, nullable=True, index=True)  # Set only on the year-end close's entries
     total_debits = Column(Numeric(15, 2), default=0)
     total_credits = Column(Numeric(15, 2), default=0)
     is_balanced = Column(Boolean, default=False)
     posted_at = Column(DateTime, nullable=True)
     posted_by = Column(Integer, nullable=True)
+    approved_at = Column(DateTime, nullable=True)  # Entries over an ApprovalThreshold post only once approved
+    approved_by = Column(Integer, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     created_by = Column(Integer, nullable=True)
@@ -40,6 +43,8 @@ class JournalLine(Base):
     account_id = Column(Integer, ForeignKey("chart_of_accounts.id"), nullable=False)
     line_number = Column(Integer, nullable=False)
     description = Column(Text, nullable=True)
+    department_id = Column(Integer, nullable=True, index=True)
+    cost_center_id = Column(Integer, nullable=True, index=True)
     debit_amount = Column(Numeric(15, 2), default=0)
     credit_amount = Column(Numeric(15, 2), default=0)
     created_at = Column(DateTime, default=datetime.utcnow)
@@ -54,6 +59,8 @@ class JournalLineBase(BaseModel):
     account_id: int
     line_number: int
     description: Optional[str] = None
+    department_id: Optional[int] = None
+    cost_center_id: Optional[int] = None
     debit_amount: Decimal = Field(default=0, ge=0)
     credit_amount: Decimal = Field(default=0, ge=0)
 
@@ -64,6 +71,8 @@ class JournalLineUpdate(BaseModel):
     account_id: Optional[int] = None
     line_number: Optional[int] = None
     description: Optional[str] = None
+    department_id: Optional[int] = None
+    cost_center_id: Optional[int] = None
     debit_amount: Optional[Decimal] = Field(None, ge=0)
     credit_amount: Optional[Decimal] = Field(None, ge=0)
 
@@ -80,7 +89,7 @@ class JournalEntryBase(BaseModel):
     entry_date: date
     reference: Optional[str] = Field(None, max_length=100)
     description: str
-    entry_type: str = Field(..., regex="^(Manual|System|Recurring)$")
+    entry_type: str = Field(..., pattern="^(Manual|System|Recurring)$")
     journal_lines: List[JournalLineCreate]
 
 class JournalEntryCreate(JournalEntryBase):
@@ -90,11 +99,12 @@ class JournalEntryUpdate(BaseModel):
     entry_date: Optional[date] = None
     reference: Optional[str] = Field(None, max_length=100)
     description: Optional[str] = None
-    entry_type: Optional[str] = Field(None, regex="^(Manual|System|Recurring)$")
+    entry_type: Optional[str] = Field(None, pattern="^(Manual|System|Recurring)$")
     journal_lines: Optional[List[JournalLineCreate]] = None
 
 class JournalEntry(JournalEntryBase):
     id: int
+    entry_type: str  # Closing entries are created only by the year-end close
     entry_number: str
     status: str
     total_debits: Decimal
@@ -102,6 +112,8 @@ class JournalEntry(JournalEntryBase):
     is_balanced: bool
     posted_at: Optional[datetime] = None
     posted_by: Optional[int] = None
+    approved_at: Optional[datetime] = None
+    approved_by: Optional[int] = None
     created_at: datetime
     updated_at: datetime
     created_by: Optional[int] = None
@@ -0,0 +1,49 @@
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Date, Text, Numeric
+from sqlalchemy.ext.declarative import declarative_base
+from datetime import datetime, date
+from typing import Optional
+from pydantic import BaseModel, Field
+from decimal import Decimal
+
+Base = declarative_base()
+
+# SQLAlchemy Model
+class PostingRule(Base):
+    __tablename__ = "posting_rules"
+
+    id = Column(Integer, primary_key=True, index=True)
+    rule_type = Column(String(30), nullable=False, index=True)  # AccountDimension, ApprovalThreshold, PeriodLock
+    account_id = Column(Integer, nullable=True, index=True)  # None applies the rule to every account
+    department_id = Column(Integer, nullable=True)  # None matches any department
+    cost_center_id = Column(Integer, nullable=True)  # None matches any cost center
+    threshold_amount = Column(Numeric(15, 2), nullable=True)
+    start_date = Column(Date, nullable=True)
+    end_date = Column(Date, nullable=True)
+    description = Column(Text, nullable=True)
+    is_active = Column(Boolean, default=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_by = Column(Integer, nullable=True)
+
+# Pydantic Models
+class PostingRuleBase(BaseModel):
+    rule_type: str = Field(..., pattern="^(AccountDimension|ApprovalThreshold|PeriodLock)$")
+    account_id: Optional[int] = None
+    department_id: Optional[int] = None
+    cost_center_id: Optional[int] = None
+    threshold_amount: Optional[Decimal] = Field(None, ge=0)
+    start_date: Optional[date] = None
+    end_date: Optional[date] = None
+    description: Optional[str] = None
+    is_active: bool = True
+
+class PostingRuleCreate(PostingRuleBase):
+    pass
+
+class PostingRuleResponse(PostingRuleBase):
+    id: int
+    created_at: datetime
+    updated_at: datetime
+
+    class Config:
+        from_attributes = True
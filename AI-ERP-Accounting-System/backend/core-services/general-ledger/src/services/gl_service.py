@@ -1,18 +1,27 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_
-from typing import List, Optional
-from datetime import datetime
+from sqlalchemy import and_, or_, func
+from typing import List, Optional, Dict, Any
+from datetime import datetime, date
 from decimal import Decimal
 import logging
 
 from ..models.chart_of_accounts import ChartOfAccounts, ChartOfAccountsCreate, ChartOfAccountsUpdate
+from ..models.journal_entries import JournalEntry, JournalEntryCreate, JournalLine, JournalLineCreate
+from ..models.fiscal_years import FiscalYear, YearEndCloseRequest
 from ..database.connection import get_db
+from .journal_service import JournalService
 
 logger = logging.getLogger(__name__)
 
+# Keep individual closing entries to a manageable size
+MAX_CLOSING_LINES_PER_ENTRY = 1000
+
 class GeneralLedgerService:
     """Service class for General Ledger operations"""
     
+    def __init__(self):
+        self.journal_service = JournalService()
+    
     def create_account(self, db: Session, account: ChartOfAccountsCreate) -> ChartOfAccounts:
         """Create a new chart of accounts entry"""
         try:
@@ -275,4 +284,193 @@ class GeneralLedgerService:
             
         except Exception as e:
             logger.error(f"Error validating account structure: {str(e)}")
-            raise 
\ No newline at end of file
+            raise 
+    
+    def close_fiscal_year(
+        self,
+        db: Session,
+        year: int,
+        close_request: YearEndCloseRequest,
+        closed_by: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """Close revenue and expense accounts to retained earnings and lock the fiscal year"""
+        try:
+            fiscal_year = db.query(FiscalYear).filter(FiscalYear.year == year).first()
+            if not fiscal_year:
+                fiscal_year = FiscalYear(
+                    year=year,
+                    start_date=close_request.start_date or date(year, 1, 1),
+                    end_date=close_request.end_date or date(year, 12, 31),
+                    status="Open"
+                )
+                db.add(fiscal_year)
+                db.flush()
+            
+            if fiscal_year.status == "Closed":
+                raise ValueError(f"Fiscal year {year} is already closed. Reopen it before closing again")
+            
+            retained_earnings = db.query(ChartOfAccounts).filter(
+                and_(
+                    ChartOfAccounts.id == close_request.retained_earnings_account_id,
+                    ChartOfAccounts.account_type == "Equity",
+                    ChartOfAccounts.is_active == True
+                )
+            ).first()
+            if not retained_earnings:
+                raise ValueError(
+                    f"Retained earnings account {close_request.retained_earnings_account_id} not found, inactive or not an Equity account"
+                )
+            
+            # Closing balance of every P&L account in one grouped query
+            balances = db.query(
+                JournalLine.account_id,
+                func.sum(JournalLine.debit_amount).label("total_debits"),
+                func.sum(JournalLine.credit_amount).label("total_credits")
+            ).join(
+                JournalEntry, JournalEntry.id == JournalLine.journal_entry_id
+            ).join(
+                ChartOfAccounts, ChartOfAccounts.id == JournalLine.account_id
+            ).filter(
+                and_(
+                    JournalEntry.status == "Posted",
+                    JournalEntry.closes_fiscal_year_id.is_(None),
+                    JournalEntry.entry_date >= fiscal_year.start_date,
+                    JournalEntry.entry_date <= fiscal_year.end_date,
+                    ChartOfAccounts.account_type.in_(["Revenue", "Expense"])
+                )
+            ).group_by(JournalLine.account_id).order_by(JournalLine.account_id).all()
+            
+            closing_entries = self._build_closing_entries(
+                year=year,
+                balances=balances,
+                retained_earnings_account_id=retained_earnings.id,
+                closing_date=close_request.closing_date or fiscal_year.end_date,
+                description=close_request.description or f"Year-end close {year}"
+            )
+            
+            # Post through the bulk path before the year is locked
+            entry_ids = self.journal_service.create_journal_entries_bulk(
+                db, closing_entries, post=True, commit=False, closes_fiscal_year_id=fiscal_year.id
+            )
+            
+            net_income = sum(
+                (row.total_credits or Decimal("0")) - (row.total_debits or Decimal("0"))
+                for row in balances
+            )
+            
+            fiscal_year.status = "Closed"
+            fiscal_year.retained_earnings_account_id = retained_earnings.id
+            fiscal_year.closed_at = datetime.utcnow()
+            fiscal_year.closed_by = closed_by
+            fiscal_year.updated_at = datetime.utcnow()
+            
+            db.commit()
+            
+            logger.info(f"Closed fiscal year {year} with {len(entry_ids)} closing entries")
+            return {
+                "year": year,
+                "status": fiscal_year.status,
+                "closed_by": fiscal_year.closed_by,
+                "closing_entry_ids": entry_ids,
+                "accounts_closed": len(balances),
+                "net_income": net_income
+            }
+            
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error closing fiscal year {year}: {str(e)}")
+            raise
+    
+    def reopen_fiscal_year(self, db: Session, year: int) -> Dict[str, Any]:
+        """Reopen a closed fiscal year and void its closing entries"""
+        try:
+            fiscal_year = db.query(FiscalYear).filter(FiscalYear.year == year).first()
+            if not fiscal_year:
+                raise ValueError(f"Fiscal year {year} not found")
+            
+            if fiscal_year.status != "Closed":
+                raise ValueError(f"Fiscal year {year} is not closed")
+            
+            # Closing entries are replaced on the next close, so void them in place
+            voided = db.query(JournalEntry).filter(
+                and_(
+                    JournalEntry.closes_fiscal_year_id == fiscal_year.id,
+                    JournalEntry.status == "Posted"
+                )
+            ).update(
+                {"status": "Void", "updated_at": datetime.utcnow()},
+                synchronize_session=False
+            )
+            
+            fiscal_year.status = "Open"
+            fiscal_year.reopened_at = datetime.utcnow()
+            fiscal_year.updated_at = datetime.utcnow()
+            
+            db.commit()
+            
+            logger.info(f"Reopened fiscal year {year}, voided {voided} closing entries")
+            return {"year": year, "status": fiscal_year.status, "voided_entries": voided}
+            
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error reopening fiscal year {year}: {str(e)}")
+            raise
+    
+    def _build_closing_entries(
+        self,
+        year: int,
+        balances: List[Any],
+        retained_earnings_account_id: int,
+        closing_date: date,
+        description: str
+    ) -> List[JournalEntryCreate]:
+        """Build balanced closing entries that zero out each P&L account"""
+        closing_lines = []
+        for row in balances:
+            net_balance = (row.total_debits or Decimal("0")) - (row.total_credits or Decimal("0"))
+            if net_balance == 0:
+                continue
+            closing_lines.append((
+                row.account_id,
+                -net_balance if net_balance < 0 else Decimal("0"),
+                net_balance if net_balance > 0 else Decimal("0")
+            ))
+        
+        entries = []
+        chunk_size = MAX_CLOSING_LINES_PER_ENTRY - 1  # Leave room for the retained earnings line
+        for start in range(0, len(closing_lines), chunk_size):
+            chunk = closing_lines[start:start + chunk_size]
+            journal_lines = [
+                JournalLineCreate(
+                    account_id=account_id,
+                    line_number=line_number,
+                    description="Close account to retained earnings",
+                    debit_amount=debit_amount,
+                    credit_amount=credit_amount
+                )
+                for line_number, (account_id, debit_amount, credit_amount) in enumerate(chunk, start=1)
+            ]
+            
+            # Offset the net of this chunk against retained earnings
+            chunk_net = sum(line.debit_amount - line.credit_amount for line in journal_lines)
+            journal_lines.append(JournalLineCreate(
+                account_id=retained_earnings_account_id,
+                line_number=len(journal_lines) + 1,
+                description="Net income to retained earnings",
+                debit_amount=-chunk_net if chunk_net < 0 else Decimal("0"),
+                credit_amount=chunk_net if chunk_net > 0 else Decimal("0")
+            ))
+            
+            entries.append(JournalEntryCreate(
+                entry_date=closing_date,
+                reference=self._closing_reference(year),
+                description=description,
+                entry_type="System",  # Stored as Closing by create_journal_entries_bulk
+                journal_lines=journal_lines
+            ))
+        
+        return entries
+    
+    def _closing_reference(self, year: int) -> str:
+        """Reference shared by all closing entries of a fiscal year, for display only"""
+        return f"YE-CLOSE-{year}"
\ No newline at end of file
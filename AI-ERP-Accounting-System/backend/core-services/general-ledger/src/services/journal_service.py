@@ -1,6 +1,6 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_, func
-from typing import List, Optional
+from sqlalchemy import and_, or_, func, insert
+from typing import List, Optional, Dict, Iterable
 from datetime import datetime, date
 from decimal import Decimal
 import logging
@@ -8,10 +8,17 @@ import uuid
 
 from ..models.journal_entries import JournalEntry, JournalEntryCreate, JournalEntryUpdate, JournalLine, JournalLineCreate
 from ..models.chart_of_accounts import ChartOfAccounts
+from ..models.fiscal_years import FiscalYear
+from ..models.posting_rules import PostingRule
 from ..database.connection import get_db
+from ..utils.line_diff import diff_lines, apply_line_diff
 
 logger = logging.getLogger(__name__)
 
+JOURNAL_LINE_FIELDS = (
+    "account_id", "description", "department_id", "cost_center_id", "debit_amount", "credit_amount"
+)
+
 class JournalService:
     """Service class for Journal Entry operations"""
     
@@ -29,6 +36,8 @@ class JournalService:
             if not is_balanced:
                 raise ValueError(f"Journal entry is not balanced. Debits: {total_debits}, Credits: {total_credits}")
             
+            self._assert_periods_open(db, [entry.entry_date])
+            
             # Create journal entry
             db_entry = JournalEntry(
                 entry_number=entry_number,
@@ -42,27 +51,21 @@ class JournalService:
                 status="Draft"
             )
             
+            # Validate all accounts exist and are active
+            self._assert_accounts_active(db, {line.account_id for line in entry.journal_lines})
+            
             db.add(db_entry)
             db.flush()  # Get the ID without committing
             
             # Create journal lines
             for line_data in entry.journal_lines:
-                # Validate account exists and is active
-                account = db.query(ChartOfAccounts).filter(
-                    and_(
-                        ChartOfAccounts.id == line_data.account_id,
-                        ChartOfAccounts.is_active == True
-                    )
-                ).first()
-                
-                if not account:
-                    raise ValueError(f"Account {line_data.account_id} not found or inactive")
-                
                 db_line = JournalLine(
                     journal_entry_id=db_entry.id,
                     account_id=line_data.account_id,
                     line_number=line_data.line_number,
                     description=line_data.description,
+                    department_id=line_data.department_id,
+                    cost_center_id=line_data.cost_center_id,
                     debit_amount=line_data.debit_amount,
                     credit_amount=line_data.credit_amount
                 )
@@ -153,6 +156,11 @@ class JournalService:
             if db_entry.status == "Posted":
                 raise ValueError("Cannot update posted journal entry")
             
+            entry_dates = [db_entry.entry_date]
+            if entry_update.entry_date is not None:
+                entry_dates.append(entry_update.entry_date)
+            self._assert_periods_open(db, entry_dates)
+            
             # Update basic fields
             update_data = entry_update.dict(exclude_unset=True)
             
@@ -160,43 +168,22 @@ class JournalService:
                 if field != "journal_lines":
                     setattr(db_entry, field, value)
             
-            # Update journal lines if provided
+            # Update journal lines if provided, touching only the lines that changed
             if entry_update.journal_lines is not None:
-                # Delete existing lines
-                db.query(JournalLine).filter(
-                    JournalLine.journal_entry_id == entry_id
-                ).delete()
+                diff = diff_lines(
+                    db, JournalLine, "journal_entry_id", entry_id,
+                    [line.dict() for line in entry_update.journal_lines],
+                    JOURNAL_LINE_FIELDS
+                )
                 
-                # Add new lines
-                total_debits = Decimal("0")
-                total_credits = Decimal("0")
+                # Validate accounts of new and changed lines exist and are active
+                self._assert_accounts_active(db, {line["account_id"] for line in diff.added})
                 
-                for line_data in entry_update.journal_lines:
-                    # Validate account exists and is active
-                    account = db.query(ChartOfAccounts).filter(
-                        and_(
-                            ChartOfAccounts.id == line_data.account_id,
-                            ChartOfAccounts.is_active == True
-                        )
-                    ).first()
-                    
-                    if not account:
-                        raise ValueError(f"Account {line_data.account_id} not found or inactive")
-                    
-                    db_line = JournalLine(
-                        journal_entry_id=entry_id,
-                        account_id=line_data.account_id,
-                        line_number=line_data.line_number,
-                        description=line_data.description,
-                        debit_amount=line_data.debit_amount,
-                        credit_amount=line_data.credit_amount
-                    )
-                    
-                    db.add(db_line)
-                    total_debits += line_data.debit_amount
-                    total_credits += line_data.credit_amount
+                apply_line_diff(db, JournalLine, diff)
                 
-                # Update totals
+                # Update totals incrementally
+                total_debits = db_entry.total_debits + diff.delta("debit_amount")
+                total_credits = db_entry.total_credits + diff.delta("credit_amount")
                 db_entry.total_debits = total_debits
                 db_entry.total_credits = total_credits
                 db_entry.is_balanced = total_debits == total_credits
@@ -204,6 +191,10 @@ class JournalService:
                 if not db_entry.is_balanced:
                     raise ValueError(f"Journal entry is not balanced. Debits: {total_debits}, Credits: {total_credits}")
             
+            # An approval covers the entry as it was approved
+            db_entry.approved_by = None
+            db_entry.approved_at = None
+            
             # Update timestamp
             db_entry.updated_at = datetime.utcnow()
             
@@ -238,6 +229,8 @@ class JournalService:
             if not db_entry.is_balanced:
                 raise ValueError(f"Cannot post unbalanced journal entry {entry_id}")
             
+            self._assert_periods_open(db, [db_entry.entry_date])
+            
             # Update status to Posted
             db_entry.status = "Posted"
             db_entry.posted_at = datetime.utcnow()
@@ -257,6 +250,40 @@ class JournalService:
             logger.error(f"Error posting journal entry {entry_id}: {str(e)}")
             raise
     
+    def approve_journal_entry(self, db: Session, entry_id: int, approved_by: Optional[int]) -> Optional[JournalEntry]:
+        """Approve a draft entry so it can be posted past its approval threshold"""
+        try:
+            db_entry = db.query(JournalEntry).filter(
+                JournalEntry.id == entry_id
+            ).first()
+            
+            if not db_entry:
+                return None
+            
+            if db_entry.status != "Draft":
+                raise ValueError(f"Only draft journal entries can be approved, entry {entry_id} is {db_entry.status}")
+            
+            if approved_by is None:
+                raise ValueError("Approving a journal entry requires an identified user")
+            
+            if db_entry.created_by is not None and db_entry.created_by == approved_by:
+                raise ValueError(f"Journal entry {entry_id} cannot be approved by the user who created it")
+            
+            db_entry.approved_by = approved_by
+            db_entry.approved_at = datetime.utcnow()
+            db_entry.updated_at = datetime.utcnow()
+            
+            db.commit()
+            db.refresh(db_entry)
+            
+            logger.info(f"Approved journal entry: {db_entry.entry_number}")
+            return db_entry
+            
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error approving journal entry {entry_id}: {str(e)}")
+            raise
+    
     def void_journal_entry(self, db: Session, entry_id: int, reason: str) -> bool:
         """Void a journal entry"""
         try:
@@ -289,6 +316,127 @@ class JournalService:
             logger.error(f"Error voiding journal entry {entry_id}: {str(e)}")
             raise
     
+    def get_entry_ids_by_reference(self, db: Session, references: Iterable[str]) -> Dict[str, int]:
+        """IDs of the live (not voided) entries carrying each reference"""
+        references = {reference for reference in references if reference}
+        if not references:
+            return {}
+        
+        rows = db.query(JournalEntry.reference, JournalEntry.id).filter(
+            and_(
+                JournalEntry.reference.in_(references),
+                JournalEntry.status != "Void"
+            )
+        ).order_by(JournalEntry.id).all()
+        
+        entry_ids: Dict[str, int] = {}
+        for row in rows:
+            entry_ids.setdefault(row.reference, row.id)
+        return entry_ids
+    
+    def create_journal_entries_bulk(
+        self,
+        db: Session,
+        entries: List[JournalEntryCreate],
+        post: bool = False,
+        commit: bool = True,
+        closes_fiscal_year_id: Optional[int] = None,
+        draft_indexes: Iterable[int] = ()
+    ) -> List[int]:
+        """Create (and optionally post) many journal entries with set-based inserts.
+
+        Entries at draft_indexes stay Draft even when post is set, e.g. to await approval.
+        closes_fiscal_year_id is passed only by the year-end close: it marks the entries as that
+        year's Closing entries, which land on its last day, usually after its periods are locked.
+        """
+        try:
+            if not entries:
+                return []
+            
+            # Validate balances in memory before touching the database
+            totals = []
+            account_ids = set()
+            for index, entry in enumerate(entries):
+                total_debits = sum((line.debit_amount for line in entry.journal_lines), Decimal("0"))
+                total_credits = sum((line.credit_amount for line in entry.journal_lines), Decimal("0"))
+                if total_debits != total_credits:
+                    raise ValueError(
+                        f"Journal entry {index} is not balanced. Debits: {total_debits}, Credits: {total_credits}"
+                    )
+                totals.append((total_debits, total_credits))
+                account_ids.update(line.account_id for line in entry.journal_lines)
+            
+            # Validate all referenced accounts with a single query
+            self._assert_accounts_active(db, account_ids)
+            
+            self._assert_periods_open(
+                db, [entry.entry_date for entry in entries], check_period_locks=closes_fiscal_year_id is None
+            )
+            
+            # Allocate entry numbers as one block
+            entry_numbers = self._generate_entry_numbers(db, len(entries))
+            now = datetime.utcnow()
+            draft_indexes = set(draft_indexes)
+            posted = [post and index not in draft_indexes for index in range(len(entries))]
+            
+            header_rows = [
+                {
+                    "entry_number": entry_number,
+                    "entry_date": entry.entry_date,
+                    "reference": entry.reference,
+                    "description": entry.description,
+                    "entry_type": "Closing" if closes_fiscal_year_id else entry.entry_type,
+                    "closes_fiscal_year_id": closes_fiscal_year_id,
+                    "total_debits": total_debits,
+                    "total_credits": total_credits,
+                    "is_balanced": True,
+                    "status": "Posted" if is_posted else "Draft",
+                    "posted_at": now if is_posted else None,
+                    "created_at": now,
+                    "updated_at": now
+                }
+                for entry, entry_number, (total_debits, total_credits), is_posted in zip(
+                    entries, entry_numbers, totals, posted
+                )
+            ]
+            result = db.execute(
+                insert(JournalEntry).returning(JournalEntry.id, JournalEntry.entry_number),
+                header_rows
+            )
+            id_by_number = {row.entry_number: row.id for row in result}
+            entry_ids = [id_by_number[entry_number] for entry_number in entry_numbers]
+            
+            line_rows = [
+                {
+                    "journal_entry_id": entry_id,
+                    "account_id": line.account_id,
+                    "line_number": line.line_number,
+                    "description": line.description,
+                    "department_id": line.department_id,
+                    "cost_center_id": line.cost_center_id,
+                    "debit_amount": line.debit_amount,
+                    "credit_amount": line.credit_amount,
+                    "created_at": now,
+                    "updated_at": now
+                }
+                for entry, entry_id in zip(entries, entry_ids)
+                for line in entry.journal_lines
+            ]
+            db.execute(insert(JournalLine), line_rows)
+            
+            if commit:
+                db.commit()
+            else:
+                db.flush()
+            
+            logger.info(f"Created {len(entry_ids)} journal entries in bulk ({sum(posted)} posted)")
+            return entry_ids
+            
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error creating journal entries in bulk: {str(e)}")
+            raise
+    
     def create_reversing_entry(self, db: Session, entry_id: int, reverse_date: date) -> JournalEntry:
         """Create a reversing entry for a posted journal entry"""
         try:
@@ -330,22 +478,84 @@ class JournalService:
             logger.error(f"Error creating reversing entry: {str(e)}")
             raise
     
+    def _assert_accounts_active(self, db: Session, account_ids: Iterable[int]) -> None:
+        """Reject lines that reference missing or inactive accounts (one query per batch)"""
+        account_ids = set(account_ids)
+        if not account_ids:
+            return
+        
+        active_ids = {
+            row.id for row in db.query(ChartOfAccounts.id).filter(
+                and_(
+                    ChartOfAccounts.id.in_(account_ids),
+                    ChartOfAccounts.is_active == True
+                )
+            )
+        }
+        missing_ids = account_ids - active_ids
+        if missing_ids:
+            raise ValueError(f"Accounts not found or inactive: {sorted(missing_ids)}")
+    
+    def _assert_periods_open(
+        self,
+        db: Session,
+        entry_dates: Iterable[date],
+        check_period_locks: bool = True
+    ) -> None:
+        """Reject postings dated inside a closed fiscal year or an active PeriodLock rule"""
+        entry_dates = set(entry_dates)
+        if not entry_dates:
+            return
+        
+        closed_years = db.query(FiscalYear.year, FiscalYear.start_date, FiscalYear.end_date).filter(
+            and_(
+                FiscalYear.status == "Closed",
+                FiscalYear.start_date <= max(entry_dates),
+                FiscalYear.end_date >= min(entry_dates)
+            )
+        ).all()
+        
+        for fiscal_year in closed_years:
+            for entry_date in entry_dates:
+                if fiscal_year.start_date <= entry_date <= fiscal_year.end_date:
+                    raise ValueError(f"Fiscal year {fiscal_year.year} is closed for posting ({entry_date})")
+        
+        if not check_period_locks:
+            return
+        
+        # Read directly rather than through the compiled rules so a lock created moments ago applies
+        period_locks = db.query(PostingRule.start_date, PostingRule.end_date).filter(
+            and_(
+                PostingRule.rule_type == "PeriodLock",
+                PostingRule.is_active == True,
+                PostingRule.start_date <= max(entry_dates),
+                PostingRule.end_date >= min(entry_dates)
+            )
+        ).all()
+        
+        for period_lock in period_locks:
+            for entry_date in entry_dates:
+                if period_lock.start_date <= entry_date <= period_lock.end_date:
+                    raise ValueError(f"Period of {entry_date} is locked for posting")
+    
     def _generate_entry_number(self, db: Session) -> str:
         """Generate unique journal entry number"""
+        return self._generate_entry_numbers(db, 1)[0]
+    
+    def _generate_entry_numbers(self, db: Session, count: int) -> List[str]:
+        """Allocate a contiguous block of journal entry numbers"""
         try:
             # Get current year
             current_year = datetime.utcnow().year
             
             # Get count of entries for current year
-            count = db.query(JournalEntry).filter(
+            existing = db.query(JournalEntry).filter(
                 func.extract('year', JournalEntry.created_at) == current_year
             ).count()
             
             # Format: JE-YYYY-XXXXX (e.g., JE-2024-00001)
-            entry_number = f"JE-{current_year}-{count + 1:05d}"
-            
-            return entry_number
+            return [f"JE-{current_year}-{existing + offset:05d}" for offset in range(1, count + 1)]
             
         except Exception as e:
-            logger.error(f"Error generating entry number: {str(e)}")
-            raise 
\ No newline at end of file
+            logger.error(f"Error generating entry numbers: {str(e)}")
+            raise
\ No newline at end of file
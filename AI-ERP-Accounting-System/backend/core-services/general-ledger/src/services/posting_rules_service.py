@@ -0,0 +1,326 @@
+from sqlalchemy.orm import Session
+from typing import List, Optional, Dict, Any, Iterable, Tuple
+from datetime import datetime, date, timedelta
+from decimal import Decimal
+from bisect import bisect_right
+import logging
+import threading
+
+from ..models.chart_of_accounts import ChartOfAccounts
+from ..models.journal_entries import JournalEntry, JournalEntryCreate, JournalEntryUpdate, JournalLineCreate
+from ..models.fiscal_years import FiscalYear
+from ..models.posting_rules import PostingRule, PostingRuleCreate
+from ..utils.validators import validate_journal_entry
+
+logger = logging.getLogger(__name__)
+
+
+class AccountDimensionTable:
+    """Allowed (department, cost center) combinations for one account"""
+
+    def __init__(self):
+        self.pairs = set()
+        self.any_cost_center = set()  # Departments allowed with any cost center
+        self.any_department = set()  # Cost centers allowed with any department
+        self.any_combination = False
+
+    def add(self, department_id: Optional[int], cost_center_id: Optional[int]) -> None:
+        if department_id is None and cost_center_id is None:
+            self.any_combination = True
+        elif cost_center_id is None:
+            self.any_cost_center.add(department_id)
+        elif department_id is None:
+            self.any_department.add(cost_center_id)
+        else:
+            self.pairs.add((department_id, cost_center_id))
+
+    def allows(self, department_id: Optional[int], cost_center_id: Optional[int]) -> bool:
+        return (
+            self.any_combination
+            or (department_id, cost_center_id) in self.pairs
+            or department_id in self.any_cost_center
+            or cost_center_id in self.any_department
+        )
+
+
+class CompiledPostingRules:
+    """Posting rules compiled into lookup tables and evaluated over whole batches"""
+
+    def __init__(
+        self,
+        active_account_ids: Iterable[int],
+        dimension_tables: Dict[int, AccountDimensionTable],
+        approval_thresholds: Dict[int, Decimal],
+        default_approval_threshold: Optional[Decimal],
+        locked_periods: List[Tuple[date, date]]
+    ):
+        self.active_account_ids = frozenset(active_account_ids)
+        self.dimension_tables = dimension_tables
+        self.approval_thresholds = approval_thresholds
+        self.default_approval_threshold = default_approval_threshold
+        self.compiled_at = datetime.utcnow()
+
+        # Merge lock intervals so a date lookup is a single bisect
+        self._lock_starts: List[int] = []
+        self._lock_ends: List[int] = []
+        for start_date, end_date in sorted(locked_periods):
+            start, end = start_date.toordinal(), end_date.toordinal()
+            if self._lock_ends and start <= self._lock_ends[-1] + 1:
+                self._lock_ends[-1] = max(self._lock_ends[-1], end)
+            else:
+                self._lock_starts.append(start)
+                self._lock_ends.append(end)
+
+    def is_period_locked(self, entry_date: date) -> bool:
+        ordinal = entry_date.toordinal()
+        position = bisect_right(self._lock_starts, ordinal) - 1
+        return position >= 0 and ordinal <= self._lock_ends[position]
+
+    def evaluate(self, entries: List[JournalEntryCreate], posting: bool = False, approved: bool = False) -> Dict[str, Any]:
+        """Evaluate every rule over a batch of entries without touching the database.
+
+        Posting an entry over an approval threshold is an error unless the entry was approved.
+        """
+        results = []
+        locked_dates: Dict[date, bool] = {}
+
+        for index, entry in enumerate(entries):
+            structural = validate_journal_entry(entry)
+            errors = list(structural["errors"])
+
+            locked = locked_dates.get(entry.entry_date)
+            if locked is None:
+                locked = locked_dates[entry.entry_date] = self.is_period_locked(entry.entry_date)
+            if locked:
+                errors.append(f"Period of {entry.entry_date} is locked for posting")
+
+            entry_threshold = self.default_approval_threshold
+            for line in entry.journal_lines:
+                if line.account_id not in self.active_account_ids:
+                    errors.append(f"Line {line.line_number}: account {line.account_id} not found or inactive")
+                    continue
+
+                dimension_table = self.dimension_tables.get(line.account_id)
+                if dimension_table is not None and not dimension_table.allows(line.department_id, line.cost_center_id):
+                    errors.append(
+                        f"Line {line.line_number}: department {line.department_id} / cost center "
+                        f"{line.cost_center_id} is not valid for account {line.account_id}"
+                    )
+
+                line_threshold = self.approval_thresholds.get(line.account_id)
+                if line_threshold is not None and (entry_threshold is None or line_threshold < entry_threshold):
+                    entry_threshold = line_threshold
+
+            requires_approval = entry_threshold is not None and structural["total_debits"] > entry_threshold
+            if posting and requires_approval and not approved:
+                errors.append(
+                    f"Entry total {structural['total_debits']} exceeds approval threshold {entry_threshold} "
+                    f"and must be approved before posting"
+                )
+
+            results.append({
+                "index": index,
+                "valid": len(errors) == 0,
+                "errors": errors,
+                "requires_approval": requires_approval
+            })
+
+        invalid_count = sum(1 for result in results if not result["valid"])
+        return {
+            "valid": invalid_count == 0,
+            "entries_checked": len(entries),
+            "lines_checked": sum(len(entry.journal_lines) for entry in entries),
+            "invalid_entries": invalid_count,
+            "results": results
+        }
+
+
+class PostingRulesService:
+    """Service class for configurable journal posting rules"""
+
+    def __init__(self, cache_ttl_seconds: int = 60):
+        self.cache_ttl = timedelta(seconds=cache_ttl_seconds)
+        self._compiled: Optional[CompiledPostingRules] = None
+        self._lock = threading.Lock()
+
+    def create_rule(self, db: Session, rule: PostingRuleCreate) -> PostingRule:
+        """Create a new posting rule"""
+        try:
+            if rule.rule_type == "PeriodLock" and (not rule.start_date or not rule.end_date):
+                raise ValueError("PeriodLock rules require start_date and end_date")
+
+            if rule.rule_type == "ApprovalThreshold" and rule.threshold_amount is None:
+                raise ValueError("ApprovalThreshold rules require threshold_amount")
+
+            if rule.rule_type == "AccountDimension" and rule.account_id is None:
+                raise ValueError("AccountDimension rules require account_id")
+
+            db_rule = PostingRule(**rule.dict())
+            db.add(db_rule)
+            db.commit()
+            db.refresh(db_rule)
+
+            self.invalidate()
+
+            logger.info(f"Created posting rule {db_rule.id} ({rule.rule_type})")
+            return db_rule
+
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error creating posting rule: {str(e)}")
+            raise
+
+    def get_rules(
+        self,
+        db: Session,
+        rule_type: Optional[str] = None,
+        active: Optional[bool] = None
+    ) -> List[PostingRule]:
+        """Get posting rules with optional filtering"""
+        try:
+            query = db.query(PostingRule)
+
+            if rule_type:
+                query = query.filter(PostingRule.rule_type == rule_type)
+
+            if active is not None:
+                query = query.filter(PostingRule.is_active == active)
+
+            return query.order_by(PostingRule.rule_type, PostingRule.id).all()
+
+        except Exception as e:
+            logger.error(f"Error retrieving posting rules: {str(e)}")
+            raise
+
+    def deactivate_rule(self, db: Session, rule_id: int) -> bool:
+        """Deactivate a posting rule"""
+        try:
+            db_rule = db.query(PostingRule).filter(PostingRule.id == rule_id).first()
+            if not db_rule:
+                return False
+
+            db_rule.is_active = False
+            db_rule.updated_at = datetime.utcnow()
+            db.commit()
+
+            self.invalidate()
+            return True
+
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error deactivating posting rule {rule_id}: {str(e)}")
+            raise
+
+    def validate_entries(
+        self,
+        db: Session,
+        entries: List[JournalEntryCreate],
+        posting: bool = False
+    ) -> Dict[str, Any]:
+        """Validate a batch of journal entries against the compiled rules"""
+        return self.get_compiled_rules(db).evaluate(entries, posting=posting)
+
+    def validate_stored_entry(
+        self,
+        db: Session,
+        db_entry: JournalEntry,
+        entry_update: Optional[JournalEntryUpdate] = None,
+        posting: bool = False
+    ) -> Dict[str, Any]:
+        """Validate a saved entry, with an update applied, exactly as a new entry would be"""
+        compiled = self.get_compiled_rules(db)
+        update_data = entry_update.dict(exclude_unset=True) if entry_update else {}
+        journal_lines = update_data.get("journal_lines")
+        entry = JournalEntryCreate(
+            entry_date=update_data.get("entry_date") or db_entry.entry_date,
+            reference=update_data.get("reference", db_entry.reference),
+            description=update_data.get("description") or db_entry.description,
+            entry_type=update_data.get("entry_type") or db_entry.entry_type,
+            journal_lines=[
+                JournalLineCreate(**line) for line in journal_lines
+            ] if journal_lines is not None else [
+                JournalLineCreate(
+                    account_id=line.account_id,
+                    line_number=line.line_number,
+                    description=line.description,
+                    department_id=line.department_id,
+                    cost_center_id=line.cost_center_id,
+                    debit_amount=line.debit_amount or 0,
+                    credit_amount=line.credit_amount or 0
+                )
+                for line in db_entry.journal_lines
+            ]
+        )
+
+        result = compiled.evaluate([entry], posting=posting, approved=db_entry.approved_by is not None)["results"][0]
+        # Moving an entry out of a locked period is as much a change to that period as moving one in
+        if entry.entry_date != db_entry.entry_date and compiled.is_period_locked(db_entry.entry_date):
+            result["errors"].append(f"Period of {db_entry.entry_date} is locked for posting")
+            result["valid"] = False
+        return result
+
+    def get_compiled_rules(self, db: Session) -> CompiledPostingRules:
+        """Return the compiled rule set, recompiling when the cache is stale"""
+        compiled = self._compiled
+        if compiled is not None and datetime.utcnow() - compiled.compiled_at < self.cache_ttl:
+            return compiled
+
+        with self._lock:
+            compiled = self._compiled
+            if compiled is None or datetime.utcnow() - compiled.compiled_at >= self.cache_ttl:
+                compiled = self._compiled = self.compile_rules(db)
+            return compiled
+
+    def invalidate(self) -> None:
+        """Drop the compiled rules so the next validation recompiles them"""
+        self._compiled = None
+
+    def compile_rules(self, db: Session) -> CompiledPostingRules:
+        """Load accounts, rules and closed fiscal years and compile them into lookup tables"""
+        try:
+            active_account_ids = [
+                row.id for row in db.query(ChartOfAccounts.id).filter(ChartOfAccounts.is_active == True)
+            ]
+
+            rules = db.query(PostingRule).filter(PostingRule.is_active == True).all()
+
+            dimension_tables: Dict[int, AccountDimensionTable] = {}
+            approval_thresholds: Dict[int, Decimal] = {}
+            default_approval_threshold: Optional[Decimal] = None
+            locked_periods: List[Tuple[date, date]] = []
+
+            for rule in rules:
+                if rule.rule_type == "AccountDimension":
+                    dimension_tables.setdefault(rule.account_id, AccountDimensionTable()).add(
+                        rule.department_id, rule.cost_center_id
+                    )
+                elif rule.rule_type == "ApprovalThreshold":
+                    if rule.account_id is None:
+                        if default_approval_threshold is None or rule.threshold_amount < default_approval_threshold:
+                            default_approval_threshold = rule.threshold_amount
+                    else:
+                        current = approval_thresholds.get(rule.account_id)
+                        if current is None or rule.threshold_amount < current:
+                            approval_thresholds[rule.account_id] = rule.threshold_amount
+                elif rule.rule_type == "PeriodLock":
+                    locked_periods.append((rule.start_date, rule.end_date))
+
+            closed_years = db.query(FiscalYear.start_date, FiscalYear.end_date).filter(
+                FiscalYear.status == "Closed"
+            ).all()
+            locked_periods.extend((row.start_date, row.end_date) for row in closed_years)
+
+            logger.info(
+                f"Compiled {len(rules)} posting rules over {len(active_account_ids)} active accounts"
+            )
+            return CompiledPostingRules(
+                active_account_ids=active_account_ids,
+                dimension_tables=dimension_tables,
+                approval_thresholds=approval_thresholds,
+                default_approval_threshold=default_approval_threshold,
+                locked_periods=locked_periods
+            )
+
+        except Exception as e:
+            logger.error(f"Error compiling posting rules: {str(e)}")
+            raise
@@ -0,0 +1,21 @@
+from typing import Optional
+
+from jose import jwt
+from jose.exceptions import JWTError
+
+
+def current_user_id(token: str) -> Optional[int]:
+    """User id from the bearer token's subject claim.
+
+    The API gateway verifies the token before forwarding the request, so the claims are
+    only read here. Returns None when the token carries no numeric subject.
+    """
+    try:
+        claims = jwt.get_unverified_claims(token)
+    except JWTError:
+        return None
+    subject = claims.get("user_id", claims.get("sub"))
+    try:
+        return int(subject)
+    except (TypeError, ValueError):
+        return None
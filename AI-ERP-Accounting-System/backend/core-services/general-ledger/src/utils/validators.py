@@ -0,0 +1,39 @@
+from typing import Dict, Any, List
+from decimal import Decimal
+
+from ..models.journal_entries import JournalEntryCreate
+
+
+def validate_journal_entry(entry: JournalEntryCreate) -> Dict[str, Any]:
+    """Structural checks for a journal entry (no database access)"""
+    errors: List[str] = []
+
+    if len(entry.journal_lines) < 2:
+        errors.append("Journal entry must have at least two lines")
+
+    total_debits = Decimal("0")
+    total_credits = Decimal("0")
+    seen_line_numbers = set()
+
+    for line in entry.journal_lines:
+        if line.line_number in seen_line_numbers:
+            errors.append(f"Duplicate line number {line.line_number}")
+        seen_line_numbers.add(line.line_number)
+
+        if line.debit_amount and line.credit_amount:
+            errors.append(f"Line {line.line_number} has both a debit and a credit amount")
+        elif not line.debit_amount and not line.credit_amount:
+            errors.append(f"Line {line.line_number} has no amount")
+
+        total_debits += line.debit_amount
+        total_credits += line.credit_amount
+
+    if total_debits != total_credits:
+        errors.append(f"Journal entry is not balanced. Debits: {total_debits}, Credits: {total_credits}")
+
+    return {
+        "valid": len(errors) == 0,
+        "errors": errors,
+        "total_debits": total_debits,
+        "total_credits": total_credits
+    }
@@ -0,0 +1,33 @@
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Performance indexes that the ORM models cannot express portably.
+# Every statement must be idempotent; they run on each service start.
+PERFORMANCE_INDEXES = [
+    # Name search and typeahead for NameSearch (GET /suppliers?search=, /suppliers/typeahead)
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    """
+    CREATE INDEX IF NOT EXISTS ix_suppliers_name_trgm
+    ON suppliers USING gin (name gin_trgm_ops)
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS ix_suppliers_name_prefix
+    ON suppliers (lower(name) text_pattern_ops)
+    """,
+]
+
+
+def create_performance_indexes(engine: Engine) -> None:
+    """Create the service's performance indexes if they do not exist yet"""
+    if engine.dialect.name != "postgresql":
+        logger.info(f"Skipping performance indexes on {engine.dialect.name}")
+        return
+
+    with engine.begin() as connection:
+        for statement in PERFORMANCE_INDEXES:
+            connection.execute(text(statement))
+
+    logger.info(f"Ensured {len(PERFORMANCE_INDEXES)} performance indexes")
@@ -1,23 +1,35 @@
 from fastapi import FastAPI, HTTPException, Depends, status, UploadFile, File
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
 from typing import List, Optional
+import asyncio
 import logging
 from datetime import datetime, date
 from decimal import Decimal
 
-from .database.connection import get_db
+from .database.connection import get_db, engine
+from .database.indexes import create_performance_indexes
 from .models.suppliers import Supplier, SupplierCreate, SupplierUpdate
 from .models.purchase_requisitions import PurchaseRequisition, PurchaseRequisitionCreate, PurchaseRequisitionUpdate
 from .models.rfqs import RFQ, RFQCreate, RFQUpdate
 from .models.purchase_orders import PurchaseOrder, PurchaseOrderCreate, PurchaseOrderUpdate
 from .models.contracts import Contract, ContractCreate, ContractUpdate
+from .models.contract_compliance import ContractComplianceLine, ContractComplianceResult, ContractComplianceBatchReport
+from .models.spend_cube import SpendCubeSlice, SpendCubeRefreshSummary
+from .models.rfq_dispatches import RFQDispatchSummary, RFQDeliveryResponse
+from .models.supplier_scorecards import SupplierActivityBatch, SupplierScorecardResponse, SupplierRankingResponse
 from .services.procurement_service import ProcurementService
 from .services.supplier_service import SupplierService
 from .services.rfq_service import RFQService
+from .services.rfq_dispatch_service import RFQDispatchService
+from .services.spend_cube_service import SpendCubeService
+from .services.contract_compliance_service import ContractComplianceService, quarter_bounds
+from .services.supplier_scorecard_service import SupplierScorecardService
 from .utils.validators import validate_purchase_requisition
 from .utils.helpers import format_currency
+from .utils.search import NameSearch
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -44,7 +56,39 @@ security = HTTPBearer()
 # Service instances
 procurement_service = ProcurementService()
 supplier_service = SupplierService()
+supplier_search = NameSearch(Supplier)
 rfq_service = RFQService()
+rfq_dispatch_service = RFQDispatchService(rfq_service)
+contract_compliance_service = ContractComplianceService()
+spend_cube_service = SpendCubeService()
+supplier_scorecard_service = SupplierScorecardService()
+
+@app.on_event("startup")
+async def ensure_performance_indexes():
+    """Create performance indexes that migrations do not manage"""
+    try:
+        create_performance_indexes(engine)
+    except Exception as e:
+        logger.error(f"Error creating performance indexes: {str(e)}")
+
+@app.on_event("startup")
+async def resume_rfq_dispatches():
+    """Resume RFQ dispatches interrupted by a restart"""
+    app.state.rfq_dispatch_tasks = {}
+    try:
+        dispatch_ids = await asyncio.get_running_loop().run_in_executor(
+            None, rfq_dispatch_service.get_interrupted_dispatch_ids
+        )
+        for dispatch_id in dispatch_ids:
+            logger.info(f"Resuming RFQ dispatch {dispatch_id}")
+            start_rfq_dispatch_task(dispatch_id)
+    except Exception as e:
+        logger.error(f"Error resuming RFQ dispatches: {str(e)}")
+
+@app.on_event("startup")
+async def schedule_spend_cube_refresh():
+    """Keep the spend cube current with approved and amended purchase orders"""
+    app.state.spend_cube_task = asyncio.get_running_loop().create_task(spend_cube_service.run_refresh_loop())
 
 @app.get("/")
 async def root():
@@ -75,7 +119,9 @@ async def create_supplier(
 ):
     """Create a new supplier"""
     try:
-        return supplier_service.create_supplier(db, supplier)
+        db_supplier = supplier_service.create_supplier(db, supplier)
+        supplier_search.invalidate()
+        return db_supplier
     except Exception as e:
         logger.error(f"Error creating supplier: {str(e)}")
         raise HTTPException(status_code=400, detail=str(e))
@@ -92,6 +138,15 @@ async def get_suppliers(
 ):
     """Get suppliers with optional filtering"""
     try:
+        if search:
+            # Ranked trigram search instead of a wildcard scan
+            filters = []
+            if active is not None:
+                filters.append(Supplier.is_active == active)
+            if category:
+                filters.append(Supplier.category == category)
+            return supplier_search.search(db, search, skip=skip, limit=limit, filters=filters)
+        
         return supplier_service.get_suppliers(
             db, skip=skip, limit=limit, active=active, 
             category=category, search=search
@@ -100,6 +155,22 @@ async def get_suppliers(
         logger.error(f"Error retrieving suppliers: {str(e)}")
         raise HTTPException(status_code=400, detail=str(e))
 
+@app.get("/suppliers/typeahead")
+async def supplier_typeahead(
+    prefix: str,
+    limit: int = 10,
+    active: Optional[bool] = True,
+    db: Session = Depends(get_db),
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    """Suggest suppliers whose name starts with the prefix"""
+    try:
+        filters = [Supplier.is_active == active] if active is not None else []
+        return supplier_search.typeahead(db, prefix, limit=min(limit, 50), filters=filters)
+    except Exception as e:
+        logger.error(f"Error retrieving supplier suggestions: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+
 @app.get("/suppliers/{supplier_id}", response_model=Supplier)
 async def get_supplier(
     supplier_id: int,
@@ -130,6 +201,7 @@ async def update_supplier(
         updated_supplier = supplier_service.update_supplier(db, supplier_id, supplier)
         if not updated_supplier:
             raise HTTPException(status_code=404, detail="Supplier not found")
+        supplier_search.invalidate()
         return updated_supplier
     except HTTPException:
         raise
@@ -152,6 +224,37 @@ async def evaluate_supplier(
         logger.error(f"Error evaluating supplier {supplier_id}: {str(e)}")
         raise HTTPException(status_code=400, detail=str(e))
 
+@app.get("/suppliers/{supplier_id}/scorecard", response_model=SupplierScorecardResponse)
+async def get_supplier_scorecard(
+    supplier_id: int,
+    db: Session = Depends(get_db),
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    """Get a supplier's rolling 30, 90 and 365-day performance scorecards"""
+    try:
+        if not supplier_service.get_supplier(db, supplier_id):
+            raise HTTPException(status_code=404, detail="Supplier not found")
+        return supplier_scorecard_service.get_scorecard(db, supplier_id)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error retrieving scorecard for supplier {supplier_id}: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/supplier-performance/activity")
+async def record_supplier_activity(
+    batch: SupplierActivityBatch,
+    db: Session = Depends(get_db),
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    """Record goods receipts and supplier invoices in the rolling supplier scorecards"""
+    try:
+        result = supplier_scorecard_service.record_activity(db, batch)
+        return {"message": "Supplier activity recorded successfully", **result}
+    except Exception as e:
+        logger.error(f"Error recording supplier activity: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+
 # Purchase Requisition endpoints
 @app.post("/purchase-requisitions", response_model=PurchaseRequisition, status_code=status.HTTP_201_CREATED)
 async def create_purchase_requisition(
@@ -296,21 +399,73 @@ async def get_rfq(
         logger.error(f"Error retrieving RFQ {rfq_id}: {str(e)}")
         raise HTTPException(status_code=400, detail=str(e))
 
-@app.post("/rfqs/{rfq_id}/send")
+def start_rfq_dispatch_task(dispatch_id: int) -> None:
+    """Run an RFQ fan-out in the background, keeping a reference until it finishes"""
+    tasks = app.state.rfq_dispatch_tasks
+    if dispatch_id in tasks and not tasks[dispatch_id].done():
+        return
+    tasks[dispatch_id] = asyncio.get_running_loop().create_task(rfq_dispatch_service.process_dispatch(dispatch_id))
+
+@app.post("/rfqs/{rfq_id}/send", status_code=status.HTTP_202_ACCEPTED)
 async def send_rfq(
     rfq_id: int,
     supplier_ids: List[int],
+    channel: str = "Email",
     db: Session = Depends(get_db),
     credentials: HTTPAuthorizationCredentials = Depends(security)
 ):
-    """Send RFQ to suppliers"""
+    """Send RFQ to suppliers; invitations are delivered in the background under the returned dispatch ID"""
     try:
-        result = rfq_service.send_rfq_to_suppliers(db, rfq_id, supplier_ids)
-        return {"message": "RFQ sent to suppliers", "rfq_id": rfq_id, "suppliers_count": len(supplier_ids)}
+        db_dispatch = rfq_dispatch_service.start_dispatch(db, rfq_id, supplier_ids, channel)
+        if not db_dispatch:
+            raise HTTPException(status_code=404, detail="RFQ not found")
+        start_rfq_dispatch_task(db_dispatch.id)
+        return {
+            "message": "RFQ dispatch started",
+            "rfq_id": rfq_id,
+            "dispatch_id": db_dispatch.id,
+            "suppliers_count": db_dispatch.supplier_count
+        }
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error sending RFQ {rfq_id}: {str(e)}")
         raise HTTPException(status_code=400, detail=str(e))
 
+@app.get("/rfq-dispatches/{dispatch_id}", response_model=RFQDispatchSummary)
+async def get_rfq_dispatch(
+    dispatch_id: int,
+    db: Session = Depends(get_db),
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    """Get RFQ dispatch progress by tracking ID"""
+    try:
+        db_dispatch = rfq_dispatch_service.get_dispatch(db, dispatch_id)
+        if not db_dispatch:
+            raise HTTPException(status_code=404, detail="RFQ dispatch not found")
+        return db_dispatch
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error retrieving RFQ dispatch {dispatch_id}: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/rfq-dispatches/{dispatch_id}/deliveries", response_model=List[RFQDeliveryResponse])
+async def get_rfq_dispatch_deliveries(
+    dispatch_id: int,
+    status: Optional[str] = None,
+    skip: int = 0,
+    limit: int = 100,
+    db: Session = Depends(get_db),
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    """Get per-supplier delivery status of an RFQ dispatch"""
+    try:
+        return rfq_dispatch_service.get_deliveries(db, dispatch_id, status=status, skip=skip, limit=limit)
+    except Exception as e:
+        logger.error(f"Error retrieving deliveries of RFQ dispatch {dispatch_id}: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+
 @app.post("/rfqs/{rfq_id}/close")
 async def close_rfq(
     rfq_id: int,
@@ -334,7 +489,9 @@ async def create_contract(
 ):
     """Create a new contract"""
     try:
-        return procurement_service.create_contract(db, contract)
+        db_contract = procurement_service.create_contract(db, contract)
+        contract_compliance_service.invalidate()
+        return db_contract
     except Exception as e:
         logger.error(f"Error creating contract: {str(e)}")
         raise HTTPException(status_code=400, detail=str(e))
@@ -378,6 +535,19 @@ async def get_contract(
         logger.error(f"Error retrieving contract {contract_id}: {str(e)}")
         raise HTTPException(status_code=400, detail=str(e))
 
+@app.post("/contracts/compliance-check", response_model=List[ContractComplianceResult])
+async def check_contract_compliance(
+    lines: List[ContractComplianceLine],
+    db: Session = Depends(get_db),
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    """Check order lines against the contract price in force for each supplier, item and date"""
+    try:
+        return contract_compliance_service.check_lines(db, lines)
+    except Exception as e:
+        logger.error(f"Error checking contract compliance: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+
 # Reporting endpoints
 @app.get("/reports/supplier-performance")
 async def get_supplier_performance_report(
@@ -394,6 +564,37 @@ async def get_supplier_performance_report(
         logger.error(f"Error generating supplier performance report: {str(e)}")
         raise HTTPException(status_code=400, detail=str(e))
 
+@app.get("/reports/supplier-performance/rankings", response_model=SupplierRankingResponse)
+async def get_supplier_rankings(
+    window_days: int = 90,
+    min_deliveries: int = 1,
+    skip: int = 0,
+    limit: int = 100,
+    db: Session = Depends(get_db),
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    """Rank suppliers by rolling scorecard score over the last 30, 90 or 365 days"""
+    try:
+        return supplier_scorecard_service.get_rankings(
+            db, window_days=window_days, min_deliveries=min_deliveries, skip=skip, limit=limit
+        )
+    except Exception as e:
+        logger.error(f"Error ranking suppliers: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/reports/supplier-performance/scorecards")
+async def rebuild_supplier_scorecards(
+    db: Session = Depends(get_db),
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    """Recompute every rolling supplier scorecard from the daily performance buckets"""
+    try:
+        scorecards = supplier_scorecard_service.rebuild(db)
+        return {"message": "Supplier scorecards rebuilt successfully", "scorecards": scorecards}
+    except Exception as e:
+        logger.error(f"Error rebuilding supplier scorecards: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+
 @app.get("/reports/procurement-analytics")
 async def get_procurement_analytics(
     start_date: date,
@@ -409,6 +610,57 @@ async def get_procurement_analytics(
         logger.error(f"Error generating procurement analytics: {str(e)}")
         raise HTTPException(status_code=400, detail=str(e))
 
+@app.get("/reports/spend-cube", response_model=SpendCubeSlice)
+async def get_spend_cube(
+    dimensions: str = "category",
+    time_grain: str = "month",
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    category: Optional[str] = None,
+    supplier_id: Optional[int] = None,
+    entity_id: Optional[int] = None,
+    format: str = "json",
+    db: Session = Depends(get_db),
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    """Slice, drill down or roll up committed spend by any of category, supplier, entity and period"""
+    try:
+        if format not in ("json", "parquet"):
+            raise ValueError("format must be json or parquet")
+        cube_slice = spend_cube_service.get_slice(
+            db,
+            [dimension.strip() for dimension in dimensions.split(",") if dimension.strip()],
+            time_grain=time_grain,
+            start_date=start_date,
+            end_date=end_date,
+            category=category,
+            supplier_id=supplier_id,
+            entity_id=entity_id
+        )
+        if format == "parquet":
+            return Response(
+                content=spend_cube_service.to_parquet(cube_slice),
+                media_type="application/vnd.apache.parquet",
+                headers={"Content-Disposition": 'attachment; filename="spend-cube.parquet"'}
+            )
+        return cube_slice
+    except Exception as e:
+        logger.error(f"Error reading spend cube: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/reports/spend-cube/refresh", response_model=SpendCubeRefreshSummary)
+async def refresh_spend_cube(
+    full: bool = False,
+    db: Session = Depends(get_db),
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    """Apply purchase orders changed since the last refresh now; full=true rebuilds the cube from every PO"""
+    try:
+        return await asyncio.get_running_loop().run_in_executor(None, lambda: spend_cube_service.refresh(db, full=full))
+    except Exception as e:
+        logger.error(f"Error refreshing spend cube: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+
 @app.get("/reports/contract-compliance")
 async def get_contract_compliance_report(
     as_of_date: date,
@@ -423,6 +675,29 @@ async def get_contract_compliance_report(
         logger.error(f"Error generating contract compliance report: {str(e)}")
         raise HTTPException(status_code=400, detail=str(e))
 
+@app.get("/reports/contract-compliance/po-lines", response_model=ContractComplianceBatchReport)
+async def get_po_line_compliance_report(
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    quarter: Optional[str] = None,
+    supplier_id: Optional[int] = None,
+    exception_limit: int = 1000,
+    db: Session = Depends(get_db),
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    """Check every PO line in a date range or quarter (YYYY-Qn) against the contracts in force on its date"""
+    try:
+        if quarter:
+            start_date, end_date = quarter_bounds(quarter)
+        if not start_date or not end_date:
+            raise ValueError("Either quarter or both start_date and end_date are required")
+        return await asyncio.get_running_loop().run_in_executor(
+            None, lambda: contract_compliance_service.run_batch(db, start_date, end_date, supplier_id, exception_limit)
+        )
+    except Exception as e:
+        logger.error(f"Error generating PO line compliance report: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000) 
\ No newline at end of file
@@ -0,0 +1,53 @@
+from pydantic import BaseModel, Field
+from typing import List, Optional
+from datetime import date
+from decimal import Decimal
+
+# Pydantic Models
+class ContractComplianceLine(BaseModel):
+    supplier_id: int
+    item_code: str = Field(..., min_length=1, max_length=50)
+    order_date: date
+    quantity: Decimal = Field(..., gt=0)
+    unit_price: Decimal = Field(..., ge=0)
+
+class ContractComplianceResult(BaseModel):
+    supplier_id: int
+    item_code: str
+    order_date: date
+    status: str  # Compliant, OverContractPrice, NoContract
+    contract_id: Optional[int] = None
+    contract_number: Optional[str] = None
+    contract_price: Optional[Decimal] = None
+    unit_price: Decimal
+    price_variance_amount: Decimal
+
+class ContractComplianceException(ContractComplianceResult):
+    purchase_order_id: int
+    po_number: Optional[str] = None
+    line_id: int
+
+class ContractComplianceSupplierRow(BaseModel):
+    supplier_id: int
+    lines_checked: int
+    compliant_lines: int
+    over_price_lines: int
+    no_contract_lines: int
+    price_variance_amount: Decimal
+    off_contract_spend: Decimal
+
+class ContractComplianceBatchReport(BaseModel):
+    start_date: date
+    end_date: date
+    supplier_id: Optional[int] = None
+    contract_prices_indexed: int
+    lines_checked: int
+    compliant_lines: int
+    over_price_lines: int
+    no_contract_lines: int
+    compliance_rate: float
+    contracted_spend: Decimal
+    off_contract_spend: Decimal
+    price_variance_amount: Decimal
+    suppliers: List[ContractComplianceSupplierRow]
+    exceptions: List[ContractComplianceException]
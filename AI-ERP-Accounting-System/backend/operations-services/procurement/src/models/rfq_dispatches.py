@@ -0,0 +1,73 @@
+from sqlalchemy import Column, Integer, String, DateTime, Text, Index, UniqueConstraint
+from sqlalchemy.ext.declarative import declarative_base
+from pydantic import BaseModel
+from typing import Optional
+from datetime import datetime
+
+Base = declarative_base()
+
+# SQLAlchemy Models
+class RFQDispatch(Base):
+    """One fan-out of an RFQ to a set of suppliers; its id is the tracking ID returned to the caller"""
+    __tablename__ = "rfq_dispatches"
+
+    id = Column(Integer, primary_key=True, index=True)
+    rfq_id = Column(Integer, nullable=False, index=True)
+    channel = Column(String(20), nullable=False)  # Email, Webhook
+    status = Column(String(20), nullable=False, default="Running")  # Running, Completed, Failed
+    subject = Column(String(255), nullable=False)
+    body = Column(Text, nullable=False)
+    supplier_count = Column(Integer, default=0)
+    delivered_count = Column(Integer, default=0)
+    failed_count = Column(Integer, default=0)
+    error = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    completed_at = Column(DateTime)
+
+class RFQDelivery(Base):
+    """Delivery of one dispatch to one supplier; written before sending so a resumed dispatch never resends"""
+    __tablename__ = "rfq_deliveries"
+
+    id = Column(Integer, primary_key=True, index=True)
+    dispatch_id = Column(Integer, nullable=False)
+    supplier_id = Column(Integer, nullable=False)
+    destination = Column(String(500))
+    # Pending, Sending, Delivered, Failed, NoDestination; Unconfirmed = interrupted mid-send, never resent automatically
+    status = Column(String(20), nullable=False, default="Pending")
+    attempts = Column(Integer, nullable=False, default=0)
+    error = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    delivered_at = Column(DateTime)
+
+    __table_args__ = (
+        UniqueConstraint("dispatch_id", "supplier_id", name="uq_rfq_delivery"),
+        Index("ix_rfq_deliveries_status", "dispatch_id", "status"),
+    )
+
+# Pydantic Models
+class RFQDispatchSummary(BaseModel):
+    id: int
+    rfq_id: int
+    channel: str
+    status: str
+    supplier_count: int
+    delivered_count: int
+    failed_count: int
+    error: Optional[str] = None
+    created_at: datetime
+    completed_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+class RFQDeliveryResponse(BaseModel):
+    id: int
+    supplier_id: int
+    destination: Optional[str] = None
+    status: str
+    attempts: int
+    error: Optional[str] = None
+    delivered_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
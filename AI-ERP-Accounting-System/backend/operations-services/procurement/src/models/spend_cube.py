@@ -0,0 +1,77 @@
+from sqlalchemy import Column, Integer, String, DateTime, Date, Numeric, Index, UniqueConstraint
+from sqlalchemy.ext.declarative import declarative_base
+from pydantic import BaseModel
+from typing import List, Optional
+from datetime import datetime, date
+from decimal import Decimal
+
+Base = declarative_base()
+
+# SQLAlchemy Models
+class SpendCubeCell(Base):
+    """Committed PO spend for one category, supplier, month and entity"""
+    __tablename__ = "procurement_spend_cube"
+
+    id = Column(Integer, primary_key=True, index=True)
+    month = Column(Date, nullable=False)  # First day of the order month
+    category = Column(String(100), nullable=False)
+    supplier_id = Column(Integer, nullable=False)
+    entity_id = Column(Integer, nullable=False)  # 0 when the PO has no entity
+    amount = Column(Numeric(18, 2), nullable=False, default=0)
+    po_count = Column(Integer, nullable=False, default=0)
+    line_count = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        UniqueConstraint("month", "category", "supplier_id", "entity_id", name="uq_procurement_spend_cube_cell"),
+        # Dashboards slice by category or supplier over a run of months
+        Index("ix_procurement_spend_cube_category", "category", "month"),
+        Index("ix_procurement_spend_cube_supplier", "supplier_id", "month"),
+    )
+
+class SpendCubeContribution(Base):
+    """What each PO currently adds to the cube, so a changed PO can be moved or removed exactly"""
+    __tablename__ = "procurement_spend_cube_pos"
+
+    purchase_order_id = Column(Integer, primary_key=True)
+    month = Column(Date, nullable=False)
+    category = Column(String(100), nullable=False)
+    supplier_id = Column(Integer, nullable=False)
+    entity_id = Column(Integer, nullable=False)
+    amount = Column(Numeric(18, 2), nullable=False, default=0)
+    line_count = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class SpendCubeState(Base):
+    """Single row holding the refresh watermark: POs updated after it are not in the cube yet"""
+    __tablename__ = "procurement_spend_cube_state"
+
+    id = Column(Integer, primary_key=True)
+    refreshed_through = Column(DateTime)  # Null until the first refresh, which scans every PO
+    last_refresh_at = Column(DateTime)
+    last_changed_count = Column(Integer, default=0)
+
+# Pydantic Models
+class SpendCubeRow(BaseModel):
+    category: Optional[str] = None
+    supplier_id: Optional[int] = None
+    entity_id: Optional[int] = None
+    period_start: Optional[date] = None
+    amount: Decimal
+    po_count: int
+    line_count: int
+
+class SpendCubeSlice(BaseModel):
+    dimensions: List[str]
+    time_grain: str
+    start_date: Optional[date] = None
+    end_date: Optional[date] = None
+    refreshed_through: Optional[datetime] = None
+    total_amount: Decimal
+    total_po_count: int
+    rows: List[SpendCubeRow]
+
+class SpendCubeRefreshSummary(BaseModel):
+    scanned_purchase_orders: int
+    changed_purchase_orders: int
+    refreshed_through: datetime
@@ -0,0 +1,135 @@
+from sqlalchemy import Column, Integer, String, DateTime, Date, Numeric, Index, UniqueConstraint
+from sqlalchemy.ext.declarative import declarative_base
+from pydantic import BaseModel, Field
+from typing import List, Optional
+from datetime import datetime, date
+from decimal import Decimal
+
+Base = declarative_base()
+
+# SQLAlchemy Models
+class SupplierPerformanceDaily(Base):
+    """Per-supplier, per-day sums of receipt and invoice activity; the source of every scorecard window"""
+    __tablename__ = "supplier_performance_daily"
+
+    id = Column(Integer, primary_key=True, index=True)
+    supplier_id = Column(Integer, nullable=False)
+    activity_date = Column(Date, nullable=False)
+    delivery_count = Column(Integer, nullable=False, default=0)
+    on_time_count = Column(Integer, nullable=False, default=0)
+    lead_time_days_sum = Column(Integer, nullable=False, default=0)
+    quantity_received = Column(Numeric(18, 4), nullable=False, default=0)
+    quantity_rejected = Column(Numeric(18, 4), nullable=False, default=0)
+    invoice_count = Column(Integer, nullable=False, default=0)
+    ordered_amount = Column(Numeric(18, 2), nullable=False, default=0)  # PO value of the invoiced quantities
+    invoiced_amount = Column(Numeric(18, 2), nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        UniqueConstraint("supplier_id", "activity_date", name="uq_supplier_performance_daily"),
+        # Window advances read the days entering and leaving every window
+        Index("ix_supplier_performance_daily_date", "activity_date"),
+    )
+
+class SupplierScorecard(Base):
+    """Rolling-window totals and score for one supplier, kept current as activity is recorded"""
+    __tablename__ = "supplier_scorecards"
+
+    id = Column(Integer, primary_key=True, index=True)
+    supplier_id = Column(Integer, nullable=False)
+    window_days = Column(Integer, nullable=False)  # 30, 90 or 365
+    delivery_count = Column(Integer, nullable=False, default=0)
+    on_time_count = Column(Integer, nullable=False, default=0)
+    lead_time_days_sum = Column(Integer, nullable=False, default=0)
+    quantity_received = Column(Numeric(18, 4), nullable=False, default=0)
+    quantity_rejected = Column(Numeric(18, 4), nullable=False, default=0)
+    invoice_count = Column(Integer, nullable=False, default=0)
+    ordered_amount = Column(Numeric(18, 2), nullable=False, default=0)
+    invoiced_amount = Column(Numeric(18, 2), nullable=False, default=0)
+    score = Column(Numeric(7, 2))  # Null until the supplier has activity in the window
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        UniqueConstraint("supplier_id", "window_days", name="uq_supplier_scorecard"),
+        # Rankings read the top of one window by score
+        Index("ix_supplier_scorecards_ranking", "window_days", "score"),
+    )
+
+class SupplierScorecardWindow(Base):
+    """Last day included in each rolling window; windows slide forward one day bucket at a time"""
+    __tablename__ = "supplier_scorecard_windows"
+
+    window_days = Column(Integer, primary_key=True)
+    as_of_date = Column(Date, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class SupplierPerformanceEvent(Base):
+    """Receipts and invoices already counted, so redelivered events are not counted twice"""
+    __tablename__ = "supplier_performance_events"
+
+    id = Column(Integer, primary_key=True, index=True)
+    source_type = Column(String(20), nullable=False)  # Receipt, Invoice
+    source_id = Column(Integer, nullable=False)
+    supplier_id = Column(Integer, nullable=False)
+    activity_date = Column(Date, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        UniqueConstraint("source_type", "source_id", name="uq_supplier_performance_event"),
+    )
+
+# Pydantic Models
+class SupplierReceiptActivity(BaseModel):
+    receipt_id: int
+    supplier_id: int
+    order_date: date
+    promised_date: date
+    receipt_date: date
+    quantity_received: Decimal = Field(..., gt=0)
+    quantity_rejected: Decimal = Field(default=0, ge=0)
+
+class SupplierInvoiceActivity(BaseModel):
+    invoice_id: int
+    supplier_id: int
+    invoice_date: date
+    ordered_amount: Decimal = Field(..., ge=0)  # PO price times invoiced quantity
+    invoiced_amount: Decimal = Field(..., ge=0)
+
+class SupplierActivityBatch(BaseModel):
+    receipts: List[SupplierReceiptActivity] = []
+    invoices: List[SupplierInvoiceActivity] = []
+
+class SupplierScorecardWindowResponse(BaseModel):
+    window_days: int
+    as_of_date: date
+    delivery_count: int
+    on_time_rate: Optional[float] = None
+    average_lead_time_days: Optional[float] = None
+    quantity_received: Decimal
+    quantity_rejected: Decimal
+    reject_rate: Optional[float] = None
+    invoice_count: int
+    ordered_amount: Decimal
+    invoiced_amount: Decimal
+    price_variance_amount: Decimal
+    price_variance_rate: Optional[float] = None
+    score: Optional[Decimal] = None
+
+class SupplierScorecardResponse(BaseModel):
+    supplier_id: int
+    windows: List[SupplierScorecardWindowResponse]
+
+class SupplierRankingRow(BaseModel):
+    rank: int
+    supplier_id: int
+    score: Decimal
+    delivery_count: int
+    on_time_rate: Optional[float] = None
+    reject_rate: Optional[float] = None
+    price_variance_rate: Optional[float] = None
+    average_lead_time_days: Optional[float] = None
+
+class SupplierRankingResponse(BaseModel):
+    window_days: int
+    as_of_date: date
+    rankings: List[SupplierRankingRow]
@@ -0,0 +1,238 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import func
+from typing import List, Optional, Dict, Any, NamedTuple, Tuple
+from datetime import date
+from decimal import Decimal
+import logging
+import threading
+import time
+
+from ..models.contracts import Contract, ContractLine
+from ..models.purchase_orders import PurchaseOrder, PurchaseOrderLine
+from ..models.contract_compliance import ContractComplianceLine
+from ..utils.interval_index import IntervalIndex, PricedInterval, OPEN_ENDED
+
+logger = logging.getLogger(__name__)
+
+INDEX_TTL_SECONDS = 300
+BATCH_FETCH_SIZE = 10000
+# Contracts that never bound the supplier; the rest applied over their start and end dates
+EXCLUDED_CONTRACT_STATUSES = ("draft", "cancelled")
+EXCLUDED_PO_STATUSES = ("draft", "cancelled", "rejected")
+PRICE_TOLERANCE = Decimal("0.0001")
+
+
+class ContractTerms(NamedTuple):
+    contract_id: int
+    contract_number: Optional[str]
+    unit_price: Decimal
+
+
+def quarter_bounds(quarter: str) -> Tuple[date, date]:
+    """First and last day of a quarter written as YYYY-Qn"""
+    try:
+        year, number = quarter.upper().split("-Q")
+        year, number = int(year), int(number)
+        if not 1 <= number <= 4:
+            raise ValueError
+    except ValueError:
+        raise ValueError("quarter must look like 2024-Q3")
+    start = date(year, 3 * number - 2, 1)
+    end = date(year + 1, 1, 1) if number == 4 else date(year, 3 * number + 1, 1)
+    return start, date.fromordinal(end.toordinal() - 1)
+
+
+def check_price(terms: Optional[ContractTerms], quantity: Decimal, unit_price: Decimal) -> Tuple[str, Decimal]:
+    """Compliance status of one line and the amount paid over the contract price"""
+    if terms is None:
+        return "NoContract", Decimal("0")
+    if unit_price > terms.unit_price + PRICE_TOLERANCE:
+        return "OverContractPrice", (unit_price - terms.unit_price) * quantity
+    return "Compliant", Decimal("0")
+
+
+class ContractComplianceService:
+    """Checks PO prices against the contract in force for the supplier and item on the order date.
+
+    Contract validity periods and negotiated prices are held in an in-process IntervalIndex,
+    rebuilt every few minutes or when contracts change, so each line costs one bisect.
+    """
+
+    def __init__(self):
+        self._index: Optional[IntervalIndex] = None
+        self._lock = threading.Lock()
+
+    def invalidate(self) -> None:
+        """Drop the contract index after contracts change"""
+        self._index = None
+
+    def check_lines(self, db: Session, lines: List[ContractComplianceLine]) -> List[Dict[str, Any]]:
+        """Check ad-hoc lines, e.g. a PO being drafted, against the contract index"""
+        try:
+            index = self._contract_index(db)
+            results = []
+            for line in lines:
+                terms = index.lookup((line.supplier_id, line.item_code), line.order_date)
+                status, variance = check_price(terms, line.quantity, line.unit_price)
+                results.append(self._result(line, terms, status, variance))
+            return results
+
+        except Exception as e:
+            logger.error(f"Error checking contract compliance: {str(e)}")
+            raise
+
+    def run_batch(
+        self,
+        db: Session,
+        start_date: date,
+        end_date: date,
+        supplier_id: Optional[int] = None,
+        exception_limit: int = 1000
+    ) -> Dict[str, Any]:
+        """Check every PO line ordered in the range in one pass over lines sorted by supplier, item and date"""
+        try:
+            if end_date < start_date:
+                raise ValueError("end_date must not be before start_date")
+            index = self._contract_index(db)
+
+            query = db.query(
+                PurchaseOrder.id.label("purchase_order_id"),
+                PurchaseOrder.po_number,
+                PurchaseOrder.supplier_id,
+                PurchaseOrder.order_date,
+                PurchaseOrderLine.id.label("line_id"),
+                PurchaseOrderLine.item_code,
+                PurchaseOrderLine.quantity,
+                PurchaseOrderLine.unit_price
+            ).join(
+                PurchaseOrderLine, PurchaseOrderLine.purchase_order_id == PurchaseOrder.id
+            ).filter(
+                PurchaseOrder.order_date.between(start_date, end_date),
+                func.lower(func.coalesce(PurchaseOrder.status, "")).notin_(EXCLUDED_PO_STATUSES)
+            )
+            if supplier_id:
+                query = query.filter(PurchaseOrder.supplier_id == supplier_id)
+            query = query.order_by(
+                PurchaseOrder.supplier_id, PurchaseOrderLine.item_code, PurchaseOrder.order_date, PurchaseOrderLine.id
+            ).yield_per(BATCH_FETCH_SIZE)
+
+            totals = {"Compliant": 0, "OverContractPrice": 0, "NoContract": 0}
+            contracted_spend = off_contract_spend = variance_total = Decimal("0")
+            suppliers: Dict[int, Dict[str, Any]] = {}
+            exceptions: List[Dict[str, Any]] = []
+            current_key, position = None, 0
+            for line in query:
+                key = (line.supplier_id, line.item_code)
+                if key != current_key:
+                    current_key, position = key, 0
+                # Dates ascend within a key, so each search starts where the previous one ended
+                terms, position = index.lookup_from(key, line.order_date.toordinal(), position)
+
+                quantity = Decimal(line.quantity or 0)
+                unit_price = Decimal(line.unit_price or 0)
+                status, variance = check_price(terms, quantity, unit_price)
+
+                totals[status] += 1
+                supplier = suppliers.setdefault(line.supplier_id, {
+                    "supplier_id": line.supplier_id, "lines_checked": 0, "compliant_lines": 0, "over_price_lines": 0,
+                    "no_contract_lines": 0, "price_variance_amount": Decimal("0"), "off_contract_spend": Decimal("0")
+                })
+                supplier["lines_checked"] += 1
+                if status == "NoContract":
+                    spend = quantity * unit_price
+                    off_contract_spend += spend
+                    supplier["no_contract_lines"] += 1
+                    supplier["off_contract_spend"] += spend
+                else:
+                    contracted_spend += quantity * unit_price
+                    if status == "Compliant":
+                        supplier["compliant_lines"] += 1
+                    else:
+                        variance_total += variance
+                        supplier["over_price_lines"] += 1
+                        supplier["price_variance_amount"] += variance
+
+                if status != "Compliant" and len(exceptions) < exception_limit:
+                    exceptions.append({
+                        **self._result(line, terms, status, variance),
+                        "purchase_order_id": line.purchase_order_id,
+                        "po_number": line.po_number,
+                        "line_id": line.line_id
+                    })
+
+            checked = sum(totals.values())
+            return {
+                "start_date": start_date,
+                "end_date": end_date,
+                "supplier_id": supplier_id,
+                "contract_prices_indexed": index.interval_count,
+                "lines_checked": checked,
+                "compliant_lines": totals["Compliant"],
+                "over_price_lines": totals["OverContractPrice"],
+                "no_contract_lines": totals["NoContract"],
+                "compliance_rate": totals["Compliant"] / checked if checked else 0,
+                "contracted_spend": contracted_spend,
+                "off_contract_spend": off_contract_spend,
+                "price_variance_amount": variance_total,
+                "suppliers": sorted(
+                    suppliers.values(),
+                    key=lambda row: (-row["price_variance_amount"], -row["off_contract_spend"], row["supplier_id"])
+                ),
+                "exceptions": exceptions
+            }
+
+        except Exception as e:
+            logger.error(f"Error running contract compliance batch: {str(e)}")
+            raise
+
+    def _contract_index(self, db: Session) -> IntervalIndex:
+        index = self._index
+        if index is not None and time.monotonic() - index.built_at < INDEX_TTL_SECONDS:
+            return index
+
+        with self._lock:
+            index = self._index
+            if index is None or time.monotonic() - index.built_at >= INDEX_TTL_SECONDS:
+                index = self._index = self._build_index(db)
+            return index
+
+    def _build_index(self, db: Session) -> IntervalIndex:
+        rows = db.query(
+            Contract.id, Contract.contract_number, Contract.supplier_id, Contract.start_date, Contract.end_date,
+            ContractLine.item_code, ContractLine.unit_price
+        ).join(
+            ContractLine, ContractLine.contract_id == Contract.id
+        ).filter(
+            func.lower(func.coalesce(Contract.status, "")).notin_(EXCLUDED_CONTRACT_STATUSES),
+            ContractLine.item_code.isnot(None),
+            ContractLine.unit_price.isnot(None)
+        ).all()
+
+        index = IntervalIndex(
+            (
+                (row.supplier_id, row.item_code),
+                PricedInterval(
+                    start=row.start_date.toordinal(),
+                    end=row.end_date.toordinal() if row.end_date else OPEN_ENDED,
+                    # Where contracts overlap, the most recently started one (a renewal) sets the price
+                    priority=(row.start_date.toordinal(), row.id),
+                    value=ContractTerms(row.id, row.contract_number, Decimal(row.unit_price))
+                )
+            )
+            for row in rows
+        )
+        logger.info(f"Built contract price index: {index.interval_count} prices over {len(index.starts)} supplier items")
+        return index
+
+    def _result(self, line: Any, terms: Optional[ContractTerms], status: str, variance: Decimal) -> Dict[str, Any]:
+        return {
+            "supplier_id": line.supplier_id,
+            "item_code": line.item_code,
+            "order_date": line.order_date,
+            "status": status,
+            "contract_id": terms.contract_id if terms else None,
+            "contract_number": terms.contract_number if terms else None,
+            "contract_price": terms.unit_price if terms else None,
+            "unit_price": Decimal(line.unit_price or 0),
+            "price_variance_amount": variance
+        }
@@ -0,0 +1,257 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import func, insert, update
+from typing import Any, List, Optional
+from datetime import datetime
+import asyncio
+import logging
+
+from ..models.rfqs import RFQ
+from ..models.suppliers import Supplier
+from ..models.rfq_dispatches import RFQDispatch, RFQDelivery
+from ..database.connection import SessionLocal
+from .rfq_dispatcher import RFQDispatcher, Invitation, DeliveryResult, RFQ_PORTAL_WEBHOOK_URL
+
+logger = logging.getLogger(__name__)
+
+LOAD_BATCH_SIZE = 1000  # Pending deliveries handed to one dispatcher pass
+CHANNELS = ("Email", "Webhook")
+
+
+def invitation_subject(rfq: RFQ) -> str:
+    return f"Request for quotation {rfq.rfq_number}: {rfq.title}"
+
+
+def invitation_body(rfq: RFQ) -> str:
+    lines = [f"You are invited to submit a quotation for {rfq.rfq_number}: {rfq.title}.", ""]
+    if rfq.description:
+        lines += [rfq.description, ""]
+    if rfq.due_date:
+        lines += [f"Please submit your quotation by {rfq.due_date}.", ""]
+    lines.append("Procurement")
+    return "\n".join(lines)
+
+
+class RFQDispatchService:
+    """Fans an RFQ out to suppliers in the background, tracking every delivery"""
+
+    def __init__(self, rfq_service: Any, dispatcher: Optional[RFQDispatcher] = None):
+        self.rfq_service = rfq_service
+        self.dispatcher = dispatcher or RFQDispatcher()
+
+    def start_dispatch(self, db: Session, rfq_id: int, supplier_ids: List[int], channel: str = "Email") -> Optional[RFQDispatch]:
+        """Record the dispatch and one pending delivery per supplier; None if the RFQ does not exist"""
+        try:
+            if channel not in CHANNELS:
+                raise ValueError(f"channel must be one of: {', '.join(CHANNELS)}")
+            if channel == "Webhook" and not RFQ_PORTAL_WEBHOOK_URL:
+                raise ValueError("Supplier portal webhook is not configured")
+            supplier_ids = list(dict.fromkeys(supplier_ids))
+            if not supplier_ids:
+                raise ValueError("At least one supplier is required")
+
+            rfq = db.query(RFQ).filter(RFQ.id == rfq_id).first()
+            if not rfq:
+                return None
+
+            emails = dict(db.query(Supplier.id, Supplier.email).filter(Supplier.id.in_(supplier_ids)).all())
+
+            # RFQ status and supplier links change as they did when the endpoint sent inline
+            self.rfq_service.send_rfq_to_suppliers(
+                db, rfq_id, [supplier_id for supplier_id in supplier_ids if supplier_id in emails]
+            )
+
+            db_dispatch = RFQDispatch(
+                rfq_id=rfq_id,
+                channel=channel,
+                status="Running",
+                subject=invitation_subject(rfq),
+                body=invitation_body(rfq),
+                supplier_count=len(supplier_ids)
+            )
+            db.add(db_dispatch)
+            db.flush()
+
+            rows = []
+            for supplier_id in supplier_ids:
+                destination = RFQ_PORTAL_WEBHOOK_URL if channel == "Webhook" else emails.get(supplier_id)
+                if supplier_id not in emails:
+                    status, error = "Failed", "Supplier not found"
+                elif not destination:
+                    status, error = "NoDestination", "Supplier has no email address"
+                else:
+                    status, error = "Pending", None
+                rows.append({
+                    "dispatch_id": db_dispatch.id,
+                    "supplier_id": supplier_id,
+                    "destination": destination if status == "Pending" else None,
+                    "status": status,
+                    "error": error
+                })
+            db.execute(insert(RFQDelivery), rows)
+
+            db.commit()
+            db.refresh(db_dispatch)
+            return db_dispatch
+
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error starting dispatch of RFQ {rfq_id}: {str(e)}")
+            raise
+
+    def get_dispatch(self, db: Session, dispatch_id: int) -> Optional[RFQDispatch]:
+        """Get an RFQ dispatch by its tracking ID"""
+        try:
+            return db.query(RFQDispatch).filter(RFQDispatch.id == dispatch_id).first()
+        except Exception as e:
+            logger.error(f"Error retrieving RFQ dispatch {dispatch_id}: {str(e)}")
+            raise
+
+    def get_deliveries(
+        self,
+        db: Session,
+        dispatch_id: int,
+        status: Optional[str] = None,
+        skip: int = 0,
+        limit: int = 100
+    ) -> List[RFQDelivery]:
+        """Per-supplier delivery status of a dispatch"""
+        try:
+            query = db.query(RFQDelivery).filter(RFQDelivery.dispatch_id == dispatch_id)
+            if status:
+                query = query.filter(RFQDelivery.status == status)
+            return query.order_by(RFQDelivery.id).offset(skip).limit(limit).all()
+        except Exception as e:
+            logger.error(f"Error retrieving deliveries of RFQ dispatch {dispatch_id}: {str(e)}")
+            raise
+
+    def get_interrupted_dispatch_ids(self) -> List[int]:
+        """Dispatches left Running by a crash or restart"""
+        db = SessionLocal()
+        try:
+            return [row.id for row in db.query(RFQDispatch.id).filter(RFQDispatch.status == "Running")]
+        finally:
+            db.close()
+
+    async def process_dispatch(self, dispatch_id: int) -> None:
+        """Deliver every pending invitation, writing outcomes back in batches"""
+        try:
+            await asyncio.to_thread(self._release_interrupted_sends, dispatch_id)
+            last_id = 0
+            while True:
+                invitations = await asyncio.to_thread(self._load_pending_deliveries, dispatch_id, last_id)
+                if not invitations:
+                    break
+                last_id = invitations[-1].delivery_id
+                async for results in self.dispatcher.send_all(invitations, self._claim_delivery):
+                    await asyncio.to_thread(self._record_results, dispatch_id, results)
+
+            await asyncio.to_thread(self._finish_dispatch, dispatch_id, "Completed", None)
+
+        except Exception as e:
+            logger.error(f"RFQ dispatch {dispatch_id} failed: {str(e)}")
+            await asyncio.to_thread(self._finish_dispatch, dispatch_id, "Failed", str(e))
+
+    def _release_interrupted_sends(self, dispatch_id: int) -> None:
+        """Deliveries caught mid-send may have arrived; park them instead of resending"""
+        db = SessionLocal()
+        try:
+            released = db.query(RFQDelivery).filter(
+                RFQDelivery.dispatch_id == dispatch_id,
+                RFQDelivery.status == "Sending"
+            ).update({RFQDelivery.status: "Unconfirmed"}, synchronize_session=False)
+            db.commit()
+            if released:
+                logger.warning(f"RFQ dispatch {dispatch_id}: {released} deliveries interrupted mid-send, not resending")
+        finally:
+            db.close()
+
+    def _load_pending_deliveries(self, dispatch_id: int, after_id: int) -> List[Invitation]:
+        """The next pending deliveries; each is only claimed once a send slot is free for it"""
+        db = SessionLocal()
+        try:
+            db_dispatch = db.query(RFQDispatch).filter(RFQDispatch.id == dispatch_id).one()
+            deliveries = db.query(
+                RFQDelivery.id, RFQDelivery.supplier_id, RFQDelivery.destination
+            ).filter(
+                RFQDelivery.dispatch_id == dispatch_id,
+                RFQDelivery.status == "Pending",
+                RFQDelivery.id > after_id
+            ).order_by(RFQDelivery.id).limit(LOAD_BATCH_SIZE).all()
+
+            return [
+                Invitation(
+                    delivery.id, db_dispatch.rfq_id, delivery.supplier_id, db_dispatch.channel,
+                    delivery.destination, db_dispatch.subject, db_dispatch.body
+                )
+                for delivery in deliveries
+            ]
+        finally:
+            db.close()
+
+    async def _claim_delivery(self, invitation: Invitation) -> bool:
+        return await asyncio.to_thread(self._mark_sending, invitation.delivery_id)
+
+    def _mark_sending(self, delivery_id: int) -> bool:
+        """Mark a delivery Sending just before it leaves, so a crash cannot resend it; False if already taken"""
+        db = SessionLocal()
+        try:
+            claimed = db.query(RFQDelivery).filter(
+                RFQDelivery.id == delivery_id,
+                RFQDelivery.status == "Pending"
+            ).update({RFQDelivery.status: "Sending"}, synchronize_session=False)
+            db.commit()
+            return claimed == 1
+
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _record_results(self, dispatch_id: int, results: List[DeliveryResult]) -> None:
+        """Store a batch of delivery outcomes and the dispatch progress in one transaction"""
+        db = SessionLocal()
+        try:
+            delivered_at = datetime.utcnow()
+            db.execute(update(RFQDelivery), [
+                {
+                    "id": result.delivery_id,
+                    "status": "Delivered" if result.delivered else "Failed",
+                    "attempts": result.attempts,
+                    "error": result.error,
+                    "delivered_at": delivered_at if result.delivered else None
+                }
+                for result in results
+            ])
+
+            delivered = sum(1 for result in results if result.delivered)
+            db.query(RFQDispatch).filter(RFQDispatch.id == dispatch_id).update({
+                RFQDispatch.delivered_count: RFQDispatch.delivered_count + delivered
+            }, synchronize_session=False)
+            db.commit()
+
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _finish_dispatch(self, dispatch_id: int, status: str, error: Optional[str]) -> None:
+        db = SessionLocal()
+        try:
+            db_dispatch = db.query(RFQDispatch).filter(RFQDispatch.id == dispatch_id).one()
+            db_dispatch.status = status
+            db_dispatch.error = error
+            db_dispatch.failed_count = db.query(func.count(RFQDelivery.id)).filter(
+                RFQDelivery.dispatch_id == dispatch_id,
+                RFQDelivery.status.in_(["Failed", "NoDestination"])
+            ).scalar()
+            if status == "Completed":
+                db_dispatch.completed_at = datetime.utcnow()
+            db.commit()
+            logger.info(
+                f"RFQ dispatch {dispatch_id} {status.lower()}: {db_dispatch.delivered_count} of "
+                f"{db_dispatch.supplier_count} suppliers reached, {db_dispatch.failed_count} failed"
+            )
+        finally:
+            db.close()
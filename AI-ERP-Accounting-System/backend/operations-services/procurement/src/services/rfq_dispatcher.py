@@ -0,0 +1,212 @@
+from concurrent.futures import ThreadPoolExecutor
+from email.message import EmailMessage
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, NamedTuple, Optional
+import asyncio
+import logging
+import os
+import random
+import smtplib
+import time
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+SMTP_HOST = os.getenv("SMTP_HOST", "localhost")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "25"))
+SMTP_USERNAME = os.getenv("SMTP_USERNAME")
+SMTP_PASSWORD = os.getenv("SMTP_PASSWORD")
+SMTP_USE_TLS = os.getenv("SMTP_USE_TLS", "false").lower() == "true"
+RFQ_FROM_ADDRESS = os.getenv("RFQ_FROM_ADDRESS", "procurement@fins-erp.local")
+RFQ_PORTAL_WEBHOOK_URL = os.getenv("RFQ_PORTAL_WEBHOOK_URL")
+RFQ_TRANSPORT = os.getenv("RFQ_TRANSPORT", "live")  # live, stub
+RFQ_SEND_CONCURRENCY = int(os.getenv("RFQ_SEND_CONCURRENCY", "20"))
+RFQ_MAX_ATTEMPTS = int(os.getenv("RFQ_MAX_ATTEMPTS", "4"))
+RFQ_RETRY_BASE_SECONDS = float(os.getenv("RFQ_RETRY_BASE_SECONDS", "1"))
+RFQ_RETRY_MAX_SECONDS = float(os.getenv("RFQ_RETRY_MAX_SECONDS", "30"))
+RESULT_BATCH_SIZE = 100  # Delivery outcomes handed back per batch write
+RESULT_FLUSH_SECONDS = 2.0  # ...or sooner, so slow retries do not hold finished outcomes back
+
+
+class Invitation(NamedTuple):
+    delivery_id: int
+    rfq_id: int
+    supplier_id: int
+    channel: str  # Email, Webhook
+    destination: str
+    subject: str
+    body: str
+
+
+class DeliveryResult(NamedTuple):
+    delivery_id: int
+    delivered: bool
+    attempts: int
+    error: Optional[str]
+
+
+class PermanentDeliveryError(Exception):
+    """The destination rejected the invitation; retrying cannot help"""
+
+
+def build_message(invitation: Invitation) -> EmailMessage:
+    message = EmailMessage()
+    message["From"] = RFQ_FROM_ADDRESS
+    message["To"] = invitation.destination
+    message["Subject"] = invitation.subject
+    # Stable per delivery so relays and mailboxes can drop a duplicate
+    message["Message-ID"] = f"<rfq-delivery-{invitation.delivery_id}@{RFQ_FROM_ADDRESS.split('@')[-1]}>"
+    message.set_content(invitation.body)
+    return message
+
+
+def webhook_payload(invitation: Invitation) -> Dict[str, Any]:
+    return {
+        "delivery_id": invitation.delivery_id,
+        "rfq_id": invitation.rfq_id,
+        "supplier_id": invitation.supplier_id,
+        "subject": invitation.subject,
+        "body": invitation.body
+    }
+
+
+def retry_delay(attempt: int) -> float:
+    """Exponential backoff with full jitter after the given failed attempt"""
+    return random.uniform(0, min(RFQ_RETRY_MAX_SECONDS, RFQ_RETRY_BASE_SECONDS * 2 ** (attempt - 1)))
+
+
+class EmailTransport:
+    """Blocking smtplib delivery, one connection per message"""
+
+    def send(self, invitation: Invitation) -> None:
+        try:
+            with smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=30) as smtp:
+                if SMTP_USE_TLS:
+                    smtp.starttls()
+                if SMTP_USERNAME:
+                    smtp.login(SMTP_USERNAME, SMTP_PASSWORD or "")
+                smtp.send_message(build_message(invitation))
+        except smtplib.SMTPRecipientsRefused as e:
+            raise PermanentDeliveryError(f"Recipient refused: {invitation.destination}") from e
+
+
+class WebhookTransport:
+    """Posts the invitation to the supplier portal; 4xx other than 429 is not retried"""
+
+    def __init__(self, timeout: float = 30.0):
+        self.client = httpx.Client(timeout=timeout)
+
+    def send(self, invitation: Invitation) -> None:
+        response = self.client.post(
+            invitation.destination,
+            json=webhook_payload(invitation),
+            # Lets the portal drop a redelivered invitation
+            headers={"Idempotency-Key": f"rfq-delivery-{invitation.delivery_id}"}
+        )
+        if 400 <= response.status_code < 500 and response.status_code != 429:
+            raise PermanentDeliveryError(f"Portal rejected invitation: HTTP {response.status_code}")
+        response.raise_for_status()
+
+
+class StubTransport:
+    """Local stand-in for tests: records invitations, optionally failing some attempts first"""
+
+    def __init__(self, failures: Optional[Dict[int, int]] = None, rejected: Optional[List[int]] = None, delay: float = 0.0):
+        self.failures = dict(failures or {})  # supplier_id -> attempts that fail before one succeeds
+        self.rejected = set(rejected or [])  # supplier_ids whose destination rejects permanently
+        self.delay = delay
+        self.sent: List[Invitation] = []
+        self.attempts: Dict[int, int] = {}
+
+    def send(self, invitation: Invitation) -> None:
+        if self.delay:
+            time.sleep(self.delay)
+        self.attempts[invitation.supplier_id] = self.attempts.get(invitation.supplier_id, 0) + 1
+        if invitation.supplier_id in self.rejected:
+            raise PermanentDeliveryError(f"Stub rejected supplier {invitation.supplier_id}")
+        if self.failures.get(invitation.supplier_id, 0) > 0:
+            self.failures[invitation.supplier_id] -= 1
+            raise ConnectionError(f"Stub transient failure for supplier {invitation.supplier_id}")
+        self.sent.append(invitation)
+
+
+def default_transports() -> Dict[str, Any]:
+    if RFQ_TRANSPORT == "stub":
+        stub = StubTransport()
+        return {"Email": stub, "Webhook": stub}
+    return {"Email": EmailTransport(), "Webhook": WebhookTransport()}
+
+
+class RFQDispatcher:
+    """Delivers invitations with at most `concurrency` in flight, retrying each with backoff"""
+
+    def __init__(
+        self,
+        transports: Optional[Dict[str, Any]] = None,
+        concurrency: int = RFQ_SEND_CONCURRENCY,
+        max_attempts: int = RFQ_MAX_ATTEMPTS
+    ):
+        self.transports = transports or default_transports()
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        # Transports block; a pool of their own keeps the default executor from capping concurrency
+        self.executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="rfq-dispatch")
+
+    async def send_all(
+        self,
+        invitations: List[Invitation],
+        claim: Optional[Callable[[Invitation], Awaitable[bool]]] = None
+    ) -> AsyncIterator[List[DeliveryResult]]:
+        """Yield outcomes in batches as deliveries finish, rather than after the slowest one.
+
+        claim is awaited once a send slot is free, just before the first attempt; an invitation
+        it returns False for is not sent and has no outcome.
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+        pending = [asyncio.ensure_future(self._deliver(invitation, semaphore, claim)) for invitation in invitations]
+        batch: List[DeliveryResult] = []
+        flushed_at = time.monotonic()
+        try:
+            for finished in asyncio.as_completed(pending):
+                result = await finished
+                if result is None:
+                    continue
+                batch.append(result)
+                if len(batch) >= RESULT_BATCH_SIZE or time.monotonic() - flushed_at >= RESULT_FLUSH_SECONDS:
+                    yield batch
+                    batch = []
+                    flushed_at = time.monotonic()
+            if batch:
+                yield batch
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _deliver(
+        self,
+        invitation: Invitation,
+        semaphore: asyncio.Semaphore,
+        claim: Optional[Callable[[Invitation], Awaitable[bool]]]
+    ) -> Optional[DeliveryResult]:
+        transport = self.transports[invitation.channel]
+        attempt = 0
+        while True:
+            attempt += 1
+            # The slot is released while backing off so other destinations keep moving
+            async with semaphore:
+                if attempt == 1 and claim is not None and not await claim(invitation):
+                    return None
+                try:
+                    await asyncio.get_running_loop().run_in_executor(self.executor, transport.send, invitation)
+                    return DeliveryResult(invitation.delivery_id, True, attempt, None)
+                except PermanentDeliveryError as e:
+                    logger.error(f"RFQ {invitation.rfq_id} to supplier {invitation.supplier_id} rejected: {str(e)}")
+                    return DeliveryResult(invitation.delivery_id, False, attempt, str(e))
+                except Exception as e:
+                    if attempt >= self.max_attempts:
+                        logger.error(
+                            f"RFQ {invitation.rfq_id} to supplier {invitation.supplier_id} failed "
+                            f"after {attempt} attempts: {str(e)}"
+                        )
+                        return DeliveryResult(invitation.delivery_id, False, attempt, str(e))
+            await asyncio.sleep(retry_delay(attempt))
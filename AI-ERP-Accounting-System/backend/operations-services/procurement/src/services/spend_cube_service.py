@@ -0,0 +1,331 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import func, delete, or_
+from sqlalchemy.dialects import postgresql, sqlite
+from typing import List, Optional, Dict, Any, Tuple
+from datetime import datetime, date, timedelta
+from decimal import Decimal
+import asyncio
+import logging
+import os
+
+from ..models.purchase_orders import PurchaseOrder, PurchaseOrderLine
+from ..models.suppliers import Supplier
+from ..models.spend_cube import SpendCubeCell, SpendCubeContribution, SpendCubeState
+from ..database.connection import SessionLocal
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet export is optional
+    pa = pq = None
+
+logger = logging.getLogger(__name__)
+
+SPEND_CUBE_REFRESH_SECONDS = int(os.getenv("SPEND_CUBE_REFRESH_SECONDS", "60"))
+# Rescanned behind the watermark to catch POs whose transactions committed late; unchanged POs cost nothing
+REFRESH_OVERLAP = timedelta(minutes=10)
+REFRESH_CHUNK_SIZE = 5000
+# POs in these statuses are not committed spend
+EXCLUDED_PO_STATUSES = ("draft", "submitted", "pending", "pending approval", "rejected", "cancelled")
+UNCATEGORIZED = "Uncategorized"
+NO_ENTITY = 0
+CENTS = Decimal("0.01")
+
+DIMENSION_COLUMNS = {
+    "category": SpendCubeCell.category,
+    "supplier": SpendCubeCell.supplier_id,
+    "entity": SpendCubeCell.entity_id,
+    "period": SpendCubeCell.month,
+}
+DIMENSION_FIELDS = {"category": "category", "supplier": "supplier_id", "entity": "entity_id", "period": "period_start"}
+TIME_GRAINS = ("month", "quarter", "year")
+CUBE_METRICS = ("amount", "po_count", "line_count")
+
+
+def period_start(month: date, grain: str) -> date:
+    if grain == "quarter":
+        return month.replace(month=(month.month - 1) // 3 * 3 + 1, day=1)
+    if grain == "year":
+        return month.replace(month=1, day=1)
+    return month.replace(day=1)
+
+
+class SpendCubeService:
+    """Category x supplier x month x entity spend, refreshed incrementally from changed POs.
+
+    Each committed PO falls in exactly one cell. A refresh reads only POs updated since the
+    watermark, compares each with what it contributed last time and applies the difference,
+    so approvals, amendments and cancellations all move the cube without a full scan.
+    """
+
+    def refresh(self, db: Session, full: bool = False) -> Dict[str, Any]:
+        """Apply POs changed since the last refresh; full=True empties the cube and rescans every PO"""
+        try:
+            state = self._lock_state(db)
+            started = datetime.utcnow()
+            if full:
+                db.execute(delete(SpendCubeCell))
+                db.execute(delete(SpendCubeContribution))
+                state.refreshed_through = None
+            scan_from = state.refreshed_through - REFRESH_OVERLAP if state.refreshed_through else None
+
+            scanned = changed = 0
+            last_id = 0
+            while True:
+                rows = self._changed_purchase_orders(db, scan_from, last_id)
+                if not rows:
+                    break
+                last_id = rows[-1].id
+                scanned += len(rows)
+                changed += self._apply_chunk(db, rows)
+
+            db.query(SpendCubeCell).filter(SpendCubeCell.po_count <= 0).delete(synchronize_session=False)
+            state.refreshed_through = started
+            state.last_refresh_at = datetime.utcnow()
+            state.last_changed_count = changed
+            db.commit()
+
+            if changed:
+                logger.info(f"Spend cube refresh: {changed} of {scanned} scanned purchase orders changed")
+            return {"scanned_purchase_orders": scanned, "changed_purchase_orders": changed, "refreshed_through": started}
+
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error refreshing spend cube: {str(e)}")
+            raise
+
+    def refresh_now(self) -> Dict[str, Any]:
+        db = SessionLocal()
+        try:
+            return self.refresh(db)
+        finally:
+            db.close()
+
+    async def run_refresh_loop(self) -> None:
+        """Refresh the cube on a fixed interval so approved POs reach dashboards within a minute or so"""
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                await loop.run_in_executor(None, self.refresh_now)
+            except Exception as e:
+                logger.error(f"Scheduled spend cube refresh failed: {str(e)}")
+            await asyncio.sleep(SPEND_CUBE_REFRESH_SECONDS)
+
+    def get_slice(
+        self,
+        db: Session,
+        dimensions: List[str],
+        time_grain: str = "month",
+        start_date: Optional[date] = None,
+        end_date: Optional[date] = None,
+        category: Optional[str] = None,
+        supplier_id: Optional[int] = None,
+        entity_id: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """Spend grouped by any subset of dimensions: fewer rolls up, more plus a filter drills down"""
+        try:
+            unknown = [dimension for dimension in dimensions if dimension not in DIMENSION_COLUMNS]
+            if unknown:
+                raise ValueError(f"dimensions must be among: {', '.join(DIMENSION_COLUMNS)}")
+            if time_grain not in TIME_GRAINS:
+                raise ValueError(f"time_grain must be one of: {', '.join(TIME_GRAINS)}")
+            dimensions = list(dict.fromkeys(dimensions))
+
+            columns = [DIMENSION_COLUMNS[dimension] for dimension in dimensions]
+            query = db.query(*columns, *[func.sum(getattr(SpendCubeCell, metric)) for metric in CUBE_METRICS])
+            if start_date:
+                query = query.filter(SpendCubeCell.month >= period_start(start_date, "month"))
+            if end_date:
+                query = query.filter(SpendCubeCell.month <= end_date)
+            if category:
+                query = query.filter(SpendCubeCell.category == category)
+            if supplier_id is not None:
+                query = query.filter(SpendCubeCell.supplier_id == supplier_id)
+            if entity_id is not None:
+                query = query.filter(SpendCubeCell.entity_id == entity_id)
+            if columns:
+                query = query.group_by(*columns)
+
+            # Months fold into quarters and years here; the cube only stores months
+            grouped: Dict[Tuple[Any, ...], List[Any]] = {}
+            for row in query.all():
+                key = tuple(
+                    period_start(value, time_grain) if dimension == "period" else value
+                    for dimension, value in zip(dimensions, row)
+                )
+                amount, po_count, line_count = row[len(dimensions):]
+                if po_count is None:
+                    continue
+                totals = grouped.setdefault(key, [Decimal("0"), 0, 0])
+                totals[0] += Decimal(amount or 0)
+                totals[1] += int(po_count)
+                totals[2] += int(line_count or 0)
+
+            rows = [
+                {
+                    **{DIMENSION_FIELDS[dimension]: value for dimension, value in zip(dimensions, key)},
+                    "amount": totals[0].quantize(CENTS),
+                    "po_count": totals[1],
+                    "line_count": totals[2]
+                }
+                for key, totals in grouped.items() if totals[1]
+            ]
+            rows.sort(key=lambda row: (row.get("period_start") or date.min, -row["amount"]))
+
+            state = db.query(SpendCubeState).first()
+            return {
+                "dimensions": dimensions,
+                "time_grain": time_grain,
+                "start_date": start_date,
+                "end_date": end_date,
+                "refreshed_through": state.refreshed_through if state else None,
+                "total_amount": sum((row["amount"] for row in rows), Decimal("0")),
+                "total_po_count": sum(row["po_count"] for row in rows),
+                "rows": rows
+            }
+
+        except Exception as e:
+            logger.error(f"Error reading spend cube: {str(e)}")
+            raise
+
+    def to_parquet(self, cube_slice: Dict[str, Any]) -> bytes:
+        """Serialize a slice for analysts' tools; needs the optional pyarrow package"""
+        if pq is None:
+            raise ValueError("Parquet export requires pyarrow, which is not installed")
+
+        types = {
+            "category": pa.string(),
+            "supplier_id": pa.int64(),
+            "entity_id": pa.int64(),
+            "period_start": pa.date32(),
+            "amount": pa.decimal128(18, 2),
+            "po_count": pa.int64(),
+            "line_count": pa.int64(),
+        }
+        fields = [DIMENSION_FIELDS[dimension] for dimension in cube_slice["dimensions"]] + list(CUBE_METRICS)
+        schema = pa.schema([(field, types[field]) for field in fields])
+        table = pa.table({field: [row[field] for row in cube_slice["rows"]] for field in fields}, schema=schema)
+
+        sink = pa.BufferOutputStream()
+        pq.write_table(table, sink)
+        return sink.getvalue().to_pybytes()
+
+    def _lock_state(self, db: Session) -> SpendCubeState:
+        """The watermark row, locked so concurrent refreshes cannot apply the same change twice"""
+        dialect_insert = postgresql.insert if db.get_bind().dialect.name == "postgresql" else sqlite.insert
+        db.execute(dialect_insert(SpendCubeState).values(id=1).on_conflict_do_nothing(index_elements=["id"]))
+        return db.query(SpendCubeState).filter(SpendCubeState.id == 1).with_for_update().one()
+
+    def _changed_purchase_orders(self, db: Session, scan_from: Optional[datetime], after_id: int) -> List[Any]:
+        """Next keyset chunk of POs whose header or any line was updated since scan_from, with their spend totals"""
+        query = db.query(
+            PurchaseOrder.id,
+            PurchaseOrder.supplier_id,
+            PurchaseOrder.entity_id,
+            PurchaseOrder.order_date,
+            PurchaseOrder.status,
+            Supplier.category,
+            func.sum(PurchaseOrderLine.quantity * PurchaseOrderLine.unit_price).label("amount"),
+            func.count(PurchaseOrderLine.id).label("line_count")
+        ).outerjoin(
+            PurchaseOrderLine, PurchaseOrderLine.purchase_order_id == PurchaseOrder.id
+        ).outerjoin(
+            Supplier, Supplier.id == PurchaseOrder.supplier_id
+        ).filter(PurchaseOrder.id > after_id)
+        if scan_from:
+            # Line edits do not touch the header's updated_at, so lines changed since the watermark count too
+            changed_lines = db.query(PurchaseOrderLine.purchase_order_id).filter(PurchaseOrderLine.updated_at > scan_from)
+            query = query.filter(or_(PurchaseOrder.updated_at > scan_from, PurchaseOrder.id.in_(changed_lines)))
+        return query.group_by(
+            PurchaseOrder.id, Supplier.category
+        ).order_by(PurchaseOrder.id).limit(REFRESH_CHUNK_SIZE).all()
+
+    def _apply_chunk(self, db: Session, rows: List[Any]) -> int:
+        """Move each changed PO's spend from its old cell to its new one; returns the POs that changed"""
+        previous = {
+            contribution.purchase_order_id: contribution
+            for contribution in db.query(SpendCubeContribution).filter(
+                SpendCubeContribution.purchase_order_id.in_([row.id for row in rows])
+            )
+        }
+
+        deltas: Dict[Tuple[date, str, int, int], List[Any]] = {}
+        upserts: List[Dict[str, Any]] = []
+        removed: List[int] = []
+        for row in rows:
+            current = self._contribution(row)
+            old = previous.get(row.id)
+            old_values = (
+                (old.month, old.category, old.supplier_id, old.entity_id, Decimal(old.amount).quantize(CENTS), old.line_count)
+                if old else None
+            )
+            if current == old_values:
+                continue
+
+            if old_values:
+                totals = deltas.setdefault(old_values[:4], [Decimal("0"), 0, 0])
+                totals[0] -= old_values[4]
+                totals[1] -= 1
+                totals[2] -= old_values[5]
+            if current:
+                totals = deltas.setdefault(current[:4], [Decimal("0"), 0, 0])
+                totals[0] += current[4]
+                totals[1] += 1
+                totals[2] += current[5]
+                upserts.append(dict(zip(
+                    ("purchase_order_id", "month", "category", "supplier_id", "entity_id", "amount", "line_count"),
+                    (row.id, *current)
+                )))
+            else:
+                removed.append(row.id)
+
+        if deltas:
+            self._upsert_cells(db, deltas)
+        if upserts:
+            dialect_insert = postgresql.insert if db.get_bind().dialect.name == "postgresql" else sqlite.insert
+            statement = dialect_insert(SpendCubeContribution)
+            db.execute(statement.on_conflict_do_update(
+                index_elements=["purchase_order_id"],
+                set_={
+                    **{
+                        column: getattr(statement.excluded, column)
+                        for column in ("month", "category", "supplier_id", "entity_id", "amount", "line_count")
+                    },
+                    "updated_at": datetime.utcnow()
+                }
+            ), upserts)
+        if removed:
+            db.execute(delete(SpendCubeContribution).where(SpendCubeContribution.purchase_order_id.in_(removed)))
+        return len(upserts) + len(removed)
+
+    def _contribution(self, row: Any) -> Optional[Tuple[Any, ...]]:
+        """(month, category, supplier, entity, amount, lines) a PO adds to the cube, or None if it adds nothing"""
+        if not row.order_date or not row.line_count or (row.status or "").lower() in EXCLUDED_PO_STATUSES:
+            return None
+        return (
+            row.order_date.replace(day=1),
+            row.category or UNCATEGORIZED,
+            row.supplier_id,
+            row.entity_id or NO_ENTITY,
+            Decimal(row.amount or 0).quantize(CENTS),
+            row.line_count
+        )
+
+    def _upsert_cells(self, db: Session, deltas: Dict[Tuple[date, str, int, int], List[Any]]) -> None:
+        """Add the deltas to existing cells, creating cells that do not exist yet"""
+        dialect_insert = postgresql.insert if db.get_bind().dialect.name == "postgresql" else sqlite.insert
+        statement = dialect_insert(SpendCubeCell)
+        statement = statement.on_conflict_do_update(
+            index_elements=["month", "category", "supplier_id", "entity_id"],
+            set_={
+                **{metric: getattr(SpendCubeCell, metric) + getattr(statement.excluded, metric) for metric in CUBE_METRICS},
+                "updated_at": datetime.utcnow()
+            }
+        )
+        db.execute(statement, [
+            {
+                "month": month, "category": category, "supplier_id": supplier_id, "entity_id": entity_id,
+                **dict(zip(CUBE_METRICS, totals))
+            }
+            for (month, category, supplier_id, entity_id), totals in deltas.items()
+        ])
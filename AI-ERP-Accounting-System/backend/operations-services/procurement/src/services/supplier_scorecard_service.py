@@ -0,0 +1,389 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import case, delete, func, literal, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from typing import List, Optional, Dict, Any, Tuple
+from datetime import datetime, date, timedelta
+from decimal import Decimal
+import logging
+
+from ..models.supplier_scorecards import (
+    SupplierPerformanceDaily, SupplierScorecard, SupplierScorecardWindow, SupplierPerformanceEvent,
+    SupplierActivityBatch
+)
+
+logger = logging.getLogger(__name__)
+
+WINDOWS = (30, 90, 365)
+SCORECARD_METRICS = (
+    "delivery_count", "on_time_count", "lead_time_days_sum", "quantity_received", "quantity_rejected",
+    "invoice_count", "ordered_amount", "invoiced_amount"
+)
+# Score weights; a component without activity in the window is left out and the rest re-weighted
+DELIVERY_WEIGHT = Decimal("40")
+QUALITY_WEIGHT = Decimal("35")
+PRICE_WEIGHT = Decimal("25")
+
+
+def receipt_contribution(receipt: Any) -> Tuple[Any, ...]:
+    """Scorecard metrics one receipt contributes, in SCORECARD_METRICS order"""
+    return (
+        1,
+        1 if receipt.receipt_date <= receipt.promised_date else 0,
+        max((receipt.receipt_date - receipt.order_date).days, 0),
+        receipt.quantity_received,
+        receipt.quantity_rejected,
+        0, Decimal("0"), Decimal("0")
+    )
+
+
+def invoice_contribution(invoice: Any) -> Tuple[Any, ...]:
+    """Scorecard metrics one supplier invoice contributes, in SCORECARD_METRICS order"""
+    return (0, 0, 0, Decimal("0"), Decimal("0"), 1, invoice.ordered_amount, invoice.invoiced_amount)
+
+
+def ratio(numerator: Any, denominator: Any) -> Optional[float]:
+    return float(numerator) / float(denominator) if denominator else None
+
+
+class SupplierScorecardService:
+    """Rolling 30/90/365-day supplier scorecards maintained incrementally.
+
+    Receipts and invoices are added to per-supplier daily buckets and, when they fall inside a
+    window, straight to that window's totals. Windows move forward by adding the days that enter
+    and subtracting the days that leave, so neither recording nor reading rescans history.
+    """
+
+    def record_activity(self, db: Session, batch: SupplierActivityBatch, as_of: Optional[date] = None) -> Dict[str, int]:
+        """Count new receipts and invoices in the daily buckets and the windows they fall in"""
+        try:
+            as_of = as_of or date.today()
+            activities = {("Receipt", receipt.receipt_id): receipt for receipt in batch.receipts}
+            activities.update({("Invoice", invoice.invoice_id): invoice for invoice in batch.invoices})
+            if not activities:
+                return {"recorded": 0, "duplicates": 0}
+
+            dialect_insert = self._dialect_insert(db)
+            claimed = {tuple(row) for row in db.execute(
+                dialect_insert(SupplierPerformanceEvent).on_conflict_do_nothing(
+                    index_elements=["source_type", "source_id"]
+                ).returning(SupplierPerformanceEvent.source_type, SupplierPerformanceEvent.source_id),
+                [
+                    {
+                        "source_type": source_type,
+                        "source_id": source_id,
+                        "supplier_id": activity.supplier_id,
+                        "activity_date": self._activity_date(activity)
+                    }
+                    for (source_type, source_id), activity in activities.items()
+                ]
+            )}
+
+            daily: Dict[Tuple[int, date], List[Any]] = {}
+            for key in claimed:
+                activity = activities[key]
+                contribution = receipt_contribution(activity) if key[0] == "Receipt" else invoice_contribution(activity)
+                totals = daily.setdefault(
+                    (activity.supplier_id, self._activity_date(activity)), [0] * len(SCORECARD_METRICS)
+                )
+                for index, value in enumerate(contribution):
+                    totals[index] += value
+
+            if daily:
+                self._upsert_increments(db, SupplierPerformanceDaily, ["supplier_id", "activity_date"], [
+                    {"supplier_id": supplier_id, "activity_date": activity_date, **dict(zip(SCORECARD_METRICS, values))}
+                    for (supplier_id, activity_date), values in daily.items()
+                ])
+
+                # A shared lock keeps a concurrent window advance from missing or double counting this batch
+                windows = self._ensure_windows(db, as_of, read_only=True)
+                scorecards: Dict[Tuple[int, int], List[Any]] = {}
+                for (supplier_id, activity_date), values in daily.items():
+                    for window_days, window_as_of in windows.items():
+                        if window_as_of - timedelta(days=window_days) < activity_date <= window_as_of:
+                            totals = scorecards.setdefault((supplier_id, window_days), [0] * len(SCORECARD_METRICS))
+                            for index, value in enumerate(values):
+                                totals[index] += value
+
+                if scorecards:
+                    self._upsert_increments(db, SupplierScorecard, ["supplier_id", "window_days"], [
+                        {"supplier_id": supplier_id, "window_days": window_days, **dict(zip(SCORECARD_METRICS, values))}
+                        for (supplier_id, window_days), values in scorecards.items()
+                    ])
+                    self._refresh_scores(db, SupplierScorecard.supplier_id.in_(list({key[0] for key in scorecards})))
+
+            db.commit()
+            return {"recorded": len(claimed), "duplicates": len(activities) - len(claimed)}
+
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error recording supplier activity: {str(e)}")
+            raise
+
+    def advance_windows(self, db: Session, as_of: Optional[date] = None) -> int:
+        """Slide every window forward to end on as_of; returns the number of windows moved"""
+        try:
+            as_of = as_of or date.today()
+            windows = self._ensure_windows(db, as_of)
+            advanced = 0
+            for window_days, window_as_of in windows.items():
+                if window_as_of >= as_of:
+                    continue
+                self._slide_window(db, window_days, window_as_of, as_of)
+                advanced += 1
+
+            db.commit()
+            if advanced:
+                logger.info(f"Advanced {advanced} supplier scorecard windows to {as_of}")
+            return advanced
+
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error advancing supplier scorecard windows: {str(e)}")
+            raise
+
+    def rebuild(self, db: Session, as_of: Optional[date] = None) -> int:
+        """Recompute every window from the daily buckets; returns the number of scorecards written"""
+        try:
+            as_of = as_of or date.today()
+            self._ensure_windows(db, as_of)
+            db.execute(delete(SupplierScorecard))
+
+            written = 0
+            for window_days in WINDOWS:
+                grouped = select(
+                    SupplierPerformanceDaily.supplier_id,
+                    literal(window_days),
+                    *[func.sum(getattr(SupplierPerformanceDaily, metric)) for metric in SCORECARD_METRICS]
+                ).where(
+                    SupplierPerformanceDaily.activity_date > as_of - timedelta(days=window_days),
+                    SupplierPerformanceDaily.activity_date <= as_of
+                ).group_by(SupplierPerformanceDaily.supplier_id)
+
+                result = db.execute(SupplierScorecard.__table__.insert().from_select(
+                    ["supplier_id", "window_days", *SCORECARD_METRICS], grouped
+                ))
+                written += result.rowcount
+
+            db.execute(
+                update(SupplierScorecardWindow).values(as_of_date=as_of, updated_at=datetime.utcnow())
+            )
+            self._refresh_scores(db)
+            db.commit()
+
+            logger.info(f"Rebuilt {written} supplier scorecards as of {as_of}")
+            return written
+
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error rebuilding supplier scorecards: {str(e)}")
+            raise
+
+    def get_scorecard(self, db: Session, supplier_id: int, as_of: Optional[date] = None) -> Dict[str, Any]:
+        """One supplier's 30, 90 and 365-day scorecards"""
+        try:
+            windows = self._current_windows(db, as_of or date.today())
+            rows = {
+                row.window_days: row
+                for row in db.query(SupplierScorecard).filter(SupplierScorecard.supplier_id == supplier_id).all()
+            }
+            return {
+                "supplier_id": supplier_id,
+                "windows": [
+                    self._window_response(window_days, windows[window_days], rows.get(window_days))
+                    for window_days in WINDOWS
+                ]
+            }
+
+        except Exception as e:
+            logger.error(f"Error retrieving scorecard for supplier {supplier_id}: {str(e)}")
+            raise
+
+    def get_rankings(
+        self,
+        db: Session,
+        window_days: int = 90,
+        min_deliveries: int = 1,
+        skip: int = 0,
+        limit: int = 100,
+        as_of: Optional[date] = None
+    ) -> Dict[str, Any]:
+        """Suppliers ranked by score for one window, best first"""
+        try:
+            if window_days not in WINDOWS:
+                raise ValueError(f"window_days must be one of: {', '.join(str(days) for days in WINDOWS)}")
+            windows = self._current_windows(db, as_of or date.today())
+
+            rows = db.query(SupplierScorecard).filter(
+                SupplierScorecard.window_days == window_days,
+                SupplierScorecard.score.isnot(None),
+                SupplierScorecard.delivery_count >= min_deliveries
+            ).order_by(
+                SupplierScorecard.score.desc(), SupplierScorecard.supplier_id
+            ).offset(skip).limit(limit).all()
+
+            return {
+                "window_days": window_days,
+                "as_of_date": windows[window_days],
+                "rankings": [
+                    {
+                        "rank": skip + position + 1,
+                        "supplier_id": row.supplier_id,
+                        "score": row.score,
+                        "delivery_count": row.delivery_count,
+                        "on_time_rate": ratio(row.on_time_count, row.delivery_count),
+                        "reject_rate": ratio(row.quantity_rejected, row.quantity_received),
+                        "price_variance_rate": ratio(row.invoiced_amount - row.ordered_amount, row.ordered_amount),
+                        "average_lead_time_days": ratio(row.lead_time_days_sum, row.delivery_count)
+                    }
+                    for position, row in enumerate(rows)
+                ]
+            }
+
+        except Exception as e:
+            logger.error(f"Error ranking suppliers: {str(e)}")
+            raise
+
+    def _current_windows(self, db: Session, as_of: date) -> Dict[int, date]:
+        """Window end dates, sliding them forward first if a day has passed since the last advance"""
+        windows = {
+            row.window_days: row.as_of_date for row in db.query(SupplierScorecardWindow).all()
+        }
+        if len(windows) < len(WINDOWS) or any(window_as_of < as_of for window_as_of in windows.values()):
+            self.advance_windows(db, as_of)
+            windows = {row.window_days: row.as_of_date for row in db.query(SupplierScorecardWindow).all()}
+        return windows
+
+    def _ensure_windows(self, db: Session, as_of: date, read_only: bool = False) -> Dict[int, date]:
+        """Lock the window rows, creating any missing window from the daily buckets"""
+        self._create_missing_windows(db, as_of)
+        rows = db.query(SupplierScorecardWindow).with_for_update(read=read_only).all()
+        return {row.window_days: row.as_of_date for row in rows}
+
+    def _create_missing_windows(self, db: Session, as_of: date) -> None:
+        existing = {window_days for (window_days,) in db.query(SupplierScorecardWindow.window_days).all()}
+        missing = [window_days for window_days in WINDOWS if window_days not in existing]
+        if not missing:
+            return
+
+        # A new window starts empty, one day before as_of, and fills by sliding forward to it
+        created = db.execute(
+            self._dialect_insert(db)(SupplierScorecardWindow).on_conflict_do_nothing(
+                index_elements=["window_days"]
+            ).returning(SupplierScorecardWindow.window_days),
+            [{"window_days": window_days, "as_of_date": as_of - timedelta(days=window_days + 1)} for window_days in missing]
+        ).scalars().all()
+        if created:
+            db.execute(delete(SupplierScorecard).where(SupplierScorecard.window_days.in_(created)))
+
+    def _slide_window(self, db: Session, window_days: int, from_date: date, to_date: date) -> None:
+        """Add the days in (from_date, to_date] and drop the days that fall out of the window"""
+        span = timedelta(days=window_days)
+        entering = SupplierPerformanceDaily.activity_date > from_date
+        leaving = SupplierPerformanceDaily.activity_date <= to_date - span
+        deltas = select(
+            SupplierPerformanceDaily.supplier_id,
+            literal(window_days),
+            *[
+                func.sum(
+                    case((entering, getattr(SupplierPerformanceDaily, metric)), else_=0)
+                    - case((leaving, getattr(SupplierPerformanceDaily, metric)), else_=0)
+                )
+                for metric in SCORECARD_METRICS
+            ]
+        ).where(
+            SupplierPerformanceDaily.activity_date > from_date - span,
+            SupplierPerformanceDaily.activity_date <= to_date
+        ).group_by(SupplierPerformanceDaily.supplier_id)
+
+        statement = self._dialect_insert(db)(SupplierScorecard).from_select(
+            ["supplier_id", "window_days", *SCORECARD_METRICS], deltas
+        )
+        db.execute(self._increment_on_conflict(statement, SupplierScorecard, ["supplier_id", "window_days"]))
+
+        changed = select(SupplierPerformanceDaily.supplier_id).where(
+            SupplierPerformanceDaily.activity_date > from_date - span,
+            SupplierPerformanceDaily.activity_date <= to_date,
+            (SupplierPerformanceDaily.activity_date > from_date) | (SupplierPerformanceDaily.activity_date <= to_date - span)
+        )
+        self._refresh_scores(db, SupplierScorecard.window_days == window_days, SupplierScorecard.supplier_id.in_(changed))
+
+        db.execute(
+            update(SupplierScorecardWindow).where(
+                SupplierScorecardWindow.window_days == window_days
+            ).values(as_of_date=to_date, updated_at=datetime.utcnow())
+        )
+
+    def _refresh_scores(self, db: Session, *filters: Any) -> None:
+        """Recompute the stored score of the matching scorecards from their window totals"""
+        db.execute(
+            update(SupplierScorecard).where(*filters).values(score=self._score_expression(), updated_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+
+    def _score_expression(self) -> Any:
+        """0-100 weighted score: on-time deliveries, accepted quantity and closeness to PO price"""
+        card = SupplierScorecard
+        delivered = card.delivery_count > 0
+        received = card.quantity_received > 0
+        ordered = card.ordered_amount > 0
+
+        on_time = card.on_time_count * Decimal("1") / card.delivery_count
+        accepted = Decimal("1") - card.quantity_rejected / card.quantity_received
+        variance = func.abs(card.invoiced_amount - card.ordered_amount) / card.ordered_amount
+        price = case((variance >= 1, Decimal("0")), else_=Decimal("1") - variance)
+
+        points = (
+            case((delivered, DELIVERY_WEIGHT * on_time), else_=Decimal("0"))
+            + case((received, QUALITY_WEIGHT * case((accepted < 0, Decimal("0")), else_=accepted)), else_=Decimal("0"))
+            + case((ordered, PRICE_WEIGHT * price), else_=Decimal("0"))
+        )
+        weights = (
+            case((delivered, DELIVERY_WEIGHT), else_=Decimal("0"))
+            + case((received, QUALITY_WEIGHT), else_=Decimal("0"))
+            + case((ordered, PRICE_WEIGHT), else_=Decimal("0"))
+        )
+        return case((weights > 0, func.round(Decimal("100") * points / weights, 2)), else_=None)
+
+    def _upsert_increments(self, db: Session, model: Any, keys: List[str], rows: List[Dict[str, Any]]) -> None:
+        """Add the increments to existing rows, creating rows that do not exist yet"""
+        statement = self._increment_on_conflict(self._dialect_insert(db)(model), model, keys)
+        db.execute(statement, rows)
+
+    def _increment_on_conflict(self, statement: Any, model: Any, keys: List[str]) -> Any:
+        return statement.on_conflict_do_update(
+            index_elements=keys,
+            set_={
+                **{
+                    metric: getattr(model, metric) + getattr(statement.excluded, metric)
+                    for metric in SCORECARD_METRICS
+                },
+                "updated_at": datetime.utcnow()
+            }
+        )
+
+    def _dialect_insert(self, db: Session) -> Any:
+        return postgresql.insert if db.get_bind().dialect.name == "postgresql" else sqlite.insert
+
+    def _activity_date(self, activity: Any) -> date:
+        return activity.receipt_date if hasattr(activity, "receipt_date") else activity.invoice_date
+
+    def _window_response(self, window_days: int, as_of: date, row: Optional[SupplierScorecard]) -> Dict[str, Any]:
+        values = {metric: getattr(row, metric) if row else 0 for metric in SCORECARD_METRICS}
+        return {
+            "window_days": window_days,
+            "as_of_date": as_of,
+            "delivery_count": values["delivery_count"],
+            "on_time_rate": ratio(values["on_time_count"], values["delivery_count"]),
+            "average_lead_time_days": ratio(values["lead_time_days_sum"], values["delivery_count"]),
+            "quantity_received": Decimal(values["quantity_received"]),
+            "quantity_rejected": Decimal(values["quantity_rejected"]),
+            "reject_rate": ratio(values["quantity_rejected"], values["quantity_received"]),
+            "invoice_count": values["invoice_count"],
+            "ordered_amount": Decimal(values["ordered_amount"]),
+            "invoiced_amount": Decimal(values["invoiced_amount"]),
+            "price_variance_amount": Decimal(values["invoiced_amount"]) - Decimal(values["ordered_amount"]),
+            "price_variance_rate": ratio(
+                Decimal(values["invoiced_amount"]) - Decimal(values["ordered_amount"]), values["ordered_amount"]
+            ),
+            "score": row.score if row else None
+        }
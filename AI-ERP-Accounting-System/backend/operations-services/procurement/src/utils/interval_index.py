@@ -0,0 +1,79 @@
+from typing import Any, Dict, Hashable, Iterable, List, NamedTuple, Optional, Tuple
+from bisect import bisect_right
+from datetime import date
+import heapq
+import time
+
+OPEN_ENDED = date.max.toordinal()
+
+
+class PricedInterval(NamedTuple):
+    start: int  # Date ordinals, both inclusive
+    end: int
+    priority: Tuple[int, ...]  # Where intervals overlap, the highest priority applies
+    value: Any
+
+
+class IntervalIndex:
+    """Non-overlapping segments per key, built by a sweep over possibly overlapping intervals.
+
+    Overlaps are resolved once at build time, so a lookup is a single bisect over the
+    key's segment starts. Lookups in ascending date order can pass the previous position
+    as a hint and walk a key's segments in one pass.
+    """
+
+    def __init__(self, intervals: Iterable[Tuple[Hashable, PricedInterval]]):
+        grouped: Dict[Hashable, List[PricedInterval]] = {}
+        for key, interval in intervals:
+            if interval.start <= interval.end:
+                grouped.setdefault(key, []).append(interval)
+
+        self.starts: Dict[Hashable, List[int]] = {}
+        self.values: Dict[Hashable, List[Optional[Any]]] = {}
+        self.interval_count = 0
+        for key, key_intervals in grouped.items():
+            self.starts[key], self.values[key] = self._sweep(key_intervals)
+            self.interval_count += len(key_intervals)
+        self.built_at = time.monotonic()
+
+    def lookup(self, key: Hashable, on: date) -> Optional[Any]:
+        """Value of the interval in force for the key on the date, or None"""
+        return self.lookup_from(key, on.toordinal(), 0)[0]
+
+    def lookup_from(self, key: Hashable, ordinal: int, hint: int) -> Tuple[Optional[Any], int]:
+        """Lookup starting the search at a previous position for the same key; returns (value, position)"""
+        starts = self.starts.get(key)
+        if not starts:
+            return None, 0
+        if hint and starts[hint - 1] > ordinal:
+            hint = 0
+        position = bisect_right(starts, ordinal, hint)
+        return (self.values[key][position - 1] if position else None), position
+
+    @staticmethod
+    def _sweep(intervals: List[PricedInterval]) -> Tuple[List[int], List[Optional[Any]]]:
+        """Split the timeline at every start and end and keep the winning interval per segment"""
+        intervals.sort(key=lambda interval: interval.start)
+        boundaries = sorted({interval.start for interval in intervals} | {
+            interval.end + 1 for interval in intervals if interval.end < OPEN_ENDED
+        })
+
+        starts: List[int] = []
+        values: List[Optional[Any]] = []
+        active: List[Tuple[Any, ...]] = []  # Max-heap by priority via negated priorities
+        next_interval = 0
+        for boundary in boundaries:
+            while next_interval < len(intervals) and intervals[next_interval].start <= boundary:
+                interval = intervals[next_interval]
+                heapq.heappush(active, (tuple(-item for item in interval.priority), next_interval, interval))
+                next_interval += 1
+            # Expired intervals are dropped lazily, only once they reach the top
+            while active and active[0][2].end < boundary:
+                heapq.heappop(active)
+
+            value = active[0][2].value if active else None
+            if values and values[-1] is value:
+                continue
+            starts.append(boundary)
+            values.append(value)
+        return starts, values
@@ -0,0 +1,76 @@
+import importlib.util
+import os
+import sys
+import types
+
+from sqlalchemy import create_engine, Column, Integer, String, Date, DateTime, Numeric, Text
+from sqlalchemy.orm import declarative_base, sessionmaker
+from sqlalchemy.pool import StaticPool
+
+# Tests import the service as the "src" package, the way uvicorn loads src.main
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# The core procurement models and the database connection live outside this service's tree. Where
+# they are missing, register minimal stand-ins carrying just the columns the services under test use.
+Base = declarative_base()
+
+
+class RFQ(Base):
+    __tablename__ = "rfqs"
+
+    id = Column(Integer, primary_key=True)
+    rfq_number = Column(String(50))
+    title = Column(String(255))
+    description = Column(Text)
+    due_date = Column(Date)
+    status = Column(String(20))
+
+
+class Supplier(Base):
+    __tablename__ = "suppliers"
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String(255))
+    email = Column(String(255))
+    category = Column(String(100))
+
+
+class PurchaseOrder(Base):
+    __tablename__ = "purchase_orders"
+
+    id = Column(Integer, primary_key=True)
+    po_number = Column(String(50))
+    supplier_id = Column(Integer)
+    entity_id = Column(Integer)
+    order_date = Column(Date)
+    status = Column(String(20))
+    updated_at = Column(DateTime)
+
+
+class PurchaseOrderLine(Base):
+    __tablename__ = "purchase_order_lines"
+
+    id = Column(Integer, primary_key=True)
+    purchase_order_id = Column(Integer)
+    item_code = Column(String(50))
+    quantity = Column(Numeric(15, 4))
+    unit_price = Column(Numeric(15, 4))
+    updated_at = Column(DateTime)
+
+
+engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+SessionLocal = sessionmaker(bind=engine)
+
+STAND_INS = {
+    "src.database.connection": {"Base": Base, "engine": engine, "SessionLocal": SessionLocal},
+    "src.models.rfqs": {"RFQ": RFQ},
+    "src.models.suppliers": {"Supplier": Supplier},
+    "src.models.purchase_orders": {"PurchaseOrder": PurchaseOrder, "PurchaseOrderLine": PurchaseOrderLine},
+}
+
+for name, attributes in STAND_INS.items():
+    if importlib.util.find_spec(name) is not None:
+        continue
+    module = types.ModuleType(name)
+    module.__dict__.update(attributes)
+    sys.modules[name] = module
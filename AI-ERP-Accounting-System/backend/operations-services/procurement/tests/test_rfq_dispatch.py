@@ -0,0 +1,140 @@
+import asyncio
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from src.models.rfqs import RFQ
+from src.models.suppliers import Supplier
+from src.models.rfq_dispatches import RFQDispatch, RFQDelivery
+from src.services import rfq_dispatch_service as dispatch_module
+from src.services import rfq_dispatcher as dispatcher_module
+from src.services.rfq_dispatch_service import RFQDispatchService
+from src.services.rfq_dispatcher import RFQDispatcher, StubTransport
+
+
+class RecordingRFQService:
+    """Stands in for RFQService, recording the suppliers each RFQ was sent to"""
+
+    def __init__(self):
+        self.sent = []
+
+    def send_rfq_to_suppliers(self, db, rfq_id, supplier_ids):
+        self.sent.append((rfq_id, supplier_ids))
+
+
+class WatchingTransport(StubTransport):
+    """Stub that records how many deliveries were still Pending while each one was sent"""
+
+    def __init__(self, factory, **kwargs):
+        super().__init__(**kwargs)
+        self.factory = factory
+        self.pending_counts = []
+
+    def send(self, invitation):
+        db = self.factory()
+        self.pending_counts.append(db.query(RFQDelivery).filter(RFQDelivery.status == "Pending").count())
+        db.close()
+        super().send(invitation)
+
+
+@pytest.fixture
+def session_factory(monkeypatch):
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    for model in (RFQ, Supplier, RFQDispatch, RFQDelivery):
+        model.metadata.create_all(engine, tables=[model.__table__])
+    factory = sessionmaker(bind=engine)
+    monkeypatch.setattr(dispatch_module, "SessionLocal", factory)
+    monkeypatch.setattr(dispatcher_module, "retry_delay", lambda attempt: 0)
+
+    db = factory()
+    db.add(RFQ(id=1, rfq_number="RFQ-2024-0001", title="Office chairs", status="Draft"))
+    for supplier_id in range(1, 6):
+        db.add(Supplier(id=supplier_id, name=f"Supplier {supplier_id}", email=f"s{supplier_id}@example.com"))
+    db.add(Supplier(id=6, name="Supplier 6", email=None))
+    db.commit()
+    db.close()
+    return factory
+
+
+def start(factory, service, supplier_ids):
+    db = factory()
+    dispatch_id = service.start_dispatch(db, 1, supplier_ids).id
+    db.close()
+    return dispatch_id
+
+
+def deliveries(factory, dispatch_id):
+    db = factory()
+    rows = {row.supplier_id: row for row in db.query(RFQDelivery).filter(RFQDelivery.dispatch_id == dispatch_id)}
+    db.close()
+    return rows
+
+
+def test_dispatch_delivers_retries_and_records_outcomes(session_factory):
+    transport = StubTransport(failures={2: 1}, rejected=[3])
+    rfq_service = RecordingRFQService()
+    service = RFQDispatchService(rfq_service, RFQDispatcher({"Email": transport}, concurrency=2, max_attempts=3))
+
+    dispatch_id = start(session_factory, service, [1, 2, 3, 6, 99])
+    assert rfq_service.sent == [(1, [1, 2, 3, 6])]
+    asyncio.run(service.process_dispatch(dispatch_id))
+
+    rows = deliveries(session_factory, dispatch_id)
+    assert {supplier_id: row.status for supplier_id, row in rows.items()} == {
+        1: "Delivered", 2: "Delivered", 3: "Failed", 6: "NoDestination", 99: "Failed"
+    }
+    assert rows[2].attempts == 2
+    db = session_factory()
+    db_dispatch = db.get(RFQDispatch, dispatch_id)
+    assert (db_dispatch.status, db_dispatch.delivered_count, db_dispatch.failed_count) == ("Completed", 2, 3)
+    db.close()
+
+
+def test_deliveries_are_claimed_only_when_a_send_slot_is_free(session_factory):
+    transport = WatchingTransport(session_factory)
+    service = RFQDispatchService(RecordingRFQService(), RFQDispatcher({"Email": transport}, concurrency=1))
+
+    dispatch_id = start(session_factory, service, [1, 2, 3, 4, 5])
+    asyncio.run(service.process_dispatch(dispatch_id))
+
+    # One slot: each delivery leaves Pending only as it is sent, not when the batch is loaded
+    assert transport.pending_counts == [4, 3, 2, 1, 0]
+    assert len(transport.sent) == 5
+
+
+def test_delivery_taken_by_another_worker_is_not_sent(session_factory):
+    class TakingTransport(StubTransport):
+        def send(self, invitation):
+            db = session_factory()
+            db.query(RFQDelivery).filter(RFQDelivery.supplier_id == 5).update({RFQDelivery.status: "Sending"})
+            db.commit()
+            db.close()
+            super().send(invitation)
+
+    transport = TakingTransport()
+    service = RFQDispatchService(RecordingRFQService(), RFQDispatcher({"Email": transport}, concurrency=1))
+
+    dispatch_id = start(session_factory, service, [1, 5])
+    asyncio.run(service.process_dispatch(dispatch_id))
+
+    assert [invitation.supplier_id for invitation in transport.sent] == [1]
+    assert deliveries(session_factory, dispatch_id)[5].status == "Sending"
+
+
+def test_resumed_dispatch_parks_in_flight_deliveries(session_factory):
+    transport = StubTransport()
+    service = RFQDispatchService(RecordingRFQService(), RFQDispatcher({"Email": transport}))
+
+    dispatch_id = start(session_factory, service, [1, 2, 3])
+    db = session_factory()
+    db.query(RFQDelivery).filter(RFQDelivery.supplier_id == 1).update({RFQDelivery.status: "Sending"})
+    db.commit()
+    db.close()
+
+    assert service.get_interrupted_dispatch_ids() == [dispatch_id]
+    asyncio.run(service.process_dispatch(dispatch_id))
+
+    assert sorted(invitation.supplier_id for invitation in transport.sent) == [2, 3]
+    assert deliveries(session_factory, dispatch_id)[1].status == "Unconfirmed"
@@ -0,0 +1,57 @@
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from src.models.suppliers import Supplier
+from src.models.purchase_orders import PurchaseOrder, PurchaseOrderLine
+from src.models.spend_cube import SpendCubeCell, SpendCubeContribution, SpendCubeState
+from src.services.spend_cube_service import SpendCubeService, REFRESH_OVERLAP
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    for model in (Supplier, PurchaseOrder, PurchaseOrderLine, SpendCubeCell, SpendCubeContribution, SpendCubeState):
+        model.metadata.create_all(engine, tables=[model.__table__])
+    session = sessionmaker(bind=engine)()
+    session.add(Supplier(id=1, name="Supplier 1", category="Furniture"))
+    session.commit()
+    yield session
+    session.close()
+
+
+def add_order(db, order_id, amount, updated_at):
+    db.add(PurchaseOrder(
+        id=order_id, supplier_id=1, entity_id=1, order_date=date(2024, 3, 5), status="Approved", updated_at=updated_at
+    ))
+    db.add(PurchaseOrderLine(
+        id=order_id, purchase_order_id=order_id, quantity=Decimal("1"), unit_price=amount, updated_at=updated_at
+    ))
+
+
+def cube_amount(db):
+    return db.query(SpendCubeCell.amount).filter(SpendCubeCell.category == "Furniture").scalar()
+
+
+def test_refresh_applies_header_and_line_changes(db):
+    service = SpendCubeService()
+    long_ago = datetime.utcnow() - 10 * REFRESH_OVERLAP
+    add_order(db, 1, Decimal("100.00"), long_ago)
+    add_order(db, 2, Decimal("50.00"), long_ago)
+    db.commit()
+
+    assert service.refresh(db)["changed_purchase_orders"] == 2
+    assert cube_amount(db) == Decimal("150.00")
+
+    # Editing a line leaves the header's updated_at alone
+    db.get(PurchaseOrderLine, 1).unit_price = Decimal("120.00")
+    db.get(PurchaseOrderLine, 1).updated_at = datetime.utcnow() + timedelta(seconds=1)
+    db.commit()
+
+    summary = service.refresh(db)
+    assert (summary["scanned_purchase_orders"], summary["changed_purchase_orders"]) == (1, 1)
+    assert cube_amount(db) == Decimal("170.00")